@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+不活跃会话归档任务
+
+把最后活动早于阈值的会话及其消息移到压缩的归档库，按小批从热库删除。
+热库的位置、会话分片等配置与API服务器相同（读取LLM_ROLES_*环境变量），
+可以在服务器运行时定期执行（如每天一次的cron任务）。
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.llm_roles.database.archive import ArchivedDatabase
+from src.llm_roles.web.container import ARCHIVE_PATH_ENV, ServiceContainer
+
+
+def enable_incremental_vacuum(db: ArchivedDatabase) -> None:
+    """把热库切换为auto_vacuum=INCREMENTAL
+
+    需要执行一次完整的VACUUM，期间持有写锁，应在维护窗口执行。之后归档任务
+    每批都能把删除释放的空闲页归还给文件系统。
+    """
+    for store in db.stores:
+        if not store.conn:
+            store.connect()
+        store.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        store.conn.execute("VACUUM")
+        print(f"已启用增量清理: {store.db_path}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="把不活跃的会话移到归档库")
+    parser.add_argument("--archive", default=os.environ.get(ARCHIVE_PATH_ENV),
+                        help="归档库路径，默认读取环境变量LLM_ROLES_ARCHIVE_PATH")
+    parser.add_argument("--inactive-days", type=float, default=30, help="最后活动早于多少天前的会话被归档")
+    parser.add_argument("--batch-size", type=int, default=50, help="每个删除事务处理的会话数")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="先把热库切换为增量清理模式（执行一次完整VACUUM）")
+    args = parser.parse_args()
+
+    if not args.archive:
+        parser.error("需要指定--archive或环境变量LLM_ROLES_ARCHIVE_PATH")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        container = ServiceContainer(archive_path=args.archive, invalidation_interval=0)
+        container.start()
+    try:
+        if not isinstance(container.db, ArchivedDatabase):
+            parser.error("会话归档只支持sqlite后端")
+        if args.enable_incremental_vacuum:
+            enable_incremental_vacuum(container.db)
+        result = container.db.archive_inactive(args.inactive_days * 86400, batch_size=args.batch_size)
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            container.close()
+
+    print(f"归档会话: {result['sessions']}，消息: {result['messages']}，"
+          f"因有新活动跳过: {result['skipped']}，热库剩余空闲页: {result['free_pages']}")
+
+
+if __name__ == "__main__":
+    main()
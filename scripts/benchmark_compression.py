@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+消息压缩基准测试
+
+在临时数据库中写入同一批模拟的长回复，比较不压缩、zlib、lzma和带预设字典的zlib
+在数据库大小（VACUUM后）和读取会话消息的延迟上的差别。
+"""
+
+import argparse
+import contextlib
+import io
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.llm_roles.database.compression import TextCompressor, train_dictionary
+from src.llm_roles.database.sqlite import SQLiteDatabase
+
+# 模拟助手回复的句子
+SENTENCES = [
+    "好的，下面我将分步骤为你详细说明。",
+    "首先，我们需要明确问题的背景和约束条件。",
+    "需要注意的是，这种方法在数据量较大时可能存在性能问题。",
+    "如果你还有其他问题，欢迎随时告诉我。",
+    "总结一下，推荐的做法是先评估现有方案，再逐步迁移。",
+    "Here is an example implementation that you can adapt to your project.",
+    "Make sure to handle errors and edge cases before deploying to production.",
+    "The time complexity of this approach is O(n log n), which is acceptable for most inputs.",
+    "```python\ndef process(items):\n    return [item.strip() for item in items if item]\n```\n",
+    "此外，建议为关键路径添加单元测试和监控指标。",
+]
+
+
+def make_messages(count: int, seed: int) -> List[str]:
+    """生成长度在200到4000字符之间、措辞有重复的回复"""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        parts = []
+        target = rng.randint(200, 4000)
+        while sum(map(len, parts)) < target:
+            sentence = rng.choice(SENTENCES)
+            # 混入一些不重复的内容
+            parts.append(sentence if rng.random() < 0.7 else f"{sentence}（编号{rng.randint(0, 10 ** 6)}）")
+        messages.append("".join(parts))
+    return messages
+
+
+def run_case(label: str, compression: Optional[TextCompressor], messages: List[str],
+             per_session: int, reads: int, tmp_dir: str) -> None:
+    """写入消息、VACUUM并测量读取延迟"""
+    path = str(Path(tmp_dir) / f"{label.replace('+', '_')}.db")
+    db = SQLiteDatabase(path, compression=compression)
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.connect()
+        role_id = db.create_role({"name": "基准测试角色"})
+    if compression and compression.use_dictionary:
+        db.store_compression_dictionary(train_dictionary(messages[:500]))
+
+    session_ids = []
+    start = time.perf_counter()
+    for offset in range(0, len(messages), per_session):
+        session_id = db.create_session(role_id)
+        db.add_messages(session_id, [
+            {"sender": "assistant", "content": content} for content in messages[offset:offset + per_session]
+        ])
+        session_ids.append(session_id)
+    write_elapsed = time.perf_counter() - start
+    db.conn.execute("VACUUM")
+    size = Path(path).stat().st_size
+
+    rng = random.Random(0)
+    latencies = []
+    for _ in range(reads):
+        session_id = rng.choice(session_ids)
+        start = time.perf_counter()
+        db.get_session_messages(session_id)
+        latencies.append(time.perf_counter() - start)
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.disconnect()
+
+    latencies.sort()
+    print(f"{label:<12} {size / 1024 / 1024:>9.2f} MiB {len(messages) / write_elapsed:>10,.0f} 条/秒 "
+          f"{statistics.median(latencies) * 1000:>8.2f} ms {latencies[int(len(latencies) * 0.99)] * 1000:>8.2f} ms")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="消息压缩基准测试：数据库大小与读取延迟")
+    parser.add_argument("--messages", type=int, default=5000, help="写入的消息数")
+    parser.add_argument("--per-session", type=int, default=20, help="每个会话的消息数")
+    parser.add_argument("--reads", type=int, default=500, help="读取整个会话消息的次数")
+    parser.add_argument("--threshold", type=int, default=512, help="压缩阈值（字节）")
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages, seed=42)
+    print("=" * 64)
+    print(f"消息压缩基准（{args.messages}条，每会话{args.per_session}条，阈值{args.threshold}字节）")
+    print("=" * 64)
+    print(f"{'设置':<10} {'数据库大小':>12} {'写入':>14} {'读取p50':>10} {'读取p99':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label in ("none", "zlib", "zlib:1", "lzma", "zlib+dict"):
+            compression = None if label == "none" else TextCompressor.parse(label, args.threshold)
+            run_case(label, compression, messages, args.per_session, args.reads, tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+会话消息记录吞吐量基准测试
+
+在临时数据库中分别测量逐条追加和批量追加消息的吞吐量（条/秒）。
+指定--shards时，再比较多个写入线程并发逐条追加时单库与会话分片的吞吐量。
+"""
+
+import argparse
+import contextlib
+import io
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.llm_roles.database.sharding import ShardedDatabase
+from src.llm_roles.database.sqlite import SQLiteDatabase
+from src.llm_roles.services.role_manager import RoleManager
+from src.llm_roles.services.session_service import SessionService
+
+
+def run_benchmark(total: int, batch_size: int) -> None:
+    """运行基准测试并打印结果
+
+    Args:
+        total: 每种模式写入的消息数
+        batch_size: 批量模式下每批的消息数
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = SQLiteDatabase(str(Path(tmp_dir) / "bench.db"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.connect()
+            role = RoleManager(db).create_role(name="基准测试角色")
+        service = SessionService(db)
+        content = "这是一条用于基准测试的消息。" * 10
+
+        # 逐条追加：每条消息一个事务
+        session = service.create_session(role.id)
+        start = time.perf_counter()
+        for i in range(total):
+            service.append_message(session['id'], 'user' if i % 2 == 0 else 'assistant', content)
+        single_elapsed = time.perf_counter() - start
+
+        # 批量追加：每批消息一个事务
+        session = service.create_session(role.id)
+        batch = [
+            {'sender': 'user' if i % 2 == 0 else 'assistant', 'content': content}
+            for i in range(batch_size)
+        ]
+        start = time.perf_counter()
+        for _ in range(total // batch_size):
+            service.append_messages(session['id'], batch)
+        batch_elapsed = time.perf_counter() - start
+        batch_total = (total // batch_size) * batch_size
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.disconnect()
+
+    print("=" * 60)
+    print("会话消息记录吞吐量")
+    print("=" * 60)
+    print(f"逐条追加: {total} 条, {single_elapsed:.2f} 秒, {total / single_elapsed:,.0f} 条/秒")
+    print(f"批量追加(每批{batch_size}条): {batch_total} 条, {batch_elapsed:.2f} 秒, "
+          f"{batch_total / batch_elapsed:,.0f} 条/秒")
+
+
+def run_concurrent(total: int, writers: int, shards: int) -> float:
+    """多个线程各自向一个会话逐条追加消息，返回吞吐量
+
+    Args:
+        total: 所有线程合计写入的消息数
+        writers: 写入线程数
+        shards: 会话分片数，为0时会话与目录共用一个数据库文件
+
+    Returns:
+        float: 吞吐量（条/秒）
+    """
+    pragmas = {'journal_mode': 'WAL', 'busy_timeout': 30000}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = SQLiteDatabase(str(Path(tmp_dir) / "bench.db"), pragmas=pragmas)
+        if shards:
+            db = ShardedDatabase(db, str(Path(tmp_dir) / "shards"), shards, pragmas=pragmas)
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.connect()
+            role = RoleManager(db).create_role(name="基准测试角色")
+        service = SessionService(db)
+        content = "这是一条用于基准测试的消息。" * 10
+        sessions = [service.create_session(role.id)['id'] for _ in range(writers)]
+        per_writer = total // writers
+
+        def write(session_id: str) -> None:
+            for i in range(per_writer):
+                service.append_message(session_id, 'user' if i % 2 == 0 else 'assistant', content)
+
+        threads = [threading.Thread(target=write, args=(session_id,)) for session_id in sessions]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.disconnect()
+    return per_writer * writers / elapsed
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="会话消息记录吞吐量基准测试")
+    parser.add_argument("--messages", type=int, default=5000, help="每种模式写入的消息数")
+    parser.add_argument("--batch-size", type=int, default=50, help="批量模式下每批的消息数")
+    parser.add_argument("--shards", type=int, nargs="*", default=[],
+                        help="比较并发写入吞吐量的会话分片数，如 --shards 2 4 8")
+    parser.add_argument("--writers", type=int, default=8, help="并发写入线程数")
+    args = parser.parse_args()
+
+    run_benchmark(args.messages, args.batch_size)
+
+    if args.shards:
+        print(f"并发逐条追加({args.writers}个线程)")
+        for shards in [0] + args.shards:
+            label = f"{shards}个分片" if shards else "单库"
+            print(f"{label}: {run_concurrent(args.messages, args.writers, shards):,.0f} 条/秒")
+
+
+if __name__ == "__main__":
+    main()
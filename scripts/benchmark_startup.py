@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+API服务冷启动基准测试
+
+每轮在新的Python进程中导入api_server、执行应用启动（生命周期），
+再通过ASGI依次处理GET /openapi.json和GET /health，分别记录各阶段耗时，
+最后输出多轮的中位数。进程总耗时包含解释器启动。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+
+def run_child() -> None:
+    """子进程：测量导入、启动和首个请求的耗时，结果以JSON输出到stdout"""
+    # httpx只用于发送请求，不计入导入耗时
+    import httpx
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        from src.llm_roles.web.api_server import app
+        imported = time.perf_counter()
+
+        async def serve_first_requests():
+            async with app.router.lifespan_context(app):
+                started = time.perf_counter()
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                    openapi = await client.get("/openapi.json")
+                    openapi_served = time.perf_counter()
+                    health = await client.get("/health")
+                    health_served = time.perf_counter()
+            assert openapi.status_code == 200 and health.status_code == 200
+            return started, openapi_served, health_served
+
+        started, openapi_served, health_served = asyncio.run(serve_first_requests())
+
+    print(json.dumps({
+        'import': imported - start,
+        'startup': started - imported,
+        'first_openapi': openapi_served - started,
+        'first_health': health_served - openapi_served,
+        'total': health_served - start,
+    }))
+
+
+def run_benchmark(rounds: int) -> None:
+    """运行基准测试并打印结果
+
+    Args:
+        rounds: 启动次数
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = dict(os.environ, LLM_ROLES_DB_PATH=str(Path(tmp_dir) / "bench.db"))
+        for _ in range(rounds):
+            spawned = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, __file__, "--child"],
+                env=env, cwd=str(project_root), capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            result['process'] = time.perf_counter() - spawned
+            results.append(result)
+
+    def median_ms(key: str) -> float:
+        return statistics.median(r[key] for r in results) * 1000
+
+    print("=" * 60)
+    print(f"API服务冷启动耗时（{rounds}轮中位数）")
+    print("=" * 60)
+    print(f"导入api_server:        {median_ms('import'):8.1f} ms")
+    print(f"应用启动（生命周期）:  {median_ms('startup'):8.1f} ms")
+    print(f"首个/openapi.json:     {median_ms('first_openapi'):8.1f} ms")
+    print(f"首个/health:           {median_ms('first_health'):8.1f} ms")
+    print(f"导入到首个请求完成:    {median_ms('total'):8.1f} ms")
+    print(f"进程总耗时:            {median_ms('process'):8.1f} ms")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="API服务冷启动基准测试")
+    parser.add_argument("--rounds", type=int, default=5, help="启动次数")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child()
+    else:
+        run_benchmark(args.rounds)
+
+
+if __name__ == "__main__":
+    main()
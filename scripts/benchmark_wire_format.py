@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+响应编码格式基准测试
+
+在数据库副本上生成角色列表、模板列表和提示词三类响应，
+分别测量JSON和MessagePack的编码耗时、解码耗时和字节数（含gzip压缩后）。
+"""
+
+import argparse
+import contextlib
+import gzip
+import io
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.llm_roles.web.container import ServiceContainer
+from src.llm_roles.web.responses import (
+    JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, deserialize_envelope, msgpack, serialize_envelope
+)
+
+DEFAULT_DB = project_root / "resource" / "db" / "llm_roles.db"
+
+
+def build_payloads(db_path: str, roles: int) -> Dict[str, Dict[str, Any]]:
+    """生成用于测试的响应字典
+
+    Args:
+        db_path: 数据库路径
+        roles: 角色列表的条数
+
+    Returns:
+        Dict[str, Dict[str, Any]]: 名称到响应字典的映射
+    """
+    container = ServiceContainer(db_path=db_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        container.start()
+        try:
+            role_list = container.role_api.list_roles(limit=roles)
+            if not role_list['data']['roles']:
+                raise SystemExit(f"数据库中没有角色: {db_path}")
+            role_id = role_list['data']['roles'][0]['id']
+            payloads = {
+                f'角色列表({roles}条)': role_list,
+                '模板列表': container.prompt_api.list_templates(limit=roles),
+                '单个提示词': container.prompt_api.generate_prompt(role_id),
+            }
+        finally:
+            container.close()
+    return payloads
+
+
+def measure(func: Callable[[], Any], iterations: int) -> float:
+    """返回单次调用的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run_benchmark(db_path: Path, roles: int, iterations: int) -> None:
+    """运行基准测试并打印结果
+
+    Args:
+        db_path: 源数据库路径，测试在其副本上进行
+        roles: 角色列表的条数
+        iterations: 每项测量的重复次数
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        copy_path = Path(tmp_dir) / "bench.db"
+        shutil.copyfile(db_path, copy_path)
+        payloads = build_payloads(str(copy_path), roles)
+
+    print("=" * 78)
+    print(f"响应编码格式对比（每项{iterations}次平均）")
+    print("=" * 78)
+    print(f"{'响应':<14}{'格式':<10}{'编码(µs)':>10}{'解码(µs)':>10}{'字节':>10}{'gzip字节':>10}")
+    for name, result in payloads.items():
+        for label, media_type in (('JSON', JSON_MEDIA_TYPE), ('MsgPack', MSGPACK_MEDIA_TYPE)):
+            body = serialize_envelope(result, media_type)
+            encode_us = measure(lambda: serialize_envelope(result, media_type), iterations)
+            decode_us = measure(lambda: deserialize_envelope(body, media_type), iterations)
+            compressed = len(gzip.compress(body, compresslevel=6))
+            print(f"{name:<14}{label:<10}{encode_us:>10.1f}{decode_us:>10.1f}{len(body):>10,}{compressed:>10,}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="响应编码格式基准测试")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB, help="源数据库路径（只读，测试使用副本）")
+    parser.add_argument("--roles", type=int, default=100, help="角色列表的条数")
+    parser.add_argument("--iterations", type=int, default=500, help="每项测量的重复次数")
+    args = parser.parse_args()
+
+    if msgpack is None:
+        parser.error("需要安装msgpack: pip install msgpack")
+    run_benchmark(args.db, args.roles, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
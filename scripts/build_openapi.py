@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+OpenAPI文档构建脚本
+
+把api_docs/api_docs.yml编译为api_docs/openapi.json，API服务启动后直接返回该文件的内容。
+修改YAML文档后、打包部署前运行。
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.llm_roles.web.openapi import JSON_PATH, YAML_PATH, compile_openapi
+
+
+def main():
+    """主函数"""
+    body = compile_openapi(YAML_PATH, JSON_PATH)
+    print(f"已生成 {JSON_PATH.relative_to(project_root)} ({len(body):,} 字节)")
+
+
+if __name__ == "__main__":
+    main()
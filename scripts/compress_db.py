@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+消息内容和模板内容的压缩迁移工具
+
+按新的压缩设置重写已有数据库中的messages.content和prompt_templates.template_content：
+已压缩的值先解压，再按新设置决定是否压缩（--codec none把所有值还原为文本）。
+按rowid分批处理，每批一个短事务，可以在服务器运行时执行。
+
+    # 训练预设字典并用它压缩超过512字节的值，完成后VACUUM收缩文件
+    python scripts/compress_db.py resource/db/llm_roles.db --codec zlib+dict --threshold 512 \\
+        --train-dictionary --vacuum
+"""
+
+import argparse
+import contextlib
+import copy
+import io
+import random
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Dict, Optional
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.llm_roles.database.compression import TextCompressor, train_dictionary
+from src.llm_roles.database.sharding import _SessionShard
+from src.llm_roles.database.sqlite import SQLiteDatabase
+
+# 需要迁移的表和列
+COLUMNS = (('messages', 'content'), ('prompt_templates', 'template_content'))
+
+
+def used_bytes(db: SQLiteDatabase) -> int:
+    """数据库中已使用的页占用的字节数（不含空闲页）"""
+    page_size = db.conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = db.conn.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = db.conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return (page_count - free_pages) * page_size
+
+
+def has_table(db: SQLiteDatabase, table: str) -> bool:
+    """数据库中是否有该表（会话分片库没有模板表）"""
+    return db.conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+def train(db: SQLiteDatabase, samples: int) -> Optional[int]:
+    """从随机抽取的消息和模板中训练预设字典并保存
+
+    Returns:
+        Optional[int]: 字典ID，样本中没有重复内容时返回None
+    """
+    texts = []
+    for table, column in COLUMNS:
+        if has_table(db, table):
+            rows = db.conn.execute(
+                f"SELECT {column} FROM {table} ORDER BY random() LIMIT ?", (samples,)
+            ).fetchall()
+            texts.extend(db._decode(row[0]) for row in rows)
+    random.shuffle(texts)
+    dictionary = train_dictionary(texts)
+    if not dictionary:
+        return None
+    return db.store_compression_dictionary(dictionary)
+
+
+def recompress(db: SQLiteDatabase, table: str, column: str, batch_size: int) -> Dict[str, int]:
+    """按数据库当前的压缩设置重写一列
+
+    Returns:
+        Dict[str, int]: 检查和重写的行数
+    """
+    result = {'rows': 0, 'rewritten': 0}
+    last_rowid = 0
+    while True:
+        rows = db.conn.execute(
+            f"SELECT rowid, {column} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (last_rowid, batch_size)
+        ).fetchall()
+        if not rows:
+            return result
+        updates = []
+        for rowid, value in rows:
+            encoded = db._encode(db._decode(value))
+            if encoded != value:
+                updates.append((encoded, rowid))
+        if updates:
+            with db.transaction():
+                db.conn.executemany(f"UPDATE {table} SET {column} = ? WHERE rowid = ?", updates)
+        result['rows'] += len(rows)
+        result['rewritten'] += len(updates)
+        last_rowid = rows[-1][0]
+
+
+def migrate(path: str, compression: Optional[TextCompressor], train_samples: int,
+            batch_size: int, vacuum: bool) -> None:
+    """迁移一个数据库文件并打印结果"""
+    conn = sqlite3.connect(path)
+    try:
+        is_catalog = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'roles'").fetchone() is not None
+    finally:
+        conn.close()
+    # 会话分片库不创建目录表；每个文件加载自己的预设字典
+    db = (SQLiteDatabase if is_catalog else _SessionShard)(path, compression=copy.copy(compression))
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.connect()
+    try:
+        before = used_bytes(db)
+        if train_samples:
+            dict_id = train(db, train_samples)
+            print(f"{path}: " + (f"已保存预设字典 {dict_id}" if dict_id is not None else "样本中没有重复内容，不使用字典"))
+        for table, column in COLUMNS:
+            if has_table(db, table):
+                result = recompress(db, table, column, batch_size)
+                print(f"{path}: {table}.{column} 检查 {result['rows']} 行，重写 {result['rewritten']} 行")
+        after = used_bytes(db)
+        if vacuum:
+            db.conn.execute("VACUUM")
+        print(f"{path}: 已用空间 {before / 1024:,.0f} KiB -> {after / 1024:,.0f} KiB")
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.disconnect()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="按新的压缩设置重写消息内容和模板内容")
+    parser.add_argument("paths", nargs="+", help="数据库文件（主库和各会话分片）")
+    parser.add_argument("--codec", default="zlib", help="zlib、lzma、zlib+dict（可带\":级别\"）或none")
+    parser.add_argument("--threshold", type=int, default=1024, help="达到该字节数的值才压缩")
+    parser.add_argument("--train-dictionary", action="store_true", help="先从已有数据训练预设字典（zlib+dict）")
+    parser.add_argument("--samples", type=int, default=2000, help="训练字典时每张表抽取的样本数")
+    parser.add_argument("--batch-size", type=int, default=500, help="每个事务重写的行数")
+    parser.add_argument("--vacuum", action="store_true", help="完成后执行VACUUM收缩文件（期间持有写锁）")
+    args = parser.parse_args()
+
+    compression = None if args.codec == "none" else TextCompressor.parse(args.codec, args.threshold)
+    if args.train_dictionary and not (compression and compression.use_dictionary):
+        parser.error("--train-dictionary需要--codec zlib+dict")
+    for path in args.paths:
+        if not Path(path).exists():
+            parser.error(f"数据库文件不存在: {path}")
+        try:
+            migrate(path, compression, args.samples if args.train_dictionary else 0,
+                    args.batch_size, args.vacuum)
+        except sqlite3.Error as e:
+            print(f"{path}: 迁移失败: {e}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
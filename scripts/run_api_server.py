@@ -7,23 +7,15 @@ LLM角色管理API服务启动脚本
 该脚本启动LLM角色管理API服务，支持Swagger UI进行API交互
 """
 
+import argparse
 import os
 import sys
-import uvicorn
 from pathlib import Path
 
 # 添加项目根目录到Python路径
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-# 检查yaml库是否已安装
-try:
-    import yaml
-except ImportError:
-    print("需要安装pyyaml库以支持OpenAPI文档加载")
-    print("请运行: pip install pyyaml")
-    sys.exit(1)
-
 # 确保api_docs目录存在
 api_docs_dir = project_root / "api_docs"
 api_docs_dir.mkdir(parents=True, exist_ok=True)
@@ -34,35 +26,79 @@ if not api_docs_path.exists():
     print(f"警告: API文档文件不存在: {api_docs_path}")
     print("API将使用FastAPI自动生成的OpenAPI模式")
 
+# 预编译的openapi.json缺失或过期时需要用yaml重新生成（见scripts/build_openapi.py）
+from src.llm_roles.web.openapi import is_stale
+if api_docs_path.exists() and is_stale():
+    try:
+        import yaml
+    except ImportError:
+        print("需要安装pyyaml库以支持OpenAPI文档加载")
+        print("请运行: pip install pyyaml")
+        sys.exit(1)
+
 # 确保数据库目录存在
 db_dir = project_root / "resource" / "db"
 db_dir.mkdir(parents=True, exist_ok=True)
 
-# 检查数据库文件是否存在
-db_path = db_dir / "llm_roles.db"
+# 检查数据库文件是否存在（可通过环境变量LLM_ROLES_DB_PATH指定）
+db_path = Path(os.environ.get("LLM_ROLES_DB_PATH", db_dir / "llm_roles.db"))
 if not db_path.exists():
     print("数据库文件不存在，请先运行初始化脚本:")
     print("python src/llm_roles/database/scripts/init_db.py")
     sys.exit(1)
 
+def parse_pragma(value: str):
+    """解析命令行中的 名称=值 形式的PRAGMA设置"""
+    name, sep, setting = value.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"PRAGMA设置应为 名称=值: {value}")
+    return name.strip(), setting.strip()
+
+
 def main():
     """启动API服务器"""
+    parser = argparse.ArgumentParser(description="LLM角色管理API服务")
+    parser.add_argument("--prod", action="store_true",
+                        help="生产模式：多工作进程、不自动重载，默认启用WAL等SQLite设置")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数，生产模式默认为CPU核数")
+    parser.add_argument("--preload", action="store_true",
+                        help="启动工作进程前先在主进程中加载应用，工作进程预热后再接收请求")
+    parser.add_argument("--keepalive", type=int, default=5, help="空闲keep-alive连接的保持时间（秒）")
+    parser.add_argument("--backlog", type=int, default=2048, help="监听队列长度")
+    parser.add_argument("--graceful-timeout", type=int, default=30,
+                        help="关闭时等待进行中请求完成的最长时间（秒）")
+    parser.add_argument("--threadpool-size", type=int, default=None,
+                        help="每个工作进程处理同步请求的线程数")
+    parser.add_argument("--pragma", type=parse_pragma, action="append", default=[],
+                        metavar="NAME=VALUE", help="每个数据库连接执行的SQLite PRAGMA，可重复指定")
+    args = parser.parse_args()
+
+    from src.llm_roles.web.server import serve
+
     print("=" * 60)
-    print("LLM角色管理API服务")
+    print("LLM角色管理API服务" + ("（生产模式）" if args.prod else "（开发模式）"))
     print("=" * 60)
-    print(f"* 访问Swagger UI文档: http://localhost:8000/docs")
-    print(f"* 访问ReDoc文档: http://localhost:8000/redoc")
-    print(f"* OpenAPI JSON: http://localhost:8000/openapi.json")
-    print(f"* 健康检查: http://localhost:8000/health")
+    print(f"* 访问Swagger UI文档: http://localhost:{args.port}/docs")
+    print(f"* 访问ReDoc文档: http://localhost:{args.port}/redoc")
+    print(f"* OpenAPI JSON: http://localhost:{args.port}/openapi.json")
+    print(f"* 健康检查: http://localhost:{args.port}/health")
     print("=" * 60)
     
     # 启动服务器
-    uvicorn.run(
-        "src.llm_roles.web.api_server:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True
+    serve(
+        production=args.prod,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        preload=args.preload,
+        keepalive=args.keepalive,
+        backlog=args.backlog,
+        graceful_timeout=args.graceful_timeout,
+        threadpool_size=args.threadpool_size,
+        pragmas=dict(args.pragma)
     )
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -4,5 +4,8 @@
 
 from .role_api import RoleAPI
 from .prompt_api import PromptAPI
+from .catalog_api import CatalogAPI
+from .session_api import SessionAPI
+from .batch_api import BatchAPI
 
-__all__ = ['RoleAPI', 'PromptAPI'] 
\ No newline at end of file
+__all__ = ['RoleAPI', 'PromptAPI', 'CatalogAPI', 'SessionAPI', 'BatchAPI'] 
\ No newline at end of file
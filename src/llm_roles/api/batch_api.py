@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from typing import Any, Callable, Dict, List
+from http import HTTPStatus
+
+from ..database.base import DatabaseBackend
+from .prompt_api import PromptAPI
+from .role_api import RoleAPI
+
+# 批量执行模式：atomic 全部成功才提交；continue 跳过失败的操作，其余照常提交
+BATCH_MODES = ('atomic', 'continue')
+
+# 不写入数据的操作，只读模式下只允许这些操作
+READ_OPERATIONS = ('get_role', 'get_template')
+
+
+class _OperationFailed(Exception):
+    """操作返回失败结果，用于触发保存点回滚"""
+
+
+class BatchAPI:
+    """批量操作API，在一个数据库事务中按顺序执行多个角色和提示词操作"""
+
+    def __init__(self, role_api: RoleAPI, prompt_api: PromptAPI, db_backend: DatabaseBackend,
+                 read_only: bool = False):
+        """初始化批量操作API
+
+        Args:
+            role_api: 角色API
+            prompt_api: 提示词API
+            db_backend: 数据库后端，提供事务和保存点
+            read_only: 是否拒绝包含写操作的批量请求（memory后端的写入不持久化）
+        """
+        self.db = db_backend
+        self.read_only = read_only
+        self.operations: Dict[str, Callable[..., Dict[str, Any]]] = {
+            'create_role': role_api.create_role,
+            'get_role': role_api.get_role,
+            'update_role': role_api.update_role,
+            'delete_role': role_api.delete_role,
+            'rollback_role': role_api.rollback_role,
+            'create_template': prompt_api.create_template,
+            'get_template': prompt_api.get_template,
+            'update_template': prompt_api.update_template,
+            'delete_template': prompt_api.delete_template,
+            'set_role_default_template': prompt_api.set_role_default_template,
+            'remove_role_default_template': prompt_api.remove_role_default_template,
+        }
+
+    def execute(self, operations: List[Dict[str, Any]], mode: str = 'atomic') -> Dict[str, Any]:
+        """批量执行操作API
+
+        每个操作形如 {"op": "create_role", "args": {"role_data": {...}}}，args 按对应
+        API方法的参数名传入。参数值可以写成 {"$ref": "0.data.id"}，引用前面第0个操作
+        结果中的字段（如新建角色的ID）。
+
+        Args:
+            operations: 按顺序执行的操作列表
+            mode: 'atomic' 任一操作失败则全部回滚；'continue' 只回滚失败的操作
+
+        Returns:
+            Dict[str, Any]: 包含每个操作结果的响应
+        """
+        if mode not in BATCH_MODES:
+            return {
+                'status': HTTPStatus.BAD_REQUEST,
+                'message': f'不支持的批量执行模式: {mode}',
+                'success': False
+            }
+        for index, operation in enumerate(operations):
+            if operation.get('op') not in self.operations:
+                return {
+                    'status': HTTPStatus.BAD_REQUEST,
+                    'message': f'第{index}个操作不受支持: {operation.get("op")}',
+                    'success': False
+                }
+            if self.read_only and operation['op'] not in READ_OPERATIONS:
+                return {
+                    'status': HTTPStatus.METHOD_NOT_ALLOWED,
+                    'message': f'第{index}个操作会写入数据，当前为只读模式: {operation["op"]}',
+                    'success': False
+                }
+
+        results: List[Dict[str, Any]] = []
+        failed_index = None
+        try:
+            with self.db.transaction():
+                for index, operation in enumerate(operations):
+                    result = self._run(index, operation, results, mode)
+                    results.append(result)
+                    if not result['success'] and mode == 'atomic':
+                        failed_index = index
+                        raise _OperationFailed()
+        except _OperationFailed:
+            pass
+        except Exception as e:
+            return {
+                'status': HTTPStatus.INTERNAL_SERVER_ERROR,
+                'message': f'批量操作失败，已全部回滚: {str(e)}',
+                'success': False
+            }
+
+        # atomic模式下失败之后的操作不会执行
+        for index in range(len(results), len(operations)):
+            results.append({
+                'index': index,
+                'op': operations[index]['op'],
+                'status': HTTPStatus.FAILED_DEPENDENCY,
+                'message': '未执行：前面的操作失败',
+                'success': False,
+                'data': None
+            })
+
+        succeeded = sum(1 for r in results if r['success'])
+        data = {
+            'mode': mode,
+            'committed': failed_index is None,
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'results': results
+        }
+        if failed_index is not None:
+            return {
+                'status': results[failed_index]['status'],
+                'message': f'第{failed_index}个操作失败，批量操作已全部回滚',
+                'success': False,
+                'data': data
+            }
+        return {
+            'status': HTTPStatus.OK,
+            'message': '批量操作执行完成',
+            'success': True,
+            'data': data
+        }
+
+    def _run(self, index: int, operation: Dict[str, Any], results: List[Dict[str, Any]],
+             mode: str) -> Dict[str, Any]:
+        """执行单个操作，continue模式下失败的操作回滚到自己的保存点
+
+        Args:
+            index: 操作序号
+            operation: 操作定义
+            results: 前面操作的结果，用于解析引用
+            mode: 批量执行模式
+
+        Returns:
+            Dict[str, Any]: 单个操作的结果
+        """
+        name = operation['op']
+        outcome: Dict[str, Any] = {}
+        try:
+            with self.db.savepoint():
+                args = self._resolve(operation.get('args') or {}, results)
+                outcome = self.operations[name](**args)
+                if not outcome.get('success'):
+                    raise _OperationFailed()
+        except _OperationFailed:
+            pass
+        except (TypeError, ValueError, LookupError) as e:
+            outcome = {
+                'status': HTTPStatus.BAD_REQUEST,
+                'message': f'操作参数无效: {str(e)}',
+                'success': False
+            }
+
+        return {
+            'index': index,
+            'op': name,
+            'status': outcome.get('status'),
+            'message': outcome.get('message'),
+            'success': bool(outcome.get('success')),
+            'data': outcome.get('data')
+        }
+
+    def _resolve(self, value: Any, results: List[Dict[str, Any]]) -> Any:
+        """把参数中的 {"$ref": "序号.字段路径"} 替换为前面操作结果中的值
+
+        Args:
+            value: 参数值
+            results: 前面操作的结果
+
+        Returns:
+            Any: 解析后的参数值
+
+        Raises:
+            LookupError: 引用的操作不存在、失败或字段不存在
+        """
+        if isinstance(value, dict):
+            if set(value) == {'$ref'}:
+                return self._lookup(value['$ref'], results)
+            return {key: self._resolve(item, results) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._resolve(item, results) for item in value]
+        return value
+
+    @staticmethod
+    def _lookup(ref: str, results: List[Dict[str, Any]]) -> Any:
+        """按 "序号.字段路径" 读取前面操作的结果"""
+        index, _, path = str(ref).partition('.')
+        if not index.isdigit() or int(index) >= len(results):
+            raise LookupError(f'引用了不存在或尚未执行的操作: {ref}')
+        current: Any = results[int(index)]
+        if not current['success']:
+            raise LookupError(f'引用了失败的操作: {ref}')
+        for key in path.split('.') if path else []:
+            if isinstance(current, list) and key.isdigit() and int(key) < len(current):
+                current = current[int(key)]
+            elif isinstance(current, dict) and key in current:
+                current = current[key]
+            else:
+                raise LookupError(f'引用的字段不存在: {ref}')
+        return current
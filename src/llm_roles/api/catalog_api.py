@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import zlib
+from typing import Dict, Iterable, Iterator, Any
+from http import HTTPStatus
+
+from ..services.catalog_service import CatalogService
+
+
+class CatalogAPI:
+    """目录导入导出API"""
+    
+    def __init__(self, catalog_service: CatalogService):
+        """初始化目录API
+        
+        Args:
+            catalog_service: 目录导入导出服务
+        """
+        self.service = catalog_service
+        
+    def export_catalog(self, compress: bool = False) -> Iterator[bytes]:
+        """流式导出目录API
+        
+        Args:
+            compress: 是否输出gzip压缩流
+            
+        Returns:
+            Iterator[bytes]: JSONL字节流（可能经过gzip压缩）
+        """
+        lines = (line.encode('utf-8') for line in self.service.export_lines())
+        if not compress:
+            return lines
+        return self._gzip_stream(lines)
+    
+    @staticmethod
+    def _gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """将字节流增量压缩为gzip格式"""
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    
+    def import_catalog(self, lines: Iterable[str], chunk_size: int = 1000, skip: int = 0) -> Dict[str, Any]:
+        """导入目录API
+        
+        Args:
+            lines: JSONL文本行
+            chunk_size: 每个事务包含的记录数
+            skip: 跳过的前置行数（断点续传）
+            
+        Returns:
+            Dict[str, Any]: 包含导入统计的响应；失败时data.lines为已提交的行数，可作为续传的skip
+        """
+        committed = {'lines': skip}
+        
+        def checkpoint(line_no: int) -> None:
+            committed['lines'] = line_no
+            
+        try:
+            stats = self.service.import_lines(
+                lines, chunk_size=chunk_size, skip=skip, on_checkpoint=checkpoint
+            )
+            
+            return {
+                'status': HTTPStatus.OK,
+                'message': '目录导入成功',
+                'success': True,
+                'data': stats
+            }
+        except ValueError as e:
+            return {
+                'status': HTTPStatus.BAD_REQUEST,
+                'message': f'目录导入失败: {str(e)}',
+                'success': False,
+                'data': committed
+            }
+        except Exception as e:
+            return {
+                'status': HTTPStatus.INTERNAL_SERVER_ERROR,
+                'message': f'目录导入失败: {str(e)}',
+                'success': False,
+                'data': committed
+            }
@@ -221,4 +221,106 @@ class RoleAPI:
                 'status': HTTPStatus.INTERNAL_SERVER_ERROR,
                 'message': f'搜索角色失败: {str(e)}',
                 'success': False
-            } 
\ No newline at end of file
+            }
+    
+    def list_role_versions(self, role_id: str, limit: int = 100, offset: int = 0) -> Dict[str, Any]:
+        """列出角色历史版本API
+        
+        Args:
+            role_id: 角色ID
+            limit: 返回的最大版本数量
+            offset: 分页偏移量
+            
+        Returns:
+            Dict[str, Any]: 包含版本列表的响应
+        """
+        try:
+            versions = self.manager.list_role_versions(role_id, limit=limit, offset=offset)
+            
+            return {
+                'status': HTTPStatus.OK,
+                'message': '获取角色版本列表成功',
+                'success': True,
+                'data': {
+                    'versions': versions,
+                    'count': len(versions),
+                    'role_id': role_id,
+                    'limit': limit,
+                    'offset': offset
+                }
+            }
+        except Exception as e:
+            return {
+                'status': HTTPStatus.INTERNAL_SERVER_ERROR,
+                'message': f'获取角色版本列表失败: {str(e)}',
+                'success': False
+            }
+    
+    def get_role_version(self, role_id: str, version: int) -> Dict[str, Any]:
+        """获取角色历史版本API
+        
+        Args:
+            role_id: 角色ID
+            version: 版本号
+            
+        Returns:
+            Dict[str, Any]: 包含该版本角色数据的响应
+        """
+        try:
+            role = self.manager.get_role_version(role_id, version)
+            
+            if not role:
+                return {
+                    'status': HTTPStatus.NOT_FOUND,
+                    'message': f'角色版本不存在: {role_id}@{version}',
+                    'success': False
+                }
+                
+            return {
+                'status': HTTPStatus.OK,
+                'message': '获取角色版本成功',
+                'success': True,
+                'data': {
+                    'version': version,
+                    'role': role.to_dict()
+                }
+            }
+        except Exception as e:
+            return {
+                'status': HTTPStatus.INTERNAL_SERVER_ERROR,
+                'message': f'获取角色版本失败: {str(e)}',
+                'success': False
+            }
+    
+    def rollback_role(self, role_id: str, version: int) -> Dict[str, Any]:
+        """回滚角色到历史版本API
+        
+        Args:
+            role_id: 角色ID
+            version: 目标版本号
+            
+        Returns:
+            Dict[str, Any]: 包含回滚结果的响应
+        """
+        try:
+            role = self.manager.rollback_role(role_id, version)
+            
+            if not role:
+                return {
+                    'status': HTTPStatus.NOT_FOUND,
+                    'message': f'角色或版本不存在: {role_id}@{version}',
+                    'success': False
+                }
+                
+            return {
+                'status': HTTPStatus.OK,
+                'message': '角色回滚成功',
+                'success': True,
+                'data': role.to_dict()
+            }
+        except Exception as e:
+            return {
+                'status': HTTPStatus.INTERNAL_SERVER_ERROR,
+                'message': f'角色回滚失败: {str(e)}',
+                'success': False
+            }
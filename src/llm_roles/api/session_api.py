@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from typing import Dict, List, Any, Optional
+from http import HTTPStatus
+
+from ..services.session_service import SessionService
+
+
+class SessionAPI:
+    """会话管理API"""
+    
+    def __init__(self, session_service: SessionService):
+        """初始化会话API
+        
+        Args:
+            session_service: 会话服务
+        """
+        self.service = session_service
+        
+    def create_session(self, role_id: str, user_id: Optional[str] = None,
+                       metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """创建会话API
+        
+        Args:
+            role_id: 角色ID
+            user_id: 用户ID
+            metadata: 会话元数据
+            
+        Returns:
+            Dict[str, Any]: 包含会话信息的响应
+        """
+        try:
+            session = self.service.create_session(role_id, user_id=user_id, metadata=metadata)
+            
+            return {
+                'status': HTTPStatus.CREATED,
+                'message': '会话创建成功',
+                'success': True,
+                'data': session
+            }
+        except ValueError as e:
+            return {
+                'status': HTTPStatus.NOT_FOUND,
+                'message': str(e),
+                'success': False
+            }
+        except Exception as e:
+            return {
+                'status': HTTPStatus.INTERNAL_SERVER_ERROR,
+                'message': f'会话创建失败: {str(e)}',
+                'success': False
+            }
+    
+    def get_session(self, session_id: str) -> Dict[str, Any]:
+        """获取会话API
+        
+        Args:
+            session_id: 会话ID
+            
+        Returns:
+            Dict[str, Any]: 包含会话信息的响应
+        """
+        try:
+            session = self.service.get_session(session_id)
+            
+            if not session:
+                return {
+                    'status': HTTPStatus.NOT_FOUND,
+                    'message': f'会话不存在: {session_id}',
+                    'success': False
+                }
+                
+            return {
+                'status': HTTPStatus.OK,
+                'message': '获取会话成功',
+                'success': True,
+                'data': session
+            }
+        except Exception as e:
+            return {
+                'status': HTTPStatus.INTERNAL_SERVER_ERROR,
+                'message': f'获取会话失败: {str(e)}',
+                'success': False
+            }
+    
+    def append_messages(self, session_id: str, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批量追加会话消息API
+        
+        Args:
+            session_id: 会话ID
+            messages: 消息列表，每条包含sender、content和可选的metadata
+            
+        Returns:
+            Dict[str, Any]: 包含写入消息ID和序号的响应
+        """
+        if not messages:
+            return {
+                'status': HTTPStatus.BAD_REQUEST,
+                'message': '消息列表不能为空',
+                'success': False
+            }
+            
+        try:
+            added = self.service.append_messages(session_id, messages)
+            
+            return {
+                'status': HTTPStatus.CREATED,
+                'message': '消息记录成功',
+                'success': True,
+                'data': {
+                    'messages': added,
+                    'count': len(added),
+                    'session_id': session_id
+                }
+            }
+        except ValueError as e:
+            status = HTTPStatus.NOT_FOUND if '会话不存在' in str(e) else HTTPStatus.BAD_REQUEST
+            return {
+                'status': status,
+                'message': str(e),
+                'success': False
+            }
+        except Exception as e:
+            return {
+                'status': HTTPStatus.INTERNAL_SERVER_ERROR,
+                'message': f'消息记录失败: {str(e)}',
+                'success': False
+            }
+    
+    def get_session_messages(self, session_id: str, limit: int = 100, before: Optional[int] = None,
+                             after: Optional[int] = None, order: str = 'asc') -> Dict[str, Any]:
+        """分页获取会话消息API
+        
+        Args:
+            session_id: 会话ID
+            limit: 返回的最大消息数量
+            before: 只返回序号小于该值的消息
+            after: 只返回序号大于该值的消息
+            order: 排序方向，'asc'或'desc'
+            
+        Returns:
+            Dict[str, Any]: 包含消息列表的响应；next_cursor为下一页游标
+                （asc时作为after，desc时作为before），没有更多数据时为None
+        """
+        if order not in ('asc', 'desc'):
+            return {
+                'status': HTTPStatus.BAD_REQUEST,
+                'message': f'无效的排序方向: {order}',
+                'success': False
+            }
+            
+        try:
+            messages = self.service.get_session_messages(
+                session_id, limit=limit, before=before, after=after, order=order
+            )
+            next_cursor = messages[-1]['sequence'] if len(messages) == limit else None
+            
+            return {
+                'status': HTTPStatus.OK,
+                'message': '获取会话消息成功',
+                'success': True,
+                'data': {
+                    'messages': messages,
+                    'count': len(messages),
+                    'session_id': session_id,
+                    'order': order,
+                    'next_cursor': next_cursor
+                }
+            }
+        except Exception as e:
+            return {
+                'status': HTTPStatus.INTERNAL_SERVER_ERROR,
+                'message': f'获取会话消息失败: {str(e)}',
+                'success': False
+            }
+    
+    def tail_session_messages(self, session_id: str, n: int = 20) -> Dict[str, Any]:
+        """获取会话最近消息API
+        
+        Args:
+            session_id: 会话ID
+            n: 消息数量
+            
+        Returns:
+            Dict[str, Any]: 包含最近消息（按时间正序）的响应
+        """
+        try:
+            messages = self.service.tail(session_id, n)
+            
+            return {
+                'status': HTTPStatus.OK,
+                'message': '获取会话最近消息成功',
+                'success': True,
+                'data': {
+                    'messages': messages,
+                    'count': len(messages),
+                    'session_id': session_id
+                }
+            }
+        except Exception as e:
+            return {
+                'status': HTTPStatus.INTERNAL_SERVER_ERROR,
+                'message': f'获取会话最近消息失败: {str(e)}',
+                'success': False
+            }
+    
+    def build_context(self, session_id: str, format: str = 'openai', max_messages: Optional[int] = None,
+                      max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """组装对话上下文API
+        
+        Args:
+            session_id: 会话ID
+            format: 输出格式(openai, anthropic)
+            max_messages: 最多包含的历史消息数
+            max_tokens: 估算token总预算
+            
+        Returns:
+            Dict[str, Any]: 包含可直接发送给模型的消息列表的响应
+        """
+        try:
+            context = self.service.build_context(
+                session_id, format=format, max_messages=max_messages, max_tokens=max_tokens
+            )
+            
+            return {
+                'status': HTTPStatus.OK,
+                'message': '对话上下文组装成功',
+                'success': True,
+                'data': context
+            }
+        except ValueError as e:
+            status = HTTPStatus.BAD_REQUEST if '不支持的上下文格式' in str(e) else HTTPStatus.NOT_FOUND
+            return {
+                'status': status,
+                'message': str(e),
+                'success': False
+            }
+        except Exception as e:
+            return {
+                'status': HTTPStatus.INTERNAL_SERVER_ERROR,
+                'message': f'对话上下文组装失败: {str(e)}',
+                'success': False
+            }
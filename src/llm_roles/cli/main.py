@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""llm-roles 命令行入口"""
+
+import contextlib
+import gzip
+import io
+import json
+import sys
+from pathlib import Path
+from typing import IO, Optional
+
+import click
+
+from ..database.sqlite import SQLiteDatabase
+from ..services.catalog_service import CatalogService
+
+
+def _open_input(path: str) -> IO[str]:
+    """打开JSONL输入，自动识别gzip压缩"""
+    raw = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    stream = io.BufferedReader(raw) if not hasattr(raw, 'peek') else raw
+    if stream.peek(2)[:2] == b'\x1f\x8b':
+        return io.TextIOWrapper(gzip.GzipFile(fileobj=stream), encoding='utf-8')
+    return io.TextIOWrapper(stream, encoding='utf-8')
+
+
+def _open_output(path: str, compress: bool) -> IO[str]:
+    """打开JSONL输出，按需使用gzip压缩"""
+    raw = sys.stdout.buffer if path == '-' else open(path, 'wb')
+    if compress:
+        return io.TextIOWrapper(gzip.GzipFile(fileobj=raw, mode='wb'), encoding='utf-8')
+    return io.TextIOWrapper(raw, encoding='utf-8')
+
+
+@click.group()
+@click.option('--db', 'db_path', default=None, help='数据库文件路径，默认使用resource/db/llm_roles.db')
+@click.pass_context
+def main(ctx: click.Context, db_path: Optional[str]) -> None:
+    """LLM角色管理命令行工具"""
+    ctx.obj = SQLiteDatabase(db_path)
+
+
+@main.command('export')
+@click.argument('output', default='-')
+@click.option('--gzip', 'compress', is_flag=True, default=None,
+              help='使用gzip压缩输出（输出文件名以.gz结尾时默认启用）')
+@click.option('--batch-size', default=1000, show_default=True, help='每次从数据库读取的记录数')
+@click.pass_obj
+def export_catalog(db: SQLiteDatabase, output: str, compress: Optional[bool], batch_size: int) -> None:
+    """将角色、模板和默认模板关联导出为JSONL"""
+    if compress is None:
+        compress = output.endswith('.gz')
+
+    service = CatalogService(db)
+    count = 0
+    with _open_output(output, compress) as f:
+        # 数据库日志输出到stderr，避免混入导出到stdout的数据
+        with contextlib.redirect_stdout(sys.stderr):
+            for line in service.export_lines(batch_size=batch_size):
+                f.write(line)
+                count += 1
+            db.disconnect()
+
+    click.echo(f"已导出 {count} 条记录", err=True)
+
+
+@main.command('import')
+@click.argument('input_path', metavar='INPUT', default='-')
+@click.option('--chunk-size', default=1000, show_default=True, help='每个事务包含的记录数')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default=None,
+              help='断点文件路径；存在时从记录的位置继续导入，完成后删除')
+@click.pass_obj
+def import_catalog(db: SQLiteDatabase, input_path: str, chunk_size: int,
+                   checkpoint: Optional[str]) -> None:
+    """从JSONL（可gzip压缩）导入目录，已存在的记录会被覆盖"""
+    skip = 0
+    checkpoint_path = Path(checkpoint) if checkpoint else None
+    if checkpoint_path and checkpoint_path.exists():
+        state = json.loads(checkpoint_path.read_text(encoding='utf-8'))
+        if state.get('input') == input_path:
+            skip = int(state.get('line', 0))
+            click.echo(f"从第 {skip + 1} 行继续导入", err=True)
+
+    def save_checkpoint(line_no: int) -> None:
+        if checkpoint_path:
+            tmp = checkpoint_path.with_suffix(checkpoint_path.suffix + '.tmp')
+            tmp.write_text(json.dumps({'input': input_path, 'line': line_no}), encoding='utf-8')
+            tmp.replace(checkpoint_path)
+
+    service = CatalogService(db)
+    try:
+        with _open_input(input_path) as f:
+            stats = service.import_lines(
+                f, chunk_size=chunk_size, skip=skip, on_checkpoint=save_checkpoint
+            )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        db.disconnect()
+
+    if checkpoint_path and checkpoint_path.exists():
+        checkpoint_path.unlink()
+
+    click.echo(
+        f"导入完成: 角色 {stats['roles']}，模板 {stats['templates']}，"
+        f"默认模板关联 {stats['role_default_templates']}",
+        err=True
+    )
+
+
+if __name__ == '__main__':
+    main()
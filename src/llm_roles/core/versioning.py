@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""角色版本差量工具
+
+角色的每次更新记录为相对上一版本的差量，每隔 SNAPSHOT_INTERVAL 个版本
+保存一次完整快照。重建任意版本时，只需从最近的快照开始依次应用不超过
+SNAPSHOT_INTERVAL - 1 个差量。
+"""
+
+from typing import Any, Dict, List, Optional
+
+# 快照间隔：版本 1, 1 + N, 1 + 2N ... 为完整快照
+SNAPSHOT_INTERVAL = 10
+
+# 不纳入版本状态的字段（时间戳每次序列化都会变化，ID 不会变化）
+_EXCLUDED_FIELDS = ('id', 'created_at', 'updated_at')
+
+
+def is_snapshot_version(version: int) -> bool:
+    """判断指定版本号是否应保存为完整快照
+
+    Args:
+        version: 版本号，从1开始
+
+    Returns:
+        bool: 是否为快照版本
+    """
+    return (version - 1) % SNAPSHOT_INTERVAL == 0
+
+
+def role_state(role_data: Dict[str, Any]) -> Dict[str, Any]:
+    """提取角色数据中参与版本管理的字段
+
+    Args:
+        role_data: 角色数据字典（基础字段与属性已合并）
+
+    Returns:
+        Dict[str, Any]: 角色版本状态
+    """
+    return {k: v for k, v in role_data.items() if k not in _EXCLUDED_FIELDS}
+
+
+def diff_role_state(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """计算两个角色状态之间的差量
+
+    Args:
+        old: 旧版本状态
+        new: 新版本状态
+
+    Returns:
+        Dict[str, Any]: 差量，格式为 {"set": {...}, "unset": [...]}
+    """
+    changed = {k: v for k, v in new.items() if k not in old or old[k] != v}
+    removed = sorted(k for k in old if k not in new)
+    return {'set': changed, 'unset': removed}
+
+
+def apply_role_delta(state: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """在角色状态上应用差量
+
+    Args:
+        state: 基础状态
+        delta: 由 diff_role_state 生成的差量
+
+    Returns:
+        Dict[str, Any]: 应用差量后的新状态
+    """
+    result = dict(state)
+    result.update(delta.get('set', {}))
+    for key in delta.get('unset', []):
+        result.pop(key, None)
+    return result
+
+
+def rebuild_role_state(entries: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """从快照及其后续差量重建角色状态
+
+    Args:
+        entries: 按版本号升序排列的版本记录，第一条必须是快照，
+            每条包含 is_snapshot 和 payload 字段
+
+    Returns:
+        Optional[Dict[str, Any]]: 重建后的状态，如果记录为空或不以快照开头则返回None
+    """
+    if not entries or not entries[0]['is_snapshot']:
+        return None
+
+    state: Dict[str, Any] = {}
+    for entry in entries:
+        if entry['is_snapshot']:
+            state = dict(entry['payload'])
+        else:
+            state = apply_role_delta(state, entry['payload'])
+    return state
+
+
+def changed_fields(delta: Dict[str, Any]) -> List[str]:
+    """列出差量涉及的字段名
+
+    Args:
+        delta: 差量
+
+    Returns:
+        List[str]: 排序后的字段名列表
+    """
+    return sorted(set(delta.get('set', {})) | set(delta.get('unset', [])))
@@ -0,0 +1,445 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""不活跃会话的冷存储归档
+
+messages表只增不减，早已结束的会话占据热库的空间和页缓存。归档任务把
+last_activity早于阈值的会话连同消息移到单独的归档库：
+
+- 每个会话在归档库中占一行，消息序列化后整体zlib压缩，以会话ID为主键查找。
+- 热库按小批删除已归档的会话，每批一个短事务；删除前会话又有新消息
+  （last_activity变化）的不删除，归档库中的副本随之丢弃。
+- 热库启用了auto_vacuum=INCREMENTAL时，每批之后执行incremental_vacuum归还空闲页；
+  否则空闲页留在数据库内供后续写入复用，文件不再增长。
+
+ArchivedDatabase包装热库：热库中找不到会话或消息时回退到归档库，
+向已归档的会话追加消息时先把它恢复到热库。
+"""
+
+import functools
+import json
+import sqlite3
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..utils.metrics import Counter
+from .base import DatabaseBackend
+from .replica import ReplicatedDatabase
+from .sharding import ShardedDatabase
+from .sqlite import SQLiteDatabase, _safe_json_loads
+
+ARCHIVE_READS = Counter(
+    'llm_roles_archive_reads_total', '热库未命中后从归档库读取会话的次数', ['result']
+)
+ARCHIVE_SESSIONS = Counter(
+    'llm_roles_archive_sessions_total', '归档任务处理的会话数', ['result']
+)
+
+_ARCHIVE_SQL = """
+CREATE TABLE IF NOT EXISTS archived_sessions (
+    id TEXT PRIMARY KEY,
+    role_id TEXT NOT NULL,
+    user_id TEXT,
+    created_at TIMESTAMP NOT NULL,
+    last_activity TIMESTAMP NOT NULL,
+    metadata JSON,
+    message_count INTEGER NOT NULL,
+    messages BLOB NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_archived_sessions_role ON archived_sessions (role_id);
+"""
+
+# 会话和消息行的列，归档和恢复时按这个顺序读写
+_SESSION_COLUMNS = "id, role_id, user_id, created_at, last_activity, metadata"
+_MESSAGE_COLUMNS = "id, sender, content, timestamp, metadata, sequence"
+
+
+class SessionArchive(SQLiteDatabase):
+    """归档库：每个会话一行，消息整体压缩"""
+
+    def _ensure_schema(self) -> None:
+        self.conn.executescript(_ARCHIVE_SQL)
+
+    def put_sessions(self, sessions: List[Tuple[tuple, List[tuple]]]) -> None:
+        """写入（或覆盖）一批会话
+
+        Args:
+            sessions: (会话行, 消息行列表) 列表，列顺序同_SESSION_COLUMNS和_MESSAGE_COLUMNS
+        """
+        if not self.conn:
+            self.connect()
+        rows = [
+            (*session, len(messages),
+             zlib.compress(json.dumps([list(m) for m in messages], ensure_ascii=False).encode('utf-8')))
+            for session, messages in sessions
+        ]
+        with self.transaction():
+            self.conn.executemany(f"""
+                INSERT OR REPLACE INTO archived_sessions ({_SESSION_COLUMNS}, message_count, messages)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def load(self, session_id: str) -> Optional[Tuple[tuple, List[tuple]]]:
+        """读取已归档的会话
+
+        Args:
+            session_id: 会话ID
+
+        Returns:
+            Optional[Tuple[tuple, List[tuple]]]: (会话行, 按序号排列的消息行列表)，未归档时返回None
+        """
+        if not self.conn:
+            self.connect()
+        row = self.conn.execute(
+            f"SELECT {_SESSION_COLUMNS}, messages FROM archived_sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        messages = json.loads(zlib.decompress(row[6]).decode('utf-8'))
+        return tuple(row[:6]), [tuple(m) for m in messages]
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """读取已归档会话的信息，不解压消息"""
+        if not self.conn:
+            self.connect()
+        row = self.conn.execute(
+            f"SELECT {_SESSION_COLUMNS} FROM archived_sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'role_id': row[1],
+            'user_id': row[2],
+            'created_at': row[3],
+            'last_activity': row[4],
+            'metadata': _safe_json_loads(row[5], {})
+        }
+
+    def remove(self, session_ids: List[str]) -> None:
+        """删除已归档的会话"""
+        if not self.conn:
+            self.connect()
+        with self.transaction():
+            self.conn.executemany("DELETE FROM archived_sessions WHERE id = ?", [(i,) for i in session_ids])
+
+    def has_role_sessions(self, role_id: str) -> bool:
+        """是否有引用该角色的已归档会话"""
+        if not self.conn:
+            self.connect()
+        return self.conn.execute(
+            "SELECT 1 FROM archived_sessions WHERE role_id = ? LIMIT 1", (role_id,)
+        ).fetchone() is not None
+
+
+def session_stores(db: DatabaseBackend) -> List[SQLiteDatabase]:
+    """获取保存会话的SQLite库（分片时为各分片，副本时为主库）
+
+    Args:
+        db: 数据库后端
+
+    Returns:
+        List[SQLiteDatabase]: 保存会话的库
+
+    Raises:
+        ValueError: 后端不是SQLite
+    """
+    if isinstance(db, ShardedDatabase):
+        return list(db.shards)
+    if isinstance(db, ReplicatedDatabase):
+        return [db.primary]
+    if isinstance(db, SQLiteDatabase):
+        return [db]
+    raise ValueError(f"会话归档只支持SQLite后端: {type(db).__name__}")
+
+
+def archive_inactive_sessions(store: SQLiteDatabase, archive: SessionArchive, inactive_for: float,
+                              batch_size: int = 50, vacuum_pages: int = 1000) -> Dict[str, int]:
+    """把一个热库中不活跃的会话移到归档库
+
+    Args:
+        store: 保存会话的热库
+        archive: 归档库
+        inactive_for: 最后活动早于多少秒前的会话被归档
+        batch_size: 每个删除事务处理的会话数
+        vacuum_pages: 热库启用增量清理时每批之后最多归还的空闲页数
+
+    Returns:
+        Dict[str, int]: 归档的会话数、消息数、因有新活动而跳过的会话数和热库剩余空闲页数
+    """
+    if not store.conn:
+        store.connect()
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=inactive_for)).strftime('%Y-%m-%d %H:%M:%S')
+    session_ids = [row[0] for row in store.conn.execute(
+        "SELECT id FROM sessions WHERE last_activity < ? ORDER BY last_activity", (cutoff,)
+    )]
+    incremental = store.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    result = {'sessions': 0, 'messages': 0, 'skipped': 0, 'free_pages': 0}
+
+    for start in range(0, len(session_ids), batch_size):
+        batch = []
+        for session_id in session_ids[start:start + batch_size]:
+            session = store.conn.execute(
+                f"SELECT {_SESSION_COLUMNS} FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if session is None:
+                continue
+            messages = store.conn.execute(
+                f"SELECT {_MESSAGE_COLUMNS} FROM messages WHERE session_id = ? ORDER BY sequence",
+                (session_id,)
+            ).fetchall()
+            # 归档库整体压缩，单条消息以原文保存
+            batch.append((tuple(session), [(m[0], m[1], store._decode(m[2]), *m[3:]) for m in messages]))
+        if not batch:
+            continue
+        # 先写归档库再删热库，中途失败时会话仍在热库中（归档副本在下次归档时覆盖）
+        archive.put_sessions(batch)
+
+        skipped = []
+        with store.transaction():
+            for session, messages in batch:
+                # 读取之后又有新消息的会话不删除
+                store.conn.execute("""
+                    DELETE FROM messages WHERE session_id = ?
+                    AND EXISTS (SELECT 1 FROM sessions WHERE id = ? AND last_activity = ?)
+                """, (session[0], session[0], session[4]))
+                deleted = store.conn.execute(
+                    "DELETE FROM sessions WHERE id = ? AND last_activity = ?", (session[0], session[4])
+                ).rowcount
+                if deleted:
+                    result['sessions'] += 1
+                    result['messages'] += len(messages)
+                else:
+                    skipped.append(session[0])
+        if skipped:
+            archive.remove(skipped)
+            result['skipped'] += len(skipped)
+        if incremental:
+            # incremental_vacuum每步进一次只归还一页，executescript会执行到结束
+            store.conn.executescript(f"PRAGMA incremental_vacuum({int(vacuum_pages)});")
+
+    ARCHIVE_SESSIONS.labels('archived').inc(result['sessions'])
+    ARCHIVE_SESSIONS.labels('skipped').inc(result['skipped'])
+    result['free_pages'] = store.conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return result
+
+
+def _filter_messages(messages: List[Dict[str, Any]], limit: Optional[int], before: Optional[int],
+                     after: Optional[int], order: str) -> List[Dict[str, Any]]:
+    """按与get_session_messages相同的规则筛选已归档的消息"""
+    if before is not None:
+        messages = [m for m in messages if m['sequence'] < before]
+    if after is not None:
+        messages = [m for m in messages if m['sequence'] > after]
+    if order == 'desc':
+        messages.reverse()
+    return messages if limit is None else messages[:limit]
+
+
+def _delegate(name: str) -> Callable:
+    """直接交给热库的操作"""
+    @functools.wraps(getattr(DatabaseBackend, name))
+    def method(self, *args, **kwargs):
+        return getattr(self.db, name)(*args, **kwargs)
+    method.__isabstractmethod__ = False
+    return method
+
+
+class ArchivedDatabase(DatabaseBackend):
+    """热库加不活跃会话的归档库"""
+
+    def __init__(self, db: DatabaseBackend, archive_path: str):
+        """初始化
+
+        Args:
+            db: 热库（SQLite、只读快照副本或会话分片）
+            archive_path: 归档库文件路径
+        """
+        self.db = db
+        self.stores = session_stores(db)
+        self.archive = SessionArchive(archive_path)
+
+    @property
+    def db_path(self) -> Optional[str]:
+        """热库（目录库）文件路径"""
+        return getattr(self.db, 'db_path', None)
+
+    @property
+    def connection_count(self) -> int:
+        """热库和归档库打开的连接数"""
+        return self.db.connection_count + self.archive.connection_count
+
+    def connect(self) -> None:
+        """连接热库和归档库"""
+        self.db.connect()
+        self.archive.connect()
+
+    def disconnect(self) -> None:
+        """关闭热库和归档库的连接"""
+        self.archive.disconnect()
+        self.db.disconnect()
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disconnect()
+
+    def archive_inactive(self, inactive_for: float, batch_size: int = 50) -> Dict[str, int]:
+        """把所有热库中不活跃的会话移到归档库
+
+        Args:
+            inactive_for: 最后活动早于多少秒前的会话被归档
+            batch_size: 每个删除事务处理的会话数
+
+        Returns:
+            Dict[str, int]: 各热库结果的合计
+        """
+        total: Dict[str, int] = {}
+        for store in self.stores:
+            for key, value in archive_inactive_sessions(store, self.archive, inactive_for, batch_size).items():
+                total[key] = total.get(key, 0) + value
+        return total
+
+    def _store_for(self, session_id: str) -> SQLiteDatabase:
+        """会话所在的热库"""
+        if isinstance(self.db, ShardedDatabase):
+            return self.db.shard_for(session_id)
+        return self.stores[0]
+
+    def _restore(self, session_id: str) -> bool:
+        """把已归档的会话恢复到热库
+
+        Returns:
+            bool: 会话是否曾被归档
+        """
+        archived = self.archive.load(session_id)
+        if archived is None:
+            return False
+        session, messages = archived
+        store = self._store_for(session_id)
+        if not store.conn:
+            store.connect()
+        # 并发恢复同一个会话时后到的插入被忽略
+        with store.transaction():
+            store.conn.execute(
+                f"INSERT OR IGNORE INTO sessions ({_SESSION_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", session
+            )
+            store.conn.executemany(
+                f"INSERT OR IGNORE INTO messages ({_MESSAGE_COLUMNS}, session_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(*m, session_id) for m in messages]
+            )
+        self.archive.remove([session_id])
+        ARCHIVE_READS.labels('restored').inc()
+        return True
+
+    # =========== 事务 ===========
+
+    def transaction(self):
+        """在热库的事务中执行多个操作"""
+        return self.db.transaction()
+
+    def savepoint(self):
+        """在热库的外层事务中设置保存点"""
+        return self.db.savepoint()
+
+    # =========== 会话与消息 ===========
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """获取会话信息，热库中没有时查找归档库"""
+        session = self.db.get_session(session_id)
+        if session is None:
+            session = self.archive.get_session(session_id)
+            if session is not None:
+                ARCHIVE_READS.labels('session').inc()
+        return session
+
+    def get_session_messages(self, session_id: str, limit: Optional[int] = None,
+                             before: Optional[int] = None, after: Optional[int] = None,
+                             order: str = 'asc') -> List[Dict[str, Any]]:
+        """获取会话消息，热库中没有时从归档库解压读取"""
+        messages = self.db.get_session_messages(session_id, limit=limit, before=before, after=after, order=order)
+        if messages:
+            return messages
+        archived = self.archive.load(session_id)
+        if archived is None:
+            return messages
+        ARCHIVE_READS.labels('messages').inc()
+        return _filter_messages([self.archive._row_to_message(m) for m in archived[1]],
+                                limit, before, after, order)
+
+    def tail_session_messages(self, session_id: str, n: int) -> List[Dict[str, Any]]:
+        """获取会话最近的n条消息（按时间正序），热库中没有时读取归档库"""
+        messages = self.get_session_messages(session_id, limit=n, order='desc')
+        messages.reverse()
+        return messages
+
+    def add_message(self, session_id: str, sender: str, content: str,
+                    metadata: Optional[Dict[str, Any]] = None) -> str:
+        """添加消息，会话已归档时先恢复到热库"""
+        added = self.add_messages(session_id, [
+            {'sender': sender, 'content': content, 'metadata': metadata}
+        ])
+        return added[0]['id']
+
+    def add_messages(self, session_id: str, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量添加消息，会话已归档时先恢复到热库"""
+        try:
+            return self.db.add_messages(session_id, messages)
+        except ValueError:
+            if not self._restore(session_id):
+                raise
+        return self.db.add_messages(session_id, messages)
+
+    def delete_role(self, role_id: str) -> bool:
+        """删除角色，仍有会话（包括已归档的会话）引用时拒绝
+
+        Raises:
+            sqlite3.IntegrityError: 如果有会话引用该角色
+        """
+        if self.archive.has_role_sessions(role_id):
+            raise sqlite3.IntegrityError("FOREIGN KEY constraint failed")
+        return self.db.delete_role(role_id)
+
+    create_session = _delegate('create_session')
+
+    # =========== 目录 ===========
+
+    create_role = _delegate('create_role')
+    get_role = _delegate('get_role')
+    get_role_version_info = _delegate('get_role_version_info')
+    update_role = _delegate('update_role')
+    list_roles = _delegate('list_roles')
+    search_roles = _delegate('search_roles')
+    get_role_version = _delegate('get_role_version')
+    list_role_versions = _delegate('list_role_versions')
+    create_template = _delegate('create_template')
+    get_template = _delegate('get_template')
+    get_template_version_info = _delegate('get_template_version_info')
+    update_template = _delegate('update_template')
+    delete_template = _delegate('delete_template')
+    list_templates = _delegate('list_templates')
+    set_role_default_template = _delegate('set_role_default_template')
+    remove_role_default_template = _delegate('remove_role_default_template')
+    get_role_default_templates = _delegate('get_role_default_templates')
+    get_role_default_template_version_info = _delegate('get_role_default_template_version_info')
+    export_roles = _delegate('export_roles')
+    export_templates = _delegate('export_templates')
+    export_role_default_templates = _delegate('export_role_default_templates')
+    upsert_catalog_records = _delegate('upsert_catalog_records')
+
+    # =========== 变更日志 ===========
+
+    def get_change_log_bounds(self) -> Tuple[int, int]:
+        """获取热库变更日志中最早和最新的序号"""
+        return self.db.get_change_log_bounds()
+
+    def get_changes(self, after: int, limit: int = 1000) -> List[Dict[str, Any]]:
+        """按序号读取热库的变更日志"""
+        return self.db.get_changes(after, limit)
+
+    def prune_changes(self, keep: int) -> int:
+        """删除热库中较早的变更日志"""
+        return self.db.prune_changes(keep)
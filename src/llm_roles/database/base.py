@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional
+from typing import Any, ContextManager, Dict, Iterator, List, Optional, Tuple
 
 class DatabaseBackend(ABC):
     """数据库后端抽象基类"""
@@ -17,6 +17,16 @@ class DatabaseBackend(ABC):
         """关闭数据库连接"""
         pass
     
+    @abstractmethod
+    def transaction(self) -> ContextManager[None]:
+        """在一个事务中执行多个操作，全部成功才提交"""
+        pass
+    
+    @abstractmethod
+    def savepoint(self) -> ContextManager[None]:
+        """在事务中设置保存点，代码块失败时只回滚到保存点"""
+        pass
+    
     @abstractmethod
     def create_role(self, role_data: Dict[str, Any]) -> str:
         """创建角色"""
@@ -27,6 +37,11 @@ class DatabaseBackend(ABC):
         """获取角色"""
         pass
     
+    @abstractmethod
+    def get_role_version_info(self, role_id: str) -> Optional[Dict[str, Any]]:
+        """获取角色的版本信息（updated_at和最新版本号），不读取属性"""
+        pass
+    
     @abstractmethod
     def update_role(self, role_id: str, role_data: Dict[str, Any]) -> bool:
         """更新角色"""
@@ -47,6 +62,18 @@ class DatabaseBackend(ABC):
         """搜索角色"""
         pass
     
+    # 角色版本相关方法
+    @abstractmethod
+    def get_role_version(self, role_id: str, version: int) -> Optional[Dict[str, Any]]:
+        """获取角色历史版本"""
+        pass
+    
+    @abstractmethod
+    def list_role_versions(self, role_id: str, limit: int = 100,
+                           offset: int = 0) -> List[Dict[str, Any]]:
+        """列出角色历史版本"""
+        pass
+    
     # 会话相关方法
     @abstractmethod
     def create_session(self, role_id: str, user_id: Optional[str] = None,
@@ -61,6 +88,96 @@ class DatabaseBackend(ABC):
         pass
     
     @abstractmethod
-    def get_session_messages(self, session_id: str) -> List[Dict[str, Any]]:
-        """获取会话消息"""
-        pass 
\ No newline at end of file
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """获取会话"""
+        pass
+    
+    @abstractmethod
+    def add_messages(self, session_id: str, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """在一个事务中批量添加消息"""
+        pass
+    
+    @abstractmethod
+    def get_session_messages(self, session_id: str, limit: Optional[int] = None,
+                             before: Optional[int] = None, after: Optional[int] = None,
+                             order: str = 'asc') -> List[Dict[str, Any]]:
+        """获取会话消息（按会话内序号分页）"""
+        pass
+    
+    @abstractmethod
+    def tail_session_messages(self, session_id: str, n: int) -> List[Dict[str, Any]]:
+        """获取会话最近的n条消息"""
+        pass
+    
+    # 提示词模板相关方法
+    @abstractmethod
+    def create_template(self, template_data: Dict[str, Any]) -> str:
+        """创建提示词模板"""
+        pass
+    
+    @abstractmethod
+    def get_template(self, template_id: str) -> Optional[Dict[str, Any]]:
+        """获取提示词模板"""
+        pass
+    
+    @abstractmethod
+    def get_template_version_info(self, template_id: str) -> Optional[Dict[str, Any]]:
+        """获取模板的版本信息（updated_at），不读取模板内容"""
+        pass
+    
+    @abstractmethod
+    def update_template(self, template_id: str, template_data: Dict[str, Any]) -> bool:
+        """更新提示词模板"""
+        pass
+    
+    @abstractmethod
+    def delete_template(self, template_id: str) -> bool:
+        """删除提示词模板及其默认模板关联"""
+        pass
+    
+    @abstractmethod
+    def list_templates(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """列出提示词模板"""
+        pass
+    
+    # 角色默认模板相关方法
+    @abstractmethod
+    def set_role_default_template(self, role_id: str, template_id: str) -> bool:
+        """设置角色的默认模板"""
+        pass
+    
+    @abstractmethod
+    def remove_role_default_template(self, role_id: str, template_id: str) -> bool:
+        """移除角色的默认模板"""
+        pass
+    
+    @abstractmethod
+    def get_role_default_templates(self, role_id: str) -> List[Dict[str, Any]]:
+        """获取角色的默认模板列表（按名称排序）"""
+        pass
+    
+    @abstractmethod
+    def get_role_default_template_version_info(self, role_id: str) -> Optional[Dict[str, Any]]:
+        """获取角色第一个默认模板（按名称排序）的ID和updated_at"""
+        pass
+    
+    # 目录导入导出相关方法
+    @abstractmethod
+    def export_roles(self, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """流式导出角色原始记录"""
+        pass
+    
+    @abstractmethod
+    def export_templates(self, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """流式导出提示词模板原始记录"""
+        pass
+    
+    @abstractmethod
+    def export_role_default_templates(self, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """流式导出角色默认模板关联"""
+        pass
+    
+    @abstractmethod
+    def upsert_catalog_records(self, records: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, int]:
+        """在一个事务中批量写入目录记录"""
+        pass
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""大文本字段的透明压缩
+
+messages.content和prompt_templates.template_content超过阈值时以BLOB存储压缩后的内容，
+未超过阈值或压缩后没有变小的值仍以TEXT存储。读取时按值的类型区分，已有的未压缩数据
+和压缩数据可以混合存在，关闭压缩后旧的压缩值仍然可读。
+
+压缩值以两字节格式标记开头：
+
+- b'Cz'：zlib（raw deflate）
+- b'Cx'：LZMA2（raw，1 MiB字典）
+- b'Cd'：使用预设字典的zlib，标记后4字节为字典ID（字典内容的crc32），
+  字典保存在同一数据库的compression_dictionaries表中
+"""
+
+import lzma
+import re
+import zlib
+from collections import Counter
+from typing import Callable, Iterable, Optional, Union
+
+CODECS = ('zlib', 'lzma')
+
+_ZLIB = b'Cz'
+_LZMA = b'Cx'
+_ZLIB_DICT = b'Cd'
+
+# raw LZMA2没有文件头，压缩和解压使用相同的字典大小
+_LZMA_FILTERS = [{'id': lzma.FILTER_LZMA2, 'dict_size': 1 << 20}]
+
+# zlib预设字典最多使用32 KiB
+MAX_DICTIONARY_SIZE = 32 * 1024
+
+DICTIONARY_SQL = """
+CREATE TABLE IF NOT EXISTS compression_dictionaries (
+    id INTEGER PRIMARY KEY,
+    data BLOB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+def dictionary_id(data: bytes) -> int:
+    """计算预设字典的ID
+
+    Args:
+        data: 字典内容
+
+    Returns:
+        int: 字典内容的crc32
+    """
+    return zlib.crc32(data)
+
+
+class TextCompressor:
+    """按阈值压缩文本字段"""
+
+    def __init__(self, codec: str = 'zlib', threshold: int = 1024, level: Optional[int] = None,
+                 use_dictionary: bool = False):
+        """初始化压缩设置
+
+        Args:
+            codec: 压缩算法，zlib或lzma
+            threshold: UTF-8编码后达到该字节数的值才压缩
+            level: 压缩级别，默认zlib为6、lzma为6
+            use_dictionary: 是否使用数据库中最新的预设字典（仅zlib）
+
+        Raises:
+            ValueError: 算法未知，或lzma与预设字典同时使用
+        """
+        if codec not in CODECS:
+            raise ValueError(f"未知的压缩算法: {codec}")
+        if use_dictionary and codec != 'zlib':
+            raise ValueError("预设字典只支持zlib")
+        self.codec = codec
+        self.threshold = threshold
+        self.level = 6 if level is None else level
+        self.use_dictionary = use_dictionary
+        # 由数据库在连接时设置
+        self.dictionary: Optional[bytes] = None
+
+    @classmethod
+    def parse(cls, value: str, threshold: int = 1024) -> 'TextCompressor':
+        """解析"zlib"、"lzma"、"zlib+dict"形式的压缩设置，可带":级别"
+
+        Args:
+            value: 设置字符串，如"lzma:9"
+            threshold: 压缩阈值（字节）
+
+        Returns:
+            TextCompressor: 压缩设置
+        """
+        codec, _, level = value.strip().lower().partition(':')
+        use_dictionary = codec.endswith('+dict')
+        return cls(codec[:-len('+dict')] if use_dictionary else codec, threshold,
+                   int(level) if level else None, use_dictionary)
+
+    def compress(self, text: Optional[str]) -> Union[str, bytes, None]:
+        """压缩文本，未达到阈值或压缩后没有变小时原样返回
+
+        Args:
+            text: 文本
+
+        Returns:
+            Union[str, bytes, None]: 原文本或带格式标记的压缩值
+        """
+        if text is None or len(text) * 4 < self.threshold:
+            return text
+        data = text.encode('utf-8')
+        if len(data) < self.threshold:
+            return text
+        if self.codec == 'lzma':
+            payload = _LZMA + lzma.compress(data, format=lzma.FORMAT_RAW,
+                                            filters=[{**_LZMA_FILTERS[0], 'preset': self.level}])
+        elif self.dictionary:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=self.dictionary)
+            payload = (_ZLIB_DICT + dictionary_id(self.dictionary).to_bytes(4, 'big')
+                       + compressor.compress(data) + compressor.flush())
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+            payload = _ZLIB + compressor.compress(data) + compressor.flush()
+        return payload if len(payload) < len(data) else text
+
+
+def decompress(value: Union[str, bytes, None], dictionaries: Callable[[int], bytes]) -> Optional[str]:
+    """还原可能被压缩的文本字段
+
+    Args:
+        value: 数据库中读出的值，TEXT原样返回
+        dictionaries: 按ID获取预设字典的函数
+
+    Returns:
+        Optional[str]: 文本
+
+    Raises:
+        ValueError: 格式标记未知
+    """
+    if not isinstance(value, bytes):
+        return value
+    marker = value[:2]
+    if marker == _ZLIB:
+        return zlib.decompress(value[2:], -15).decode('utf-8')
+    if marker == _LZMA:
+        return lzma.decompress(value[2:], format=lzma.FORMAT_RAW, filters=_LZMA_FILTERS).decode('utf-8')
+    if marker == _ZLIB_DICT:
+        decompressor = zlib.decompressobj(-15, zdict=dictionaries(int.from_bytes(value[2:6], 'big')))
+        return (decompressor.decompress(value[6:]) + decompressor.flush()).decode('utf-8')
+    raise ValueError(f"未知的压缩格式: {marker!r}")
+
+
+def train_dictionary(samples: Iterable[str], size: int = MAX_DICTIONARY_SIZE) -> bytes:
+    """从样本中挑选反复出现的句子和短语作为zlib预设字典
+
+    按"出现次数×长度"排序，价值越高的片段越靠近字典末尾（deflate回溯距离更短）。
+
+    Args:
+        samples: 样本文本
+        size: 字典的最大字节数
+
+    Returns:
+        bytes: 字典内容，样本中没有重复片段时为空
+    """
+    counts: Counter = Counter()
+    for sample in samples:
+        # 同一样本内重复的片段只计一次，只保留跨样本重复的内容
+        counts.update({
+            segment for segment in re.split(r'(?<=[。！？.!?\n])', sample)
+            if len(segment.strip()) >= 8
+        })
+    segments = sorted(
+        (segment for segment, count in counts.items() if count > 1),
+        key=lambda segment: counts[segment] * len(segment.encode('utf-8'))
+    )
+    chosen = []
+    total = 0
+    for segment in reversed(segments):
+        data = segment.encode('utf-8')
+        if total + len(data) > size:
+            continue
+        chosen.append(data)
+        total += len(data)
+    return b''.join(reversed(chosen))
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""数据库操作的指标采集，各后端共用"""
+
+import functools
+import time
+from typing import Any
+
+from ..utils.metrics import DB_QUERIES_IN_FLIGHT, DB_QUERY_ERRORS, DB_QUERY_ROWS, DB_QUERY_SECONDS
+from ..utils.profiling import DB as PROFILE_DB, record as record_profile
+
+
+def row_count(result: Any) -> int:
+    """根据返回值估算操作涉及的行数：列表按长度，单条记录、ID或成功标志计为1"""
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return 1 if result else 0
+
+
+def instrumented(func):
+    """记录数据库操作的耗时、行数和异常次数，标签在装饰时绑定，调用时不再查找"""
+    operation = func.__name__
+    seconds = DB_QUERY_SECONDS.labels(operation)
+    rows = DB_QUERY_ROWS.labels(operation)
+    errors = DB_QUERY_ERRORS.labels(operation)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        DB_QUERIES_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            seconds.observe(elapsed)
+            record_profile(PROFILE_DB, elapsed)
+            DB_QUERIES_IN_FLIGHT.dec()
+        rows.inc(row_count(result))
+        return result
+
+    return wrapper
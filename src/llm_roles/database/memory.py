@@ -0,0 +1,1073 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""内存数据库后端
+
+与SQLiteDatabase行为一致的纯内存实现，可用作测试夹具、基准测试的基线，或只读为主的热数据层。
+
+每张表是以主键为键的字典，行以与SQLite相同的列值保存（JSON字段保存为字符串，读取时解析，
+调用方拿到的总是副本）。排序和关联查询使用辅助索引：按名称排序的有序列表、
+角色的版本号列表、会话的消息列表和默认模板的双向关联集合。
+
+所有写入都经过_put/_delete，并在撤销日志中记录旧值，事务、保存点和单个操作的失败回滚
+都通过撤销日志实现。外键和唯一约束与SQLite一致，违反时抛出sqlite3.IntegrityError。
+整个后端使用一把可重入锁：transaction()在整个代码块期间持有该锁，相当于SQLite的单写者模型。
+"""
+
+import bisect
+import heapq
+import json
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from .base import DatabaseBackend
+from ..core.versioning import (
+    changed_fields,
+    diff_role_state,
+    is_snapshot_version,
+    rebuild_role_state,
+    role_state,
+)
+
+# 表名
+ROLES = 'roles'
+ROLE_VERSIONS = 'role_versions'
+SESSIONS = 'sessions'
+MESSAGES = 'messages'
+TEMPLATES = 'prompt_templates'
+BINDINGS = 'role_default_templates'
+
+_ROLE_COLUMNS = ('id', 'name', 'description', 'role_type')
+
+
+def _timestamp() -> str:
+    """与SQLite的CURRENT_TIMESTAMP相同格式的UTC时间（精确到秒）"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _timestamp_ms() -> str:
+    """与strftime('%Y-%m-%d %H:%M:%f', 'now')相同格式的UTC时间（精确到毫秒）"""
+    now = datetime.now(timezone.utc)
+    return now.strftime('%Y-%m-%d %H:%M:%S.') + f'{now.microsecond // 1000:03d}'
+
+
+def _sequence(item: Tuple[int, str]) -> int:
+    """消息索引项的序号"""
+    return item[0]
+
+
+def _loads(json_str: Optional[str], default: Any = None) -> Any:
+    """解析JSON字段，空值或无效值时返回默认值"""
+    if not json_str:
+        return default
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        return default
+
+
+class MemoryDatabase(DatabaseBackend):
+    """内存数据库实现"""
+
+    def __init__(self):
+        """初始化空的内存数据库"""
+        self._tables: Dict[str, Dict[Any, Dict[str, Any]]] = {
+            name: {} for name in (ROLES, ROLE_VERSIONS, SESSIONS, MESSAGES, TEMPLATES, BINDINGS)
+        }
+        # 插入顺序，同名记录按插入顺序排列（与SQLite按rowid扫描的结果一致）
+        self._rowid = 0
+        # 辅助索引
+        self._role_names: List[Tuple[str, int, str]] = []
+        self._template_names: List[Tuple[str, int, str]] = []
+        self._role_versions: Dict[str, List[int]] = {}
+        self._role_sessions: Dict[str, Set[str]] = {}
+        self._session_messages: Dict[str, List[Tuple[int, str]]] = {}
+        self._role_bindings: Dict[str, Set[str]] = {}
+        self._template_bindings: Dict[str, Set[str]] = {}
+
+        self._lock = threading.RLock()
+        # 当前事务的撤销日志和嵌套深度，只在持有锁时访问
+        self._undo: Optional[List[Tuple[str, Any, Optional[Dict[str, Any]]]]] = None
+        self._depth = 0
+        self._connected = False
+
+    def connect(self) -> None:
+        """标记为已连接（内存数据库无需建立连接）"""
+        self._connected = True
+
+    def disconnect(self) -> None:
+        """标记为已断开，数据保留"""
+        self._connected = False
+
+    @property
+    def connection_count(self) -> int:
+        """当前打开的连接数"""
+        return 1 if self._connected else 0
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disconnect()
+
+    def load_catalog(self, source: DatabaseBackend, batch_size: int = 1000) -> Dict[str, int]:
+        """从另一个后端复制角色、模板和默认模板关联，用于启动时预热
+
+        不复制版本历史和会话。
+
+        Args:
+            source: 数据来源后端
+            batch_size: 每批写入的记录数
+
+        Returns:
+            Dict[str, int]: 各类型复制的记录数
+        """
+        totals = {'roles': 0, 'templates': 0, 'role_default_templates': 0}
+        for kind, records in (('role', source.export_roles(batch_size)),
+                              ('template', source.export_templates(batch_size)),
+                              ('role_default_template', source.export_role_default_templates(batch_size))):
+            batch = []
+            for record in records:
+                batch.append((kind, record))
+                if len(batch) >= batch_size:
+                    for key, count in self.upsert_catalog_records(batch).items():
+                        totals[key] += count
+                    batch = []
+            if batch:
+                for key, count in self.upsert_catalog_records(batch).items():
+                    totals[key] += count
+        return totals
+
+    # =========== 存储与索引 ===========
+
+    def _index(self, table: str, key: Any, row: Dict[str, Any]) -> None:
+        """把行加入辅助索引"""
+        if table == ROLES:
+            bisect.insort(self._role_names, (row['name'], row['rowid'], key))
+        elif table == TEMPLATES:
+            bisect.insort(self._template_names, (row['name'], row['rowid'], key))
+        elif table == ROLE_VERSIONS:
+            bisect.insort(self._role_versions.setdefault(key[0], []), key[1])
+        elif table == SESSIONS:
+            self._role_sessions.setdefault(row['role_id'], set()).add(key)
+        elif table == MESSAGES:
+            bisect.insort(self._session_messages.setdefault(row['session_id'], []), (row['sequence'], key))
+        elif table == BINDINGS:
+            self._role_bindings.setdefault(key[0], set()).add(key[1])
+            self._template_bindings.setdefault(key[1], set()).add(key[0])
+
+    @staticmethod
+    def _discard_sorted(items: List[Any], item: Any) -> None:
+        index = bisect.bisect_left(items, item)
+        if index < len(items) and items[index] == item:
+            del items[index]
+
+    @staticmethod
+    def _discard_member(index: Dict[Any, Any], key: Any, member: Any) -> None:
+        members = index.get(key)
+        if members is None:
+            return
+        if isinstance(members, list):
+            MemoryDatabase._discard_sorted(members, member)
+        else:
+            members.discard(member)
+        if not members:
+            del index[key]
+
+    def _unindex(self, table: str, key: Any, row: Dict[str, Any]) -> None:
+        """把行从辅助索引中移除"""
+        if table == ROLES:
+            self._discard_sorted(self._role_names, (row['name'], row['rowid'], key))
+        elif table == TEMPLATES:
+            self._discard_sorted(self._template_names, (row['name'], row['rowid'], key))
+        elif table == ROLE_VERSIONS:
+            self._discard_member(self._role_versions, key[0], key[1])
+        elif table == SESSIONS:
+            self._discard_member(self._role_sessions, row['role_id'], key)
+        elif table == MESSAGES:
+            self._discard_member(self._session_messages, row['session_id'], (row['sequence'], key))
+        elif table == BINDINGS:
+            self._discard_member(self._role_bindings, key[0], key[1])
+            self._discard_member(self._template_bindings, key[1], key[0])
+
+    def _store(self, table: str, key: Any, row: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """写入（row为None时删除）一行并维护索引，返回旧行"""
+        rows = self._tables[table]
+        old = rows.pop(key, None)
+        if old is not None:
+            self._unindex(table, key, old)
+        if row is not None:
+            rows[key] = row
+            self._index(table, key, row)
+        return old
+
+    def _put(self, table: str, key: Any, row: Dict[str, Any]) -> None:
+        """插入或替换一行，记录撤销信息"""
+        if 'rowid' not in row:
+            old = self._tables[table].get(key)
+            self._rowid += 1
+            row['rowid'] = old['rowid'] if old is not None else self._rowid
+        self._undo.append((table, key, self._store(table, key, row)))
+
+    def _delete(self, table: str, key: Any) -> bool:
+        """删除一行，记录撤销信息
+
+        Returns:
+            bool: 行是否存在
+        """
+        old = self._store(table, key, None)
+        if old is None:
+            return False
+        self._undo.append((table, key, old))
+        return True
+
+    def _rollback_to(self, mark: int) -> None:
+        """按撤销日志逆序恢复，直到日志长度回到mark"""
+        while len(self._undo) > mark:
+            table, key, old = self._undo.pop()
+            self._store(table, key, old)
+
+    @contextmanager
+    def _atomic(self) -> Iterator[None]:
+        """单个写操作：不在事务中时，失败则撤销该操作的全部写入"""
+        with self._lock:
+            if self._depth:
+                yield
+                return
+            self._undo = []
+            try:
+                yield
+            except BaseException:
+                self._rollback_to(0)
+                raise
+            finally:
+                self._undo = None
+
+    # =========== 事务 ===========
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """在一个事务中执行多个操作，全部成功才提交，出现异常时整体回滚
+
+        事务期间持有后端的锁，其他线程的读写会等待事务结束。可以嵌套，只有最外层负责回滚。
+        """
+        with self._lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+
+            self._undo = []
+            self._depth = 1
+            try:
+                yield
+            except BaseException:
+                self._rollback_to(0)
+                raise
+            finally:
+                self._depth = 0
+                self._undo = None
+
+    @contextmanager
+    def savepoint(self) -> Iterator[None]:
+        """在外层事务中设置保存点，代码块抛出异常时只回滚到保存点
+
+        必须在transaction()内使用。
+        """
+        with self._lock:
+            if not self._depth:
+                raise RuntimeError("savepoint() 必须在 transaction() 中使用")
+            mark = len(self._undo)
+            try:
+                yield
+            except BaseException:
+                self._rollback_to(mark)
+                raise
+
+    # =========== 角色操作 ===========
+
+    @staticmethod
+    def _role_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+        """将角色行转换为基础字段与属性合并后的字典"""
+        role = {column: row[column] for column in _ROLE_COLUMNS}
+        role.update(_loads(row['attributes'], {}))
+        return role
+
+    def create_role(self, role_data: Dict[str, Any]) -> str:
+        """创建新角色
+
+        Args:
+            role_data: 角色数据字典
+
+        Returns:
+            str: 创建的角色ID
+
+        Raises:
+            sqlite3.IntegrityError: 如果角色ID已存在
+        """
+        role_id = role_data.get('id', str(uuid.uuid4()))
+        name = role_data.get('name', '')
+        description = role_data.get('description', '')
+        role_type = role_data.get('role_type', '')
+        attributes = {k: v for k, v in role_data.items() if k not in _ROLE_COLUMNS}
+
+        with self._atomic():
+            if role_id in self._tables[ROLES]:
+                raise sqlite3.IntegrityError(f"UNIQUE constraint failed: roles.id ({role_id})")
+            now = _timestamp()
+            self._put(ROLES, role_id, {
+                'id': role_id, 'name': name, 'description': description, 'role_type': role_type,
+                'attributes': json.dumps(attributes), 'created_at': now, 'updated_at': now
+            })
+            state = role_state({
+                'name': name,
+                'description': description,
+                'role_type': role_type,
+                **attributes
+            })
+            self._insert_role_version(role_id, 1, True, state)
+        return role_id
+
+    def get_role(self, role_id: str) -> Optional[Dict[str, Any]]:
+        """获取角色信息
+
+        Args:
+            role_id: 角色ID
+
+        Returns:
+            角色信息字典，如果不存在返回None
+        """
+        with self._lock:
+            row = self._tables[ROLES].get(role_id)
+            return self._role_from_row(row) if row else None
+
+    def get_role_version_info(self, role_id: str) -> Optional[Dict[str, Any]]:
+        """获取角色的版本信息，不解析属性，用于条件请求校验
+
+        Args:
+            role_id: 角色ID
+
+        Returns:
+            包含updated_at和最新版本号的字典，如果角色不存在返回None
+        """
+        with self._lock:
+            row = self._tables[ROLES].get(role_id)
+            if not row:
+                return None
+            versions = self._role_versions.get(role_id)
+            return {'id': role_id, 'updated_at': row['updated_at'],
+                    'version': versions[-1] if versions else None}
+
+    def update_role(self, role_id: str, role_data: Dict[str, Any]) -> bool:
+        """更新角色信息
+
+        Args:
+            role_id: 角色ID
+            role_data: 更新的角色数据，属性非空时整体替换原有属性
+
+        Returns:
+            是否成功更新
+        """
+        changes = {column: role_data[column] for column in _ROLE_COLUMNS[1:]
+                   if role_data.get(column) is not None}
+        attributes = {k: v for k, v in role_data.items() if k not in _ROLE_COLUMNS}
+        if attributes:
+            changes['attributes'] = json.dumps(attributes)
+        if not changes:
+            return False
+
+        with self._atomic():
+            row = self._tables[ROLES].get(role_id)
+            if not row:
+                return False
+            new_row = {**row, **changes, 'updated_at': _timestamp_ms()}
+            self._put(ROLES, role_id, new_row)
+            old_state = role_state(self._role_from_row(row))
+            new_state = role_state(self._role_from_row(new_row))
+            self._record_role_version(role_id, old_state, new_state)
+        return True
+
+    def delete_role(self, role_id: str) -> bool:
+        """删除角色及其历史版本
+
+        Args:
+            role_id: 角色ID
+
+        Returns:
+            是否成功删除
+
+        Raises:
+            sqlite3.IntegrityError: 如果角色仍被会话或默认模板关联引用
+        """
+        with self._atomic():
+            if role_id not in self._tables[ROLES]:
+                return False
+            if role_id in self._role_sessions or role_id in self._role_bindings:
+                raise sqlite3.IntegrityError("FOREIGN KEY constraint failed")
+            for version in list(self._role_versions.get(role_id, ())):
+                self._delete(ROLE_VERSIONS, (role_id, version))
+            self._delete(ROLES, role_id)
+        return True
+
+    def list_roles(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """列出角色（按名称排序）
+
+        Args:
+            limit: 返回的最大记录数
+            offset: 偏移量
+
+        Returns:
+            角色列表
+        """
+        with self._lock:
+            rows = self._tables[ROLES]
+            return [self._role_from_row(rows[key])
+                    for _, _, key in self._role_names[offset:offset + limit]]
+
+    def search_roles(self, query: str) -> List[Dict[str, Any]]:
+        """按名称或描述搜索角色（不区分大小写）
+
+        Args:
+            query: 搜索关键词
+
+        Returns:
+            符合条件的角色列表（按名称排序）
+        """
+        needle = query.lower()
+        with self._lock:
+            rows = self._tables[ROLES]
+            result = []
+            for _, _, key in self._role_names:
+                row = rows[key]
+                if needle in row['name'].lower() or needle in (row['description'] or '').lower():
+                    result.append(self._role_from_row(row))
+            return result
+
+    # =========== 角色版本操作 ===========
+
+    def _insert_role_version(self, role_id: str, version: int, is_snapshot: bool,
+                             payload: Dict[str, Any]) -> None:
+        """写入一条版本记录"""
+        self._put(ROLE_VERSIONS, (role_id, version), {
+            'version_id': str(uuid.uuid4()), 'role_id': role_id, 'version': version,
+            'is_snapshot': is_snapshot, 'attributes': json.dumps(payload), 'created_at': _timestamp()
+        })
+
+    def _record_role_version(self, role_id: str, old_state: Dict[str, Any],
+                             new_state: Dict[str, Any]) -> None:
+        """记录一次角色更新产生的版本，规则与SQLiteDatabase相同"""
+        versions = self._role_versions.get(role_id)
+        if not versions:
+            self._insert_role_version(role_id, 1, True, old_state)
+            last_version = 1
+        else:
+            last_version = versions[-1]
+
+        if new_state == old_state:
+            return
+
+        version = last_version + 1
+        if is_snapshot_version(version):
+            self._insert_role_version(role_id, version, True, new_state)
+        else:
+            self._insert_role_version(role_id, version, False, diff_role_state(old_state, new_state))
+
+    def get_role_version(self, role_id: str, version: int) -> Optional[Dict[str, Any]]:
+        """获取角色的指定历史版本
+
+        Args:
+            role_id: 角色ID
+            version: 版本号
+
+        Returns:
+            版本信息字典（data字段为该版本的完整角色数据），如果不存在返回None
+        """
+        with self._lock:
+            versions = self._role_versions.get(role_id, [])
+            end = bisect.bisect_right(versions, version)
+            if not end or versions[end - 1] != version:
+                return None
+            rows = self._tables[ROLE_VERSIONS]
+            # 从不晚于该版本的最近快照开始
+            start = end - 1
+            while start > 0 and not rows[(role_id, versions[start])]['is_snapshot']:
+                start -= 1
+            entries = [rows[(role_id, v)] for v in versions[start:end]]
+
+        state = rebuild_role_state([
+            {'is_snapshot': entry['is_snapshot'], 'payload': json.loads(entry['attributes'])}
+            for entry in entries
+        ])
+        if state is None:
+            return None
+
+        return {
+            'role_id': role_id,
+            'version': version,
+            'is_snapshot': entries[-1]['is_snapshot'],
+            'created_at': entries[-1]['created_at'],
+            'data': {'id': role_id, **state}
+        }
+
+    def list_role_versions(self, role_id: str, limit: int = 100,
+                           offset: int = 0) -> List[Dict[str, Any]]:
+        """列出角色的历史版本（按版本号倒序）
+
+        Args:
+            role_id: 角色ID
+            limit: 返回的最大记录数
+            offset: 偏移量
+
+        Returns:
+            版本摘要列表，差量版本包含变更字段列表
+        """
+        with self._lock:
+            rows = self._tables[ROLE_VERSIONS]
+            selected = list(reversed(self._role_versions.get(role_id, [])))[offset:offset + limit]
+            entries = [rows[(role_id, v)] for v in selected]
+
+        return [{
+            'version_id': entry['version_id'],
+            'version': entry['version'],
+            'is_snapshot': entry['is_snapshot'],
+            'changed_fields': None if entry['is_snapshot'] else changed_fields(json.loads(entry['attributes'])),
+            'created_at': entry['created_at']
+        } for entry in entries]
+
+    # =========== 会话操作 ===========
+
+    def create_session(self, role_id: str, user_id: Optional[str] = None,
+                      metadata: Optional[Dict[str, Any]] = None) -> str:
+        """创建会话
+
+        Args:
+            role_id: 角色ID
+            user_id: 用户ID
+            metadata: 会话元数据
+
+        Returns:
+            会话ID
+
+        Raises:
+            sqlite3.IntegrityError: 如果角色不存在
+        """
+        session_id = str(uuid.uuid4())
+        with self._atomic():
+            if role_id not in self._tables[ROLES]:
+                raise sqlite3.IntegrityError("FOREIGN KEY constraint failed")
+            now = _timestamp()
+            self._put(SESSIONS, session_id, {
+                'id': session_id, 'role_id': role_id, 'user_id': user_id,
+                'created_at': now, 'last_activity': now, 'metadata': json.dumps(metadata or {})
+            })
+        return session_id
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """获取会话信息
+
+        Args:
+            session_id: 会话ID
+
+        Returns:
+            会话信息字典，如果不存在返回None
+        """
+        with self._lock:
+            row = self._tables[SESSIONS].get(session_id)
+            if not row:
+                return None
+            return {
+                'id': row['id'],
+                'role_id': row['role_id'],
+                'user_id': row['user_id'],
+                'created_at': row['created_at'],
+                'last_activity': row['last_activity'],
+                'metadata': _loads(row['metadata'], {})
+            }
+
+    def add_message(self, session_id: str, sender: str, content: str,
+                   metadata: Optional[Dict[str, Any]] = None) -> str:
+        """添加消息
+
+        Args:
+            session_id: 会话ID
+            sender: 发送者 ('user' 或 'assistant')
+            content: 消息内容
+            metadata: 消息元数据
+
+        Returns:
+            消息ID
+        """
+        added = self.add_messages(session_id, [
+            {'sender': sender, 'content': content, 'metadata': metadata}
+        ])
+        return added[0]['id']
+
+    def add_messages(self, session_id: str, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量添加消息
+
+        Args:
+            session_id: 会话ID
+            messages: 消息列表，每条包含sender、content和可选的metadata
+
+        Returns:
+            按输入顺序排列的 {'id', 'sequence', 'timestamp'} 列表
+
+        Raises:
+            ValueError: 如果会话不存在
+        """
+        if not messages:
+            return []
+
+        with self._atomic():
+            session = self._tables[SESSIONS].get(session_id)
+            if not session:
+                raise ValueError(f"会话不存在: {session_id}")
+            timestamp = _timestamp()
+            self._put(SESSIONS, session_id, {**session, 'last_activity': timestamp})
+
+            existing = self._session_messages.get(session_id)
+            base = existing[-1][0] if existing else 0
+            added = []
+            for offset, message in enumerate(messages, start=1):
+                message_id = str(uuid.uuid4())
+                self._put(MESSAGES, message_id, {
+                    'id': message_id, 'session_id': session_id,
+                    'sender': message['sender'], 'content': message['content'],
+                    'metadata': json.dumps(message.get('metadata') or {}),
+                    'sequence': base + offset, 'timestamp': timestamp
+                })
+                added.append({'id': message_id, 'sequence': base + offset, 'timestamp': timestamp})
+        return added
+
+    @staticmethod
+    def _message_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+        """将消息行转换为字典"""
+        message = {
+            'id': row['id'],
+            'sender': row['sender'],
+            'content': row['content'],
+            'timestamp': row['timestamp'],
+            'sequence': row['sequence'],
+        }
+        metadata = _loads(row['metadata'], {})
+        if metadata:
+            message['metadata'] = metadata
+        return message
+
+    def get_session_messages(self, session_id: str, limit: Optional[int] = None,
+                             before: Optional[int] = None, after: Optional[int] = None,
+                             order: str = 'asc') -> List[Dict[str, Any]]:
+        """获取会话消息
+
+        按会话内序号排序，支持以序号为游标分页。
+
+        Args:
+            session_id: 会话ID
+            limit: 返回的最大消息数，None表示不限制
+            before: 只返回序号小于该值的消息
+            after: 只返回序号大于该值的消息
+            order: 排序方向，'asc'或'desc'
+
+        Returns:
+            消息列表
+
+        Raises:
+            ValueError: 如果排序方向无效
+        """
+        if order not in ('asc', 'desc'):
+            raise ValueError(f"无效的排序方向: {order}")
+
+        with self._lock:
+            index = self._session_messages.get(session_id, [])
+            # 索引项为(序号, 消息ID)，按序号二分定位游标边界
+            lo = bisect.bisect_right(index, after, key=_sequence) if after is not None else 0
+            hi = bisect.bisect_left(index, before, key=_sequence) if before is not None else len(index)
+            selected = index[lo:hi]
+            if order == 'desc':
+                selected = selected[::-1]
+            if limit is not None:
+                selected = selected[:max(limit, 0)]
+            rows = self._tables[MESSAGES]
+            return [self._message_from_row(rows[key]) for _, key in selected]
+
+    def tail_session_messages(self, session_id: str, n: int) -> List[Dict[str, Any]]:
+        """获取会话最近的n条消息（按时间正序）
+
+        Args:
+            session_id: 会话ID
+            n: 消息数量
+
+        Returns:
+            消息列表
+        """
+        messages = self.get_session_messages(session_id, limit=n, order='desc')
+        messages.reverse()
+        return messages
+
+    # =========== 提示词模板操作 ===========
+
+    @staticmethod
+    def _template_from_row(row: Dict[str, Any], include_default: bool = True) -> Dict[str, Any]:
+        """将模板行转换为字典"""
+        template = {
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'format': row['format'] or 'openai',
+            'role_types': _loads(row['role_types'], []),
+            'template_content': row['template_content'],
+            'variables': _loads(row['variables'], []),
+        }
+        if include_default:
+            template['is_default'] = bool(row['is_default'])
+        template['created_at'] = row['created_at']
+        template['updated_at'] = row['updated_at']
+        return template
+
+    def create_template(self, template_data: Dict[str, Any]) -> str:
+        """创建新提示词模板
+
+        Args:
+            template_data: 模板数据字典
+
+        Returns:
+            str: 创建的模板ID
+
+        Raises:
+            sqlite3.IntegrityError: 如果模板ID已存在
+        """
+        template_id = template_data.get('id', str(uuid.uuid4()))
+        with self._atomic():
+            if template_id in self._tables[TEMPLATES]:
+                raise sqlite3.IntegrityError(f"UNIQUE constraint failed: prompt_templates.id ({template_id})")
+            now = _timestamp()
+            self._put(TEMPLATES, template_id, {
+                'id': template_id,
+                'name': template_data.get('name', ''),
+                'description': template_data.get('description', ''),
+                'format': template_data.get('format', 'openai'),
+                'is_default': 0,
+                'role_types': json.dumps(template_data.get('role_types', [])),
+                'template_content': template_data.get('template_content', ''),
+                'variables': json.dumps(template_data.get('variables', [])),
+                'version': 1,
+                'created_at': now,
+                'updated_at': now
+            })
+        return template_id
+
+    def get_template(self, template_id: str) -> Optional[Dict[str, Any]]:
+        """获取提示词模板信息
+
+        Args:
+            template_id: 模板ID
+
+        Returns:
+            模板信息字典，如果不存在返回None
+        """
+        with self._lock:
+            row = self._tables[TEMPLATES].get(template_id)
+            return self._template_from_row(row, include_default=False) if row else None
+
+    def get_template_version_info(self, template_id: str) -> Optional[Dict[str, Any]]:
+        """获取模板的版本信息，用于条件请求校验
+
+        Args:
+            template_id: 模板ID
+
+        Returns:
+            包含updated_at和修改计数version的字典，如果模板不存在返回None
+        """
+        with self._lock:
+            row = self._tables[TEMPLATES].get(template_id)
+            if not row:
+                return None
+            return {'id': template_id, 'updated_at': row['updated_at'], 'version': row['version']}
+
+    def update_template(self, template_id: str, template_data: Dict[str, Any]) -> bool:
+        """更新提示词模板信息
+
+        Args:
+            template_id: 模板ID
+            template_data: 更新的模板数据
+
+        Returns:
+            是否成功更新
+        """
+        changes = {}
+        for key in ('name', 'description', 'format', 'role_types', 'template_content', 'variables'):
+            if key in template_data:
+                value = template_data[key]
+                if key in ('role_types', 'variables') and value is not None:
+                    value = json.dumps(value)
+                changes[key] = value
+        if not changes:
+            return False
+
+        with self._atomic():
+            row = self._tables[TEMPLATES].get(template_id)
+            if not row:
+                return False
+            self._put(TEMPLATES, template_id, {**row, **changes, 'updated_at': _timestamp_ms(),
+                                               'version': row['version'] + 1})
+        return True
+
+    def delete_template(self, template_id: str) -> bool:
+        """删除提示词模板及其角色默认模板关联
+
+        Args:
+            template_id: 模板ID
+
+        Returns:
+            是否成功删除
+        """
+        with self._atomic():
+            if template_id not in self._tables[TEMPLATES]:
+                return False
+            for role_id in list(self._template_bindings.get(template_id, ())):
+                self._delete(BINDINGS, (role_id, template_id))
+            self._delete(TEMPLATES, template_id)
+        return True
+
+    def list_templates(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """列出提示词模板（按名称排序）
+
+        Args:
+            limit: 返回的最大记录数
+            offset: 偏移量
+
+        Returns:
+            模板列表
+        """
+        with self._lock:
+            rows = self._tables[TEMPLATES]
+            return [self._template_from_row(rows[key])
+                    for _, _, key in self._template_names[offset:offset + limit]]
+
+    # =========== 角色默认模板操作 ===========
+
+    def set_role_default_template(self, role_id: str, template_id: str) -> bool:
+        """设置角色的默认模板，关联已存在时视为成功
+
+        Args:
+            role_id: 角色ID
+            template_id: 模板ID
+
+        Returns:
+            是否成功设置，角色或模板不存在时返回False
+        """
+        with self._atomic():
+            if role_id not in self._tables[ROLES] or template_id not in self._tables[TEMPLATES]:
+                return False
+            key = (role_id, template_id)
+            if key not in self._tables[BINDINGS]:
+                self._put(BINDINGS, key, {
+                    'role_id': role_id, 'template_id': template_id, 'created_at': _timestamp()
+                })
+        return True
+
+    def remove_role_default_template(self, role_id: str, template_id: str) -> bool:
+        """移除角色的默认模板
+
+        Args:
+            role_id: 角色ID
+            template_id: 模板ID
+
+        Returns:
+            是否成功移除
+        """
+        with self._atomic():
+            return self._delete(BINDINGS, (role_id, template_id))
+
+    def _sorted_role_templates(self, role_id: str) -> List[Dict[str, Any]]:
+        """角色默认模板的行，按名称排序"""
+        rows = self._tables[TEMPLATES]
+        bound = [rows[template_id] for template_id in self._role_bindings.get(role_id, ())]
+        bound.sort(key=lambda row: (row['name'], row['rowid']))
+        return bound
+
+    def get_role_default_templates(self, role_id: str) -> List[Dict[str, Any]]:
+        """获取角色的默认模板列表
+
+        Args:
+            role_id: 角色ID
+
+        Returns:
+            模板列表（按名称排序）
+        """
+        with self._lock:
+            return [self._template_from_row(row) for row in self._sorted_role_templates(role_id)]
+
+    def get_role_default_template_version_info(self, role_id: str) -> Optional[Dict[str, Any]]:
+        """获取生成提示词时使用的角色默认模板（按名称排序的第一个）的版本信息
+
+        Args:
+            role_id: 角色ID
+
+        Returns:
+            包含模板ID、updated_at和version的字典，如果角色没有默认模板返回None
+        """
+        with self._lock:
+            bound = self._sorted_role_templates(role_id)
+            if not bound:
+                return None
+            return {'id': bound[0]['id'], 'updated_at': bound[0]['updated_at'], 'version': bound[0]['version']}
+
+    # =========== 目录导入导出 ===========
+
+    def _export(self, table: str, batch_size: int, convert) -> Iterator[Dict[str, Any]]:
+        """按主键顺序分批导出，每批在锁内读取，产出时不持有锁"""
+        last_key = None
+        while True:
+            with self._lock:
+                rows = self._tables[table]
+                keys = heapq.nsmallest(
+                    batch_size, (k for k in rows if last_key is None or k > last_key)
+                )
+                batch = [convert(rows[k]) for k in keys]
+            if not batch:
+                return
+            yield from batch
+            last_key = keys[-1]
+
+    def export_roles(self, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """按ID顺序流式导出角色原始记录
+
+        Args:
+            batch_size: 每批读取的记录数
+
+        Yields:
+            角色记录字典，attributes为解析后的字典
+        """
+        return self._export(ROLES, batch_size, lambda row: {
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'role_type': row['role_type'],
+            'attributes': _loads(row['attributes'], {}),
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        })
+
+    def export_templates(self, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """按ID顺序流式导出提示词模板原始记录
+
+        Args:
+            batch_size: 每批读取的记录数
+
+        Yields:
+            模板记录字典
+        """
+        return self._export(TEMPLATES, batch_size, lambda row: {
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'format': row['format'] or 'openai',
+            'is_default': bool(row['is_default']),
+            'role_types': _loads(row['role_types'], []),
+            'template_content': row['template_content'],
+            'variables': _loads(row['variables'], []),
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        })
+
+    def export_role_default_templates(self, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """流式导出角色默认模板关联
+
+        Args:
+            batch_size: 每批读取的记录数
+
+        Yields:
+            关联记录字典
+        """
+        return self._export(BINDINGS, batch_size, lambda row: {
+            'role_id': row['role_id'], 'template_id': row['template_id'], 'created_at': row['created_at']
+        })
+
+    def upsert_catalog_records(self, records: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, int]:
+        """在一个事务中批量写入（插入或覆盖）目录记录
+
+        覆盖已有版本历史的角色时，会追加一个完整快照版本，保证版本链与当前数据一致。
+
+        Args:
+            records: (类型, 数据) 列表，类型为 role、template 或 role_default_template
+
+        Returns:
+            Dict[str, int]: 各类型写入的记录数
+
+        Raises:
+            ValueError: 如果记录类型未知
+            sqlite3.IntegrityError: 如果关联引用的角色或模板不存在
+        """
+        roles, templates, bindings = [], [], []
+        for kind, data in records:
+            if kind == 'role':
+                roles.append(data)
+            elif kind == 'template':
+                templates.append(data)
+            elif kind == 'role_default_template':
+                bindings.append(data)
+            else:
+                raise ValueError(f"未知的记录类型: {kind}")
+
+        with self._atomic():
+            now = _timestamp()
+            for r in roles:
+                existing = self._tables[ROLES].get(r['id'])
+                self._put(ROLES, r['id'], {
+                    'id': r['id'],
+                    'name': r.get('name', ''),
+                    'description': r.get('description', ''),
+                    'role_type': r.get('role_type', ''),
+                    'attributes': json.dumps(r.get('attributes') or {}),
+                    'created_at': existing['created_at'] if existing else (r.get('created_at') or now),
+                    'updated_at': r.get('updated_at') or now
+                })
+                versions = self._role_versions.get(r['id'])
+                if existing and versions:
+                    state = role_state({
+                        'name': r.get('name', ''),
+                        'description': r.get('description', ''),
+                        'role_type': r.get('role_type', ''),
+                        **(r.get('attributes') or {})
+                    })
+                    self._insert_role_version(r['id'], versions[-1] + 1, True, state)
+
+            for t in templates:
+                existing = self._tables[TEMPLATES].get(t['id'])
+                self._put(TEMPLATES, t['id'], {
+                    'id': t['id'],
+                    'name': t.get('name', ''),
+                    'description': t.get('description', ''),
+                    'format': t.get('format', 'openai'),
+                    'is_default': int(bool(t.get('is_default', False))),
+                    'role_types': json.dumps(t.get('role_types') or []),
+                    'template_content': t.get('template_content', ''),
+                    'variables': json.dumps(t.get('variables') or []),
+                    'version': existing['version'] + 1 if existing else 1,
+                    'created_at': existing['created_at'] if existing else (t.get('created_at') or now),
+                    'updated_at': t.get('updated_at') or now
+                })
+
+            for b in bindings:
+                key = (b['role_id'], b['template_id'])
+                if b['role_id'] not in self._tables[ROLES] or b['template_id'] not in self._tables[TEMPLATES]:
+                    raise sqlite3.IntegrityError("FOREIGN KEY constraint failed")
+                if key not in self._tables[BINDINGS]:
+                    self._put(BINDINGS, key, {
+                        'role_id': b['role_id'], 'template_id': b['template_id'],
+                        'created_at': b.get('created_at') or now
+                    })
+
+        return {
+            'roles': len(roles),
+            'templates': len(templates),
+            'role_default_templates': len(bindings)
+        }
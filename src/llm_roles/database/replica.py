@@ -0,0 +1,421 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""只读快照副本
+
+读多写少时，角色和模板的读取不必与写入共用同一个数据库文件和锁：
+
+- 后台线程按间隔用sqlite3.Connection.backup把主库复制到本地快照文件（默认位于/dev/shm），
+  主库没有变化（PRAGMA data_version不变）时不复制，只刷新快照的确认时间。
+- 角色、模板和提示词生成用到的读取走快照，其余读取和所有写入走主库。
+- 快照超过max_staleness未确认时读取回到主库，读取结果的延迟不会超过这个上限。
+- 客户端写入目录数据后，在快照包含这次写入之前，它的读取都走主库（读己之写）。
+  客户端由bind_client()绑定到当前上下文，Web层按请求头或客户端地址设置。
+- 变更日志报告其他进程的修改时调用fence()，在快照包含这次修改之前所有读取都走主库，
+  缓存失效后重新加载的数据不会来自旧快照。
+"""
+
+import functools
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from ..utils.metrics import Counter, Histogram
+from .base import DatabaseBackend
+from .sqlite import SQLiteDatabase
+
+REPLICA_READS = Counter(
+    'llm_roles_replica_reads_total', '可由快照提供的读取次数', ['source', 'reason']
+)
+REPLICA_REFRESHES = Counter(
+    'llm_roles_replica_refreshes_total', '快照刷新次数', ['result']
+)
+REPLICA_REFRESH_SECONDS = Histogram(
+    'llm_roles_replica_refresh_seconds', '复制主库生成快照的耗时（秒）',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+
+# 读取走主库的原因
+FRESH = 'fresh'
+OWN_WRITE = 'own_write'
+FENCED = 'fenced'
+STALE = 'stale'
+TRANSACTION = 'transaction'
+
+_client: ContextVar[Optional[str]] = ContextVar('llm_roles_replica_client', default=None)
+
+
+def bind_client(client_id: Optional[str]) -> Token:
+    """把客户端标识绑定到当前上下文，用于读己之写
+
+    Args:
+        client_id: 客户端标识，None表示不跟踪
+
+    Returns:
+        Token: 传给unbind_client()恢复之前的绑定
+    """
+    return _client.set(client_id)
+
+
+def unbind_client(token: Token) -> None:
+    """恢复bind_client()之前的客户端绑定"""
+    _client.reset(token)
+
+
+def default_snapshot_dir() -> str:
+    """快照文件的默认目录：优先使用内存文件系统/dev/shm"""
+    shm = Path('/dev/shm')
+    if shm.is_dir() and shm.stat().st_mode & 0o002:
+        return str(shm)
+    return tempfile.gettempdir()
+
+
+class _Snapshot(SQLiteDatabase):
+    """一代快照：以只读方式打开，不检查表结构"""
+
+    def __init__(self, db_path: str, data_version: int, verified_at: float):
+        """
+        Args:
+            db_path: 快照文件路径
+            data_version: 复制时主库的data_version
+            verified_at: 确认快照与主库一致的时间（time.monotonic()）
+        """
+        super().__init__(db_path)
+        self.data_version = data_version
+        self.verified_at = verified_at
+        # 正在使用这一代快照的读取数，被替换且归零后关闭
+        self.readers = 0
+        self.retired = False
+
+    def connect(self) -> None:
+        """为当前线程打开只读连接"""
+        conn = sqlite3.connect(f'{Path(self.db_path).resolve().as_uri()}?mode=ro',
+                               uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        with self._connections_lock:
+            stale = self._add_connection(conn)
+        for old in stale:
+            old.close()
+
+    def close(self) -> None:
+        """关闭所有连接并删除快照文件"""
+        with self._connections_lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for conn in connections:
+            conn.close()
+        Path(self.db_path).unlink(missing_ok=True)
+
+
+def _snapshot_read(name: str) -> Callable:
+    """可由快照提供的读取"""
+    @functools.wraps(getattr(DatabaseBackend, name))
+    def method(self, *args, **kwargs):
+        return self._read(name, args, kwargs)
+    method.__isabstractmethod__ = False
+    return method
+
+
+def _primary(name: str, catalog_write: bool = False) -> Callable:
+    """直接交给主库的操作；catalog_write为True时记录当前客户端的写入时间"""
+    @functools.wraps(getattr(DatabaseBackend, name))
+    def method(self, *args, **kwargs):
+        result = getattr(self.primary, name)(*args, **kwargs)
+        if catalog_write:
+            self._record_write()
+        return result
+    method.__isabstractmethod__ = False
+    return method
+
+
+class ReplicatedDatabase(DatabaseBackend):
+    """主库加只读快照副本"""
+
+    def __init__(self, primary: SQLiteDatabase, max_staleness: float = 2.0,
+                 refresh_interval: Optional[float] = None, snapshot_dir: Optional[str] = None,
+                 max_clients: int = 10000):
+        """初始化副本
+
+        Args:
+            primary: 主库
+            max_staleness: 快照允许落后主库的最长时间（秒），超过时读取走主库
+            refresh_interval: 后台刷新间隔（秒），默认为max_staleness的一半；0表示不启动后台线程，
+                由调用方执行refresh()
+            snapshot_dir: 快照文件所在目录，默认优先使用/dev/shm
+            max_clients: 记录最近写入时间的客户端数上限
+        """
+        self.primary = primary
+        self.max_staleness = max_staleness
+        self.refresh_interval = max_staleness / 2 if refresh_interval is None else refresh_interval
+        self.snapshot_dir = snapshot_dir or default_snapshot_dir()
+        self.max_clients = max_clients
+
+        self._dir: Optional[Path] = None
+        self._source: Optional[sqlite3.Connection] = None
+        self._snapshot: Optional[_Snapshot] = None
+        self._generation = 0
+        # 保护当前快照的替换和读取计数
+        self._lock = threading.Lock()
+        # 同一时间只有一个刷新在进行
+        self._refresh_lock = threading.Lock()
+        # 客户端标识到最近一次目录写入完成时间的映射，按时间排序
+        self._writes: 'OrderedDict[str, float]' = OrderedDict()
+        self._writes_lock = threading.Lock()
+        # 最近一次fence()的时间，此前确认的快照不再使用
+        self._fenced_at = float('-inf')
+        self._tx_state = threading.local()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def db_path(self) -> str:
+        """主库文件路径"""
+        return self.primary.db_path
+
+    @property
+    def connection_count(self) -> int:
+        """主库和当前快照打开的连接数"""
+        snapshot = self._snapshot
+        return self.primary.connection_count + (snapshot.connection_count if snapshot else 0)
+
+    @property
+    def snapshot_age(self) -> Optional[float]:
+        """当前快照距上次确认的秒数，尚无快照时为None"""
+        snapshot = self._snapshot
+        return None if snapshot is None else time.monotonic() - snapshot.verified_at
+
+    # =========== 连接与刷新 ===========
+
+    def connect(self) -> None:
+        """连接主库，生成第一代快照并启动后台刷新"""
+        self.primary.connect()
+        if self._source is not None:
+            return
+        self._dir = Path(tempfile.mkdtemp(prefix='llm_roles_replica_', dir=self.snapshot_dir))
+        self._source = sqlite3.connect(self.primary.db_path, check_same_thread=False)
+        self.refresh()
+        if self.refresh_interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._refresh_loop, name='llm-roles-replica', daemon=True)
+            self._thread.start()
+
+    def disconnect(self) -> None:
+        """停止后台刷新，删除快照并关闭主库连接"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        with self._refresh_lock:
+            with self._lock:
+                snapshot, self._snapshot = self._snapshot, None
+            if snapshot is not None:
+                snapshot.close()
+            if self._source is not None:
+                self._source.close()
+                self._source = None
+            if self._dir is not None:
+                shutil.rmtree(self._dir, ignore_errors=True)
+                self._dir = None
+        self.primary.disconnect()
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except sqlite3.Error:
+                # 保留上一代快照，超过max_staleness后读取自动回到主库
+                REPLICA_REFRESHES.labels('error').inc()
+
+    def refresh(self) -> bool:
+        """主库有变化时复制出新一代快照，否则只刷新当前快照的确认时间
+
+        Returns:
+            bool: 是否生成了新快照
+        """
+        with self._refresh_lock:
+            if self._source is None:
+                return False
+            started = time.monotonic()
+            # data_version只在其他连接提交后变化，本连接从不写入
+            data_version = self._source.execute('PRAGMA data_version').fetchone()[0]
+            current = self._snapshot
+            if current is not None and current.data_version == data_version:
+                current.verified_at = started
+                REPLICA_REFRESHES.labels('unchanged').inc()
+                return False
+
+            self._generation += 1
+            path = self._dir / f'snapshot-{self._generation}.db'
+            target = sqlite3.connect(path)
+            try:
+                self._source.backup(target)
+                # 主库为WAL模式时快照文件头也标记为WAL，只读打开需要改回回滚日志模式
+                target.execute('PRAGMA journal_mode = DELETE')
+            finally:
+                target.close()
+            snapshot = _Snapshot(str(path), data_version, started)
+
+            close_previous = False
+            with self._lock:
+                previous, self._snapshot = self._snapshot, snapshot
+                if previous is not None:
+                    previous.retired = True
+                    close_previous = previous.readers == 0
+            if close_previous:
+                previous.close()
+            REPLICA_REFRESHES.labels('copied').inc()
+            REPLICA_REFRESH_SECONDS.observe(time.monotonic() - started)
+            return True
+
+    # =========== 读取路由 ===========
+
+    def _record_write(self) -> None:
+        """记录当前客户端的目录写入时间；事务中的写入在事务结束时记录"""
+        client = _client.get()
+        if client is None or getattr(self._tx_state, 'depth', 0) > 0:
+            return
+        now = time.monotonic()
+        with self._writes_lock:
+            self._writes[client] = now
+            self._writes.move_to_end(client)
+            # 早于max_staleness的写入已包含在任何可用的快照中
+            while self._writes:
+                oldest_client, written_at = next(iter(self._writes.items()))
+                if len(self._writes) <= self.max_clients and now - written_at <= self.max_staleness:
+                    break
+                del self._writes[oldest_client]
+
+    def fence(self, entity_id: Optional[str] = None) -> None:
+        """让读取走主库，直到下一次刷新确认的快照包含目前已提交的所有修改
+
+        注册为失效监听器时应排在缓存失效之前，缓存重新加载时读到的是主库。
+
+        Args:
+            entity_id: 变更的实体ID（不使用，便于直接注册为InvalidationBus的监听器）
+        """
+        with self._lock:
+            self._fenced_at = time.monotonic()
+
+    def _acquire(self) -> Tuple[Optional[_Snapshot], str]:
+        """选择读取的来源
+
+        Returns:
+            Tuple[Optional[_Snapshot], str]: 使用的快照（走主库时为None）和原因
+        """
+        if getattr(self._tx_state, 'depth', 0) > 0:
+            return None, TRANSACTION
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or time.monotonic() - snapshot.verified_at > self.max_staleness:
+                return None, STALE
+            if snapshot.verified_at <= self._fenced_at:
+                return None, FENCED
+            client = _client.get()
+            if client is not None:
+                written_at = self._writes.get(client)
+                if written_at is not None and written_at >= snapshot.verified_at:
+                    return None, OWN_WRITE
+            snapshot.readers += 1
+        return snapshot, FRESH
+
+    def _release(self, snapshot: _Snapshot) -> None:
+        with self._lock:
+            snapshot.readers -= 1
+            close = snapshot.retired and snapshot.readers == 0
+        if close:
+            snapshot.close()
+
+    def _read(self, name: str, args: tuple, kwargs: Dict[str, Any]) -> Any:
+        snapshot, reason = self._acquire()
+        if snapshot is None:
+            REPLICA_READS.labels('primary', reason).inc()
+            return getattr(self.primary, name)(*args, **kwargs)
+        REPLICA_READS.labels('snapshot', reason).inc()
+        try:
+            return getattr(snapshot, name)(*args, **kwargs)
+        finally:
+            self._release(snapshot)
+
+    # =========== 事务 ===========
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """在主库的事务中执行多个操作，事务内的读取也走主库"""
+        self._tx_state.depth = getattr(self._tx_state, 'depth', 0) + 1
+        try:
+            with self.primary.transaction():
+                yield
+        finally:
+            self._tx_state.depth -= 1
+        self._record_write()
+
+    @contextmanager
+    def savepoint(self) -> Iterator[None]:
+        """在主库的外层事务中设置保存点"""
+        with self.primary.savepoint():
+            yield
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disconnect()
+
+    # =========== 由快照提供的读取 ===========
+
+    get_role = _snapshot_read('get_role')
+    get_role_version_info = _snapshot_read('get_role_version_info')
+    list_roles = _snapshot_read('list_roles')
+    search_roles = _snapshot_read('search_roles')
+    get_template = _snapshot_read('get_template')
+    get_template_version_info = _snapshot_read('get_template_version_info')
+    list_templates = _snapshot_read('list_templates')
+    get_role_default_templates = _snapshot_read('get_role_default_templates')
+    get_role_default_template_version_info = _snapshot_read('get_role_default_template_version_info')
+
+    # =========== 目录写入 ===========
+
+    create_role = _primary('create_role', catalog_write=True)
+    update_role = _primary('update_role', catalog_write=True)
+    delete_role = _primary('delete_role', catalog_write=True)
+    create_template = _primary('create_template', catalog_write=True)
+    update_template = _primary('update_template', catalog_write=True)
+    delete_template = _primary('delete_template', catalog_write=True)
+    set_role_default_template = _primary('set_role_default_template', catalog_write=True)
+    remove_role_default_template = _primary('remove_role_default_template', catalog_write=True)
+    upsert_catalog_records = _primary('upsert_catalog_records', catalog_write=True)
+
+    # =========== 其余操作走主库 ===========
+
+    get_role_version = _primary('get_role_version')
+    list_role_versions = _primary('list_role_versions')
+    create_session = _primary('create_session')
+    get_session = _primary('get_session')
+    add_message = _primary('add_message')
+    add_messages = _primary('add_messages')
+    get_session_messages = _primary('get_session_messages')
+    tail_session_messages = _primary('tail_session_messages')
+    export_roles = _primary('export_roles')
+    export_templates = _primary('export_templates')
+    export_role_default_templates = _primary('export_role_default_templates')
+
+    # =========== 变更日志（跟踪变更不能读快照） ===========
+
+    def get_change_log_bounds(self) -> Tuple[int, int]:
+        """获取主库变更日志中最早和最新的序号"""
+        return self.primary.get_change_log_bounds()
+
+    def get_changes(self, after: int, limit: int = 1000) -> List[Dict[str, Any]]:
+        """按序号读取主库的变更日志"""
+        return self.primary.get_changes(after, limit)
+
+    def prune_changes(self, keep: int) -> int:
+        """删除主库中较早的变更日志"""
+        return self.primary.prune_changes(keep)
@@ -10,6 +10,8 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent.parent.parent.parent
 sys.path.insert(0, str(project_root))
 
+from src.llm_roles.database.sqlite import _CHANGE_LOG_SQL
+
 # 确保数据库目录存在
 db_dir = project_root / "resource" / "db"
 db_dir.mkdir(parents=True, exist_ok=True)
@@ -41,9 +43,15 @@ CREATE TABLE IF NOT EXISTS role_versions (
     role_id TEXT NOT NULL,
     attributes JSON NOT NULL,
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    version INTEGER,
+    is_snapshot INTEGER NOT NULL DEFAULT 0,
     FOREIGN KEY (role_id) REFERENCES roles(id)
 )
 ''')
+cursor.execute('''
+CREATE UNIQUE INDEX IF NOT EXISTS idx_role_versions_role_version
+ON role_versions (role_id, version)
+''')
 
 # 创建会话表
 cursor.execute('''
@@ -67,9 +75,14 @@ CREATE TABLE IF NOT EXISTS messages (
     content TEXT NOT NULL,
     timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     metadata JSON,
+    sequence INTEGER,
     FOREIGN KEY (session_id) REFERENCES sessions(id)
 )
 ''')
+cursor.execute('''
+CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_session_sequence
+ON messages (session_id, sequence)
+''')
 
 # 创建提示词模板表
 cursor.execute('''
@@ -98,6 +111,9 @@ CREATE TABLE IF NOT EXISTS role_default_templates (
 )
 ''')
 
+# 创建变更日志表和触发器（各进程跟踪该表使缓存失效）
+cursor.executescript(_CHANGE_LOG_SQL)
+
 # 提交更改并关闭连接
 conn.commit()
 conn.close()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""会话消息分片存储
+
+会话和消息按session_id的哈希分布到N个SQLite文件，每个文件有自己的写锁，
+聊天记录的写入不再与目录读写争用主库的唯一写锁，也不再彼此串行：
+
+- 角色、模板和默认模板关联留在主库（目录库）。
+- 会话和消息写入分片库，分片由crc32(session_id) % N决定，与进程无关。
+- 分片库不能引用主库的角色表，创建会话时检查角色存在、删除角色时检查各分片
+  没有引用它的会话，代替原来的外键约束。检查和写入之间没有跨文件的锁，
+  与删除角色同时创建的会话可能引用已删除的角色。
+
+每个分片有自己的变更日志（只记录会话追加消息），各进程据此让会话的热缓冲补上
+其他进程写入的消息。
+
+分片文件名包含分片数（sessions_3_of_8.db），改变分片数会在连接时报错而不是
+静默地找不到已有会话。
+"""
+
+import copy
+import functools
+import re
+import sqlite3
+import uuid
+import zlib
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from .base import DatabaseBackend
+from .compression import TextCompressor
+from .sqlite import _CHANGE_LOG_TABLE_SQL, _SESSION_CHANGE_LOG_SQL, SQLiteDatabase
+
+# 分片库的表结构：会话不引用角色表
+_SESSION_SHARD_SQL = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    role_id TEXT NOT NULL,
+    user_id TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_activity TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    metadata JSON
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_role ON sessions (role_id);
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    metadata JSON,
+    sequence INTEGER,
+    FOREIGN KEY (session_id) REFERENCES sessions(id)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_session_sequence ON messages (session_id, sequence);
+"""
+
+_SHARD_FILE = re.compile(r"sessions_(\d+)_of_(\d+)\.db")
+
+
+def shard_index(session_id: str, shard_count: int) -> int:
+    """计算会话所在的分片
+
+    Args:
+        session_id: 会话ID
+        shard_count: 分片数
+
+    Returns:
+        int: 分片序号（0到shard_count-1）
+    """
+    return zlib.crc32(session_id.encode('utf-8')) % shard_count
+
+
+class _SessionShard(SQLiteDatabase):
+    """只保存会话和消息的分片库"""
+
+    def _ensure_schema(self) -> None:
+        self.conn.executescript(_SESSION_SHARD_SQL + _CHANGE_LOG_TABLE_SQL + _SESSION_CHANGE_LOG_SQL)
+
+    def has_role_sessions(self, role_id: str) -> bool:
+        """分片中是否有引用该角色的会话"""
+        if not self.conn:
+            self.connect()
+        return self.conn.execute(
+            "SELECT 1 FROM sessions WHERE role_id = ? LIMIT 1", (role_id,)
+        ).fetchone() is not None
+
+
+def _catalog(name: str) -> Callable:
+    """交给目录库的操作"""
+    @functools.wraps(getattr(DatabaseBackend, name))
+    def method(self, *args, **kwargs):
+        return getattr(self.catalog, name)(*args, **kwargs)
+    method.__isabstractmethod__ = False
+    return method
+
+
+def _routed(name: str) -> Callable:
+    """按第一个参数session_id交给所在分片的操作"""
+    @functools.wraps(getattr(DatabaseBackend, name))
+    def method(self, session_id, *args, **kwargs):
+        return getattr(self.shard_for(session_id), name)(session_id, *args, **kwargs)
+    method.__isabstractmethod__ = False
+    return method
+
+
+class ShardedDatabase(DatabaseBackend):
+    """目录库加按会话分片的消息库"""
+
+    def __init__(self, catalog: DatabaseBackend, shard_dir: str, shard_count: int,
+                 pragmas: Optional[Dict[str, Union[str, int]]] = None,
+                 compression: Optional[TextCompressor] = None):
+        """初始化分片存储
+
+        Args:
+            catalog: 保存角色和模板的目录库
+            shard_dir: 分片文件所在目录，不存在时创建
+            shard_count: 分片数
+            pragmas: 每个分片连接执行的PRAGMA设置
+            compression: 消息内容的压缩设置，每个分片使用一份副本（各自加载自己的预设字典）
+
+        Raises:
+            ValueError: 分片数小于1
+        """
+        if shard_count < 1:
+            raise ValueError(f"分片数必须大于0: {shard_count}")
+        self.catalog = catalog
+        self.shard_dir = Path(shard_dir)
+        self.shard_count = shard_count
+        self.shards = [
+            _SessionShard(str(self.shard_dir / f"sessions_{i}_of_{shard_count}.db"), pragmas=pragmas,
+                          compression=copy.copy(compression))
+            for i in range(shard_count)
+        ]
+
+    @property
+    def db_path(self) -> Optional[str]:
+        """目录库文件路径"""
+        return getattr(self.catalog, 'db_path', None)
+
+    @property
+    def connection_count(self) -> int:
+        """目录库和各分片打开的连接数"""
+        return self.catalog.connection_count + sum(shard.connection_count for shard in self.shards)
+
+    def shard_for(self, session_id: str) -> SQLiteDatabase:
+        """获取会话所在的分片库
+
+        Args:
+            session_id: 会话ID
+
+        Returns:
+            SQLiteDatabase: 分片库
+        """
+        return self.shards[shard_index(session_id, self.shard_count)]
+
+    # =========== 连接 ===========
+
+    def connect(self) -> None:
+        """连接目录库和所有分片
+
+        Raises:
+            ValueError: 目录中已有按其他分片数存储的会话
+        """
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        counts = {
+            int(match.group(2)) for match in map(_SHARD_FILE.fullmatch, (p.name for p in self.shard_dir.iterdir()))
+            if match
+        }
+        if counts - {self.shard_count}:
+            raise ValueError(
+                f"{self.shard_dir}中已有按{sorted(counts - {self.shard_count})}个分片存储的会话，"
+                f"改为{self.shard_count}个分片前需要先迁移"
+            )
+        self.catalog.connect()
+        for shard in self.shards:
+            shard.connect()
+
+    def disconnect(self) -> None:
+        """关闭目录库和所有分片的连接"""
+        for shard in self.shards:
+            shard.disconnect()
+        self.catalog.disconnect()
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disconnect()
+
+    # =========== 事务 ===========
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """在目录库和所有分片上各开一个事务
+
+        出现异常时全部回滚。正常结束时先提交各分片再提交目录库，
+        跨文件的提交不是原子的：进程在两次提交之间崩溃时只有部分文件生效。
+        """
+        with ExitStack() as stack:
+            stack.enter_context(self.catalog.transaction())
+            for shard in self.shards:
+                stack.enter_context(shard.transaction())
+            yield
+
+    @contextmanager
+    def savepoint(self) -> Iterator[None]:
+        """在目录库和所有分片的外层事务中设置保存点"""
+        with ExitStack() as stack:
+            stack.enter_context(self.catalog.savepoint())
+            for shard in self.shards:
+                stack.enter_context(shard.savepoint())
+            yield
+
+    # =========== 会话与消息 ===========
+
+    def create_session(self, role_id: str, user_id: Optional[str] = None,
+                       metadata: Optional[Dict[str, Any]] = None) -> str:
+        """在会话ID对应的分片中创建会话
+
+        Args:
+            role_id: 角色ID
+            user_id: 用户ID
+            metadata: 会话元数据
+
+        Returns:
+            会话ID
+
+        Raises:
+            sqlite3.IntegrityError: 如果角色不存在
+        """
+        if self.catalog.get_role_version_info(role_id) is None:
+            raise sqlite3.IntegrityError("FOREIGN KEY constraint failed")
+        session_id = str(uuid.uuid4())
+        self.shard_for(session_id)._insert_session(session_id, role_id, user_id, metadata)
+        return session_id
+
+    get_session = _routed('get_session')
+    add_message = _routed('add_message')
+    add_messages = _routed('add_messages')
+    get_session_messages = _routed('get_session_messages')
+    tail_session_messages = _routed('tail_session_messages')
+
+    # =========== 目录 ===========
+
+    def delete_role(self, role_id: str) -> bool:
+        """删除角色，仍有会话引用时拒绝
+
+        Args:
+            role_id: 角色ID
+
+        Returns:
+            bool: 是否删除成功
+
+        Raises:
+            sqlite3.IntegrityError: 如果有会话引用该角色
+        """
+        if any(shard.has_role_sessions(role_id) for shard in self.shards):
+            raise sqlite3.IntegrityError("FOREIGN KEY constraint failed")
+        return self.catalog.delete_role(role_id)
+
+    create_role = _catalog('create_role')
+    get_role = _catalog('get_role')
+    get_role_version_info = _catalog('get_role_version_info')
+    update_role = _catalog('update_role')
+    list_roles = _catalog('list_roles')
+    search_roles = _catalog('search_roles')
+    get_role_version = _catalog('get_role_version')
+    list_role_versions = _catalog('list_role_versions')
+    create_template = _catalog('create_template')
+    get_template = _catalog('get_template')
+    get_template_version_info = _catalog('get_template_version_info')
+    update_template = _catalog('update_template')
+    delete_template = _catalog('delete_template')
+    list_templates = _catalog('list_templates')
+    set_role_default_template = _catalog('set_role_default_template')
+    remove_role_default_template = _catalog('remove_role_default_template')
+    get_role_default_templates = _catalog('get_role_default_templates')
+    get_role_default_template_version_info = _catalog('get_role_default_template_version_info')
+    export_roles = _catalog('export_roles')
+    export_templates = _catalog('export_templates')
+    export_role_default_templates = _catalog('export_role_default_templates')
+    upsert_catalog_records = _catalog('upsert_catalog_records')
+
+    # =========== 变更日志（只记录目录） ===========
+
+    def get_change_log_bounds(self) -> Tuple[int, int]:
+        """获取目录库变更日志中最早和最新的序号"""
+        return self.catalog.get_change_log_bounds()
+
+    def get_changes(self, after: int, limit: int = 1000) -> List[Dict[str, Any]]:
+        """按序号读取目录库的变更日志"""
+        return self.catalog.get_changes(after, limit)
+
+    def prune_changes(self, keep: int) -> int:
+        """删除目录库中较早的变更日志"""
+        return self.catalog.prune_changes(keep)
@@ -2,20 +2,207 @@
 # -*- coding: utf-8 -*-
 
 import json
+import re
 import sqlite3
+import threading
 import uuid
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
-class SQLiteDatabase:
+from ..core.versioning import (
+    changed_fields,
+    diff_role_state,
+    is_snapshot_version,
+    rebuild_role_state,
+    role_state,
+)
+from .base import DatabaseBackend
+from .compression import DICTIONARY_SQL, TextCompressor, decompress, dictionary_id
+from .instrumentation import instrumented as _instrumented
+
+# 数据库表结构，连接时按需创建（与 init_db.py 保持一致）
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS roles (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT,
+    role_type TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    attributes JSON NOT NULL
+);
+CREATE TABLE IF NOT EXISTS role_versions (
+    version_id TEXT PRIMARY KEY,
+    role_id TEXT NOT NULL,
+    attributes JSON NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    version INTEGER,
+    is_snapshot INTEGER NOT NULL DEFAULT 0,
+    FOREIGN KEY (role_id) REFERENCES roles(id)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    role_id TEXT NOT NULL,
+    user_id TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_activity TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    metadata JSON,
+    FOREIGN KEY (role_id) REFERENCES roles(id)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    metadata JSON,
+    sequence INTEGER,
+    FOREIGN KEY (session_id) REFERENCES sessions(id)
+);
+CREATE TABLE IF NOT EXISTS prompt_templates (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT,
+    format TEXT,
+    is_default BOOLEAN DEFAULT 0,
+    role_types TEXT,
+    template_content TEXT NOT NULL,
+    variables JSON,
+    version INTEGER NOT NULL DEFAULT 1,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS role_default_templates (
+    role_id TEXT NOT NULL,
+    template_id TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (role_id, template_id),
+    FOREIGN KEY (role_id) REFERENCES roles(id),
+    FOREIGN KEY (template_id) REFERENCES prompt_templates(id)
+);
+"""
+
+# 变更日志，由触发器写入，各进程按序号跟踪以使缓存失效（与 init_db.py 保持一致）。
+# entity为role、template、role_default_template或session；role_default_template的entity_id为角色ID，
+# 表示该角色的默认模板关联或所关联模板的内容发生了变化；session表示会话追加了消息
+_CHANGE_LOG_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    entity TEXT NOT NULL,
+    entity_id TEXT NOT NULL,
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# 追加消息时每批更新一次会话活动时间，每批只记录一条session变更（会话分片库也使用）
+_SESSION_CHANGE_LOG_SQL = """
+CREATE TRIGGER IF NOT EXISTS change_log_sessions_activity AFTER UPDATE OF last_activity ON sessions
+BEGIN
+    INSERT INTO change_log (entity, entity_id) VALUES ('session', NEW.id);
+END;
+"""
+
+_CHANGE_LOG_SQL = _CHANGE_LOG_TABLE_SQL + _SESSION_CHANGE_LOG_SQL + """
+CREATE TRIGGER IF NOT EXISTS change_log_roles_insert AFTER INSERT ON roles
+BEGIN
+    INSERT INTO change_log (entity, entity_id) VALUES ('role', NEW.id);
+END;
+CREATE TRIGGER IF NOT EXISTS change_log_roles_update AFTER UPDATE ON roles
+BEGIN
+    INSERT INTO change_log (entity, entity_id) VALUES ('role', NEW.id);
+END;
+CREATE TRIGGER IF NOT EXISTS change_log_roles_delete AFTER DELETE ON roles
+BEGIN
+    INSERT INTO change_log (entity, entity_id) VALUES ('role', OLD.id);
+END;
+CREATE TRIGGER IF NOT EXISTS change_log_prompt_templates_insert AFTER INSERT ON prompt_templates
+BEGIN
+    INSERT INTO change_log (entity, entity_id) VALUES ('template', NEW.id);
+END;
+CREATE TRIGGER IF NOT EXISTS change_log_prompt_templates_update AFTER UPDATE ON prompt_templates
+BEGIN
+    INSERT INTO change_log (entity, entity_id) VALUES ('template', NEW.id);
+    INSERT INTO change_log (entity, entity_id)
+        SELECT 'role_default_template', role_id FROM role_default_templates WHERE template_id = NEW.id;
+END;
+CREATE TRIGGER IF NOT EXISTS change_log_prompt_templates_delete AFTER DELETE ON prompt_templates
+BEGIN
+    INSERT INTO change_log (entity, entity_id) VALUES ('template', OLD.id);
+END;
+CREATE TRIGGER IF NOT EXISTS change_log_role_default_templates_insert AFTER INSERT ON role_default_templates
+BEGIN
+    INSERT INTO change_log (entity, entity_id) VALUES ('role_default_template', NEW.role_id);
+END;
+CREATE TRIGGER IF NOT EXISTS change_log_role_default_templates_update AFTER UPDATE ON role_default_templates
+BEGIN
+    INSERT INTO change_log (entity, entity_id) VALUES ('role_default_template', NEW.role_id);
+END;
+CREATE TRIGGER IF NOT EXISTS change_log_role_default_templates_delete AFTER DELETE ON role_default_templates
+BEGIN
+    INSERT INTO change_log (entity, entity_id) VALUES ('role_default_template', OLD.role_id);
+END;
+"""
+
+
+# PRAGMA名称和值的允许格式
+_PRAGMA_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_PRAGMA_VALUE = re.compile(r"-?[A-Za-z0-9_]+")
+
+
+def _safe_json_loads(json_str: Optional[str], default: Any = None) -> Any:
+    """安全解析JSON，空值或无效值时返回默认值"""
+    if not json_str:
+        return default
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        return default
+
+
+def _parse_role_types(value: Optional[str]) -> List[str]:
+    """解析模板的角色类型字段，兼容旧数据中的逗号分隔字符串"""
+    if value and isinstance(value, str) and ',' in value and not value.startswith('['):
+        return [rt.strip() for rt in value.split(',')]
+    return _safe_json_loads(value, [])
+
+
+def validate_pragmas(pragmas: Dict[str, Union[str, int]]) -> Dict[str, str]:
+    """校验PRAGMA名称和值，只允许标识符和简单的数值或关键字，防止拼接出任意SQL
+
+    Args:
+        pragmas: PRAGMA名称到值的映射
+
+    Returns:
+        Dict[str, str]: 规范化后的PRAGMA设置
+
+    Raises:
+        ValueError: 名称或值不合法
+    """
+    result = {}
+    for name, value in pragmas.items():
+        value = str(value).strip()
+        if not _PRAGMA_NAME.fullmatch(name) or not _PRAGMA_VALUE.fullmatch(value):
+            raise ValueError(f"无效的PRAGMA设置: {name}={value}")
+        result[name.lower()] = value
+    return result
+
+
+class SQLiteDatabase(DatabaseBackend):
     """SQLite数据库实现"""
     
-    def __init__(self, db_path: Optional[str] = None):
+    def __init__(self, db_path: Optional[str] = None,
+                 pragmas: Optional[Dict[str, Union[str, int]]] = None,
+                 compression: Optional[TextCompressor] = None):
         """初始化SQLite数据库连接
         
         Args:
             db_path: 数据库文件路径，默认为项目resource/db目录下的llm_roles.db
+            pragmas: 每个连接建立时执行的PRAGMA设置（如journal_mode、busy_timeout），
+                foreign_keys始终开启
+            compression: 写入消息内容和模板内容时的压缩设置，None表示不压缩
+                （已压缩的值总是可以读取）
         """
         if db_path is None:
             # 默认数据库路径
@@ -25,24 +212,260 @@ class SQLiteDatabase:
             db_path = str(db_dir / "llm_roles.db")
             
         self.db_path = db_path
-        self.conn = None
+        self.pragmas = validate_pragmas(pragmas or {})
+        # 每个线程使用独立连接，避免并发请求的事务相互交错
+        self._connections: Dict[int, sqlite3.Connection] = {}
+        self._connections_lock = threading.Lock()
+        self._schema_ready = False
+        # 每个线程的外层事务状态
+        self._tx_state = threading.local()
+        self.compression = compression
+        # 预设字典ID到内容的缓存
+        self._dictionaries: Dict[int, bytes] = {}
+        
+    @property
+    def conn(self) -> Optional[sqlite3.Connection]:
+        """当前线程的数据库连接，尚未连接时为None"""
+        return self._connections.get(threading.get_ident())
         
     def connect(self) -> None:
-        """建立数据库连接"""
-        self.conn = sqlite3.connect(self.db_path)
+        """为当前线程建立数据库连接，首次连接时确保表结构存在"""
+        # 允许跨线程使用连接（流式响应会在线程池的不同线程中迭代）
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
         # 启用外键约束
-        self.conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA foreign_keys = ON")
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
         # 配置连接返回Row对象
-        self.conn.row_factory = sqlite3.Row
-        print(f"Connected to database: {self.db_path}")
+        conn.row_factory = sqlite3.Row
+        with self._connections_lock:
+            stale = self._add_connection(conn)
+            if not self._schema_ready:
+                self._ensure_schema()
+                self._load_compression_dictionary()
+                self._schema_ready = True
+                print(f"Connected to database: {self.db_path}")
+        for old in stale:
+            old.close()
+
+    def _add_connection(self, conn: sqlite3.Connection) -> List[sqlite3.Connection]:
+        """登记当前线程的连接，并取出已退出线程的连接（需持有_connections_lock）
+
+        线程池会回收空闲线程并创建新线程，已退出线程的连接不再被使用，
+        不清理的话会一直占用数据库、WAL和共享内存文件的句柄。
+
+        Args:
+            conn: 当前线程的新连接
+
+        Returns:
+            List[sqlite3.Connection]: 需要由调用方在锁外关闭的连接
+        """
+        alive = {thread.ident for thread in threading.enumerate()}
+        ident = threading.get_ident()
+        stale = [self._connections.pop(key) for key in list(self._connections)
+                 if key not in alive or key == ident]
+        self._connections[ident] = conn
+        return stale
         
     def disconnect(self) -> None:
-        """关闭数据库连接"""
-        if self.conn:
-            self.conn.close()
-            self.conn = None
+        """关闭所有线程的数据库连接"""
+        with self._connections_lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for conn in connections:
+            conn.close()
+        if connections:
             print("Database connection closed")
             
+    @property
+    def connection_count(self) -> int:
+        """当前打开的连接数（不含已退出线程的连接，这些连接在这里关闭）"""
+        alive = {thread.ident for thread in threading.enumerate()}
+        with self._connections_lock:
+            stale = [self._connections.pop(key) for key in list(self._connections) if key not in alive]
+        for conn in stale:
+            conn.close()
+        return len(self._connections)
+            
+    def _ensure_schema(self) -> None:
+        """确保表结构存在，并对旧版本数据库做增量迁移
+        
+        多个工作进程可能同时启动，迁移在BEGIN IMMEDIATE事务中进行：先拿到写锁的进程
+        完成迁移，其余进程等待后看到的已是新表结构，不会重复添加列。
+        """
+        self.conn.executescript(_SCHEMA_SQL + _CHANGE_LOG_SQL)
+        
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 旧数据库的role_versions表缺少版本号和快照标记列
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(role_versions)")}
+            if 'version' not in columns:
+                self.conn.execute("ALTER TABLE role_versions ADD COLUMN version INTEGER")
+            if 'is_snapshot' not in columns:
+                self.conn.execute(
+                    "ALTER TABLE role_versions ADD COLUMN is_snapshot INTEGER NOT NULL DEFAULT 0"
+                )
+            self.conn.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_role_versions_role_version
+                ON role_versions (role_id, version)
+            """)
+            
+            # 模板的修改计数，updated_at相同的两次修改也能区分（用于ETag）
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(prompt_templates)")}
+            if 'version' not in columns:
+                self.conn.execute(
+                    "ALTER TABLE prompt_templates ADD COLUMN version INTEGER NOT NULL DEFAULT 1"
+                )
+        
+            # 消息按会话内的递增序号排序和分页
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(messages)")}
+            if 'sequence' not in columns:
+                self.conn.execute("ALTER TABLE messages ADD COLUMN sequence INTEGER")
+                # 按原有的时间戳顺序为旧消息补齐序号
+                self.conn.execute("""
+                    UPDATE messages SET sequence = ordered.seq
+                    FROM (
+                        SELECT rowid AS rid, ROW_NUMBER() OVER (
+                            PARTITION BY session_id ORDER BY timestamp, rowid
+                        ) AS seq
+                        FROM messages
+                    ) AS ordered
+                    WHERE messages.rowid = ordered.rid
+                """)
+            self.conn.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_session_sequence
+                ON messages (session_id, sequence)
+            """)
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+            
+    # =========== 压缩 ===========
+    
+    def _load_compression_dictionary(self) -> None:
+        """压缩设置使用预设字典时，加载数据库中最新的字典"""
+        if not (self.compression and self.compression.use_dictionary):
+            return
+        try:
+            row = self.conn.execute(
+                "SELECT id, data FROM compression_dictionaries ORDER BY created_at DESC, rowid DESC LIMIT 1"
+            ).fetchone()
+        except sqlite3.OperationalError:
+            # 还没有训练过字典
+            return
+        if row:
+            self._dictionaries[row[0]] = row[1]
+            self.compression.dictionary = row[1]
+    
+    def _dictionary(self, dict_id: int) -> bytes:
+        """按ID获取预设字典，其他进程新训练的字典在首次遇到时读取"""
+        data = self._dictionaries.get(dict_id)
+        if data is None:
+            row = self.conn.execute(
+                "SELECT data FROM compression_dictionaries WHERE id = ?", (dict_id,)
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"压缩字典不存在: {dict_id}")
+            data = self._dictionaries[dict_id] = row[0]
+        return data
+    
+    def _encode(self, text: Optional[str]) -> Union[str, bytes, None]:
+        """按压缩设置编码写入的文本"""
+        return self.compression.compress(text) if self.compression else text
+    
+    def _decode(self, value: Union[str, bytes, None]) -> Optional[str]:
+        """还原读出的文本，未压缩的值原样返回"""
+        return decompress(value, self._dictionary) if isinstance(value, bytes) else value
+    
+    def store_compression_dictionary(self, data: bytes) -> int:
+        """保存预设字典，使用预设字典的压缩设置随后改用它
+        
+        Args:
+            data: 字典内容
+            
+        Returns:
+            int: 字典ID
+        """
+        if not self.conn:
+            self.connect()
+        dict_id = dictionary_id(data)
+        self.conn.execute(DICTIONARY_SQL)
+        self.conn.execute(
+            "INSERT OR IGNORE INTO compression_dictionaries (id, data) VALUES (?, ?)", (dict_id, data)
+        )
+        self._commit()
+        self._dictionaries[dict_id] = data
+        if self.compression and self.compression.use_dictionary:
+            self.compression.dictionary = data
+        return dict_id
+    
+    # =========== 事务 ===========
+    
+    def _in_transaction(self) -> bool:
+        """当前线程是否处于transaction()开启的外层事务中"""
+        return getattr(self._tx_state, 'depth', 0) > 0
+    
+    def _commit(self) -> None:
+        """提交单个操作；处于外层事务中时由外层统一提交"""
+        if not self._in_transaction():
+            self.conn.commit()
+    
+    def _rollback(self) -> None:
+        """回滚单个操作；处于外层事务中时由外层（或保存点）负责回滚"""
+        if not self._in_transaction():
+            self.conn.rollback()
+    
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """在一个事务中执行多个操作，全部成功才提交，出现异常时整体回滚
+        
+        事务内各方法不再单独提交。可以嵌套，只有最外层负责提交或回滚。
+        """
+        if not self.conn:
+            self.connect()
+            
+        if self._in_transaction():
+            self._tx_state.depth += 1
+            try:
+                yield
+            finally:
+                self._tx_state.depth -= 1
+            return
+            
+        self.conn.execute("BEGIN")
+        self._tx_state.depth = 1
+        try:
+            yield
+        except BaseException:
+            self._tx_state.depth = 0
+            self.conn.rollback()
+            raise
+        else:
+            self._tx_state.depth = 0
+            self.conn.commit()
+    
+    @contextmanager
+    def savepoint(self) -> Iterator[None]:
+        """在外层事务中设置保存点，代码块抛出异常时只回滚到保存点
+        
+        必须在transaction()内使用。
+        """
+        if not self._in_transaction():
+            raise RuntimeError("savepoint() 必须在 transaction() 中使用")
+            
+        self._tx_state.savepoints = getattr(self._tx_state, 'savepoints', 0) + 1
+        name = f"sp_{self._tx_state.savepoints}"
+        self.conn.execute(f"SAVEPOINT {name}")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute(f"ROLLBACK TO {name}")
+            self.conn.execute(f"RELEASE {name}")
+            raise
+        else:
+            self.conn.execute(f"RELEASE {name}")
+            
     def __enter__(self):
         self.connect()
         return self
@@ -50,6 +473,7 @@ class SQLiteDatabase:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.disconnect()
         
+    @_instrumented
     def create_role(self, role_data: Dict[str, Any]) -> str:
         """创建新角色
         
@@ -80,14 +504,24 @@ class SQLiteDatabase:
                 VALUES (?, ?, ?, ?, ?)
             """, (role_id, name, description, role_type, json.dumps(attributes)))
             
-            self.conn.commit()
+            # 记录初始版本（完整快照）
+            state = role_state({
+                'name': name,
+                'description': description,
+                'role_type': role_type,
+                **attributes
+            })
+            self._insert_role_version(cursor, role_id, 1, True, state)
+            
+            self._commit()
             print(f"Created role: {role_id}")
             return role_id
         except Exception as e:
-            self.conn.rollback()
+            self._rollback()
             print(f"Error creating role: {e}")
             raise
     
+    @_instrumented
     def get_role(self, role_id: str) -> Optional[Dict[str, Any]]:
         """获取角色信息
         
@@ -124,6 +558,30 @@ class SQLiteDatabase:
         
         return role
     
+    @_instrumented
+    def get_role_version_info(self, role_id: str) -> Optional[Dict[str, Any]]:
+        """获取角色的版本信息，不读取属性JSON，用于条件请求校验
+        
+        Args:
+            role_id: 角色ID
+            
+        Returns:
+            包含updated_at和最新版本号的字典，如果角色不存在返回None
+        """
+        if not self.conn:
+            self.connect()
+            
+        row = self.conn.execute("""
+            SELECT r.updated_at,
+                   (SELECT MAX(version) FROM role_versions WHERE role_id = r.id)
+            FROM roles r WHERE r.id = ?
+        """, (role_id,)).fetchone()
+        if not row:
+            return None
+            
+        return {'id': role_id, 'updated_at': row[0], 'version': row[1]}
+    
+    @_instrumented
     def update_role(self, role_id: str, role_data: Dict[str, Any]) -> bool:
         """更新角色信息
         
@@ -172,13 +630,24 @@ class SQLiteDatabase:
             # 没有要更新的字段
             return False
             
-        update_fields.append("updated_at = CURRENT_TIMESTAMP")
+        update_fields.append("updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')")
         
         # 添加角色ID到参数列表
         params.append(role_id)
         
         # 执行更新
         try:
+            # 读取更新前的状态，用于计算版本差量
+            cursor.execute("""
+                SELECT name, description, role_type, attributes
+                FROM roles WHERE id = ?
+            """, (role_id,))
+            row = cursor.fetchone()
+            if not row:
+                # 没有找到要更新的角色
+                return False
+            old_state = role_state(self._merge_role_row(*row))
+            
             cursor.execute(f"""
                 UPDATE roles 
                 SET {', '.join(update_fields)}
@@ -188,14 +657,23 @@ class SQLiteDatabase:
             if cursor.rowcount == 0:
                 # 没有找到要更新的角色
                 return False
+            
+            new_state = role_state(self._merge_role_row(
+                name if name is not None else row[0],
+                description if description is not None else row[1],
+                role_type if role_type is not None else row[2],
+                json.dumps(attributes) if attributes else row[3]
+            ))
+            self._record_role_version(cursor, role_id, old_state, new_state)
                 
-            self.conn.commit()
+            self._commit()
             return True
         except Exception as e:
-            self.conn.rollback()
+            self._rollback()
             print(f"Error updating role: {e}")
             raise
     
+    @_instrumented
     def delete_role(self, role_id: str) -> bool:
         """删除角色
         
@@ -211,18 +689,23 @@ class SQLiteDatabase:
         cursor = self.conn.cursor()
         
         try:
+            # 先删除角色的历史版本
+            cursor.execute("DELETE FROM role_versions WHERE role_id = ?", (role_id,))
+            
             cursor.execute("DELETE FROM roles WHERE id = ?", (role_id,))
             if cursor.rowcount == 0:
                 # 没有找到要删除的角色
+                self._rollback()
                 return False
                 
-            self.conn.commit()
+            self._commit()
             return True
         except Exception as e:
-            self.conn.rollback()
+            self._rollback()
             print(f"Error deleting role: {e}")
             raise
     
+    @_instrumented
     def list_roles(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
         """列出角色
         
@@ -261,6 +744,7 @@ class SQLiteDatabase:
             
         return roles
     
+    @_instrumented
     def search_roles(self, query: str) -> List[Dict[str, Any]]:
         """搜索角色
         
@@ -299,6 +783,144 @@ class SQLiteDatabase:
             
         return roles
     
+    # =========== 角色版本操作 ===========
+    
+    @staticmethod
+    def _merge_role_row(name: str, description: str, role_type: str,
+                        attributes_json: str) -> Dict[str, Any]:
+        """将角色行的基础字段与JSON属性合并为一个字典"""
+        role = {
+            'name': name,
+            'description': description,
+            'role_type': role_type,
+        }
+        role.update(json.loads(attributes_json) if attributes_json else {})
+        return role
+    
+    def _insert_role_version(self, cursor: sqlite3.Cursor, role_id: str, version: int,
+                             is_snapshot: bool, payload: Dict[str, Any]) -> None:
+        """写入一条版本记录（不提交事务）"""
+        cursor.execute("""
+            INSERT INTO role_versions (version_id, role_id, version, is_snapshot, attributes)
+            VALUES (?, ?, ?, ?, ?)
+        """, (str(uuid.uuid4()), role_id, version, int(is_snapshot), json.dumps(payload)))
+    
+    def _record_role_version(self, cursor: sqlite3.Cursor, role_id: str,
+                             old_state: Dict[str, Any], new_state: Dict[str, Any]) -> None:
+        """记录一次角色更新产生的版本（不提交事务）
+        
+        Args:
+            cursor: 当前事务的游标
+            role_id: 角色ID
+            old_state: 更新前的角色状态
+            new_state: 更新后的角色状态
+        """
+        cursor.execute(
+            "SELECT MAX(version) FROM role_versions WHERE role_id = ?", (role_id,)
+        )
+        last_version = cursor.fetchone()[0]
+        if last_version is None:
+            # 早于版本功能创建的角色，先补记更新前的状态作为基线快照
+            self._insert_role_version(cursor, role_id, 1, True, old_state)
+            last_version = 1
+            
+        if new_state == old_state:
+            # 内容没有变化，不产生新版本
+            return
+            
+        version = last_version + 1
+        if is_snapshot_version(version):
+            self._insert_role_version(cursor, role_id, version, True, new_state)
+        else:
+            self._insert_role_version(
+                cursor, role_id, version, False, diff_role_state(old_state, new_state)
+            )
+    
+    @_instrumented
+    def get_role_version(self, role_id: str, version: int) -> Optional[Dict[str, Any]]:
+        """获取角色的指定历史版本
+        
+        从不晚于该版本的最近快照开始应用差量重建，最多读取 SNAPSHOT_INTERVAL 条记录。
+        
+        Args:
+            role_id: 角色ID
+            version: 版本号
+            
+        Returns:
+            版本信息字典（data字段为该版本的完整角色数据），如果不存在返回None
+        """
+        if not self.conn:
+            self.connect()
+            
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT version, is_snapshot, attributes, created_at
+            FROM role_versions
+            WHERE role_id = ? AND version <= ? AND version >= COALESCE((
+                SELECT MAX(version) FROM role_versions
+                WHERE role_id = ? AND version <= ? AND is_snapshot = 1
+            ), 0)
+            ORDER BY version
+        """, (role_id, version, role_id, version))
+        
+        rows = cursor.fetchall()
+        if not rows or rows[-1][0] != version:
+            return None
+            
+        state = rebuild_role_state([
+            {'is_snapshot': bool(row[1]), 'payload': json.loads(row[2])}
+            for row in rows
+        ])
+        if state is None:
+            return None
+            
+        return {
+            'role_id': role_id,
+            'version': version,
+            'is_snapshot': bool(rows[-1][1]),
+            'created_at': rows[-1][3],
+            'data': {'id': role_id, **state}
+        }
+    
+    @_instrumented
+    def list_role_versions(self, role_id: str, limit: int = 100,
+                           offset: int = 0) -> List[Dict[str, Any]]:
+        """列出角色的历史版本（按版本号倒序）
+        
+        Args:
+            role_id: 角色ID
+            limit: 返回的最大记录数
+            offset: 偏移量
+            
+        Returns:
+            版本摘要列表，差量版本包含变更字段列表
+        """
+        if not self.conn:
+            self.connect()
+            
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT version_id, version, is_snapshot, attributes, created_at
+            FROM role_versions
+            WHERE role_id = ?
+            ORDER BY version DESC
+            LIMIT ? OFFSET ?
+        """, (role_id, limit, offset))
+        
+        versions = []
+        for row in cursor.fetchall():
+            is_snapshot = bool(row[2])
+            versions.append({
+                'version_id': row[0],
+                'version': row[1],
+                'is_snapshot': is_snapshot,
+                'changed_fields': None if is_snapshot else changed_fields(json.loads(row[3])),
+                'created_at': row[4]
+            })
+            
+        return versions
+    
+    @_instrumented
     def create_session(self, role_id: str, user_id: Optional[str] = None,
                       metadata: Optional[Dict[str, Any]] = None) -> str:
         """创建会话
@@ -311,11 +933,17 @@ class SQLiteDatabase:
         Returns:
             会话ID
         """
+        session_id = str(uuid.uuid4())
+        self._insert_session(session_id, role_id, user_id, metadata)
+        return session_id
+    
+    def _insert_session(self, session_id: str, role_id: str, user_id: Optional[str],
+                        metadata: Optional[Dict[str, Any]]) -> None:
+        """以给定的会话ID写入会话（分片存储需要先确定ID再选择分片）"""
         if not self.conn:
             self.connect()
             
         cursor = self.conn.cursor()
-        session_id = str(uuid.uuid4())
         
         # 默认空元数据
         if metadata is None:
@@ -327,13 +955,44 @@ class SQLiteDatabase:
                 VALUES (?, ?, ?, ?)
             """, (session_id, role_id, user_id, json.dumps(metadata)))
             
-            self.conn.commit()
-            return session_id
+            self._commit()
         except Exception as e:
-            self.conn.rollback()
+            self._rollback()
             print(f"Error creating session: {e}")
             raise
     
+    @_instrumented
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """获取会话信息
+        
+        Args:
+            session_id: 会话ID
+            
+        Returns:
+            会话信息字典，如果不存在返回None
+        """
+        if not self.conn:
+            self.connect()
+            
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT id, role_id, user_id, created_at, last_activity, metadata
+            FROM sessions WHERE id = ?
+        """, (session_id,))
+        
+        row = cursor.fetchone()
+        if not row:
+            return None
+            
+        return {
+            'id': row[0],
+            'role_id': row[1],
+            'user_id': row[2],
+            'created_at': row[3],
+            'last_activity': row[4],
+            'metadata': _safe_json_loads(row[5], {})
+        }
+    
     def add_message(self, session_id: str, sender: str, content: str,
                    metadata: Optional[Dict[str, Any]] = None) -> str:
         """添加消息
@@ -347,77 +1006,165 @@ class SQLiteDatabase:
         Returns:
             消息ID
         """
+        added = self.add_messages(session_id, [
+            {'sender': sender, 'content': content, 'metadata': metadata}
+        ])
+        return added[0]['id']
+    
+    @_instrumented
+    def add_messages(self, session_id: str, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """在一个事务中批量添加消息
+        
+        整批消息只读取一次会话当前最大序号、只更新一次会话活动时间，并且不回读已写入的行。
+        
+        Args:
+            session_id: 会话ID
+            messages: 消息列表，每条包含sender、content和可选的metadata
+            
+        Returns:
+            按输入顺序排列的 {'id', 'sequence', 'timestamp'} 列表
+            
+        Raises:
+            ValueError: 如果会话不存在
+        """
         if not self.conn:
             self.connect()
             
+        if not messages:
+            return []
+            
         cursor = self.conn.cursor()
-        message_id = str(uuid.uuid4())
         
-        # 默认空元数据
-        if metadata is None:
-            metadata = {}
-            
         try:
-            # 插入消息
-            cursor.execute("""
-                INSERT INTO messages (id, session_id, sender, content, metadata)
-                VALUES (?, ?, ?, ?, ?)
-            """, (message_id, session_id, sender, content, json.dumps(metadata)))
-            
-            # 更新会话最后活动时间
+            # 先更新会话最后活动时间：获取写锁，同时确认会话存在
             cursor.execute("""
                 UPDATE sessions
                 SET last_activity = CURRENT_TIMESTAMP
                 WHERE id = ?
             """, (session_id,))
+            if cursor.rowcount == 0:
+                self._rollback()
+                raise ValueError(f"会话不存在: {session_id}")
             
-            self.conn.commit()
-            return message_id
+            # 会话内当前最大序号（走(session_id, sequence)索引）
+            cursor.execute(
+                "SELECT COALESCE(MAX(sequence), 0) FROM messages WHERE session_id = ?",
+                (session_id,)
+            )
+            base = cursor.fetchone()[0]
+            
+            # 与CURRENT_TIMESTAMP相同的UTC格式，调用方无需回读即可得到完整消息
+            timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            added = []
+            rows = []
+            for offset, message in enumerate(messages, start=1):
+                message_id = str(uuid.uuid4())
+                added.append({'id': message_id, 'sequence': base + offset, 'timestamp': timestamp})
+                rows.append((
+                    message_id, session_id, message['sender'], self._encode(message['content']),
+                    json.dumps(message.get('metadata') or {}), base + offset, timestamp
+                ))
+            
+            cursor.executemany("""
+                INSERT INTO messages (id, session_id, sender, content, metadata, sequence, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            
+            self._commit()
+            return added
+        except ValueError:
+            raise
         except Exception as e:
-            self.conn.rollback()
+            self._rollback()
             print(f"Error adding message: {e}")
             raise
     
-    def get_session_messages(self, session_id: str) -> List[Dict[str, Any]]:
+    @_instrumented
+    def get_session_messages(self, session_id: str, limit: Optional[int] = None,
+                             before: Optional[int] = None, after: Optional[int] = None,
+                             order: str = 'asc') -> List[Dict[str, Any]]:
         """获取会话消息
         
+        按会话内序号排序，支持以序号为游标分页。
+        
         Args:
             session_id: 会话ID
+            limit: 返回的最大消息数，None表示不限制
+            before: 只返回序号小于该值的消息
+            after: 只返回序号大于该值的消息
+            order: 排序方向，'asc'或'desc'
             
         Returns:
             消息列表
+            
+        Raises:
+            ValueError: 如果排序方向无效
         """
+        if order not in ('asc', 'desc'):
+            raise ValueError(f"无效的排序方向: {order}")
+            
         if not self.conn:
             self.connect()
             
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT id, sender, content, timestamp, metadata
+        conditions = ["session_id = ?"]
+        params: List[Any] = [session_id]
+        if before is not None:
+            conditions.append("sequence < ?")
+            params.append(before)
+        if after is not None:
+            conditions.append("sequence > ?")
+            params.append(after)
+            
+        sql = f"""
+            SELECT id, sender, content, timestamp, metadata, sequence
             FROM messages
-            WHERE session_id = ?
-            ORDER BY timestamp
-        """, (session_id,))
-        
-        messages = []
-        for row in cursor.fetchall():
-            message = {
-                'id': row[0],
-                'sender': row[1],
-                'content': row[2],
-                'timestamp': row[3],
-            }
+            WHERE {' AND '.join(conditions)}
+            ORDER BY sequence {order.upper()}
+        """
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
             
-            # 解析元数据
-            metadata = json.loads(row[4])
-            if metadata:
-                message['metadata'] = metadata
-                
-            messages.append(message)
+        cursor = self.conn.cursor()
+        cursor.execute(sql, params)
+        
+        return [self._row_to_message(row) for row in cursor.fetchall()]
+    
+    @_instrumented
+    def tail_session_messages(self, session_id: str, n: int) -> List[Dict[str, Any]]:
+        """获取会话最近的n条消息（按时间正序）
+        
+        Args:
+            session_id: 会话ID
+            n: 消息数量
             
+        Returns:
+            消息列表
+        """
+        messages = self.get_session_messages(session_id, limit=n, order='desc')
+        messages.reverse()
         return messages
     
+    def _row_to_message(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """将消息行转换为字典"""
+        message = {
+            'id': row[0],
+            'sender': row[1],
+            'content': self._decode(row[2]),
+            'timestamp': row[3],
+            'sequence': row[5],
+        }
+        
+        # 解析元数据
+        metadata = json.loads(row[4]) if row[4] else {}
+        if metadata:
+            message['metadata'] = metadata
+            
+        return message
+    
     # =========== 提示词模板操作 ===========
     
+    @_instrumented
     def create_template(self, template_data: Dict[str, Any]) -> str:
         """创建新提示词模板
         
@@ -438,7 +1185,7 @@ class SQLiteDatabase:
         description = template_data.get('description', '')
         format = template_data.get('format', 'openai')
         role_types = json.dumps(template_data.get('role_types', []))
-        template_content = template_data.get('template_content', '')
+        template_content = self._encode(template_data.get('template_content', ''))
         variables = json.dumps(template_data.get('variables', []))
         
         try:
@@ -447,14 +1194,15 @@ class SQLiteDatabase:
                 VALUES (?, ?, ?, ?, ?, ?, ?)
             """, (template_id, name, description, format, role_types, template_content, variables))
             
-            self.conn.commit()
+            self._commit()
             print(f"Created prompt template: {template_id}")
             return template_id
         except Exception as e:
-            self.conn.rollback()
+            self._rollback()
             print(f"Error creating prompt template: {e}")
             raise
     
+    @_instrumented
     def get_template(self, template_id: str) -> Optional[Dict[str, Any]]:
         """获取提示词模板信息
         
@@ -477,37 +1225,43 @@ class SQLiteDatabase:
         if not row:
             return None
             
-        # 安全解析JSON，确保空值或无效值时返回默认值
-        def safe_json_loads(json_str, default=None):
-            if not json_str:
-                return default
-            try:
-                return json.loads(json_str)
-            except json.JSONDecodeError:
-                return default
-            
-        # 处理角色类型，如果是逗号分隔的字符串，转换为列表
-        role_types = row[4]
-        if role_types and isinstance(role_types, str) and ',' in role_types:
-            role_types = [rt.strip() for rt in role_types.split(',')]
-        else:
-            role_types = safe_json_loads(role_types, [])
-            
         # 构建完整模板对象
         template = {
             'id': row[0],
             'name': row[1],
             'description': row[2],
             'format': row[3] or 'openai',  # 默认格式
-            'role_types': role_types,
-            'template_content': row[5],
-            'variables': safe_json_loads(row[6], []),
+            'role_types': _parse_role_types(row[4]),
+            'template_content': self._decode(row[5]),
+            'variables': _safe_json_loads(row[6], []),
             'created_at': row[7],
             'updated_at': row[8]
         }
         
         return template
     
+    @_instrumented
+    def get_template_version_info(self, template_id: str) -> Optional[Dict[str, Any]]:
+        """获取模板的版本信息，不读取模板内容，用于条件请求校验
+        
+        Args:
+            template_id: 模板ID
+            
+        Returns:
+            包含updated_at和修改计数version的字典，如果模板不存在返回None
+        """
+        if not self.conn:
+            self.connect()
+            
+        row = self.conn.execute(
+            "SELECT updated_at, version FROM prompt_templates WHERE id = ?", (template_id,)
+        ).fetchone()
+        if not row:
+            return None
+            
+        return {'id': template_id, 'updated_at': row[0], 'version': row[1]}
+    
+    @_instrumented
     def update_template(self, template_id: str, template_data: Dict[str, Any]) -> bool:
         """更新提示词模板信息
         
@@ -542,6 +1296,8 @@ class SQLiteDatabase:
                 value = template_data[key]
                 if key in ('role_types', 'variables') and value is not None:
                     value = json.dumps(value)
+                elif key == 'template_content':
+                    value = self._encode(value)
                 update_fields.append(f"{field} = ?")
                 params.append(value)
         
@@ -549,7 +1305,8 @@ class SQLiteDatabase:
             # 没有要更新的字段
             return False
             
-        update_fields.append("updated_at = CURRENT_TIMESTAMP")
+        update_fields.append("updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')")
+        update_fields.append("version = version + 1")
         
         # 添加模板ID到参数列表
         params.append(template_id)
@@ -566,13 +1323,14 @@ class SQLiteDatabase:
                 # 没有找到要更新的模板
                 return False
                 
-            self.conn.commit()
+            self._commit()
             return True
         except Exception as e:
-            self.conn.rollback()
+            self._rollback()
             print(f"Error updating prompt template: {e}")
             raise
     
+    @_instrumented
     def delete_template(self, template_id: str) -> bool:
         """删除提示词模板
         
@@ -595,16 +1353,17 @@ class SQLiteDatabase:
             cursor.execute("DELETE FROM prompt_templates WHERE id = ?", (template_id,))
             if cursor.rowcount == 0:
                 # 没有找到要删除的模板
-                self.conn.rollback()
+                self._rollback()
                 return False
                 
-            self.conn.commit()
+            self._commit()
             return True
         except Exception as e:
-            self.conn.rollback()
+            self._rollback()
             print(f"Error deleting prompt template: {e}")
             raise
     
+    @_instrumented
     def list_templates(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
         """列出提示词模板
         
@@ -628,30 +1387,14 @@ class SQLiteDatabase:
         
         templates = []
         for row in cursor.fetchall():
-            # 安全解析JSON，确保空值或无效值时返回默认值
-            def safe_json_loads(json_str, default=None):
-                if not json_str:
-                    return default
-                try:
-                    return json.loads(json_str)
-                except json.JSONDecodeError:
-                    return default
-            
-            # 处理角色类型，如果是逗号分隔的字符串，转换为列表
-            role_types = row[4]
-            if role_types and isinstance(role_types, str) and ',' in role_types:
-                role_types = [rt.strip() for rt in role_types.split(',')]
-            else:
-                role_types = safe_json_loads(role_types, [])
-            
             template = {
                 'id': row[0],
                 'name': row[1],
                 'description': row[2],
                 'format': row[3] or 'openai',  # 默认格式
-                'role_types': role_types,
-                'template_content': row[5],
-                'variables': safe_json_loads(row[6], []),
+                'role_types': _parse_role_types(row[4]),
+                'template_content': self._decode(row[5]),
+                'variables': _safe_json_loads(row[6], []),
                 'is_default': bool(row[7]),
                 'created_at': row[8],
                 'updated_at': row[9]
@@ -660,6 +1403,7 @@ class SQLiteDatabase:
             
         return templates
     
+    @_instrumented
     def set_role_default_template(self, role_id: str, template_id: str) -> bool:
         """设置角色的默认模板
         
@@ -700,13 +1444,14 @@ class SQLiteDatabase:
                 VALUES (?, ?)
             """, (role_id, template_id))
             
-            self.conn.commit()
+            self._commit()
             return True
         except Exception as e:
-            self.conn.rollback()
+            self._rollback()
             print(f"Error setting role default template: {e}")
             raise
     
+    @_instrumented
     def remove_role_default_template(self, role_id: str, template_id: str) -> bool:
         """移除角色的默认模板
         
@@ -732,13 +1477,14 @@ class SQLiteDatabase:
                 # 没有找到要删除的关联
                 return False
                 
-            self.conn.commit()
+            self._commit()
             return True
         except Exception as e:
-            self.conn.rollback()
+            self._rollback()
             print(f"Error removing role default template: {e}")
             raise
     
+    @_instrumented
     def get_role_default_templates(self, role_id: str) -> List[Dict[str, Any]]:
         """获取角色的默认模板列表
         
@@ -763,34 +1509,331 @@ class SQLiteDatabase:
         
         templates = []
         for row in cursor.fetchall():
-            # 安全解析JSON，确保空值或无效值时返回默认值
-            def safe_json_loads(json_str, default=None):
-                if not json_str:
-                    return default
-                try:
-                    return json.loads(json_str)
-                except json.JSONDecodeError:
-                    return default
-            
-            # 处理角色类型，如果是逗号分隔的字符串，转换为列表
-            role_types = row[4]
-            if role_types and isinstance(role_types, str) and ',' in role_types:
-                role_types = [rt.strip() for rt in role_types.split(',')]
-            else:
-                role_types = safe_json_loads(role_types, [])
-            
             template = {
                 'id': row[0],
                 'name': row[1],
                 'description': row[2],
                 'format': row[3] or 'openai',  # 默认格式
-                'role_types': role_types,
-                'template_content': row[5],
-                'variables': safe_json_loads(row[6], []),
+                'role_types': _parse_role_types(row[4]),
+                'template_content': self._decode(row[5]),
+                'variables': _safe_json_loads(row[6], []),
                 'is_default': bool(row[7]),
                 'created_at': row[8],
                 'updated_at': row[9]
             }
             templates.append(template)
             
-        return templates 
\ No newline at end of file
+        return templates
+    
+    @_instrumented
+    def get_role_default_template_version_info(self, role_id: str) -> Optional[Dict[str, Any]]:
+        """获取生成提示词时使用的角色默认模板（按名称排序的第一个）的版本信息
+        
+        Args:
+            role_id: 角色ID
+            
+        Returns:
+            包含模板ID、updated_at和version的字典，如果角色没有默认模板返回None
+        """
+        if not self.conn:
+            self.connect()
+            
+        row = self.conn.execute("""
+            SELECT pt.id, pt.updated_at, pt.version
+            FROM prompt_templates pt
+            JOIN role_default_templates rdt ON pt.id = rdt.template_id
+            WHERE rdt.role_id = ?
+            ORDER BY pt.name
+            LIMIT 1
+        """, (role_id,)).fetchone()
+        if not row:
+            return None
+            
+        return {'id': row[0], 'updated_at': row[1], 'version': row[2]}
+    
+    # =========== 目录导入导出 ===========
+    
+    def export_roles(self, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """按ID顺序流式导出角色原始记录
+        
+        使用键集分页，每次只读取一批数据，内存占用与角色总数无关。
+        
+        Args:
+            batch_size: 每批读取的记录数
+            
+        Yields:
+            角色记录字典，attributes为解析后的字典
+        """
+        last_id = ''
+        while True:
+            # 流式迭代可能在不同线程中继续，每批读取前确认当前线程已连接
+            if not self.conn:
+                self.connect()
+            rows = self.conn.execute("""
+                SELECT id, name, description, role_type, attributes, created_at, updated_at
+                FROM roles
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            """, (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+                
+            for row in rows:
+                yield {
+                    'id': row[0],
+                    'name': row[1],
+                    'description': row[2],
+                    'role_type': row[3],
+                    'attributes': _safe_json_loads(row[4], {}),
+                    'created_at': row[5],
+                    'updated_at': row[6]
+                }
+            last_id = rows[-1][0]
+    
+    def export_templates(self, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """按ID顺序流式导出提示词模板原始记录
+        
+        Args:
+            batch_size: 每批读取的记录数
+            
+        Yields:
+            模板记录字典
+        """
+        last_id = ''
+        while True:
+            # 流式迭代可能在不同线程中继续，每批读取前确认当前线程已连接
+            if not self.conn:
+                self.connect()
+            rows = self.conn.execute("""
+                SELECT id, name, description, format, is_default, role_types,
+                       template_content, variables, created_at, updated_at
+                FROM prompt_templates
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            """, (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+                
+            for row in rows:
+                yield {
+                    'id': row[0],
+                    'name': row[1],
+                    'description': row[2],
+                    'format': row[3] or 'openai',
+                    'is_default': bool(row[4]),
+                    'role_types': _parse_role_types(row[5]),
+                    'template_content': self._decode(row[6]),
+                    'variables': _safe_json_loads(row[7], []),
+                    'created_at': row[8],
+                    'updated_at': row[9]
+                }
+            last_id = rows[-1][0]
+    
+    def export_role_default_templates(self, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """流式导出角色默认模板关联
+        
+        Args:
+            batch_size: 每批读取的记录数
+            
+        Yields:
+            关联记录字典
+        """
+        last_key = ('', '')
+        while True:
+            # 流式迭代可能在不同线程中继续，每批读取前确认当前线程已连接
+            if not self.conn:
+                self.connect()
+            rows = self.conn.execute("""
+                SELECT role_id, template_id, created_at
+                FROM role_default_templates
+                WHERE (role_id, template_id) > (?, ?)
+                ORDER BY role_id, template_id
+                LIMIT ?
+            """, (*last_key, batch_size)).fetchall()
+            if not rows:
+                return
+                
+            for row in rows:
+                yield {'role_id': row[0], 'template_id': row[1], 'created_at': row[2]}
+            last_key = (rows[-1][0], rows[-1][1])
+    
+    @_instrumented
+    def upsert_catalog_records(self, records: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, int]:
+        """在一个事务中批量写入（插入或覆盖）目录记录
+        
+        覆盖已有版本历史的角色时，会追加一个完整快照版本，保证版本链与当前数据一致。
+        
+        Args:
+            records: (类型, 数据) 列表，类型为 role、template 或 role_default_template
+            
+        Returns:
+            Dict[str, int]: 各类型写入的记录数
+            
+        Raises:
+            ValueError: 如果记录类型未知
+        """
+        if not self.conn:
+            self.connect()
+            
+        roles, templates, bindings = [], [], []
+        for kind, data in records:
+            if kind == 'role':
+                roles.append(data)
+            elif kind == 'template':
+                templates.append(data)
+            elif kind == 'role_default_template':
+                bindings.append(data)
+            else:
+                raise ValueError(f"未知的记录类型: {kind}")
+        
+        cursor = self.conn.cursor()
+        try:
+            if roles:
+                cursor.executemany("""
+                    INSERT INTO roles (id, name, description, role_type, attributes,
+                                       created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?,
+                            COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, CURRENT_TIMESTAMP))
+                    ON CONFLICT(id) DO UPDATE SET
+                        name = excluded.name,
+                        description = excluded.description,
+                        role_type = excluded.role_type,
+                        attributes = excluded.attributes,
+                        updated_at = excluded.updated_at
+                """, [
+                    (r['id'], r.get('name', ''), r.get('description', ''), r.get('role_type', ''),
+                     json.dumps(r.get('attributes') or {}), r.get('created_at'), r.get('updated_at'))
+                    for r in roles
+                ])
+                self._snapshot_imported_roles(cursor, roles)
+                
+            if templates:
+                cursor.executemany("""
+                    INSERT INTO prompt_templates (id, name, description, format, is_default,
+                                                  role_types, template_content, variables,
+                                                  created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?,
+                            COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, CURRENT_TIMESTAMP))
+                    ON CONFLICT(id) DO UPDATE SET
+                        name = excluded.name,
+                        description = excluded.description,
+                        format = excluded.format,
+                        is_default = excluded.is_default,
+                        role_types = excluded.role_types,
+                        template_content = excluded.template_content,
+                        variables = excluded.variables,
+                        version = prompt_templates.version + 1,
+                        updated_at = excluded.updated_at
+                """, [
+                    (t['id'], t.get('name', ''), t.get('description', ''), t.get('format', 'openai'),
+                     int(bool(t.get('is_default', False))), json.dumps(t.get('role_types') or []),
+                     self._encode(t.get('template_content', '')), json.dumps(t.get('variables') or []),
+                     t.get('created_at'), t.get('updated_at'))
+                    for t in templates
+                ])
+                
+            if bindings:
+                cursor.executemany("""
+                    INSERT INTO role_default_templates (role_id, template_id, created_at)
+                    VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                    ON CONFLICT(role_id, template_id) DO NOTHING
+                """, [(b['role_id'], b['template_id'], b.get('created_at')) for b in bindings])
+                
+            self._commit()
+        except Exception as e:
+            self._rollback()
+            print(f"Error importing catalog records: {e}")
+            raise
+            
+        return {
+            'roles': len(roles),
+            'templates': len(templates),
+            'role_default_templates': len(bindings)
+        }
+    
+    def _snapshot_imported_roles(self, cursor: sqlite3.Cursor, roles: List[Dict[str, Any]]) -> None:
+        """为被导入覆盖且已有版本历史的角色追加快照版本（不提交事务）"""
+        by_id = {r['id']: r for r in roles}
+        ids = list(by_id)
+        # 分段查询，避免超出SQLite的参数数量上限
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            placeholders = ', '.join('?' * len(part))
+            cursor.execute(f"""
+                SELECT role_id, MAX(version) FROM role_versions
+                WHERE role_id IN ({placeholders})
+                GROUP BY role_id
+            """, part)
+            for role_id, last_version in cursor.fetchall():
+                r = by_id[role_id]
+                state = role_state({
+                    'name': r.get('name', ''),
+                    'description': r.get('description', ''),
+                    'role_type': r.get('role_type', ''),
+                    **(r.get('attributes') or {})
+                })
+                self._insert_role_version(cursor, role_id, last_version + 1, True, state)
+
+    # =========== 变更日志 ===========
+
+    @_instrumented
+    def get_change_log_bounds(self) -> Tuple[int, int]:
+        """获取变更日志中最早和最新的序号
+
+        Returns:
+            Tuple[int, int]: (最早的序号, 最新的序号)；日志为空时最早的序号为最新序号加1，
+                从未有过变更时最新的序号为0
+        """
+        if not self.conn:
+            self.connect()
+        row = self.conn.execute("""
+            SELECT
+                (SELECT MIN(seq) FROM change_log),
+                (SELECT seq FROM sqlite_sequence WHERE name = 'change_log')
+        """).fetchone()
+        latest = row[1] or 0
+        return (row[0] if row[0] is not None else latest + 1), latest
+
+    @_instrumented
+    def get_changes(self, after: int, limit: int = 1000) -> List[Dict[str, Any]]:
+        """按序号读取变更日志
+
+        Args:
+            after: 只返回序号大于该值的变更
+            limit: 返回的最大记录数
+
+        Returns:
+            List[Dict[str, Any]]: 按序号排列的 {'seq', 'entity', 'entity_id'} 列表
+        """
+        if not self.conn:
+            self.connect()
+        rows = self.conn.execute("""
+            SELECT seq, entity, entity_id FROM change_log
+            WHERE seq > ? ORDER BY seq LIMIT ?
+        """, (after, limit)).fetchall()
+        return [{'seq': row[0], 'entity': row[1], 'entity_id': row[2]} for row in rows]
+
+    @_instrumented
+    def prune_changes(self, keep: int) -> int:
+        """删除较早的变更日志，只保留最新的keep条
+
+        Args:
+            keep: 保留的记录数
+
+        Returns:
+            int: 删除的记录数
+        """
+        if not self.conn:
+            self.connect()
+        try:
+            cursor = self.conn.execute("""
+                DELETE FROM change_log
+                WHERE seq <= (SELECT seq FROM sqlite_sequence WHERE name = 'change_log') - ?
+            """, (keep,))
+            self._commit()
+            return cursor.rowcount
+        except Exception:
+            self._rollback()
+            raise
@@ -4,5 +4,7 @@
 
 from .role_manager import RoleManager
 from .prompt_service import PromptService
+from .catalog_service import CatalogService
+from .session_service import SessionService
 
-__all__ = ['RoleManager', 'PromptService'] 
\ No newline at end of file
+__all__ = ['RoleManager', 'PromptService', 'CatalogService', 'SessionService'] 
\ No newline at end of file
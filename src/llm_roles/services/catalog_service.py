@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..database.base import DatabaseBackend
+
+
+# JSONL记录类型，按导出顺序排列（关联记录依赖角色和模板，必须最后写入）
+RECORD_TYPES = ('role', 'template', 'role_default_template')
+
+
+class CatalogService:
+    """目录导入导出服务，以JSONL格式流式迁移角色、模板和角色默认模板关联
+
+    每行是一个 {"type": ..., "data": {...}} 对象。导出和导入都按批处理，
+    内存占用与目录规模无关；导入按块提交事务，并以行号作为断点续传位置。
+    """
+
+    def __init__(self, db_backend: DatabaseBackend):
+        """初始化目录服务
+
+        Args:
+            db_backend: 数据库后端接口
+        """
+        self.db = db_backend
+
+    def export_records(self, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """按依赖顺序流式导出所有目录记录
+
+        Args:
+            batch_size: 每次从数据库读取的记录数
+
+        Yields:
+            Dict[str, Any]: 形如 {"type": ..., "data": ...} 的记录
+        """
+        for role in self.db.export_roles(batch_size=batch_size):
+            yield {'type': 'role', 'data': role}
+        for template in self.db.export_templates(batch_size=batch_size):
+            yield {'type': 'template', 'data': template}
+        for binding in self.db.export_role_default_templates(batch_size=batch_size):
+            yield {'type': 'role_default_template', 'data': binding}
+
+    def export_lines(self, batch_size: int = 1000) -> Iterator[str]:
+        """流式导出JSONL文本行
+
+        Args:
+            batch_size: 每次从数据库读取的记录数
+
+        Yields:
+            str: 以换行符结尾的JSON行
+        """
+        for record in self.export_records(batch_size=batch_size):
+            yield json.dumps(record, ensure_ascii=False) + '\n'
+
+    def import_lines(self, lines: Iterable[str], chunk_size: int = 1000, skip: int = 0,
+                     on_checkpoint: Optional[Callable[[int], None]] = None) -> Dict[str, int]:
+        """从JSONL文本行导入目录记录
+
+        每 chunk_size 行在一个事务中写入（已存在的记录会被覆盖），
+        提交成功后调用 on_checkpoint(已处理行数)。中断后以该行数作为 skip 重新导入即可续传。
+
+        Args:
+            lines: JSONL文本行
+            chunk_size: 每个事务包含的记录数
+            skip: 跳过的前置行数（用于断点续传）
+            on_checkpoint: 每个块提交后的回调，参数为已处理的总行数
+
+        Returns:
+            Dict[str, int]: 导入统计，包括各类型记录数和已处理行数
+
+        Raises:
+            ValueError: 如果某行不是合法的目录记录
+        """
+        stats = {'roles': 0, 'templates': 0, 'role_default_templates': 0, 'lines': skip}
+        chunk: List[Tuple[str, Dict[str, Any]]] = []
+        line_no = 0
+
+        def flush() -> None:
+            written = self.db.upsert_catalog_records(chunk)
+            for key, count in written.items():
+                stats[key] += count
+            stats['lines'] = line_no
+            chunk.clear()
+            if on_checkpoint:
+                on_checkpoint(line_no)
+
+        for line_no, line in enumerate(lines, start=1):
+            if line_no <= skip:
+                continue
+            if line.strip():
+                chunk.append(self._parse_line(line, line_no))
+            if len(chunk) >= chunk_size:
+                flush()
+
+        if chunk:
+            flush()
+        stats['lines'] = max(stats['lines'], line_no)
+
+        return stats
+
+    @staticmethod
+    def _parse_line(line: str, line_no: int) -> Tuple[str, Dict[str, Any]]:
+        """解析并校验一行JSONL记录
+
+        Args:
+            line: 文本行
+            line_no: 行号（用于错误信息）
+
+        Returns:
+            Tuple[str, Dict[str, Any]]: (记录类型, 数据)
+
+        Raises:
+            ValueError: 如果记录格式不正确
+        """
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"第{line_no}行不是合法的JSON: {e}")
+
+        kind = record.get('type') if isinstance(record, dict) else None
+        data = record.get('data') if isinstance(record, dict) else None
+        if kind not in RECORD_TYPES or not isinstance(data, dict):
+            raise ValueError(f"第{line_no}行不是合法的目录记录")
+
+        required = ('role_id', 'template_id') if kind == 'role_default_template' else ('id',)
+        missing = [field for field in required if not data.get(field)]
+        if missing:
+            raise ValueError(f"第{line_no}行缺少必要字段: {', '.join(missing)}")
+
+        return kind, data
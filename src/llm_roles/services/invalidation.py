@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""跨进程缓存失效
+
+角色、模板、角色默认模板和会话表上的触发器把每次变更写入单调递增的change_log表。
+每个进程的InvalidationBus按间隔读取上次位置之后的变更，只让变更过的键失效：
+
+- 'role'：角色ID（角色新增、修改、删除）
+- 'template'：模板ID（模板新增、修改、删除）
+- 'role_default_template'：角色ID（默认模板关联变更，或关联的模板被修改）
+- 'session'：会话ID（会话追加了消息）
+
+会话分片库有各自的变更日志，由follow()挂到主库的总线上，与主库一起轮询。
+
+没有变更时每次轮询只是一次索引查询。落后太多、需要的日志已被清理时，
+无法知道错过了哪些键，此时通知重置监听器清空整个缓存。
+"""
+
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..database.base import DatabaseBackend
+from ..utils.metrics import Counter
+
+INVALIDATION_EVENTS = Counter(
+    'llm_roles_invalidation_events_total', '从变更日志读取并分发的失效事件数', ['entity']
+)
+INVALIDATION_RESETS = Counter(
+    'llm_roles_invalidation_resets_total', '变更日志出现缺口后清空整个缓存的次数'
+)
+
+# 变更日志中的实体类型
+ENTITIES = ('role', 'template', 'role_default_template', 'session')
+
+
+class InvalidationBus:
+    """跟踪数据库变更日志并通知各缓存失效"""
+
+    def __init__(self, db: DatabaseBackend, interval: float = 0.5, batch_size: int = 1000,
+                 retention: int = 10000, prune_every: int = 120):
+        """初始化失效总线
+
+        Args:
+            db: 提供get_change_log_bounds/get_changes/prune_changes的数据库
+            interval: 后台轮询间隔（秒），为0时不启动后台线程，由调用方执行poll()
+            batch_size: 每次读取的最大变更数
+            retention: 清理时保留的最新变更数，落后超过这个数量的进程会整体重置缓存
+            prune_every: 每隔多少次轮询清理一次变更日志，为0时不清理
+        """
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self.retention = retention
+        self.prune_every = prune_every
+        self.position: Optional[int] = None
+        self._listeners: Dict[str, List[Callable[[str], None]]] = defaultdict(list)
+        self._reset_listeners: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._polls = 0
+        self._followers: List['InvalidationBus'] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, entity: str, listener: Callable[[str], None]) -> None:
+        """注册某类实体的变更监听器，以实体ID调用
+
+        Args:
+            entity: 实体类型（role、template或role_default_template）
+            listener: 监听函数
+        """
+        if entity not in ENTITIES:
+            raise ValueError(f"未知的实体类型: {entity}")
+        self._listeners[entity].append(listener)
+
+    def subscribe_reset(self, listener: Callable[[], None]) -> None:
+        """注册重置监听器，错过的变更无法确定时调用
+
+        Args:
+            listener: 监听函数
+        """
+        self._reset_listeners.append(listener)
+
+    def follow(self, other: 'InvalidationBus') -> None:
+        """每次轮询时一并轮询另一个变更日志（如会话分片库）
+
+        Args:
+            other: 跟随本总线启动和轮询的总线，其interval应为0
+        """
+        self._followers.append(other)
+
+    def start(self) -> None:
+        """从当前最新的变更开始跟踪（不重放启动前的变更），按需启动后台线程"""
+        for follower in self._followers:
+            follower.start()
+        self.position = self.db.get_change_log_bounds()[1]
+        if self.interval > 0 and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._poll_loop, name='llm-roles-invalidation', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """停止后台线程"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _poll_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"读取变更日志失败: {e}")
+
+    def poll(self) -> int:
+        """读取上次位置之后的变更并通知监听器
+
+        Returns:
+            int: 分发的失效事件数（同一批中重复的键只算一次）
+        """
+        followed = sum(follower.poll() for follower in self._followers)
+        with self._lock:
+            if self.position is None:
+                self.position = self.db.get_change_log_bounds()[1]
+                return followed
+            earliest, latest = self.db.get_change_log_bounds()
+            dispatched = 0
+            if latest < self.position or earliest > self.position + 1:
+                # 数据库被替换或需要的日志已被清理
+                self._reset(latest)
+            else:
+                while self.position < latest:
+                    changes = self.db.get_changes(self.position, self.batch_size)
+                    if not changes:
+                        break
+                    dispatched += self._dispatch(
+                        dict.fromkeys((change['entity'], change['entity_id']) for change in changes)
+                    )
+                    self.position = changes[-1]['seq']
+
+            self._polls += 1
+            if self.prune_every and self._polls % self.prune_every == 0:
+                self.db.prune_changes(self.retention)
+            return dispatched + followed
+
+    def _dispatch(self, keys: Dict[Tuple[str, str], None]) -> int:
+        """按实体类型通知监听器"""
+        for entity, entity_id in keys:
+            INVALIDATION_EVENTS.labels(entity).inc()
+            for listener in self._listeners.get(entity, ()):
+                listener(entity_id)
+        return len(keys)
+
+    def _reset(self, latest: int) -> None:
+        """通知重置监听器并跳到最新位置"""
+        INVALIDATION_RESETS.inc()
+        for listener in self._reset_listeners:
+            listener()
+        self.position = latest
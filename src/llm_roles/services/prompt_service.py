@@ -1,13 +1,16 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, Iterator, List, Optional, Any, Union
 import os
 import json
+import time
 from pathlib import Path
 
 from ..core.prompt_template import PromptTemplate
 from ..database.base import DatabaseBackend
+from ..utils.metrics import PROMPT_RENDER_SECONDS
+from ..utils.profiling import RENDER as PROFILE_RENDER, record as record_profile
 
 
 class PromptService:
@@ -22,6 +25,11 @@ class PromptService:
         self.db = db_backend
         self._default_templates = self._load_default_templates()
         
+    @property
+    def default_template_count(self) -> int:
+        """已加载的默认模板数量"""
+        return len(self._default_templates)
+        
     def _load_default_templates(self) -> Dict[str, PromptTemplate]:
         """加载默认提示词模板
         
@@ -247,6 +255,22 @@ class PromptService:
             
         return PromptTemplate.from_dict(template_data)
     
+    def get_template_version_info(self, template_id: str) -> Optional[Dict[str, Any]]:
+        """获取模板的版本信息，不读取模板内容
+        
+        Args:
+            template_id: 模板ID
+            
+        Returns:
+            Optional[Dict[str, Any]]: 包含updated_at和修改计数version的字典（默认模板均为None），
+                如果模板不存在则返回None
+        """
+        if template_id in self._default_templates:
+            # 默认模板在服务生命周期内不变，ID本身即可标识版本
+            return {'id': template_id, 'updated_at': None, 'version': None}
+            
+        return self.db.get_template_version_info(template_id)
+    
     def update_template(self, template_id: str, **updates) -> Optional[PromptTemplate]:
         """更新提示词模板
         
@@ -307,6 +331,22 @@ class PromptService:
             
         return templates
     
+    def iter_templates(self, include_defaults: bool = True, batch_size: int = 500) -> Iterator[PromptTemplate]:
+        """逐个返回所有提示词模板（默认模板在前，自定义模板按ID顺序），每次只从数据库读取一批
+        
+        Args:
+            include_defaults: 是否包含默认模板
+            batch_size: 每批读取的记录数
+            
+        Yields:
+            PromptTemplate: 模板对象
+        """
+        if include_defaults:
+            yield from self._default_templates.values()
+            
+        for record in self.db.export_templates(batch_size=batch_size):
+            yield PromptTemplate.from_dict(record)
+    
     def generate_prompt(self, role_id: str, format: str = "openai", 
                         prompt_type: str = "complete", template_id: Optional[str] = None,
                         custom_vars: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
@@ -354,7 +394,11 @@ class PromptService:
                         break
         
         # 生成提示词
+        start = time.perf_counter()
         prompt_content = template.render(role_data, custom_vars)
+        elapsed = time.perf_counter() - start
+        PROMPT_RENDER_SECONDS.labels(format).observe(elapsed)
+        record_profile(PROFILE_RENDER, elapsed)
         
         # 根据格式和类型处理提示词
         formatted_prompt = self._format_prompt(prompt_content, format, prompt_type)
@@ -370,6 +414,37 @@ class PromptService:
             'type': prompt_type
         }
     
+    def get_prompt_version_info(self, role_id: str,
+                                template_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """获取生成提示词所依赖数据的版本信息，不读取角色属性也不渲染模板
+        
+        Args:
+            role_id: 角色ID
+            template_id: 使用的模板ID，不指定时按generate_prompt的规则选择
+            
+        Returns:
+            Optional[Dict[str, Any]]: 包含versions（角色和模板的版本信息）和
+                updated_at（其中最新的修改时间）的字典，如果角色或模板不存在则返回None
+        """
+        role_info = self.db.get_role_version_info(role_id)
+        if not role_info:
+            return None
+            
+        if template_id:
+            template_info = self.get_template_version_info(template_id)
+            if not template_info:
+                return None
+        else:
+            # 没有角色默认模板时使用的系统默认模板由角色类型决定，已包含在角色版本中
+            template_info = self.db.get_role_default_template_version_info(role_id)
+            
+        timestamps = [info['updated_at'] for info in (role_info, template_info)
+                      if info and info.get('updated_at')]
+        return {
+            'versions': [role_info, template_info],
+            'updated_at': max(timestamps) if timestamps else None
+        }
+    
     def preview_prompt(self, role_id: str, template_id: str, format: str = "openai", 
                       prompt_type: str = "complete", custom_vars: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """预览角色使用特定模板的提示词
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from typing import Dict, List, Optional, Any
+from typing import Any, Callable, Dict, Iterator, List, Optional
 
 from ..core.role import Role
 from ..database.base import DatabaseBackend
@@ -17,6 +17,20 @@ class RoleManager:
             db_backend: 数据库后端接口
         """
         self.db = db_backend
+        self._listeners: List[Callable[[str], None]] = []
+        
+    def subscribe(self, listener: Callable[[str], None]) -> None:
+        """注册角色变更监听器，角色被更新、回滚或删除后以角色ID调用
+        
+        Args:
+            listener: 监听函数
+        """
+        self._listeners.append(listener)
+        
+    def _notify(self, role_id: str) -> None:
+        """通知监听器角色已变更"""
+        for listener in self._listeners:
+            listener(role_id)
         
     def create_role(self, name: str, description: str = "", role_type: str = "", **attributes) -> Role:
         """创建新角色
@@ -74,6 +88,17 @@ class RoleManager:
             **role_data
         )
     
+    def get_role_version_info(self, role_id: str) -> Optional[Dict[str, Any]]:
+        """获取角色的版本信息，不读取和解析角色属性
+        
+        Args:
+            role_id: 角色ID
+            
+        Returns:
+            Optional[Dict[str, Any]]: 包含updated_at和最新版本号的字典，如果角色不存在则返回None
+        """
+        return self.db.get_role_version_info(role_id)
+    
     def update_role(self, role_id: str, **updates) -> Optional[Role]:
         """更新角色
         
@@ -103,6 +128,7 @@ class RoleManager:
             
         # 持久化到数据库
         self.db.update_role(role_id, role.to_dict())
+        self._notify(role_id)
         
         return role
     
@@ -115,7 +141,10 @@ class RoleManager:
         Returns:
             bool: 删除是否成功
         """
-        return self.db.delete_role(role_id)
+        deleted = self.db.delete_role(role_id)
+        if deleted:
+            self._notify(role_id)
+        return deleted
         
     def list_roles(self, limit: int = 100, offset: int = 0) -> List[Role]:
         """列出角色
@@ -130,6 +159,25 @@ class RoleManager:
         roles_data = self.db.list_roles(limit=limit, offset=offset)
         return [self._dict_to_role(role_data) for role_data in roles_data]
     
+    def iter_roles(self, batch_size: int = 500) -> Iterator[Role]:
+        """按ID顺序逐个返回所有角色，每次只从数据库读取一批
+        
+        Args:
+            batch_size: 每批读取的记录数
+            
+        Yields:
+            Role: 角色对象
+        """
+        for record in self.db.export_roles(batch_size=batch_size):
+            role_data = {
+                'id': record['id'],
+                'name': record['name'],
+                'description': record['description'],
+                'role_type': record['role_type'],
+            }
+            role_data.update(record['attributes'])
+            yield self._dict_to_role(role_data)
+    
     def search_roles(self, query: str) -> List[Role]:
         """搜索角色
         
@@ -142,6 +190,57 @@ class RoleManager:
         roles_data = self.db.search_roles(query)
         return [self._dict_to_role(role_data) for role_data in roles_data]
         
+    def list_role_versions(self, role_id: str, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """列出角色的历史版本
+        
+        Args:
+            role_id: 角色ID
+            limit: 返回的最大版本数量
+            offset: 分页偏移量
+            
+        Returns:
+            List[Dict[str, Any]]: 版本摘要列表，最新版本在前
+        """
+        return self.db.list_role_versions(role_id, limit=limit, offset=offset)
+    
+    def get_role_version(self, role_id: str, version: int) -> Optional[Role]:
+        """获取角色的指定历史版本
+        
+        Args:
+            role_id: 角色ID
+            version: 版本号
+            
+        Returns:
+            Optional[Role]: 该版本的角色对象，如果版本不存在则返回None
+        """
+        version_data = self.db.get_role_version(role_id, version)
+        if not version_data:
+            return None
+            
+        return self._dict_to_role(version_data['data'])
+    
+    def rollback_role(self, role_id: str, version: int) -> Optional[Role]:
+        """将角色回滚到指定历史版本
+        
+        回滚本身会作为一个新版本记录，历史不会被改写。
+        
+        Args:
+            role_id: 角色ID
+            version: 目标版本号
+            
+        Returns:
+            Optional[Role]: 回滚后的角色对象，如果角色或版本不存在则返回None
+        """
+        role = self.get_role_version(role_id, version)
+        if not role or not self.db.get_role(role_id):
+            return None
+            
+        # 以完整状态写回，后续版本新增的属性会被移除
+        self.db.update_role(role_id, role.to_dict())
+        self._notify(role_id)
+        
+        return role
+        
     def _dict_to_role(self, role_data: Dict[str, Any]) -> Role:
         """将字典转换为Role对象
         
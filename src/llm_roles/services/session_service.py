@@ -0,0 +1,495 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import math
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from ..database.base import DatabaseBackend
+from ..utils.cache import TTLCache
+from .prompt_service import PromptService
+
+
+# 允许的消息发送者
+VALID_SENDERS = ('user', 'assistant', 'system')
+
+# 支持的上下文输出格式
+CONTEXT_FORMATS = ('openai', 'anthropic')
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的token数：中日韩字符按每字1个token，其余字符按每4个字符1个token
+
+    Args:
+        text: 文本
+
+    Returns:
+        int: 估算的token数
+    """
+    cjk = sum(1 for ch in text if '\u2e80' <= ch <= '\u9fff' or '\uac00' <= ch <= '\ud7af')
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+class _HotTail:
+    """单个活跃会话的最近消息环形缓冲"""
+    
+    __slots__ = ('role_id', 'messages', 'complete', 'stale')
+    
+    def __init__(self, role_id: str, size: int, messages: List[Dict[str, Any]], complete: bool):
+        self.role_id = role_id
+        self.messages: Deque[Dict[str, Any]] = deque(messages, maxlen=size)
+        # 缓冲区是否包含会话的全部历史
+        self.complete = complete
+        # 变更日志报告会话有新消息，下次读取前需要补上
+        self.stale = False
+
+
+class SessionService:
+    """会话服务，提供会话创建、消息记录、历史查询和对话上下文组装功能
+    
+    每个活跃会话在内存中保留最近 hot_tail_size 条消息的环形缓冲，
+    通过本服务追加的消息直接写入缓冲，组装上下文的常见情况无需读取数据库。
+    变更日志报告会话有新消息（mark_session_changed）后，下次读取前按(session_id, sequence)
+    索引查询一次序号大于缓冲末尾的消息，补上其他进程写入的消息。
+    """
+    
+    def __init__(self, db_backend: DatabaseBackend, prompt_service: Optional[PromptService] = None,
+                 hot_tail_size: int = 50, max_active_sessions: int = 1000,
+                 system_prompt_ttl: Optional[float] = 60.0):
+        """初始化会话服务
+        
+        Args:
+            db_backend: 数据库后端接口
+            prompt_service: 用于渲染系统提示词的提示词服务，默认基于同一数据库后端创建
+            hot_tail_size: 每个活跃会话在内存中保留的最近消息数
+            max_active_sessions: 内存中保留的最大活跃会话数（LRU淘汰）
+            system_prompt_ttl: 系统提示词缓存的有效期（秒），None表示不过期
+        """
+        self.db = db_backend
+        self.prompt_service = prompt_service or PromptService(db_backend)
+        self.hot_tail_size = hot_tail_size
+        self._hot_tails = TTLCache(maxsize=max_active_sessions)
+        self._system_prompts = TTLCache(maxsize=max_active_sessions, ttl=system_prompt_ttl)
+        self._lock = threading.Lock()
+        
+    def create_session(self, role_id: str, user_id: Optional[str] = None,
+                       metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """创建会话
+        
+        Args:
+            role_id: 会话使用的角色ID
+            user_id: 用户ID
+            metadata: 会话元数据
+            
+        Returns:
+            Dict[str, Any]: 会话信息
+            
+        Raises:
+            ValueError: 如果角色不存在
+        """
+        if not self.db.get_role(role_id):
+            raise ValueError(f"角色不存在: {role_id}")
+            
+        session_id = self.db.create_session(role_id, user_id=user_id, metadata=metadata)
+        
+        # 新会话没有历史消息，直接建立完整的热缓冲
+        self._hot_tails.set(session_id, _HotTail(role_id, self.hot_tail_size, [], True))
+        
+        return self.db.get_session(session_id)
+    
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """获取会话信息
+        
+        Args:
+            session_id: 会话ID
+            
+        Returns:
+            Optional[Dict[str, Any]]: 会话信息，如果不存在则返回None
+        """
+        return self.db.get_session(session_id)
+    
+    def append_message(self, session_id: str, sender: str, content: str,
+                       metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """向会话追加一条消息
+        
+        Args:
+            session_id: 会话ID
+            sender: 发送者，见 VALID_SENDERS
+            content: 消息内容
+            metadata: 消息元数据
+            
+        Returns:
+            Dict[str, Any]: 包含消息ID和会话内序号的字典
+            
+        Raises:
+            ValueError: 如果会话不存在或消息无效
+        """
+        return self.append_messages(session_id, [
+            {'sender': sender, 'content': content, 'metadata': metadata}
+        ])[0]
+    
+    def append_messages(self, session_id: str, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """在一个事务中向会话批量追加消息
+        
+        Args:
+            session_id: 会话ID
+            messages: 消息列表，每条包含sender、content和可选的metadata
+            
+        Returns:
+            List[Dict[str, Any]]: 按输入顺序排列的消息ID和序号
+            
+        Raises:
+            ValueError: 如果会话不存在或消息无效
+        """
+        for index, message in enumerate(messages):
+            if message.get('sender') not in VALID_SENDERS:
+                raise ValueError(f"第{index + 1}条消息的发送者无效: {message.get('sender')}")
+            if not isinstance(message.get('content'), str):
+                raise ValueError(f"第{index + 1}条消息缺少内容")
+                
+        added = self.db.add_messages(session_id, messages)
+        self._append_to_hot_tail(session_id, messages, added)
+        
+        return added
+    
+    def get_session_messages(self, session_id: str, limit: Optional[int] = None,
+                             before: Optional[int] = None, after: Optional[int] = None,
+                             order: str = 'asc') -> List[Dict[str, Any]]:
+        """分页获取会话消息
+        
+        Args:
+            session_id: 会话ID
+            limit: 返回的最大消息数，None表示不限制
+            before: 只返回序号小于该值的消息
+            after: 只返回序号大于该值的消息
+            order: 排序方向，'asc'或'desc'
+            
+        Returns:
+            List[Dict[str, Any]]: 消息列表
+        """
+        return self.db.get_session_messages(
+            session_id, limit=limit, before=before, after=after, order=order
+        )
+    
+    def iter_messages(self, session_id: str, after: Optional[int] = None,
+                      batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """按序号顺序逐条返回会话消息，每次只从数据库读取一批
+        
+        Args:
+            session_id: 会话ID
+            after: 只返回序号大于该值的消息
+            batch_size: 每批读取的记录数
+            
+        Yields:
+            Dict[str, Any]: 消息
+        """
+        cursor = after
+        while True:
+            batch = self.db.get_session_messages(session_id, limit=batch_size, after=cursor)
+            yield from batch
+            if len(batch) < batch_size:
+                return
+            cursor = batch[-1]['sequence']
+    
+    def tail(self, session_id: str, n: int) -> List[Dict[str, Any]]:
+        """获取会话最近的n条消息（按时间正序）
+        
+        热缓冲足够时直接从内存返回，否则只读取这n条记录。
+        
+        Args:
+            session_id: 会话ID
+            n: 消息数量
+            
+        Returns:
+            List[Dict[str, Any]]: 消息列表
+        """
+        if n <= self.hot_tail_size:
+            entry = self._get_hot_tail(session_id)
+            if entry is not None:
+                with self._lock:
+                    buffered = list(entry.messages)
+                if n <= len(buffered) or entry.complete:
+                    return buffered[-n:] if n else []
+                    
+        return self.db.tail_session_messages(session_id, n)
+    
+    def build_context(self, session_id: str, format: str = 'openai',
+                      max_messages: Optional[int] = None,
+                      max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """组装可直接发送给模型的对话上下文
+        
+        包含会话角色的系统提示词（缓存）和最近的历史消息。历史消息优先取自内存热缓冲，
+        只有需要比缓冲更早的消息时才分页读取数据库。
+        
+        Args:
+            session_id: 会话ID
+            format: 输出格式，'openai'（系统提示词作为首条消息）或
+                'anthropic'（系统提示词单独放在system字段）
+            max_messages: 最多包含的历史消息数；与max_tokens都未指定时默认为hot_tail_size
+            max_tokens: 系统提示词与历史消息的估算token总预算
+            
+        Returns:
+            Dict[str, Any]: 上下文，messages为按时间正序的消息列表，
+                truncated表示是否因限制而省略了更早的历史
+            
+        Raises:
+            ValueError: 如果会话不存在或格式不支持
+        """
+        if format not in CONTEXT_FORMATS:
+            raise ValueError(f"不支持的上下文格式: {format}")
+            
+        entry = self._get_hot_tail(session_id)
+        if entry is None:
+            raise ValueError(f"会话不存在: {session_id}")
+            
+        if max_messages is None and max_tokens is None:
+            max_messages = self.hot_tail_size
+            
+        system_prompt = self._get_system_prompt(entry.role_id)
+        system_tokens = estimate_tokens(system_prompt)
+        budget = max_tokens - system_tokens if max_tokens is not None else None
+        
+        with self._lock:
+            pool = list(entry.messages)
+            exhausted = entry.complete
+            
+        selected: List[Dict[str, Any]] = []
+        used = 0
+        truncated = False
+        oldest = pool[0]['sequence'] if pool else None
+        while True:
+            while pool and not truncated:
+                message = pool.pop()
+                cost = estimate_tokens(message['content'])
+                if ((max_messages is not None and len(selected) >= max_messages)
+                        or (budget is not None and used + cost > budget)):
+                    truncated = True
+                    break
+                selected.append(message)
+                used += cost
+                
+            if truncated or exhausted:
+                break
+                
+            # 热缓冲不够，向前分页读取更早的消息
+            page_size = self.hot_tail_size
+            if max_messages is not None:
+                page_size = max(max_messages - len(selected) + 1, 1)
+            older = self.db.get_session_messages(
+                session_id, limit=page_size, before=oldest, order='desc'
+            )
+            if not older:
+                break
+            older.reverse()
+            pool = older
+            oldest = older[0]['sequence']
+            exhausted = len(older) < page_size
+            
+        selected.reverse()
+        return self._format_context(
+            session_id, entry.role_id, format, system_prompt, selected,
+            system_tokens + used, truncated
+        )
+    
+    def invalidate_role(self, role_id: str) -> None:
+        """使角色的系统提示词缓存失效（角色或其模板变更后调用）
+        
+        Args:
+            role_id: 角色ID
+        """
+        self._system_prompts.invalidate(role_id)
+    
+    def mark_session_changed(self, session_id: str) -> None:
+        """标记会话有新消息（可能由其他进程写入），下次读取热缓冲前先补上
+        
+        Args:
+            session_id: 会话ID
+        """
+        entry = self._hot_tails.peek(session_id)
+        if entry is not None:
+            entry.stale = True
+    
+    def clear_hot_tails(self) -> None:
+        """丢弃所有热缓冲（无法确定哪些会话被其他进程写入时调用）"""
+        self._hot_tails.clear()
+    
+    def invalidate_session(self, session_id: str) -> None:
+        """丢弃会话的热缓冲（会话被其他进程写入后调用）
+        
+        Args:
+            session_id: 会话ID
+        """
+        self._hot_tails.invalidate(session_id)
+
+    def clear_system_prompts(self) -> None:
+        """清空系统提示词缓存（无法确定哪些角色被其他进程修改时调用）"""
+        self._system_prompts.clear()
+
+    def clear_caches(self) -> None:
+        """清空所有热缓冲和系统提示词缓存"""
+        self._hot_tails.clear()
+        self._system_prompts.clear()
+
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取缓存统计
+
+        Returns:
+            Dict[str, Dict[str, Any]]: 热缓冲和系统提示词缓存的统计
+        """
+        return {
+            'hot_tails': self._hot_tails.stats(),
+            'system_prompts': self._system_prompts.stats()
+        }
+
+    def _get_hot_tail(self, session_id: str) -> Optional[_HotTail]:
+        """获取会话的热缓冲，不存在时从数据库加载最近的消息
+        
+        被标记为有新消息的缓冲先补上其他写入方追加的消息。
+        
+        Args:
+            session_id: 会话ID
+            
+        Returns:
+            Optional[_HotTail]: 热缓冲，如果会话不存在则返回None
+        """
+        entry = self._hot_tails.get(session_id)
+        if entry is not None and (not entry.stale or self._catch_up_hot_tail(session_id, entry)):
+            return entry
+            
+        session = self.db.get_session(session_id)
+        if not session:
+            return None
+            
+        messages = self.db.tail_session_messages(session_id, self.hot_tail_size)
+        entry = _HotTail(
+            session['role_id'], self.hot_tail_size, messages,
+            complete=len(messages) < self.hot_tail_size
+        )
+        self._hot_tails.set(session_id, entry)
+        return entry
+    
+    def _catch_up_hot_tail(self, session_id: str, entry: _HotTail) -> bool:
+        """把数据库中序号大于缓冲末尾的消息追加到热缓冲
+        
+        Args:
+            session_id: 会话ID
+            entry: 会话的热缓冲
+            
+        Returns:
+            bool: 缓冲是否已与数据库一致；新消息超过缓冲容量时丢弃缓冲并返回False
+        """
+        with self._lock:
+            # 先清除标记：查询期间到达的新通知会重新设置它
+            entry.stale = False
+            last = entry.messages[-1]['sequence'] if entry.messages else 0
+        newer = self.db.get_session_messages(session_id, after=last, limit=self.hot_tail_size + 1)
+        if not newer:
+            return True
+        if len(newer) > self.hot_tail_size:
+            self._hot_tails.invalidate(session_id)
+            return False
+            
+        with self._lock:
+            # 其他线程可能已经补上了部分消息
+            last = entry.messages[-1]['sequence'] if entry.messages else 0
+            for message in newer:
+                if message['sequence'] <= last:
+                    continue
+                if len(entry.messages) == entry.messages.maxlen:
+                    entry.complete = False
+                entry.messages.append(message)
+        return True
+    
+    def _append_to_hot_tail(self, session_id: str, messages: List[Dict[str, Any]],
+                            added: List[Dict[str, Any]]) -> None:
+        """将刚写入的消息追加到会话热缓冲（会话不在缓冲中时忽略）
+        
+        Args:
+            session_id: 会话ID
+            messages: 写入的消息内容
+            added: 数据库返回的消息ID、序号和时间戳
+        """
+        entry = self._hot_tails.get(session_id)
+        if entry is None or not added:
+            return
+            
+        with self._lock:
+            if entry.messages:
+                expected = entry.messages[-1]['sequence'] + 1
+            else:
+                expected = 1 if entry.complete else None
+            if expected is not None and expected > added[-1]['sequence']:
+                # 并发的读取已经从数据库补上了这些消息
+                return
+            if expected != added[0]['sequence']:
+                # 会话被其他写入方修改过，缓冲已不连续，下次使用时重新加载
+                self._hot_tails.invalidate(session_id)
+                return
+                
+            for message, info in zip(messages, added):
+                if len(entry.messages) == entry.messages.maxlen:
+                    entry.complete = False
+                full = {
+                    'id': info['id'],
+                    'sender': message['sender'],
+                    'content': message['content'],
+                    'timestamp': info.get('timestamp'),
+                    'sequence': info['sequence'],
+                }
+                if message.get('metadata'):
+                    full['metadata'] = message['metadata']
+                entry.messages.append(full)
+    
+    def _get_system_prompt(self, role_id: str) -> str:
+        """获取角色渲染后的系统提示词（带缓存）
+        
+        Args:
+            role_id: 角色ID
+            
+        Returns:
+            str: 系统提示词内容
+        """
+        prompt = self._system_prompts.get(role_id)
+        if prompt is None:
+            result = self.prompt_service.generate_prompt(
+                role_id, format='openai', prompt_type='system'
+            )
+            prompt = result['prompt']
+            self._system_prompts.set(role_id, prompt)
+        return prompt
+    
+    @staticmethod
+    def _format_context(session_id: str, role_id: str, format: str, system_prompt: str,
+                        history: List[Dict[str, Any]], estimated_tokens: int,
+                        truncated: bool) -> Dict[str, Any]:
+        """将系统提示词和历史消息格式化为指定模型接口的结构
+        
+        Returns:
+            Dict[str, Any]: 上下文字典
+        """
+        context = {
+            'session_id': session_id,
+            'role_id': role_id,
+            'format': format,
+            'message_count': len(history),
+            'estimated_tokens': estimated_tokens,
+            'truncated': truncated
+        }
+        
+        if format == 'anthropic':
+            # Anthropic接口的system单独传递，历史中的system消息并入其中
+            system_parts = [system_prompt] + [
+                m['content'] for m in history if m['sender'] == 'system'
+            ]
+            context['system'] = '\n\n'.join(system_parts)
+            context['messages'] = [
+                {'role': m['sender'], 'content': m['content']}
+                for m in history if m['sender'] != 'system'
+            ]
+        else:
+            context['messages'] = [{'role': 'system', 'content': system_prompt}] + [
+                {'role': m['sender'], 'content': m['content']} for m in history
+            ]
+            
+        return context
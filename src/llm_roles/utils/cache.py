@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """线程安全的LRU缓存，可选按写入时间过期
+
+    超出容量时淘汰最久未使用的条目；设置ttl后，条目在写入ttl秒后失效。
+    记录命中和未命中次数，供监控使用。
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        """初始化缓存
+
+        Args:
+            maxsize: 最大条目数
+            ttl: 条目有效期（秒），None表示不过期
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """获取缓存值
+
+        Args:
+            key: 缓存键
+            default: 未命中时的返回值
+
+        Returns:
+            缓存值或default
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """写入缓存值
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """获取缓存值，不更新使用顺序和命中统计
+
+        Args:
+            key: 缓存键
+            default: 不存在或已过期时的返回值
+
+        Returns:
+            缓存值或default
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+                return default
+            return entry[0]
+
+    def invalidate(self, key: Hashable) -> None:
+        """删除指定键
+
+        Args:
+            key: 缓存键
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """删除所有满足条件的键
+
+        Args:
+            predicate: 以缓存键为参数的判断函数
+
+        Returns:
+            int: 删除的条目数
+        """
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计
+
+        Returns:
+            Dict[str, Any]: 条目数、容量、命中数、未命中数和命中率
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
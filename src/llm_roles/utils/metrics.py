@@ -0,0 +1,447 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""轻量级指标采集，按Prometheus文本格式（0.0.4）输出
+
+只实现计数器、仪表和直方图三种类型，不依赖prometheus_client。
+带标签的指标先用labels()取得子指标再记录，热路径上可以提前绑定子指标以减少开销。
+多个工作进程时由MultiprocessMetrics按进程写入快照文件、输出时合并。
+"""
+
+import bisect
+import json
+import math
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# 指标采样：(指标名, 标签字典, 值)
+Sample = Tuple[str, Dict[str, str], float]
+
+# 请求级耗时的默认分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 数据库操作和模板渲染的分桶（秒）
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    """转义标签值"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    """格式化采样值"""
+    if value == math.inf:
+        return '+Inf'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    """格式化一行采样"""
+    if labels:
+        label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+        return f'{name}{{{label_text}}} {_format_value(value)}'
+    return f'{name} {_format_value(value)}'
+
+
+class _Metric:
+    """指标基类，管理按标签值区分的子指标"""
+
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional['Registry'] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], '_Metric'] = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values: str) -> '_Metric':
+        """获取指定标签值的子指标
+
+        Args:
+            *values: 按labelnames顺序的标签值
+
+        Returns:
+            子指标
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError(f'{self.name} 需要标签 {self.labelnames}')
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def _new_child(self) -> '_Metric':
+        raise NotImplementedError
+
+    def _child_samples(self) -> Iterable[Tuple[Dict[str, str], '_Metric']]:
+        """遍历所有子指标及其标签"""
+        if not self.labelnames:
+            yield {}, self
+            return
+        for key, child in list(self._children.items()):
+            yield dict(zip(self.labelnames, key)), child
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional['Registry'] = None):
+        self._value = 0.0
+        self._value_lock = threading.Lock()
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> 'Counter':
+        return Counter.__new__(Counter)._init_child()
+
+    def _init_child(self) -> 'Counter':
+        self._value = 0.0
+        self._value_lock = threading.Lock()
+        return self
+
+    def inc(self, amount: float = 1.0) -> None:
+        """增加计数"""
+        with self._value_lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def samples(self) -> List[Sample]:
+        return [(self.name, labels, child._value) for labels, child in self._child_samples()]
+
+
+class Gauge(_Metric):
+    """可增可减的仪表"""
+
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional['Registry'] = None):
+        self._value = 0.0
+        self._value_lock = threading.Lock()
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> 'Gauge':
+        return Gauge.__new__(Gauge)._init_child()
+
+    def _init_child(self) -> 'Gauge':
+        self._value = 0.0
+        self._value_lock = threading.Lock()
+        return self
+
+    def inc(self, amount: float = 1.0) -> None:
+        """增加数值"""
+        with self._value_lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        """减少数值"""
+        with self._value_lock:
+            self._value -= amount
+
+    def set(self, value: float) -> None:
+        """设置数值"""
+        self._value = float(value)
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def samples(self) -> List[Sample]:
+        return [(self.name, labels, child._value) for labels, child in self._child_samples()]
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional['Registry'] = None):
+        self._buckets = tuple(sorted(buckets))
+        self._init_child()
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> 'Histogram':
+        child = Histogram.__new__(Histogram)
+        child._buckets = self._buckets
+        return child._init_child()
+
+    def _init_child(self) -> 'Histogram':
+        # 最后一个计数对应+Inf
+        self._counts = [0] * (len(self._buckets) + 1)
+        self._sum = 0.0
+        self._value_lock = threading.Lock()
+        return self
+
+    def observe(self, value: float) -> None:
+        """记录一次观测值"""
+        index = bisect.bisect_left(self._buckets, value)
+        with self._value_lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    def samples(self) -> List[Sample]:
+        result: List[Sample] = []
+        for labels, child in self._child_samples():
+            with child._value_lock:
+                counts = list(child._counts)
+                total = child._sum
+            cumulative = 0
+            for bound, count in zip(child._buckets + (math.inf,), counts):
+                cumulative += count
+                result.append((f'{self.name}_bucket', {**labels, 'le': _format_value(bound)}, cumulative))
+            result.append((f'{self.name}_count', labels, cumulative))
+            result.append((f'{self.name}_sum', labels, total))
+        return result
+
+
+# 指标族：(指标名, 类型, 说明, 采样列表)
+Family = Tuple[str, str, str, List[Sample]]
+
+# 采集回调：在输出时计算的指标，返回 [(指标名, 类型, 说明, 采样列表)]
+Collector = Callable[[], List[Family]]
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Collector] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        """注册指标
+
+        Args:
+            metric: 指标对象
+        """
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'指标已注册: {metric.name}')
+            self._metrics[metric.name] = metric
+
+    def register_collector(self, collector: Collector) -> None:
+        """注册在输出时调用的采集回调（如缓存命中率、连接数）
+
+        Args:
+            collector: 采集回调
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def unregister_collector(self, collector: Collector) -> None:
+        """移除采集回调
+
+        Args:
+            collector: 采集回调
+        """
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        """按名称获取已注册的指标"""
+        return self._metrics.get(name)
+
+    def collect(self) -> List[Family]:
+        """采集所有指标和采集回调的当前采样
+
+        Returns:
+            List[Family]: [(指标名, 类型, 说明, 采样列表)]
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        families: List[Family] = [(m.name, m.type_name, m.documentation, m.samples()) for m in metrics]
+        for collector in collectors:
+            families.extend(collector())
+        return families
+
+    def render(self) -> str:
+        """按Prometheus文本格式输出所有指标
+
+        Returns:
+            str: 指标文本
+        """
+        return render_families(self.collect())
+
+
+def render_families(families: Iterable[Family]) -> str:
+    """把指标族格式化为Prometheus文本
+
+    Args:
+        families: [(指标名, 类型, 说明, 采样列表)]
+
+    Returns:
+        str: 指标文本
+    """
+    lines: List[str] = []
+    for name, type_name, documentation, samples in families:
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {type_name}')
+        lines.extend(_format_sample(*sample) for sample in samples)
+    return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+# =========== 多进程汇总 ===========
+
+# 各工作进程写入指标快照的目录，设置后/metrics输出所有工作进程的合计（见server.build_launch）
+METRICS_DIR_ENV = 'LLM_ROLES_METRICS_DIR'
+
+
+class MultiprocessMetrics:
+    """多个工作进程的指标汇总
+
+    注册表是进程内的，多进程部署时每次抓取只会落到其中一个工作进程。每个进程定期把自己的
+    采样写入目录下以进程号命名的文件，输出时读取所有文件合并：计数器和直方图按指标名和标签
+    求和；仪表（占用数、命中率等）求和没有意义，加上worker标签按进程分别输出。
+    进程退出时只保留累计值，已退出进程的仪表不再输出。其他进程的采样最多落后一个写入间隔。
+    """
+
+    def __init__(self, directory: str, registry: Optional[Registry] = None, pid: Optional[int] = None):
+        """初始化多进程汇总
+
+        Args:
+            directory: 快照目录，所有工作进程相同
+            registry: 指标注册表，默认为全局注册表
+            pid: 当前进程号，默认为os.getpid()
+        """
+        self.directory = directory
+        self.registry = registry or REGISTRY
+        self.pid = pid if pid is not None else os.getpid()
+        self.path = os.path.join(directory, f'{self.pid}.json')
+        # 定期写入和抓取时的写入可能同时进行
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def flush(self, alive: bool = True) -> None:
+        """把当前进程的采样写入快照文件
+
+        Args:
+            alive: 进程是否仍在运行，为False时不写入仪表
+        """
+        families = [
+            (name, type_name, documentation, samples)
+            for name, type_name, documentation, samples in self.registry.collect()
+            if alive or type_name != 'gauge'
+        ]
+        tmp_path = f'{self.path}.tmp'
+        with self._lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'pid': self.pid, 'families': families}, f, ensure_ascii=False)
+            # 原子替换，其他进程不会读到写了一半的文件
+            os.replace(tmp_path, self.path)
+
+    def close(self) -> None:
+        """进程退出前写入最终的累计值"""
+        self.flush(alive=False)
+
+    def _snapshots(self) -> Iterator[Dict[str, Any]]:
+        """读取所有进程的快照，跳过无法解析的文件"""
+        for entry in sorted(os.listdir(self.directory)):
+            if not entry.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, entry), encoding='utf-8') as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    def collect(self) -> List[Family]:
+        """写入当前进程的最新采样后，合并所有进程的快照
+
+        Returns:
+            List[Family]: [(指标名, 类型, 说明, 采样列表)]
+        """
+        self.flush()
+        merged: Dict[str, Tuple[str, str, Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Sample]]] = {}
+        for snapshot in self._snapshots():
+            worker = str(snapshot['pid'])
+            for name, type_name, documentation, samples in snapshot['families']:
+                _, _, family = merged.setdefault(name, (type_name, documentation, {}))
+                for sample_name, labels, value in samples:
+                    if type_name == 'gauge':
+                        labels = {**labels, 'worker': worker}
+                    key = (sample_name, tuple(labels.items()))
+                    previous = family.get(key)
+                    family[key] = (sample_name, labels, value + (previous[2] if previous else 0.0))
+        return [(name, type_name, documentation, list(family.values()))
+                for name, (type_name, documentation, family) in merged.items()]
+
+    def render(self) -> str:
+        """按Prometheus文本格式输出所有工作进程的合计
+
+        Returns:
+            str: 指标文本
+        """
+        return render_families(self.collect())
+
+
+def reset_metrics_dir(directory: str) -> None:
+    """清空上次运行留下的快照文件，在启动工作进程之前调用
+
+    Args:
+        directory: 快照目录
+    """
+    os.makedirs(directory, exist_ok=True)
+    for entry in os.listdir(directory):
+        if entry.endswith(('.json', '.json.tmp')):
+            os.remove(os.path.join(directory, entry))
+
+
+# =========== 全局指标 ===========
+
+HTTP_REQUESTS = Counter(
+    'llm_roles_http_requests_total', 'HTTP请求数', ['method', 'route', 'status']
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    'llm_roles_http_request_duration_seconds', 'HTTP请求耗时（秒），包含响应体发送', ['method', 'route']
+)
+HTTP_IN_FLIGHT = Gauge(
+    'llm_roles_http_requests_in_flight', '正在处理的HTTP请求数'
+)
+DB_QUERY_SECONDS = Histogram(
+    'llm_roles_db_query_duration_seconds', '数据库操作耗时（秒）', ['operation'], buckets=FAST_BUCKETS
+)
+DB_QUERY_ROWS = Counter(
+    'llm_roles_db_query_rows_total', '数据库操作返回或写入的行数', ['operation']
+)
+DB_QUERY_ERRORS = Counter(
+    'llm_roles_db_query_errors_total', '数据库操作异常次数', ['operation']
+)
+DB_QUERIES_IN_FLIGHT = Gauge(
+    'llm_roles_db_queries_in_flight', '正在执行的数据库操作数（占用中的连接数）'
+)
+PROMPT_RENDER_SECONDS = Histogram(
+    'llm_roles_prompt_render_duration_seconds', '提示词模板渲染耗时（秒）', ['format'], buckets=FAST_BUCKETS
+)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""按需性能剖析
+
+单个请求的剖析：数据库、模板渲染和序列化等耗时点调用record()，只有当前上下文中
+存在活跃的RequestProfile时才累计，未开启剖析时只多一次上下文变量读取。
+上下文变量会随run_in_threadpool传递到工作线程，同步路由中的记录也能归到所属请求。
+
+整个进程的剖析：sample_process()周期性读取所有线程的调用栈，按折叠栈格式
+（flamegraph.pl、speedscope可直接读取）写入本地文件。
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter as CounterDict
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# 耗时分类
+ROUTING = 'routing'
+DB = 'db'
+RENDER = 'render'
+SERIALIZE = 'serialize'
+APP = 'app'
+
+_current: ContextVar[Optional['RequestProfile']] = ContextVar('llm_roles_request_profile', default=None)
+
+
+class RequestProfile:
+    """单个请求的耗时分解，可选地附带确定性剖析（cProfile）结果"""
+
+    def __init__(self, deterministic: bool = True):
+        """初始化请求剖析
+
+        Args:
+            deterministic: 是否在处理函数执行期间启用cProfile
+        """
+        self.started = time.perf_counter()
+        self.endpoint_started: Optional[float] = None
+        self.endpoint_finished: Optional[float] = None
+        self.sections: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.profiler = None
+        # cProfile是否实际记录了处理函数的执行（异步处理函数不记录）
+        self.captured = False
+        if deterministic:
+            import cProfile
+            self.profiler = cProfile.Profile()
+        self._lock = threading.Lock()
+
+    def add(self, category: str, seconds: float) -> None:
+        """累计一个分类的耗时
+
+        Args:
+            category: 耗时分类
+            seconds: 耗时（秒）
+        """
+        with self._lock:
+            self.sections[category] = self.sections.get(category, 0.0) + seconds
+            self.counts[category] = self.counts.get(category, 0) + 1
+
+    def run_endpoint(self, func, *args, **kwargs) -> Any:
+        """在剖析下执行同步处理函数，记录处理函数的起止时间"""
+        self.endpoint_started = time.perf_counter()
+        try:
+            if self.profiler is None:
+                return func(*args, **kwargs)
+            self.captured = True
+            return self.profiler.runcall(func, *args, **kwargs)
+        finally:
+            self.endpoint_finished = time.perf_counter()
+
+    async def run_async_endpoint(self, func, *args, **kwargs) -> Any:
+        """执行异步处理函数，只记录起止时间（事件循环中的其他请求会混入cProfile结果）"""
+        self.endpoint_started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            self.endpoint_finished = time.perf_counter()
+
+    def breakdown(self, until: Optional[float] = None) -> Dict[str, float]:
+        """计算各分类的耗时（毫秒），各项之和等于总耗时
+
+        routing包含路由匹配、请求体解码和参数校验；serialize包含处理函数返回之后
+        到响应开始发送之前的响应模型校验和编码；app为处理函数中除数据库、渲染和
+        序列化以外的耗时。
+
+        Args:
+            until: 统计截止时间，默认为当前时间
+
+        Returns:
+            Dict[str, float]: 分类到耗时（毫秒）的映射，另含total
+        """
+        end = until if until is not None else time.perf_counter()
+        with self._lock:
+            sections = dict(self.sections)
+
+        result: Dict[str, float] = {}
+        if self.endpoint_started is None:
+            result[ROUTING] = end - self.started
+        else:
+            endpoint_end = self.endpoint_finished or end
+            recorded = sum(sections.values())
+            result[ROUTING] = self.endpoint_started - self.started
+            result[DB] = sections.get(DB, 0.0)
+            result[RENDER] = sections.get(RENDER, 0.0)
+            result[SERIALIZE] = sections.get(SERIALIZE, 0.0) + max(end - endpoint_end, 0.0)
+            result[APP] = max((endpoint_end - self.endpoint_started) - recorded, 0.0)
+        result['total'] = end - self.started
+        return {key: round(value * 1000, 3) for key, value in result.items()}
+
+
+def current_profile() -> Optional[RequestProfile]:
+    """当前上下文中活跃的请求剖析"""
+    return _current.get()
+
+
+def activate(profile: RequestProfile):
+    """在当前上下文中启用请求剖析
+
+    Returns:
+        用于deactivate的令牌
+    """
+    return _current.set(profile)
+
+
+def deactivate(token) -> None:
+    """恢复启用剖析之前的上下文"""
+    _current.reset(token)
+
+
+def record(category: str, seconds: float) -> None:
+    """若当前请求正在剖析，累计一个分类的耗时
+
+    Args:
+        category: 耗时分类
+        seconds: 耗时（秒）
+    """
+    profile = _current.get()
+    if profile is not None:
+        profile.add(category, seconds)
+
+
+def _frame_label(frame) -> str:
+    """调用栈中一帧的显示名称"""
+    code = frame.f_code
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+
+def sample_process(seconds: float, output_dir: Path, interval: float = 0.005,
+                   max_depth: int = 64) -> Dict[str, Any]:
+    """对整个进程做采样剖析，结果按折叠栈格式写入文件
+
+    Args:
+        seconds: 采样时长（秒）
+        output_dir: 输出目录
+        interval: 采样间隔（秒）
+        max_depth: 每个调用栈保留的最大深度
+
+    Returns:
+        Dict[str, Any]: 输出文件路径、采样次数和自身耗时最高的函数
+    """
+    own_thread = threading.get_ident()
+    stacks: CounterDict = CounterDict()
+    leaves: CounterDict = CounterDict()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            labels: List[str] = []
+            while frame is not None and len(labels) < max_depth:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            if not labels:
+                continue
+            leaves[labels[0]] += 1
+            stacks[';'.join(reversed(labels))] += 1
+            samples += 1
+        time.sleep(interval)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    path = output_dir / f"process-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.folded"
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in stacks.most_common():
+            f.write(f'{stack} {count}\n')
+
+    return {
+        'file': str(path),
+        'seconds': seconds,
+        'samples': samples,
+        'top_functions': [
+            {'function': name, 'samples': count, 'ratio': round(count / samples, 4)}
+            for name, count in leaves.most_common(20)
+        ]
+    }
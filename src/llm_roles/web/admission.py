@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""准入控制与降载
+
+请求在进入线程池之前按路由分组排队：每组有并发上限和有界队列。
+队列已满，或按该组近期处理耗时估算的排队时间超过目标延迟时，立即返回503和Retry-After，
+而不是让请求在线程池里等待SQLite锁直到客户端超时；排队超过目标延迟的请求同样被拒绝。
+
+健康检查、指标、文档，以及发往支持304的路由（角色、模板和提示词详情）的条件GET
+（如缓存的提示词重新验证）不排队；其他路由即使带条件头也照常排队。
+"""
+
+import asyncio
+import json
+import math
+import re
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from ..utils.metrics import Counter, Gauge, Histogram
+from .instrumentation import ASGIApp, Receive, Scope, Send
+
+ADMISSION_ACTIVE = Gauge(
+    'llm_roles_admission_active', '已准入且正在处理的请求数', ['policy']
+)
+ADMISSION_QUEUED = Gauge(
+    'llm_roles_admission_queued', '正在排队等待准入的请求数', ['policy']
+)
+ADMISSION_LIMIT = Gauge(
+    'llm_roles_admission_limit', '并发上限', ['policy']
+)
+ADMISSION_EXPECTED_WAIT = Gauge(
+    'llm_roles_admission_expected_wait_seconds', '按近期处理耗时估算的新请求排队时间（秒）', ['policy']
+)
+ADMISSION_REJECTED = Counter(
+    'llm_roles_admission_rejected_total', '被拒绝的请求数', ['policy', 'reason']
+)
+ADMISSION_BYPASSED = Counter(
+    'llm_roles_admission_bypassed_total', '不经排队直接处理的请求数'
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    'llm_roles_admission_queue_wait_seconds', '准入前的排队时间（秒）', ['policy'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+
+# 拒绝原因
+QUEUE_FULL = 'queue_full'
+PREDICTED_WAIT = 'predicted_wait'
+WAIT_TIMEOUT = 'wait_timeout'
+
+# 不排队的路径
+BYPASS_PATHS = ('/health', '/health/deep', '/ready', '/metrics', '/docs', '/redoc', '/openapi.json')
+
+# 能按If-None-Match/If-Modified-Since返回304的路由，带条件头的GET不排队
+CONDITIONAL_ROUTES = ('/roles/{role_id}', '/prompt-templates/{template_id}', '/roles/{role_id}/prompt')
+
+# 处理耗时的指数加权平均系数
+_EWMA_WEIGHT = 0.2
+
+
+def _compile_template(template: str) -> 're.Pattern[str]':
+    """把路由模板（如/roles/{role_id}）编译为匹配实际路径的正则"""
+    pattern = re.sub(r'\{[^}]+\}', '[^/]+', re.escape(template).replace(r'\{', '{').replace(r'\}', '}'))
+    return re.compile(f'^{pattern}$')
+
+
+class AdmissionPolicy:
+    """一组路由的准入策略"""
+
+    def __init__(self, name: str, limit: int, max_queue: int, latency_target: float = 0.5,
+                 routes: Sequence[str] = (), methods: Optional[Iterable[str]] = None):
+        """初始化准入策略
+
+        Args:
+            name: 策略名称，用作指标标签
+            limit: 同时处理的请求数上限
+            max_queue: 排队请求数上限
+            latency_target: 可接受的排队时间（秒），预计或实际超过时拒绝
+            routes: 适用的路由模板，为空时匹配所有路径
+            methods: 适用的HTTP方法，为None时匹配所有方法
+        """
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.latency_target = latency_target
+        self.methods = {m.upper() for m in methods} if methods is not None else None
+        self.routes = tuple(routes)
+        self._patterns = [_compile_template(route) for route in routes]
+
+    def matches(self, method: str, path: str) -> bool:
+        """请求是否适用该策略"""
+        if self.methods is not None and method not in self.methods:
+            return False
+        return not self._patterns or any(p.match(path) for p in self._patterns)
+
+
+# 默认策略，按顺序匹配。各组上限之和小于默认线程池大小（40），被准入的请求不必再等待线程
+DEFAULT_POLICIES = (
+    AdmissionPolicy('bulk', limit=2, max_queue=8, latency_target=2.0, routes=(
+        '/catalog/export', '/catalog/import', '/batch', '/debug/profile',
+        '/roles/stream', '/prompt-templates/stream', '/sessions/{session_id}/messages/stream',
+    )),
+    AdmissionPolicy('prompt', limit=8, max_queue=128, latency_target=0.5, routes=(
+        '/roles/{role_id}/prompt', '/roles/{role_id}/preview-prompt', '/sessions/{session_id}/context',
+    )),
+    # SQLite同一时间只有一个写事务，写请求并发过高只会在锁上排队
+    AdmissionPolicy('write', limit=4, max_queue=256, latency_target=1.0,
+                    methods=('POST', 'PUT', 'PATCH', 'DELETE')),
+    AdmissionPolicy('read', limit=16, max_queue=256, latency_target=0.5),
+)
+
+
+class _PolicyState:
+    """单个策略在当前事件循环中的运行状态"""
+
+    def __init__(self, policy: AdmissionPolicy):
+        self.policy = policy
+        self.active = 0
+        self.waiters: Deque['asyncio.Future[None]'] = deque()
+        # 近期处理耗时的加权平均，尚无样本时为None
+        self.service_time: Optional[float] = None
+        self.active_gauge = ADMISSION_ACTIVE.labels(policy.name)
+        self.queued_gauge = ADMISSION_QUEUED.labels(policy.name)
+        self.expected_wait_gauge = ADMISSION_EXPECTED_WAIT.labels(policy.name)
+        self.wait_histogram = ADMISSION_WAIT_SECONDS.labels(policy.name)
+        ADMISSION_LIMIT.labels(policy.name).set(policy.limit)
+
+    def expected_wait(self, position: int) -> float:
+        """估算排在第position位（从0开始）的请求需要等待的时间"""
+        if self.service_time is None:
+            return 0.0
+        return (position // self.policy.limit + 1) * self.service_time
+
+    def retry_after(self) -> int:
+        """建议客户端重试前等待的秒数"""
+        return max(1, math.ceil(self.expected_wait(len(self.waiters))))
+
+    def _update_gauges(self) -> None:
+        self.active_gauge.set(self.active)
+        self.queued_gauge.set(len(self.waiters))
+        self.expected_wait_gauge.set(self.expected_wait(len(self.waiters)))
+
+    async def acquire(self) -> Optional[str]:
+        """申请处理名额
+
+        Returns:
+            Optional[str]: 被拒绝时返回原因，准入时返回None
+        """
+        policy = self.policy
+        if self.active < policy.limit and not self.waiters:
+            self.active += 1
+            self._update_gauges()
+            self.wait_histogram.observe(0.0)
+            return None
+
+        position = len(self.waiters)
+        if position >= policy.max_queue:
+            return QUEUE_FULL
+        if self.expected_wait(position) > policy.latency_target:
+            return PREDICTED_WAIT
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self._update_gauges()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, policy.latency_target)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            return WAIT_TIMEOUT
+        except BaseException:
+            # 客户端断开等原因导致取消；若名额已经转交给本请求，需要归还
+            if waiter.done() and not waiter.cancelled():
+                self.release(None)
+            else:
+                self._discard(waiter)
+            raise
+        self.wait_histogram.observe(time.perf_counter() - start)
+        return None
+
+    def release(self, service_seconds: Optional[float]) -> None:
+        """归还处理名额，有排队请求时直接转交给队首
+
+        Args:
+            service_seconds: 本次处理耗时，用于更新排队时间估算
+        """
+        if service_seconds is not None:
+            if self.service_time is None:
+                self.service_time = service_seconds
+            else:
+                self.service_time += _EWMA_WEIGHT * (service_seconds - self.service_time)
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self.active -= 1
+        self._update_gauges()
+
+    def _discard(self, waiter: 'asyncio.Future[None]') -> None:
+        try:
+            self.waiters.remove(waiter)
+        except ValueError:
+            pass
+        self._update_gauges()
+
+
+def _is_conditional(scope: Scope) -> bool:
+    """请求是否带有If-None-Match或If-Modified-Since"""
+    for name, _ in scope.get('headers') or []:
+        if name in (b'if-none-match', b'if-modified-since'):
+            return True
+    return False
+
+
+class AdmissionMiddleware:
+    """按路由分组限制并发，超过排队目标时快速拒绝"""
+
+    def __init__(self, app: ASGIApp, policies: Sequence[AdmissionPolicy] = DEFAULT_POLICIES,
+                 bypass_paths: Sequence[str] = BYPASS_PATHS,
+                 conditional_routes: Sequence[str] = CONDITIONAL_ROUTES):
+        """初始化准入控制中间件
+
+        Args:
+            app: 下游ASGI应用
+            policies: 按顺序匹配的准入策略，未匹配的请求不受限制
+            bypass_paths: 不排队的路径
+            conditional_routes: 带条件头的GET/HEAD不排队的路由模板
+        """
+        self.app = app
+        self.states: List[_PolicyState] = [_PolicyState(policy) for policy in policies]
+        self.bypass_paths = frozenset(bypass_paths)
+        self._conditional_patterns = [_compile_template(route) for route in conditional_routes]
+        # 策略中的固定路径（如/roles/stream）也能匹配/roles/{role_id}，不按条件请求放行
+        self._fixed_paths = frozenset(
+            route for policy in policies for route in policy.routes if '{' not in route
+        )
+
+    def _select(self, scope: Scope) -> Optional[_PolicyState]:
+        """选择请求适用的策略，不需要排队时返回None"""
+        method, path = scope['method'], scope['path']
+        if method == 'OPTIONS' or path in self.bypass_paths:
+            return None
+        if (method in ('GET', 'HEAD') and path not in self._fixed_paths
+                and any(p.match(path) for p in self._conditional_patterns) and _is_conditional(scope)):
+            return None
+        for state in self.states:
+            if state.policy.matches(method, path):
+                return state
+        return None
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各策略的当前状态
+
+        Returns:
+            Dict[str, Dict[str, Any]]: 策略名称到并发数、排队数和估算等待时间的映射
+        """
+        return {
+            state.policy.name: {
+                'limit': state.policy.limit,
+                'active': state.active,
+                'queued': len(state.waiters),
+                'expected_wait': state.expected_wait(len(state.waiters))
+            }
+            for state in self.states
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        state = self._select(scope)
+        if state is None:
+            ADMISSION_BYPASSED.inc()
+            await self.app(scope, receive, send)
+            return
+
+        reason = await state.acquire()
+        if reason is not None:
+            ADMISSION_REJECTED.labels(state.policy.name, reason).inc()
+            await self._reject(send, state, reason)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            state.release(time.perf_counter() - start)
+
+    @staticmethod
+    async def _reject(send: Send, state: _PolicyState, reason: str) -> None:
+        """返回503响应"""
+        body = json.dumps({
+            'status': 503,
+            'message': '服务繁忙，请稍后重试',
+            'success': False,
+            'data': {'policy': state.policy.name, 'reason': reason}
+        }, ensure_ascii=False).encode('utf-8')
+        headers: List[Tuple[bytes, bytes]] = [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'retry-after', str(state.retry_after()).encode()),
+        ]
+        await send({'type': 'http.response.start', 'status': 503, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""读己之写的客户端绑定
+
+启用只读快照副本时，客户端写入角色或模板后，在快照包含这次写入之前它的读取都走主库。
+客户端优先按X-Client-Id请求头识别，没有时使用客户端地址（同一地址后的多个客户端
+只会多读几次主库，不会读到旧数据）。容器没有启用副本时不绑定，也不导入副本模块。
+"""
+
+from typing import Optional
+
+from .instrumentation import ASGIApp, Receive, Scope, Send
+
+CLIENT_ID_HEADER = b'x-client-id'
+
+
+def client_id(scope: Scope) -> Optional[str]:
+    """获取请求的客户端标识
+
+    Args:
+        scope: ASGI请求作用域
+
+    Returns:
+        Optional[str]: X-Client-Id请求头或客户端地址，都没有时返回None
+    """
+    for name, value in scope.get('headers') or []:
+        if name == CLIENT_ID_HEADER and value:
+            return value.decode('latin-1')
+    client = scope.get('client')
+    return client[0] if client else None
+
+
+def _uses_replica(scope: Scope) -> bool:
+    """请求使用的服务容器是否启用了只读快照副本"""
+    container = (scope.get('state') or {}).get('container')
+    if container is None:
+        container = getattr(getattr(scope.get('app'), 'state', None), 'container', None)
+    return getattr(container, 'replica', None) is not None
+
+
+class ReadAffinityMiddleware:
+    """把请求的客户端标识绑定到上下文，随run_in_threadpool传递到数据库层"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or not _uses_replica(scope):
+            await self.app(scope, receive, send)
+            return
+        from ..database.replica import bind_client, unbind_client
+        token = bind_client(client_id(scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            unbind_client(token)
@@ -1,17 +1,22 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import asyncio
+import gzip
+import io
+import json
 import os
 import sys
+from contextlib import asynccontextmanager, suppress
+from http import HTTPStatus
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 
-from fastapi import FastAPI, HTTPException, Query, Depends
+from fastapi import FastAPI, HTTPException, Query, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.openapi.docs import get_swagger_ui_html, get_redoc_html
-from fastapi.openapi.utils import get_openapi
-from fastapi.staticfiles import StaticFiles
 
 # Add project root to Python path if running directly
 current_file = Path(__file__).resolve()
@@ -19,23 +24,100 @@ project_root = current_file.parent.parent.parent.parent
 if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
-from src.llm_roles.database.sqlite import SQLiteDatabase
-from src.llm_roles.services.role_manager import RoleManager
-from src.llm_roles.services.prompt_service import PromptService
 from src.llm_roles.api.role_api import RoleAPI
 from src.llm_roles.api.prompt_api import PromptAPI
+from src.llm_roles.api.catalog_api import CatalogAPI
+from src.llm_roles.api.session_api import SessionAPI
+from src.llm_roles.api.batch_api import BatchAPI
+from src.llm_roles.web.conditional import conditional_check, make_etag, parse_timestamp
+from src.llm_roles.web.admission import AdmissionMiddleware
+from src.llm_roles.web.affinity import ReadAffinityMiddleware
+from src.llm_roles.web.container import TENANT_DIR_ENV, ServiceContainer
+from src.llm_roles.web.openapi import load_openapi_bytes
+from src.llm_roles.web.read_only import ReadOnlyMiddleware
+from src.llm_roles.web.tenant_routing import TenantMiddleware
+from src.llm_roles.web.instrumentation import (
+    MetricsMiddleware, export_worker_metrics, threadpool_stats, update_threadpool_metrics
+)
+from src.llm_roles.web.profiling import (
+    ProfiledRoute, ProfilingMiddleware, is_authorized, profile_process, profiling_enabled
+)
+from src.llm_roles.web.responses import (
+    choose_media_type, encode_for_request, envelope_response, ndjson_stream
+)
+from src.llm_roles.utils.metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, METRICS_DIR_ENV, REGISTRY, MultiprocessMetrics
+)
+
+# 应用生命周期
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时创建服务容器，关闭时释放连接和缓存"""
+    from src.llm_roles.web.server import configure_worker
+    configure_worker(app)
+    container = ServiceContainer()
+    container.start()
+    app.state.container = container
+    # 多租户模式：带X-Tenant-Id请求头的请求使用租户自己的数据库文件，只在启用时导入
+    tenants = None
+    if os.environ.get(TENANT_DIR_ENV):
+        from src.llm_roles.web.tenancy import TenantRegistry
+        tenants = TenantRegistry()
+        tenants.start()
+    app.state.tenants = tenants
+    # 多个工作进程时定期写入本进程的指标快照，/metrics合并所有进程的快照
+    exporter = exporter_task = None
+    if os.environ.get(METRICS_DIR_ENV):
+        exporter = MultiprocessMetrics(os.environ[METRICS_DIR_ENV])
+        exporter_task = asyncio.create_task(export_worker_metrics(exporter))
+    app.state.metrics_exporter = exporter
+    try:
+        yield
+    finally:
+        if exporter_task is not None:
+            exporter_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await exporter_task
+            exporter.close()
+        if tenants is not None:
+            tenants.close()
+        container.close()
 
 # 创建FastAPI应用
 app = FastAPI(
     title="LLM角色管理API",
     description="LLM角色管理系统的RESTful API接口",
     version="0.1.0",
-    docs_url="/docs",    # Swagger UI 路径
-    redoc_url="/redoc",  # ReDoc 路径
-    openapi_url="/openapi.json"  # OpenAPI JSON 路径
+    # 文档路由在下方自行注册：/openapi.json直接返回预编译的字节
+    docs_url=None,
+    redoc_url=None,
+    openapi_url=None,
+    lifespan=lifespan
 )
 
-# 添加 CORS 支持
+# 路由处理函数支持按需剖析（需要设置LLM_ROLES_PROFILE_TOKEN）
+app.router.route_class = ProfiledRoute
+
+# memory后端只读，写请求返回405，放在租户选择之内以读取请求所用的服务容器
+app.add_middleware(ReadOnlyMiddleware)
+
+# 按X-Tenant-Id请求头选择租户的服务容器（需要设置LLM_ROLES_TENANT_DIR），放在准入控制之内，
+# 被拒绝的请求不会打开租户数据库
+app.add_middleware(TenantMiddleware)
+
+# 记录请求的客户端标识，启用只读快照副本时保证客户端读到自己的写入
+app.add_middleware(ReadAffinityMiddleware)
+
+# 准入控制：按路由分组限制并发，排队过久时直接返回503，被拒绝的请求也计入指标
+app.add_middleware(AdmissionMiddleware)
+
+# 请求指标采集，放在准入控制之外以统计完整的处理耗时
+app.add_middleware(MetricsMiddleware)
+
+# 按需剖析，携带有效令牌的请求返回Server-Timing耗时分解
+app.add_middleware(ProfilingMiddleware)
+
+# 添加 CORS 支持，放在最外层，准入控制和租户选择直接返回的503/400也带CORS响应头
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # 可以设置为特定域名，例如 ["http://localhost:3000"]
@@ -45,34 +127,37 @@ app.add_middleware(
 )
 
 # 自定义OpenAPI模式
+def openapi_bytes() -> bytes:
+    """获取序列化后的OpenAPI文档，优先使用预编译的api_docs/openapi.json"""
+    body = getattr(app.state, "openapi_body", None)
+    if body is not None:
+        return body
+        
+    try:
+        body = load_openapi_bytes()
+    except Exception as e:
+        print(f"警告: 无法加载API文档文件: {e}")
+        body = None
+        
+    # 如果上述方法失败，则使用FastAPI的默认方式
+    if body is None:
+        from fastapi.openapi.utils import get_openapi
+        openapi_schema = get_openapi(
+            title=app.title,
+            version=app.version,
+            description=app.description,
+            routes=app.routes,
+        )
+        body = json.dumps(openapi_schema, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        
+    app.state.openapi_body = body
+    return body
+
 def custom_openapi():
     """自定义OpenAPI模式，允许使用预定义的API文档"""
-    # 尝试从文件加载API文档
-    api_docs_path = project_root / "api_docs" / "api_docs.yml"
-    
     if app.openapi_schema:
         return app.openapi_schema
-        
-    # 如果文件存在且为YAML格式，则尝试加载
-    if api_docs_path.exists() and api_docs_path.suffix in ['.yml', '.yaml']:
-        try:
-            import yaml
-            with open(api_docs_path, 'r', encoding='utf-8') as f:
-                openapi_schema = yaml.safe_load(f)
-                app.openapi_schema = openapi_schema
-                return app.openapi_schema
-        except (ImportError, yaml.YAMLError, IOError) as e:
-            print(f"警告: 无法加载API文档文件: {e}")
-    
-    # 如果上述方法失败，则使用FastAPI的默认方式
-    openapi_schema = get_openapi(
-        title=app.title,
-        version=app.version,
-        description=app.description,
-        routes=app.routes,
-    )
-    
-    app.openapi_schema = openapi_schema
+    app.openapi_schema = json.loads(openapi_bytes())
     return app.openapi_schema
 
 app.openapi = custom_openapi
@@ -126,38 +211,57 @@ class PromptPreviewRequest(BaseModel):
     type: Optional[str] = "complete"
     custom_variables: Optional[Dict[str, Any]] = None
 
+class SessionCreate(BaseModel):
+    role_id: str
+    user_id: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
+
+class MessageCreate(BaseModel):
+    sender: str = Field(..., description="发送者(user, assistant, system)")
+    content: str
+    metadata: Optional[Dict[str, Any]] = None
+
+class MessageBatchCreate(BaseModel):
+    messages: List[MessageCreate]
+
+class BatchOperation(BaseModel):
+    op: str = Field(..., description="操作名称，如create_role、create_template、set_role_default_template")
+    args: Dict[str, Any] = Field(default_factory=dict, description="操作参数，值可以用$ref引用前面操作的结果")
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=1000)
+    mode: str = Field("atomic", description="执行模式(atomic, continue)")
+
 class ApiResponse(BaseModel):
     status: int
     message: str
     success: bool
     data: Optional[Dict[str, Any]] = None
 
-# 依赖项 - 获取API实例
-def get_role_api():
+# 依赖项 - 从应用级服务容器获取API实例
+def get_container(request: Request) -> ServiceContainer:
+    """获取请求租户的服务容器，未指定租户时为应用启动时创建的服务容器"""
+    return getattr(request.state, "container", None) or request.app.state.container
+
+def get_role_api(container: ServiceContainer = Depends(get_container)) -> RoleAPI:
     """获取角色API实例"""
-    db_path = project_root / "resource" / "db" / "llm_roles.db"
-    if not db_path.exists():
-        raise HTTPException(
-            status_code=500, 
-            detail="数据库不存在，请先运行初始化脚本: src/llm_roles/database/scripts/init_db.py"
-        )
-    
-    db = SQLiteDatabase(str(db_path))
-    role_manager = RoleManager(db)
-    return RoleAPI(role_manager)
+    return container.role_api
 
-def get_prompt_api():
+def get_prompt_api(container: ServiceContainer = Depends(get_container)) -> PromptAPI:
     """获取提示词API实例"""
-    db_path = project_root / "resource" / "db" / "llm_roles.db"
-    if not db_path.exists():
-        raise HTTPException(
-            status_code=500, 
-            detail="数据库不存在，请先运行初始化脚本: src/llm_roles/database/scripts/init_db.py"
-        )
-    
-    db = SQLiteDatabase(str(db_path))
-    prompt_service = PromptService(db)
-    return PromptAPI(prompt_service)
+    return container.prompt_api
+
+def get_catalog_api(container: ServiceContainer = Depends(get_container)) -> CatalogAPI:
+    """获取目录导入导出API实例"""
+    return container.catalog_api
+
+def get_session_api(container: ServiceContainer = Depends(get_container)) -> SessionAPI:
+    """获取会话API实例"""
+    return container.session_api
+
+def get_batch_api(container: ServiceContainer = Depends(get_container)) -> BatchAPI:
+    """获取批量操作API实例"""
+    return container.batch_api
 
 # API路由
 @app.post("/roles", response_model=ApiResponse, tags=["角色管理"])
@@ -166,11 +270,36 @@ def create_role(role: RoleCreate, api: RoleAPI = Depends(get_role_api)):
     result = api.create_role(role.model_dump(exclude_none=True))
     return result
 
+@app.get("/roles/stream", tags=["角色管理"])
+def stream_roles(
+    batch_size: int = Query(500, ge=1, le=5000, description="每次从数据库读取的记录数"),
+    container: ServiceContainer = Depends(get_container)
+):
+    """以NDJSON流式返回全部角色（按ID排序），每行一个角色"""
+    roles = (role.to_dict() for role in container.role_manager.iter_roles(batch_size=batch_size))
+    return StreamingResponse(ndjson_stream(roles), media_type="application/x-ndjson")
+
 @app.get("/roles/{role_id}", response_model=ApiResponse, tags=["角色管理"])
-def get_role(role_id: str, api: RoleAPI = Depends(get_role_api)):
-    """获取角色详情"""
-    result = api.get_role(role_id)
-    return result
+def get_role(
+    role_id: str,
+    request: Request,
+    response: Response,
+    container: ServiceContainer = Depends(get_container)
+):
+    """获取角色详情，支持If-None-Match/If-Modified-Since条件请求"""
+    info = container.role_manager.get_role_version_info(role_id)
+    if info:
+        # JSON和MessagePack是不同的表示，ETag需要区分
+        media_type = choose_media_type(request.headers.get("accept"))
+        not_modified = conditional_check(
+            request, response,
+            make_etag("role", role_id, info["version"], info["updated_at"], media_type),
+            parse_timestamp(info["updated_at"])
+        )
+        if not_modified:
+            return not_modified
+    result = container.role_api.get_role(role_id)
+    return envelope_response(request, result, headers=response.headers)
 
 @app.put("/roles/{role_id}", response_model=ApiResponse, tags=["角色管理"])
 def update_role(role_id: str, role: RoleUpdate, api: RoleAPI = Depends(get_role_api)):
@@ -188,21 +317,48 @@ def delete_role(role_id: str, api: RoleAPI = Depends(get_role_api)):
 
 @app.get("/roles", response_model=ApiResponse, tags=["角色管理"])
 def list_roles(
+    request: Request,
     limit: int = Query(100, description="返回的最大角色数量"),
     offset: int = Query(0, description="分页偏移量"),
     api: RoleAPI = Depends(get_role_api)
 ):
     """列出所有角色"""
     result = api.list_roles(limit=limit, offset=offset)
-    return result
+    return envelope_response(request, result)
 
 @app.get("/search-roles", response_model=ApiResponse, tags=["角色管理"])
 def search_roles(
+    request: Request,
     query: str = Query(..., description="搜索关键词"),
     api: RoleAPI = Depends(get_role_api)
 ):
     """搜索角色"""
     result = api.search_roles(query)
+    return envelope_response(request, result)
+
+# 角色版本API
+@app.get("/roles/{role_id}/versions", response_model=ApiResponse, tags=["角色管理"])
+def list_role_versions(
+    role_id: str,
+    request: Request,
+    limit: int = Query(100, description="返回的最大版本数量"),
+    offset: int = Query(0, description="分页偏移量"),
+    api: RoleAPI = Depends(get_role_api)
+):
+    """列出角色历史版本"""
+    result = api.list_role_versions(role_id, limit=limit, offset=offset)
+    return envelope_response(request, result)
+
+@app.get("/roles/{role_id}/versions/{version}", response_model=ApiResponse, tags=["角色管理"])
+def get_role_version(role_id: str, version: int, api: RoleAPI = Depends(get_role_api)):
+    """获取角色的指定历史版本"""
+    result = api.get_role_version(role_id, version)
+    return result
+
+@app.post("/roles/{role_id}/versions/{version}/rollback", response_model=ApiResponse, tags=["角色管理"])
+def rollback_role(role_id: str, version: int, api: RoleAPI = Depends(get_role_api)):
+    """将角色回滚到指定历史版本"""
+    result = api.rollback_role(role_id, version)
     return result
 
 # 提示词模板管理API
@@ -215,14 +371,41 @@ def create_template(
     result = api.create_template(template.model_dump(exclude_none=True))
     return result
 
+@app.get("/prompt-templates/stream", tags=["提示词管理"])
+def stream_templates(
+    include_defaults: bool = Query(True, description="是否包含默认模板"),
+    batch_size: int = Query(500, ge=1, le=5000, description="每次从数据库读取的记录数"),
+    container: ServiceContainer = Depends(get_container)
+):
+    """以NDJSON流式返回全部提示词模板（默认模板在前，其余按ID排序），每行一个模板"""
+    templates = (
+        template.to_dict()
+        for template in container.prompt_service.iter_templates(
+            include_defaults=include_defaults, batch_size=batch_size
+        )
+    )
+    return StreamingResponse(ndjson_stream(templates), media_type="application/x-ndjson")
+
 @app.get("/prompt-templates/{template_id}", response_model=ApiResponse, tags=["提示词管理"])
 def get_template(
     template_id: str,
-    api: PromptAPI = Depends(get_prompt_api)
+    request: Request,
+    response: Response,
+    container: ServiceContainer = Depends(get_container)
 ):
-    """获取提示词模板详情"""
-    result = api.get_template(template_id)
-    return result
+    """获取提示词模板详情，支持If-None-Match/If-Modified-Since条件请求"""
+    info = container.prompt_service.get_template_version_info(template_id)
+    if info:
+        media_type = choose_media_type(request.headers.get("accept"))
+        not_modified = conditional_check(
+            request, response,
+            make_etag("template", template_id, info.get("version"), info["updated_at"], media_type),
+            parse_timestamp(info["updated_at"])
+        )
+        if not_modified:
+            return not_modified
+    result = container.prompt_api.get_template(template_id)
+    return envelope_response(request, result, headers=response.headers)
 
 @app.put("/prompt-templates/{template_id}", response_model=ApiResponse, tags=["提示词管理"])
 def update_template(
@@ -247,6 +430,7 @@ def delete_template(
 
 @app.get("/prompt-templates", response_model=ApiResponse, tags=["提示词管理"])
 def list_templates(
+    request: Request,
     include_defaults: bool = Query(True, description="是否包含默认模板"),
     limit: int = Query(100, description="返回的最大模板数量"),
     offset: int = Query(0, description="分页偏移量"),
@@ -254,29 +438,43 @@ def list_templates(
 ):
     """列出所有提示词模板"""
     result = api.list_templates(include_defaults=include_defaults, limit=limit, offset=offset)
-    return result
+    return envelope_response(request, result)
 
 # 角色提示词生成API
 @app.get("/roles/{role_id}/prompt", response_model=ApiResponse, tags=["提示词生成"])
 def get_role_prompt(
     role_id: str,
+    request: Request,
+    response: Response,
     format: str = Query("openai", description="提示词格式(openai, anthropic等)"),
     type: str = Query("complete", description="提示词类型(system, user, assistant, complete等)"),
     template_id: Optional[str] = Query(None, description="使用的模板ID"),
-    api: PromptAPI = Depends(get_prompt_api)
+    container: ServiceContainer = Depends(get_container)
 ):
-    """获取角色提示词"""
-    result = api.generate_prompt(
+    """获取角色提示词，支持If-None-Match/If-Modified-Since条件请求"""
+    info = container.prompt_service.get_prompt_version_info(role_id, template_id)
+    if info:
+        # 自定义变量为空时与POST接口生成的内容一致
+        media_type = choose_media_type(request.headers.get("accept"))
+        not_modified = conditional_check(
+            request, response,
+            make_etag("prompt", role_id, info["versions"], format, type, None, media_type),
+            parse_timestamp(info["updated_at"])
+        )
+        if not_modified:
+            return not_modified
+    result = container.prompt_api.generate_prompt(
         role_id=role_id,
         format=format,
         prompt_type=type,
         template_id=template_id
     )
-    return result
+    return envelope_response(request, result, headers=response.headers)
 
 @app.post("/roles/{role_id}/prompt", response_model=ApiResponse, tags=["提示词生成"])
 def generate_role_prompt(
     role_id: str,
+    http_request: Request,
     request: PromptGenerateRequest,
     api: PromptAPI = Depends(get_prompt_api)
 ):
@@ -288,11 +486,12 @@ def generate_role_prompt(
         template_id=request.template_id,
         custom_vars=request.custom_variables
     )
-    return result
+    return envelope_response(http_request, result)
 
 @app.post("/roles/{role_id}/preview-prompt", response_model=ApiResponse, tags=["提示词生成"])
 def preview_role_prompt(
     role_id: str,
+    http_request: Request,
     request: PromptPreviewRequest,
     api: PromptAPI = Depends(get_prompt_api)
 ):
@@ -304,7 +503,7 @@ def preview_role_prompt(
         prompt_type=request.type,
         custom_vars=request.custom_variables
     )
-    return result
+    return envelope_response(http_request, result)
 
 # 角色默认模板管理API
 @app.post("/roles/{role_id}/default-templates/{template_id}", response_model=ApiResponse, tags=["提示词管理"])
@@ -330,34 +529,251 @@ def remove_role_default_template(
 @app.get("/roles/{role_id}/default-templates", response_model=ApiResponse, tags=["提示词管理"])
 def get_role_default_templates(
     role_id: str,
+    request: Request,
     api: PromptAPI = Depends(get_prompt_api)
 ):
     """获取角色的默认模板列表"""
     result = api.get_role_default_templates(role_id)
+    return envelope_response(request, result)
+
+# 会话管理API
+@app.post("/sessions", response_model=ApiResponse, tags=["会话管理"])
+def create_session(session: SessionCreate, api: SessionAPI = Depends(get_session_api)):
+    """创建会话"""
+    result = api.create_session(session.role_id, user_id=session.user_id, metadata=session.metadata)
+    return result
+
+@app.get("/sessions/{session_id}", response_model=ApiResponse, tags=["会话管理"])
+def get_session(session_id: str, api: SessionAPI = Depends(get_session_api)):
+    """获取会话信息"""
+    result = api.get_session(session_id)
+    return result
+
+@app.post("/sessions/{session_id}/messages", response_model=ApiResponse, tags=["会话管理"])
+def append_message(
+    session_id: str,
+    message: MessageCreate,
+    api: SessionAPI = Depends(get_session_api)
+):
+    """向会话追加一条消息"""
+    result = api.append_messages(session_id, [message.model_dump()])
+    return result
+
+@app.post("/sessions/{session_id}/messages/batch", response_model=ApiResponse, tags=["会话管理"])
+def append_messages(
+    session_id: str,
+    batch: MessageBatchCreate,
+    api: SessionAPI = Depends(get_session_api)
+):
+    """在一个事务中向会话批量追加消息"""
+    result = api.append_messages(session_id, [m.model_dump() for m in batch.messages])
     return result
 
+# 会话消息API
+@app.get("/sessions/{session_id}/messages", response_model=ApiResponse, tags=["会话管理"])
+def get_session_messages(
+    session_id: str,
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000, description="返回的最大消息数量"),
+    before: Optional[int] = Query(None, description="只返回序号小于该值的消息"),
+    after: Optional[int] = Query(None, description="只返回序号大于该值的消息"),
+    order: str = Query("asc", description="排序方向(asc, desc)"),
+    api: SessionAPI = Depends(get_session_api)
+):
+    """按序号游标分页获取会话消息"""
+    result = api.get_session_messages(
+        session_id, limit=limit, before=before, after=after, order=order
+    )
+    return envelope_response(request, result)
+
+@app.get("/sessions/{session_id}/messages/stream", tags=["会话管理"])
+def stream_session_messages(
+    session_id: str,
+    request: Request,
+    after: Optional[int] = Query(None, description="只返回序号大于该值的消息"),
+    batch_size: int = Query(500, ge=1, le=5000, description="每次从数据库读取的记录数"),
+    container: ServiceContainer = Depends(get_container)
+):
+    """以NDJSON流式返回会话的全部消息（按序号排序），每行一条消息"""
+    service = container.session_service
+    if not service.get_session(session_id):
+        return envelope_response(request, {
+            'status': HTTPStatus.NOT_FOUND,
+            'message': f'会话不存在: {session_id}',
+            'success': False
+        })
+    messages = service.iter_messages(session_id, after=after, batch_size=batch_size)
+    return StreamingResponse(ndjson_stream(messages), media_type="application/x-ndjson")
+
+@app.get("/sessions/{session_id}/messages/tail", response_model=ApiResponse, tags=["会话管理"])
+def tail_session_messages(
+    session_id: str,
+    request: Request,
+    n: int = Query(20, ge=1, le=1000, description="返回最近的消息数量"),
+    api: SessionAPI = Depends(get_session_api)
+):
+    """获取会话最近的n条消息"""
+    result = api.tail_session_messages(session_id, n)
+    return envelope_response(request, result)
+
+@app.get("/sessions/{session_id}/context", response_model=ApiResponse, tags=["会话管理"])
+def build_session_context(
+    session_id: str,
+    request: Request,
+    format: str = Query("openai", description="输出格式(openai, anthropic)"),
+    max_messages: Optional[int] = Query(None, ge=0, description="最多包含的历史消息数"),
+    max_tokens: Optional[int] = Query(None, ge=1, description="系统提示词与历史消息的估算token总预算"),
+    api: SessionAPI = Depends(get_session_api)
+):
+    """组装包含系统提示词和最近历史的对话上下文"""
+    result = api.build_context(
+        session_id, format=format, max_messages=max_messages, max_tokens=max_tokens
+    )
+    return envelope_response(request, result)
+
+# 目录导入导出API
+@app.get("/catalog/export", tags=["系统"])
+def export_catalog(
+    compress: bool = Query(False, description="是否使用gzip压缩"),
+    api: CatalogAPI = Depends(get_catalog_api)
+):
+    """以JSONL流式导出角色、模板和角色默认模板关联"""
+    filename = "catalog.jsonl.gz" if compress else "catalog.jsonl"
+    return StreamingResponse(
+        api.export_catalog(compress=compress),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/catalog/import", response_model=ApiResponse, tags=["系统"])
+async def import_catalog(
+    request: Request,
+    chunk_size: int = Query(1000, ge=1, description="每个事务包含的记录数"),
+    skip: int = Query(0, ge=0, description="跳过的前置行数，用于断点续传"),
+    api: CatalogAPI = Depends(get_catalog_api)
+):
+    """从JSONL（可gzip压缩）请求体导入目录，已存在的记录会被覆盖"""
+    import tempfile
+    
+    # 请求体先写入临时文件（超过阈值才落盘），导入过程内存占用恒定
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as body:
+        async for chunk in request.stream():
+            body.write(chunk)
+        body.seek(0)
+        
+        compressed = body.read(2) == b"\x1f\x8b"
+        body.seek(0)
+        raw = gzip.GzipFile(fileobj=body, mode="rb") if compressed else body
+        lines = io.TextIOWrapper(raw, encoding="utf-8")
+        
+        return await run_in_threadpool(
+            api.import_catalog, lines, chunk_size=chunk_size, skip=skip
+        )
+
+# 批量操作API
+@app.post("/batch", response_model=ApiResponse, tags=["系统"])
+def execute_batch(batch: BatchRequest, api: BatchAPI = Depends(get_batch_api)):
+    """在一个事务中按顺序执行多个角色和提示词操作"""
+    result = api.execute([op.model_dump() for op in batch.operations], mode=batch.mode)
+    return result
+
+# API文档
+@app.get("/openapi.json", include_in_schema=False)
+def get_openapi_document(request: Request):
+    """返回预序列化的OpenAPI文档"""
+    body, headers = encode_for_request(request, openapi_bytes())
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/docs", include_in_schema=False)
+def swagger_ui():
+    """Swagger UI 文档页面"""
+    from fastapi.openapi.docs import get_swagger_ui_html
+    return get_swagger_ui_html(openapi_url="/openapi.json", title=f"{app.title} - Swagger UI")
+
+@app.get("/redoc", include_in_schema=False)
+def redoc():
+    """ReDoc 文档页面"""
+    from fastapi.openapi.docs import get_redoc_html
+    return get_redoc_html(openapi_url="/openapi.json", title=f"{app.title} - ReDoc")
+
 # 健康检查
 @app.get("/health", tags=["系统"])
 def health_check():
     """系统健康检查"""
     return {"status": "healthy", "message": "API服务运行正常"}
 
+async def _probe(request: Request) -> Dict[str, Any]:
+    """执行（或读取缓存的）就绪探测，探测在线程池中进行"""
+    container = get_container(request)
+    return await run_in_threadpool(container.readiness.check, threadpool_stats())
+
+@app.get("/ready", response_model=ApiResponse, tags=["系统"])
+async def readiness_check(request: Request):
+    """就绪检查：数据库可查询且默认模板已加载时返回200，否则返回503"""
+    probe = await _probe(request)
+    status = HTTPStatus.OK if probe["ready"] else HTTPStatus.SERVICE_UNAVAILABLE
+    response = envelope_response(request, {
+        "status": status,
+        "message": "服务已就绪" if probe["ready"] else "服务未就绪",
+        "success": probe["ready"],
+        "data": {key: probe[key] for key in ("status", "ready", "failed", "checked_at", "age")}
+    })
+    response.status_code = status
+    return response
+
+@app.get("/health/deep", response_model=ApiResponse, tags=["系统"])
+async def deep_health_check(request: Request):
+    """深度健康检查：返回数据库查询耗时、线程池占用、WAL大小和缓存状态的详细结果"""
+    probe = await _probe(request)
+    status = HTTPStatus.OK if probe["ready"] else HTTPStatus.SERVICE_UNAVAILABLE
+    response = envelope_response(request, {
+        "status": status,
+        "message": f"服务状态: {probe['status']}",
+        "success": probe["ready"],
+        "data": probe
+    })
+    response.status_code = status
+    return response
+
+# 运行指标
+@app.get("/metrics", tags=["系统"])
+async def metrics(request: Request):
+    """以Prometheus文本格式输出运行指标，多个工作进程时输出所有进程的合计"""
+    update_threadpool_metrics()
+    exporter = getattr(request.app.state, "metrics_exporter", None)
+    if exporter is None:
+        return Response(content=REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+    content = await run_in_threadpool(exporter.render)
+    return Response(content=content, media_type=METRICS_CONTENT_TYPE)
+
+# 进程级采样剖析
+@app.get("/debug/profile", response_model=ApiResponse, tags=["系统"])
+async def profile_whole_process(
+    request: Request,
+    seconds: float = Query(10, gt=0, le=300, description="采样时长（秒）")
+):
+    """对整个进程做采样剖析，结果以折叠栈格式写入本地文件"""
+    if not profiling_enabled():
+        return {"status": HTTPStatus.NOT_FOUND, "message": "剖析功能未启用", "success": False}
+    if not is_authorized(request.scope):
+        return {"status": HTTPStatus.FORBIDDEN, "message": "剖析令牌无效", "success": False}
+    
+    # 在线程池中采样，事件循环继续处理其他请求
+    result = await run_in_threadpool(profile_process, seconds)
+    if result is None:
+        return {"status": HTTPStatus.CONFLICT, "message": "已有进程采样正在进行", "success": False}
+    return {"status": HTTPStatus.OK, "message": "进程采样完成", "success": True, "data": result}
+
 # 主函数
 def main():
     """启动FastAPI应用"""
-    import uvicorn
-    
     # 确保数据库目录存在
     db_dir = project_root / "resource" / "db"
     db_dir.mkdir(parents=True, exist_ok=True)
     
-    # 启动服务器
-    uvicorn.run(
-        "src.llm_roles.web.api_server:app",
-        host="127.0.0.1",
-        port=8000,
-        reload=True
-    )
+    # 启动服务器（开发模式，生产模式见scripts/run_api_server.py --prod）
+    from src.llm_roles.web.server import serve
+    serve(host="127.0.0.1", port=8000)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""条件请求支持：根据资源版本生成ETag/Last-Modified，并判断是否可以返回304
+
+gzip/br压缩后的响应体与未压缩的不同，是另一个表示，使用在引号内追加"-gzip"/"-br"的强ETag；
+比较If-None-Match时去掉这个后缀，客户端持有任一表示的ETag都能得到304。
+"""
+
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+
+# ETag后缀区分的内容编码
+CONTENT_CODINGS: Tuple[str, ...] = ('gzip', 'br')
+
+
+def make_etag(*parts: Any) -> str:
+    """由资源版本信息生成强ETag
+
+    Args:
+        *parts: 能唯一确定响应内容的版本信息（可JSON序列化）
+
+    Returns:
+        str: 带引号的ETag
+    """
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return '"' + hashlib.sha1(raw.encode('utf-8')).hexdigest() + '"'
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """生成压缩表示的ETag
+
+    Args:
+        etag: 未压缩表示的ETag
+        encoding: 响应的Content-Encoding，None表示未压缩
+
+    Returns:
+        str: 在引号内追加"-编码"后缀的ETag，未压缩或弱ETag时原样返回
+    """
+    if not encoding or etag.startswith('W/') or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def _strip_coding(etag: str) -> str:
+    """去掉ETag的弱标记和内容编码后缀"""
+    if etag.startswith('W/'):
+        etag = etag[2:]
+    for coding in CONTENT_CODINGS:
+        suffix = f'-{coding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """解析数据库中的时间戳（无时区的值按UTC处理）
+
+    Args:
+        value: 时间戳字符串
+
+    Returns:
+        Optional[datetime]: 带时区的时间，无法解析时返回None
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _matching_etag(header: str, etag: str) -> Optional[str]:
+    """按弱比较规则（忽略内容编码后缀）查找If-None-Match中匹配的ETag
+
+    Returns:
+        Optional[str]: 匹配的ETag（保留客户端发送的编码后缀），不匹配时返回None
+    """
+    if header.strip() == '*':
+        return etag
+    opaque = _strip_coding(etag)
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if _strip_coding(candidate) == opaque:
+            return candidate[2:] if candidate.startswith('W/') else candidate
+    return None
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """按弱比较规则判断If-None-Match是否匹配"""
+    return _matching_etag(header, etag) is not None
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """判断条件请求是否可以返回304
+
+    If-None-Match存在时优先使用，忽略If-Modified-Since。
+
+    Args:
+        request: 请求对象
+        etag: 当前资源的ETag
+        last_modified: 当前资源的最后修改时间
+
+    Returns:
+        bool: 客户端缓存是否仍然有效
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP日期只精确到秒
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime] = None) -> Dict[str, str]:
+    """生成缓存校验响应头
+
+    Args:
+        etag: ETag
+        last_modified: 最后修改时间
+
+    Returns:
+        Dict[str, str]: 响应头
+    """
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if last_modified is not None:
+        headers['Last-Modified'] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def conditional_check(request: Request, response: Response, etag: str,
+                      last_modified: Optional[datetime] = None) -> Optional[Response]:
+    """处理条件GET：缓存有效时返回304响应，否则在响应上设置校验头并返回None
+
+    Args:
+        request: 请求对象
+        response: 路由注入的响应对象，用于附加响应头
+        etag: 当前资源的ETag
+        last_modified: 当前资源的最后修改时间
+
+    Returns:
+        Optional[Response]: 304响应，或None表示需要正常生成响应
+    """
+    headers = validator_headers(etag, last_modified)
+    if is_not_modified(request, etag, last_modified):
+        # 304的ETag与客户端缓存的表示（可能是压缩的）一致
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match is not None:
+            headers['ETag'] = _matching_etag(if_none_match, etag)
+        # 304需要携带与完整响应相同的Vary，缓存才能区分JSON和MessagePack表示
+        return Response(status_code=304, headers={**headers, 'Vary': 'Accept, Accept-Encoding'})
+    response.headers.update(headers)
+    return None
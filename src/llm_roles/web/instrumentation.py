@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""HTTP请求指标采集中间件
+
+使用纯ASGI中间件而不是BaseHTTPMiddleware，不额外创建任务和内存流，
+流式响应的耗时统计到最后一块发送完成为止。
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, MutableMapping
+
+import anyio.to_thread
+
+from ..utils.metrics import Gauge, HTTP_IN_FLIGHT, HTTP_REQUEST_SECONDS, HTTP_REQUESTS, MultiprocessMetrics
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+THREADPOOL_SIZE = Gauge(
+    'llm_roles_threadpool_size', '同步路由使用的线程池容量'
+)
+THREADPOOL_IN_USE = Gauge(
+    'llm_roles_threadpool_in_use', '线程池中正在使用的线程数'
+)
+
+# 多个工作进程时写入指标快照的间隔（秒），即其他进程的采样在/metrics中最多落后的时间
+METRICS_FLUSH_INTERVAL = 1.0
+
+
+class MetricsMiddleware:
+    """记录每个路由的请求数、耗时和正在处理的请求数
+
+    路由标签使用路由模板（如/roles/{role_id}），不使用实际路径，避免标签数量随ID增长。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status: Dict[str, int] = {'code': 500}
+
+        async def send_wrapper(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get('route')
+            path = getattr(route, 'path', None) or 'unmatched'
+            method = scope['method']
+            HTTP_REQUESTS.labels(method, path, status['code']).inc()
+            HTTP_REQUEST_SECONDS.labels(method, path).observe(elapsed)
+
+
+def threadpool_stats() -> Dict[str, int]:
+    """读取当前事件循环默认线程池的容量和占用，需要在事件循环中调用
+
+    Returns:
+        Dict[str, int]: {'total': 容量, 'in_use': 占用数}
+    """
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    return {'total': int(limiter.total_tokens), 'in_use': limiter.borrowed_tokens}
+
+
+def update_threadpool_metrics() -> None:
+    """更新线程池指标，需要在事件循环中调用"""
+    stats = threadpool_stats()
+    THREADPOOL_SIZE.set(stats['total'])
+    THREADPOOL_IN_USE.set(stats['in_use'])
+
+
+async def export_worker_metrics(exporter: MultiprocessMetrics, interval: float = METRICS_FLUSH_INTERVAL) -> None:
+    """定期把当前工作进程的指标写入快照文件，直到任务被取消
+
+    文件写入使用事件循环的默认执行器，不占用同步路由的线程池。
+
+    Args:
+        exporter: 当前进程的多进程汇总
+        interval: 写入间隔（秒）
+    """
+    while True:
+        update_threadpool_metrics()
+        await asyncio.to_thread(exporter.flush)
+        await asyncio.sleep(interval)
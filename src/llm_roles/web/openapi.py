@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""OpenAPI文档的预编译
+
+api_docs/api_docs.yml是手工维护的文档源文件，用PyYAML解析较慢（上百毫秒）。
+构建时把它编译为紧凑的JSON文件api_docs/openapi.json，服务启动后直接读取字节返回，
+不再解析YAML，也不需要导入yaml。JSON比YAML旧或不存在时回退到解析YAML并重新生成。
+"""
+
+import json
+from pathlib import Path
+from typing import Optional
+
+project_root = Path(__file__).resolve().parent.parent.parent.parent
+
+YAML_PATH = project_root / "api_docs" / "api_docs.yml"
+JSON_PATH = project_root / "api_docs" / "openapi.json"
+
+
+def compile_openapi(yaml_path: Path = YAML_PATH, json_path: Optional[Path] = JSON_PATH) -> bytes:
+    """把YAML文档编译为JSON字节，并写入json_path
+
+    Args:
+        yaml_path: YAML文档路径
+        json_path: 输出的JSON文件路径，为None时只返回不写入
+
+    Returns:
+        bytes: UTF-8编码的JSON
+    """
+    import yaml
+
+    with open(yaml_path, 'r', encoding='utf-8') as f:
+        schema = yaml.safe_load(f)
+    body = json.dumps(schema, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if json_path is not None:
+        tmp_path = json_path.with_suffix('.json.tmp')
+        tmp_path.write_bytes(body)
+        tmp_path.replace(json_path)
+    return body
+
+
+def is_stale(yaml_path: Path = YAML_PATH, json_path: Path = JSON_PATH) -> bool:
+    """JSON文件是否不存在或比YAML文档旧"""
+    if not json_path.exists():
+        return True
+    return yaml_path.exists() and yaml_path.stat().st_mtime > json_path.stat().st_mtime
+
+
+def load_openapi_bytes(yaml_path: Path = YAML_PATH, json_path: Path = JSON_PATH) -> Optional[bytes]:
+    """读取预编译的OpenAPI JSON，必要时从YAML重新生成
+
+    Args:
+        yaml_path: YAML文档路径
+        json_path: 预编译的JSON文件路径
+
+    Returns:
+        Optional[bytes]: JSON字节，两个文件都不存在时返回None
+    """
+    if not is_stale(yaml_path, json_path):
+        return json_path.read_bytes()
+    if not yaml_path.exists():
+        return None
+    try:
+        return compile_openapi(yaml_path, json_path)
+    except OSError:
+        # 目录只读时仍返回编译结果，只是下次启动还要重新解析
+        return compile_openapi(yaml_path, None)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""请求级按需剖析
+
+只有设置了环境变量LLM_ROLES_PROFILE_TOKEN时才可用。请求携带
+"X-Profile: <令牌>"请求头时，该请求在剖析下执行：响应头Server-Timing给出路由、
+数据库、渲染、序列化和其余处理的耗时分解。同步处理函数的cProfile结果写入本地文件，
+路径见响应头X-Profile-File；异步处理函数与事件循环中的其他请求交织，不做cProfile，
+也不返回该响应头。令牌不接受查询参数形式，以免写入访问日志。
+"""
+
+import hmac
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.routing import APIRoute
+from starlette.datastructures import MutableHeaders
+
+from ..utils.profiling import RequestProfile, activate, current_profile, deactivate, sample_process
+from .instrumentation import ASGIApp, Message, Receive, Scope, Send
+
+# 启用剖析所需的令牌，未设置时剖析功能关闭
+PROFILE_TOKEN_ENV = 'LLM_ROLES_PROFILE_TOKEN'
+
+# 剖析结果的输出目录，默认为系统临时目录下的llm_roles_profiles
+PROFILE_DIR_ENV = 'LLM_ROLES_PROFILE_DIR'
+
+PROFILE_HEADER = b'x-profile'
+
+# 同一时间只允许一个进程级采样
+_process_profile_lock = threading.Lock()
+
+
+def profiling_enabled() -> bool:
+    """是否配置了剖析令牌"""
+    return bool(os.environ.get(PROFILE_TOKEN_ENV))
+
+
+def profile_dir() -> Path:
+    """剖析结果的输出目录"""
+    configured = os.environ.get(PROFILE_DIR_ENV)
+    if configured:
+        return Path(configured)
+    import tempfile
+    return Path(tempfile.gettempdir()) / 'llm_roles_profiles'
+
+
+def _requested_token(scope: Scope) -> Optional[str]:
+    """从请求头中读取剖析令牌"""
+    for name, value in scope.get('headers') or []:
+        if name == PROFILE_HEADER:
+            return value.decode('latin-1')
+    return None
+
+
+def _server_timing(breakdown) -> str:
+    """把耗时分解格式化为Server-Timing响应头"""
+    return ', '.join(f'{name};dur={duration}' for name, duration in breakdown.items())
+
+
+def is_authorized(scope: Scope) -> bool:
+    """请求是否携带了有效的剖析令牌"""
+    token = os.environ.get(PROFILE_TOKEN_ENV)
+    if not token:
+        return False
+    requested = _requested_token(scope)
+    return requested is not None and hmac.compare_digest(requested, token)
+
+
+class ProfilingMiddleware:
+    """对携带有效剖析令牌的请求启用剖析"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or not is_authorized(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        profile_id = uuid.uuid4().hex[:12]
+        output_dir = profile_dir()
+
+        async def send_wrapper(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                headers = MutableHeaders(scope=message)
+                headers.append('Server-Timing', _server_timing(profile.breakdown()))
+                if profile.captured:
+                    headers.append('X-Profile-File', str(output_dir / f'{profile_id}.prof'))
+            await send(message)
+
+        context_token = activate(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            deactivate(context_token)
+            # 文件写入不占用事件循环
+            await run_in_threadpool(_store, profile, profile_id, output_dir, scope, profile.breakdown())
+
+
+def _store(profile: RequestProfile, profile_id: str, output_dir: Path, scope: Scope,
+           breakdown: Dict[str, float]) -> None:
+    """写入cProfile结果（可用pstats或snakeviz查看）和最终的耗时分解"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    route = scope.get('route')
+    summary = {
+        'method': scope.get('method'),
+        'path': scope.get('path'),
+        'route': getattr(route, 'path', None),
+        'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'breakdown_ms': breakdown,
+        'counts': dict(profile.counts)
+    }
+    with open(output_dir / f'{profile_id}.json', 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    if profile.captured:
+        profile.profiler.dump_stats(str(output_dir / f'{profile_id}.prof'))
+
+
+def _profiled(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    """包装路由处理函数，请求正在剖析时记录处理函数的执行区间
+
+    包装函数保持原函数的同步/异步类型，FastAPI仍会把同步处理函数放到线程池执行，
+    cProfile因此在实际执行处理函数的线程中启用。
+    """
+    if inspect.iscoroutinefunction(endpoint):
+        @wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            profile = current_profile()
+            if profile is None:
+                return await endpoint(*args, **kwargs)
+            return await profile.run_async_endpoint(endpoint, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        profile = current_profile()
+        if profile is None:
+            return endpoint(*args, **kwargs)
+        return profile.run_endpoint(endpoint, *args, **kwargs)
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """处理函数支持按需剖析的路由"""
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        super().__init__(path, _profiled(endpoint), **kwargs)
+
+
+def profile_process(seconds: float) -> Optional[Dict[str, Any]]:
+    """对整个进程采样剖析，已有采样在进行时返回None
+
+    Args:
+        seconds: 采样时长（秒）
+
+    Returns:
+        Optional[Dict[str, Any]]: 采样结果，包含输出文件路径
+    """
+    if not _process_profile_lock.acquire(blocking=False):
+        return None
+    try:
+        return sample_process(seconds, profile_dir())
+    finally:
+        _process_profile_lock.release()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""只读服务容器的写请求拒绝
+
+memory后端启动时从SQLite文件复制目录数据，之后的写入只存在于进程内存中，重启即丢失。
+这类容器（ServiceContainer.read_only）上的写请求直接返回405，而不是返回成功后悄悄丢弃。
+只读的POST路由（提示词生成和预览）照常处理；/batch中的写操作由BatchAPI拒绝。
+"""
+
+from http import HTTPStatus
+from typing import List, Sequence, Tuple
+
+from .admission import _compile_template
+from .instrumentation import ASGIApp, Receive, Scope, Send
+from .responses import serialize_envelope
+
+WRITE_METHODS = frozenset(('POST', 'PUT', 'PATCH', 'DELETE'))
+
+# 使用POST但不写入数据的路由
+READ_ROUTES = ('/roles/{role_id}/prompt', '/roles/{role_id}/preview-prompt', '/batch')
+
+
+def _is_read_only(scope: Scope) -> bool:
+    """请求使用的服务容器是否只读"""
+    container = (scope.get('state') or {}).get('container')
+    if container is None:
+        container = getattr(getattr(scope.get('app'), 'state', None), 'container', None)
+    return getattr(container, 'read_only', False)
+
+
+class ReadOnlyMiddleware:
+    """服务容器只读时拒绝写请求"""
+
+    def __init__(self, app: ASGIApp, read_routes: Sequence[str] = READ_ROUTES):
+        """初始化只读中间件
+
+        Args:
+            app: 下游ASGI应用
+            read_routes: 使用写方法但不写入数据、照常处理的路由模板
+        """
+        self.app = app
+        self._read_patterns = [_compile_template(route) for route in read_routes]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (scope['type'] != 'http' or scope['method'] not in WRITE_METHODS
+                or any(p.match(scope['path']) for p in self._read_patterns) or not _is_read_only(scope)):
+            await self.app(scope, receive, send)
+            return
+        await self._reject(send)
+
+    @staticmethod
+    async def _reject(send: Send) -> None:
+        """返回405响应"""
+        status = HTTPStatus.METHOD_NOT_ALLOWED
+        body = serialize_envelope({
+            'status': status,
+            'message': '内存后端为只读模式，写入不会持久化，已拒绝',
+            'success': False,
+            'data': None
+        })
+        headers: List[Tuple[bytes, bytes]] = [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'allow', b'GET, HEAD, OPTIONS'),
+        ]
+        await send({'type': 'http.response.start', 'status': int(status), 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""就绪与深度健康检查
+
+探测使用独立的短超时只读连接执行一条轻量查询，数据库文件缺失或被锁时很快失败，
+不会占用请求使用的连接。结果缓存ttl秒，探测频率再高也最多每ttl秒访问一次数据库。
+
+检查项分为关键和非关键两类：关键项（数据库查询、默认模板）失败时服务未就绪；
+非关键项（线程池占用、WAL大小）超过阈值时服务仍就绪，但状态标记为degraded。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from ..database.base import DatabaseBackend
+from ..services.prompt_service import PromptService
+from ..services.session_service import SessionService
+
+# 整体状态
+OK = 'ok'
+DEGRADED = 'degraded'
+UNAVAILABLE = 'unavailable'
+
+
+class ReadinessProbe:
+    """带结果缓存的就绪探测"""
+
+    def __init__(self, db: DatabaseBackend, prompt_service: PromptService,
+                 session_service: SessionService, ttl: float = 2.0,
+                 query_timeout: float = 1.0, max_query_latency: float = 0.25,
+                 max_wal_bytes: int = 256 * 1024 * 1024, max_pool_utilization: float = 0.9):
+        """初始化就绪探测
+
+        Args:
+            db: 数据库
+            prompt_service: 提示词服务，用于检查默认模板是否已加载
+            session_service: 会话服务，用于读取缓存状态
+            ttl: 探测结果的缓存时间（秒）
+            query_timeout: 探测查询等待数据库锁的最长时间（秒）
+            max_query_latency: 探测查询耗时上限（秒），超过时未就绪
+            max_wal_bytes: WAL文件大小上限（字节），超过时降级
+            max_pool_utilization: 线程池占用率上限，超过时降级
+        """
+        self.db = db
+        self.prompt_service = prompt_service
+        self.session_service = session_service
+        self.ttl = ttl
+        self.query_timeout = query_timeout
+        self.max_query_latency = max_query_latency
+        self.max_wal_bytes = max_wal_bytes
+        self.max_pool_utilization = max_pool_utilization
+        self._result: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def check(self, pool: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """获取探测结果，缓存未过期时直接返回缓存
+
+        并发探测时只有一个线程真正执行检查，其余线程等待并共享结果。
+
+        Args:
+            pool: 线程池状态 {'total': 容量, 'in_use': 占用数}，需要在事件循环中读取后传入
+
+        Returns:
+            Dict[str, Any]: 包含status、ready、checks以及结果年龄的字典
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._result is None or now - self._checked_at >= self.ttl:
+                self._result = self._run_checks(pool)
+                self._checked_at = now
+            result = dict(self._result)
+            result['age'] = round(time.monotonic() - self._checked_at, 3)
+            return result
+
+    def _run_checks(self, pool: Optional[Dict[str, int]]) -> Dict[str, Any]:
+        """执行所有检查"""
+        checks = {
+            'database': self._check_database(),
+            'pool': self._check_pool(pool),
+            'wal': self._check_wal(),
+            'caches': self._check_caches(),
+        }
+        critical_failed = [name for name, c in checks.items() if c['critical'] and not c['ok']]
+        degraded = [name for name, c in checks.items() if not c['ok']]
+        status = UNAVAILABLE if critical_failed else DEGRADED if degraded else OK
+        return {
+            'status': status,
+            'ready': not critical_failed,
+            'failed': degraded,
+            'checked_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'checks': checks
+        }
+
+    def _check_database(self) -> Dict[str, Any]:
+        """用独立的只读连接执行一条轻量查询并计时"""
+        result: Dict[str, Any] = {'critical': True, 'threshold_ms': self.max_query_latency * 1000}
+        path = getattr(self.db, 'db_path', None)
+        if path is None:
+            # 没有数据库文件的后端（如内存后端）直接执行一次轻量读取
+            start = time.perf_counter()
+            self.db.list_roles(limit=1)
+            latency = time.perf_counter() - start
+            return {**result, 'ok': latency <= self.max_query_latency,
+                    'latency_ms': round(latency * 1000, 3)}
+        if not os.path.exists(path):
+            return {**result, 'ok': False, 'error': f'数据库文件不存在: {path}'}
+
+        start = time.perf_counter()
+        try:
+            # 只读模式打开，文件在检查之后被删除时也不会新建空数据库
+            uri = f'{Path(path).resolve().as_uri()}?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, timeout=self.query_timeout)
+            try:
+                conn.execute('SELECT 1 FROM roles LIMIT 1').fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            return {**result, 'ok': False, 'error': str(e),
+                    'latency_ms': round((time.perf_counter() - start) * 1000, 3)}
+        latency = time.perf_counter() - start
+        return {**result, 'ok': latency <= self.max_query_latency,
+                'latency_ms': round(latency * 1000, 3)}
+
+    def _check_pool(self, pool: Optional[Dict[str, int]]) -> Dict[str, Any]:
+        """线程池占用和已打开的数据库连接数"""
+        result: Dict[str, Any] = {
+            'critical': False,
+            'db_connections': self.db.connection_count,
+            'threshold': self.max_pool_utilization
+        }
+        if not pool or not pool.get('total'):
+            return {**result, 'ok': True}
+        utilization = pool['in_use'] / pool['total']
+        return {**result, 'ok': utilization <= self.max_pool_utilization,
+                'threadpool_total': pool['total'], 'threadpool_in_use': pool['in_use'],
+                'utilization': round(utilization, 3)}
+
+    def _check_wal(self) -> Dict[str, Any]:
+        """WAL文件大小，检查点长期无法完成时会持续增长并拖慢读取"""
+        path = getattr(self.db, 'db_path', None)
+        if path is None:
+            return {'critical': False, 'ok': True, 'bytes': 0, 'threshold_bytes': self.max_wal_bytes}
+        wal_path = f'{path}-wal'
+        size = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        return {'critical': False, 'ok': size <= self.max_wal_bytes,
+                'bytes': size, 'threshold_bytes': self.max_wal_bytes}
+
+    def _check_caches(self) -> Dict[str, Any]:
+        """默认模板是否已加载，以及会话缓存的预热情况"""
+        templates = self.prompt_service.default_template_count
+        caches = self.session_service.cache_stats()
+        return {
+            'critical': True,
+            'ok': templates > 0,
+            'default_templates': templates,
+            'warm': all(stats['size'] > 0 for stats in caches.values()),
+            'sizes': {name: stats['size'] for name, stats in caches.items()}
+        }
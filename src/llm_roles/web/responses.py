@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""快速响应路径：把API返回的响应字典直接序列化为字节，并按Accept-Encoding压缩
+
+路由声明的response_model会让FastAPI对返回的字典做一次模型校验和重新序列化，
+列表和提示词这类大响应因此要复制多份。这里一次json.dumps得到最终字节，跳过校验。
+全量列表则使用ndjson_stream逐批输出，内存占用与数据量无关。
+
+请求的Accept优先选择application/msgpack时，响应体改用MessagePack编码，
+信封结构（status/message/success/data）与JSON相同。未安装msgpack时始终返回JSON。
+msgpack和brotli在第一次协商到它们时才导入，不增加启动时间。
+"""
+
+import gzip
+import importlib
+import json
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from fastapi import Request, Response
+
+from ..utils.profiling import SERIALIZE, record as record_profile
+from .conditional import encoded_etag
+
+# 小于该字节数的响应不压缩，压缩收益抵不过开销
+MIN_COMPRESS_SIZE = 1024
+
+# 动态内容使用中等压缩级别，兼顾速度和压缩率
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# ApiResponse的字段，快速路径按同样的结构输出
+_ENVELOPE_FIELDS = ('status', 'message', 'success', 'data')
+
+JSON_MEDIA_TYPE = 'application/json'
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+# 部分客户端库仍使用的旧名称
+_MSGPACK_ALIASES = (MSGPACK_MEDIA_TYPE, 'application/x-msgpack')
+
+# 可选依赖：brotli未安装时只提供gzip，msgpack未安装时只提供JSON
+_OPTIONAL_MODULES = ('brotli', 'msgpack')
+_loaded: Dict[str, Any] = {}
+
+
+def _optional(name: str) -> Any:
+    """第一次使用时导入可选依赖
+
+    Args:
+        name: 模块名（brotli或msgpack）
+
+    Returns:
+        模块，未安装时返回None
+    """
+    if name not in _loaded:
+        try:
+            _loaded[name] = importlib.import_module(name)
+        except ImportError:
+            _loaded[name] = None
+    return _loaded[name]
+
+
+def __getattr__(name: str) -> Any:
+    """responses.brotli/responses.msgpack按需导入，未安装时为None"""
+    if name in _OPTIONAL_MODULES:
+        return _optional(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def supported_encodings() -> List[str]:
+    """当前环境支持的压缩编码，按优先级排列
+
+    Returns:
+        List[str]: 编码名称列表
+    """
+    return ['br', 'gzip'] if _optional('brotli') is not None else ['gzip']
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """根据Accept-Encoding选择压缩编码
+
+    Args:
+        accept_encoding: 请求的Accept-Encoding头
+
+    Returns:
+        Optional[str]: 选中的编码，不压缩时返回None
+    """
+    if not accept_encoding:
+        return None
+
+    weights = _parse_weights(accept_encoding)
+    best, best_quality = None, 0.0
+    for encoding in supported_encodings():
+        quality = weights.get(encoding, weights.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _parse_weights(header: str) -> Dict[str, float]:
+    """解析Accept类请求头，返回名称（小写）到q值的映射"""
+    weights: Dict[str, float] = {}
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            param = param.strip()
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        weights[name] = quality
+    return weights
+
+
+def choose_media_type(accept: Optional[str]) -> str:
+    """根据Accept选择响应的编码格式
+
+    只有msgpack的q值严格高于JSON时才使用MessagePack，未携带Accept、
+    Accept为*/*或未安装msgpack时都返回JSON。
+
+    Args:
+        accept: 请求的Accept头
+
+    Returns:
+        str: JSON_MEDIA_TYPE或MSGPACK_MEDIA_TYPE
+    """
+    if not accept:
+        return JSON_MEDIA_TYPE
+
+    weights = _parse_weights(accept)
+    wildcard = weights.get('application/*', weights.get('*/*', 0.0))
+    msgpack_quality = max(weights.get(name, wildcard) for name in _MSGPACK_ALIASES)
+    json_quality = weights.get(JSON_MEDIA_TYPE, wildcard)
+    if msgpack_quality > json_quality and _optional('msgpack') is not None:
+        return MSGPACK_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    """按指定编码压缩响应体
+
+    Args:
+        body: 原始字节
+        encoding: 'br'或'gzip'
+
+    Returns:
+        bytes: 压缩后的字节
+    """
+    if encoding == 'br':
+        return _optional('brotli').compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def serialize_envelope(result: Mapping[str, Any], media_type: str = JSON_MEDIA_TYPE) -> bytes:
+    """把API响应字典序列化为与ApiResponse相同结构的字节
+
+    Args:
+        result: API层返回的响应字典
+        media_type: JSON_MEDIA_TYPE或MSGPACK_MEDIA_TYPE
+
+    Returns:
+        bytes: UTF-8编码的JSON或MessagePack
+    """
+    start = time.perf_counter()
+    envelope = {field: result.get(field) for field in _ENVELOPE_FIELDS}
+    if media_type == MSGPACK_MEDIA_TYPE:
+        body = _optional('msgpack').packb(envelope, default=str, use_bin_type=True)
+    else:
+        body = json.dumps(
+            envelope, ensure_ascii=False, separators=(',', ':'), default=str
+        ).encode('utf-8')
+    record_profile(SERIALIZE, time.perf_counter() - start)
+    return body
+
+
+def deserialize_envelope(body: bytes, media_type: str = JSON_MEDIA_TYPE) -> Dict[str, Any]:
+    """解析serialize_envelope生成的字节，供客户端和测试使用
+
+    Args:
+        body: 响应体（未压缩）
+        media_type: 响应的Content-Type
+
+    Returns:
+        Dict[str, Any]: 响应字典
+    """
+    if media_type.split(';')[0].strip().lower() in _MSGPACK_ALIASES:
+        return _optional('msgpack').unpackb(body, raw=False)
+    return json.loads(body)
+
+
+def encode_for_request(request: Request, body: bytes) -> Tuple[bytes, Dict[str, str]]:
+    """按请求的Accept-Encoding压缩响应体
+
+    Args:
+        request: 请求对象
+        body: 原始字节
+
+    Returns:
+        Tuple[bytes, Dict[str, str]]: 响应体和需要附加的响应头
+    """
+    headers = {'Vary': 'Accept-Encoding'}
+    if len(body) < MIN_COMPRESS_SIZE:
+        return body, headers
+
+    encoding = choose_encoding(request.headers.get('accept-encoding'))
+    if encoding is None:
+        return body, headers
+
+    headers['Content-Encoding'] = encoding
+    start = time.perf_counter()
+    compressed = compress_body(body, encoding)
+    record_profile(SERIALIZE, time.perf_counter() - start)
+    return compressed, headers
+
+
+def envelope_response(request: Request, result: Mapping[str, Any],
+                      headers: Optional[Mapping[str, str]] = None) -> Response:
+    """生成快速路径响应：按Accept选择JSON或MessagePack，一次序列化，必要时压缩
+
+    Args:
+        request: 请求对象
+        result: API层返回的响应字典
+        headers: 额外的响应头（如ETag）
+
+    Returns:
+        Response: JSON或MessagePack响应
+    """
+    media_type = choose_media_type(request.headers.get('accept'))
+    body, encoding_headers = encode_for_request(request, serialize_envelope(result, media_type))
+    response_headers = dict(headers or {})
+    encoding = encoding_headers.get('Content-Encoding')
+    if encoding:
+        # 压缩后的响应体是另一个表示，强ETag不能与未压缩的相同
+        for name in response_headers:
+            if name.lower() == 'etag':
+                response_headers[name] = encoded_etag(response_headers[name], encoding)
+    response_headers.update(encoding_headers)
+    response_headers['Vary'] = 'Accept, Accept-Encoding'
+    return Response(content=body, media_type=media_type, headers=response_headers)
+
+
+def ndjson_stream(rows: Iterable[Mapping[str, Any]], chunk_rows: int = 100) -> Iterator[bytes]:
+    """把记录逐行编码为NDJSON，每chunk_rows行作为一个输出块
+
+    生成器只有在上一块被发送后才会继续读取，读取速度受客户端消费速度限制。
+    中途出错时输出一行{"error": ...}后结束，因为此时响应状态码已经发出。
+
+    Args:
+        rows: 记录迭代器
+        chunk_rows: 每个输出块包含的行数
+
+    Yields:
+        bytes: NDJSON数据块
+    """
+    buffer: List[bytes] = []
+    try:
+        for row in rows:
+            buffer.append(json.dumps(row, ensure_ascii=False, default=str).encode('utf-8') + b'\n')
+            if len(buffer) >= chunk_rows:
+                yield b''.join(buffer)
+                buffer = []
+    except Exception as e:
+        buffer.append(json.dumps({'error': str(e)}, ensure_ascii=False).encode('utf-8') + b'\n')
+    if buffer:
+        yield b''.join(buffer)
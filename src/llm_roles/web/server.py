@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""API服务启动配置
+
+开发模式：单进程、代码修改后自动重载。
+生产模式：多个工作进程共享监听端口，每个进程在生命周期启动阶段建立自己的数据库连接、
+应用PRAGMA并设置线程池大小；收到SIGTERM/SIGINT后停止接收新连接，
+等待进行中的请求完成（最长graceful_timeout秒）后再释放连接和缓存。
+
+工作进程由uvicorn重新导入应用，配置通过环境变量传递给每个进程。
+指标注册表是进程内的，多个工作进程时每个进程把采样写入LLM_ROLES_METRICS_DIR下的快照文件，
+/metrics合并所有进程的快照后输出（见utils.metrics.MultiprocessMetrics）。
+"""
+
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import FastAPI
+
+from ..utils.metrics import METRICS_DIR_ENV
+from .container import PRAGMAS_ENV
+
+APP_IMPORT_PATH = "src.llm_roles.web.api_server:app"
+
+# 每个工作进程的线程池大小（同步路由并发执行的上限）
+THREADPOOL_SIZE_ENV = "LLM_ROLES_THREADPOOL_SIZE"
+
+# 为1时工作进程在开始接收请求前预先生成OpenAPI模式
+PRELOAD_ENV = "LLM_ROLES_PRELOAD"
+
+# 生产模式默认的SQLite设置：WAL允许多个进程并发读且读写互不阻塞，
+# NORMAL同步级别在WAL下仍保证崩溃一致性，busy_timeout让写锁冲突时等待而不是立即报错
+PRODUCTION_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": "5000",
+}
+
+
+def build_launch(production: bool = False, host: str = "127.0.0.1", port: int = 8000,
+                 workers: Optional[int] = None, preload: bool = False,
+                 keepalive: int = 5, backlog: int = 2048, graceful_timeout: int = 30,
+                 threadpool_size: Optional[int] = None, pragmas: Optional[Dict[str, str]] = None,
+                 metrics_dir: Optional[str] = None) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """生成uvicorn启动参数和传给工作进程的环境变量
+
+    Args:
+        production: 是否使用生产模式（多进程、不自动重载）
+        host: 监听地址
+        port: 监听端口
+        workers: 工作进程数，生产模式默认为CPU核数
+        preload: 工作进程是否在接收请求前完成预热
+        keepalive: 空闲keep-alive连接的保持时间（秒）
+        backlog: 监听队列长度
+        graceful_timeout: 关闭时等待进行中请求完成的最长时间（秒）
+        threadpool_size: 每个工作进程的线程池大小，默认保持anyio的40
+        pragmas: 额外的SQLite PRAGMA设置，生产模式下覆盖PRODUCTION_PRAGMAS中的同名项
+        metrics_dir: 多个工作进程时的指标快照目录，默认读取环境变量LLM_ROLES_METRICS_DIR，
+            未设置时为系统临时目录下按端口区分的llm_roles_metrics-<端口>
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, str]]: uvicorn.run的参数和需要设置的环境变量
+    """
+    env: Dict[str, str] = {}
+    effective_pragmas = dict(PRODUCTION_PRAGMAS) if production else {}
+    effective_pragmas.update(pragmas or {})
+    if effective_pragmas:
+        env[PRAGMAS_ENV] = ",".join(f"{name}={value}" for name, value in effective_pragmas.items())
+    if threadpool_size:
+        env[THREADPOOL_SIZE_ENV] = str(threadpool_size)
+    if preload:
+        env[PRELOAD_ENV] = "1"
+
+    options: Dict[str, Any] = {
+        "host": host,
+        "port": port,
+        "timeout_keep_alive": keepalive,
+        "backlog": backlog,
+        "timeout_graceful_shutdown": graceful_timeout,
+    }
+    if production:
+        options["workers"] = workers or os.cpu_count() or 1
+        if options["workers"] > 1:
+            if metrics_dir is None:
+                import tempfile
+                metrics_dir = (os.environ.get(METRICS_DIR_ENV)
+                               or os.path.join(tempfile.gettempdir(), f"llm_roles_metrics-{port}"))
+            env[METRICS_DIR_ENV] = metrics_dir
+    else:
+        options["reload"] = True
+    return options, env
+
+
+def serve(**kwargs: Any) -> None:
+    """按build_launch的参数启动API服务
+
+    Args:
+        **kwargs: 传给build_launch的参数
+    """
+    import uvicorn
+
+    options, env = build_launch(**kwargs)
+    os.environ.update(env)
+    if env.get(METRICS_DIR_ENV):
+        # 上次运行的工作进程留下的累计值不计入本次
+        from ..utils.metrics import reset_metrics_dir
+        reset_metrics_dir(env[METRICS_DIR_ENV])
+    if env.get(PRELOAD_ENV):
+        # 在主进程中导入应用并加载API文档，配置错误时在启动工作进程之前就失败
+        from .api_server import app
+        app.openapi()
+    uvicorn.run(APP_IMPORT_PATH, **options)
+
+
+def configure_worker(app: FastAPI) -> None:
+    """在工作进程的生命周期启动阶段应用进程级设置，需要在事件循环中调用
+
+    Args:
+        app: FastAPI应用
+    """
+    import anyio.to_thread
+
+    threadpool_size = os.environ.get(THREADPOOL_SIZE_ENV)
+    if threadpool_size:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = int(threadpool_size)
+    if os.environ.get(PRELOAD_ENV) == "1":
+        app.openapi()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""每个租户一个数据库文件
+
+设置LLM_ROLES_TENANT_DIR后，带X-Tenant-Id请求头的请求读写该目录下<租户ID>.db中的
+角色、模板和会话，每个租户有自己的服务容器（连接、缓存和变更日志跟踪），一个租户的
+慢查询和写锁不影响其他租户；不带请求头的请求仍使用主库。按请求头选择容器的中间件
+在tenant_routing中，本模块只在启用多租户模式时导入。
+
+租户容器在第一次请求时打开，建表和增量迁移也在此时进行。打开的租户数有上限，
+超过时关闭最久未使用的租户，空闲超过一定时间的租户也会被关闭；正在处理请求的
+租户不会被关闭。每个打开的租户最多持有与线程池大小相同的连接数，打开的文件数
+上限约为 租户上限 × 线程池大小 × 3（数据库、WAL和共享内存文件）。
+
+租户容器不启动自己的后台线程：注册表的一个线程按LLM_ROLES_INVALIDATION_INTERVAL轮询
+所有打开租户的变更日志，并关闭空闲租户，线程数与打开的租户数无关。
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from ..utils.metrics import Counter, REGISTRY, Sample
+from .container import INVALIDATION_INTERVAL_ENV, TENANT_DIR_ENV, ServiceContainer
+
+TENANT_OPENS = Counter(
+    'llm_roles_tenant_opens_total', '打开租户数据库的次数'
+)
+TENANT_EVICTIONS = Counter(
+    'llm_roles_tenant_evictions_total', '关闭租户数据库的次数', ['reason']
+)
+
+# 同时打开的最大租户数
+MAX_OPEN_TENANTS_ENV = "LLM_ROLES_MAX_OPEN_TENANTS"
+
+# 租户空闲多少秒后关闭，为0时只按数量淘汰
+TENANT_IDLE_TIMEOUT_ENV = "LLM_ROLES_TENANT_IDLE_TIMEOUT"
+
+# 租户ID直接用作文件名
+_TENANT_ID_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.-]{0,63}')
+
+# 淘汰原因
+CAPACITY = 'capacity'
+IDLE = 'idle'
+
+
+def validate_tenant_id(tenant_id: str) -> str:
+    """检查租户ID可以安全地用作文件名
+
+    Args:
+        tenant_id: 租户ID
+
+    Returns:
+        str: 租户ID
+
+    Raises:
+        ValueError: 租户ID为空、过长或包含字母、数字、"_"、"."、"-"以外的字符
+    """
+    if not _TENANT_ID_PATTERN.fullmatch(tenant_id or '') or '..' in tenant_id:
+        raise ValueError(f"无效的租户ID: {tenant_id!r}")
+    return tenant_id
+
+
+def open_tenant_container(db_path: str) -> ServiceContainer:
+    """创建租户的服务容器
+
+    PRAGMA、压缩和变更日志跟踪沿用环境变量设置；只读快照副本、会话分片和归档
+    是针对单个大库的，租户库不启用。变更日志由TenantRegistry的线程统一轮询。
+
+    Args:
+        db_path: 租户数据库文件路径
+
+    Returns:
+        ServiceContainer: 尚未启动的服务容器
+    """
+    return ServiceContainer(db_path=db_path, backend="sqlite", replica_max_staleness=0,
+                            session_shards=0, archive_path="", invalidation_thread=False)
+
+
+class TenantLease:
+    """一次请求对租户容器的占用"""
+
+    def __init__(self, tenant_id: str):
+        self.tenant_id = tenant_id
+        self.container: Optional[ServiceContainer] = None
+        self.error: Optional[Exception] = None
+        self.leases = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        """租户容器是否已启动"""
+        return self.container is not None
+
+
+class TenantRegistry:
+    """按租户ID打开、缓存和淘汰租户服务容器（LRU）"""
+
+    def __init__(self, tenant_dir: Optional[str] = None, max_open: Optional[int] = None,
+                 idle_timeout: Optional[float] = None,
+                 factory: Callable[[str], ServiceContainer] = open_tenant_container,
+                 poll_interval: Optional[float] = None):
+        """初始化租户注册表
+
+        Args:
+            tenant_dir: 租户数据库文件所在目录，默认读取环境变量LLM_ROLES_TENANT_DIR
+            max_open: 同时打开的最大租户数，默认读取环境变量LLM_ROLES_MAX_OPEN_TENANTS，未设置时为64
+            idle_timeout: 租户空闲多少秒后关闭，默认读取环境变量LLM_ROLES_TENANT_IDLE_TIMEOUT，
+                未设置时为300，为0时只按数量淘汰
+            factory: 按数据库文件路径创建租户服务容器的函数
+            poll_interval: 轮询各租户变更日志的间隔（秒），默认读取环境变量LLM_ROLES_INVALIDATION_INTERVAL，
+                未设置时为0.5，为0时不轮询
+
+        Raises:
+            ValueError: 未指定租户目录，或最大租户数小于1
+        """
+        tenant_dir = tenant_dir or os.environ.get(TENANT_DIR_ENV)
+        if not tenant_dir:
+            raise ValueError("未指定租户数据库目录")
+        if max_open is None:
+            max_open = int(os.environ.get(MAX_OPEN_TENANTS_ENV) or 64)
+        if max_open < 1:
+            raise ValueError("最大租户数必须大于0")
+        if idle_timeout is None:
+            idle_timeout = float(os.environ.get(TENANT_IDLE_TIMEOUT_ENV) or 300)
+        if poll_interval is None:
+            poll_interval = float(os.environ.get(INVALIDATION_INTERVAL_ENV) or 0.5)
+        self.tenant_dir = tenant_dir
+        self.max_open = max_open
+        self.idle_timeout = idle_timeout
+        self.factory = factory
+        self.poll_interval = poll_interval
+        # 按最近使用排序，最久未使用的在前
+        self._tenants: 'OrderedDict[str, TenantLease]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def path_for(self, tenant_id: str) -> str:
+        """获取租户的数据库文件路径
+
+        Args:
+            tenant_id: 租户ID
+
+        Returns:
+            str: 数据库文件路径
+
+        Raises:
+            ValueError: 租户ID无效
+        """
+        return os.path.join(self.tenant_dir, f"{validate_tenant_id(tenant_id)}.db")
+
+    def checkout(self, tenant_id: str) -> TenantLease:
+        """占用租户，不打开数据库（只持有一次锁，可以在事件循环中调用）
+
+        Args:
+            tenant_id: 租户ID
+
+        Returns:
+            TenantLease: 占用记录，ready为False时需要调用open()
+
+        Raises:
+            ValueError: 租户ID无效
+        """
+        validate_tenant_id(tenant_id)
+        with self._lock:
+            lease = self._tenants.get(tenant_id)
+            if lease is None:
+                lease = self._tenants[tenant_id] = TenantLease(tenant_id)
+            else:
+                self._tenants.move_to_end(tenant_id)
+            lease.leases += 1
+            lease.last_used = time.monotonic()
+            return lease
+
+    def open(self, lease: TenantLease) -> ServiceContainer:
+        """打开租户数据库（首次打开时建表和迁移），同一租户的并发请求只打开一次
+
+        Args:
+            lease: checkout()返回的占用记录
+
+        Returns:
+            ServiceContainer: 已启动的租户服务容器
+
+        Raises:
+            Exception: 数据库无法打开，等待同一次打开的其他请求得到相同的异常
+        """
+        with lease.lock:
+            if lease.container is None and lease.error is None:
+                try:
+                    os.makedirs(self.tenant_dir, exist_ok=True)
+                    container = self.factory(self.path_for(lease.tenant_id))
+                    container.start(register_metrics=False)
+                except Exception as e:
+                    lease.error = e
+                    with self._lock:
+                        if self._tenants.get(lease.tenant_id) is lease:
+                            del self._tenants[lease.tenant_id]
+                    raise
+                lease.container = container
+                TENANT_OPENS.inc()
+            if lease.error is not None:
+                raise lease.error
+            return lease.container
+
+    def release(self, lease: TenantLease) -> List[TenantLease]:
+        """结束占用，超过租户上限时取出最久未使用的空闲租户
+
+        关闭连接可能触发WAL检查点，由调用方在锁外（事件循环之外）调用close_evicted()。
+
+        Args:
+            lease: checkout()返回的占用记录
+
+        Returns:
+            List[TenantLease]: 被淘汰、需要关闭的租户
+        """
+        with self._lock:
+            lease.leases -= 1
+            lease.last_used = time.monotonic()
+            return self._evict_over_capacity()
+
+    @contextmanager
+    def lease(self, tenant_id: str) -> Iterator[ServiceContainer]:
+        """在with块内占用并打开租户
+
+        Args:
+            tenant_id: 租户ID
+
+        Yields:
+            ServiceContainer: 租户服务容器
+        """
+        lease = self.checkout(tenant_id)
+        try:
+            yield self.open(lease)
+        finally:
+            self.close_evicted(self.release(lease))
+
+    def _evict_over_capacity(self) -> List[TenantLease]:
+        """取出超过上限的最久未使用且没有被占用的租户（需持有锁）"""
+        evicted = []
+        excess = len(self._tenants) - self.max_open
+        if excess > 0:
+            for tenant_id, lease in list(self._tenants.items()):
+                if lease.leases == 0:
+                    evicted.append(self._tenants.pop(tenant_id))
+                    excess -= 1
+                    if excess == 0:
+                        break
+        return evicted
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """关闭空闲超过idle_timeout的租户
+
+        Args:
+            now: 当前时间（time.monotonic()），默认取当前值
+
+        Returns:
+            int: 关闭的租户数
+        """
+        if not self.idle_timeout:
+            return 0
+        deadline = (time.monotonic() if now is None else now) - self.idle_timeout
+        with self._lock:
+            evicted = [
+                self._tenants.pop(tenant_id)
+                for tenant_id, lease in list(self._tenants.items())
+                if lease.leases == 0 and lease.last_used < deadline
+            ]
+        self.close_evicted(evicted, IDLE)
+        return len(evicted)
+
+    @staticmethod
+    def close_evicted(evicted: List[TenantLease], reason: str = CAPACITY) -> None:
+        """关闭被淘汰的租户容器
+
+        Args:
+            evicted: release()或淘汰空闲租户时取出的租户
+            reason: 淘汰原因，用于指标
+        """
+        for lease in evicted:
+            if lease.container is not None:
+                TENANT_EVICTIONS.labels(reason).inc()
+                lease.container.close()
+
+    def poll_changes(self) -> int:
+        """轮询所有打开租户的变更日志，轮询期间占用租户，不会被关闭
+
+        Returns:
+            int: 分发的失效事件总数
+        """
+        with self._lock:
+            polled = [lease for lease in self._tenants.values()
+                      if lease.ready and lease.container.invalidation is not None]
+            # 直接增加占用计数，不改变最近使用顺序
+            for lease in polled:
+                lease.leases += 1
+        dispatched = 0
+        try:
+            for lease in polled:
+                try:
+                    dispatched += lease.container.invalidation.poll()
+                except Exception as e:
+                    print(f"读取租户变更日志失败 {lease.tenant_id}: {e}")
+        finally:
+            with self._lock:
+                for lease in polled:
+                    lease.leases -= 1
+                evicted = self._evict_over_capacity()
+            self.close_evicted(evicted)
+        return dispatched
+
+    def start(self) -> None:
+        """启动轮询变更日志和关闭空闲租户的后台线程并注册指标"""
+        if (self.idle_timeout or self.poll_interval) and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._maintenance_loop, name='llm-roles-tenants', daemon=True)
+            self._thread.start()
+        REGISTRY.register_collector(self.collect_metrics)
+
+    def close(self) -> None:
+        """停止后台线程并关闭所有租户"""
+        REGISTRY.unregister_collector(self.collect_metrics)
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            leases = list(self._tenants.values())
+            self._tenants.clear()
+        for lease in leases:
+            if lease.container is not None:
+                lease.container.close()
+
+    def _maintenance_loop(self) -> None:
+        evict_every = min(self.idle_timeout / 2, 30.0) if self.idle_timeout else None
+        next_evict = time.monotonic() + evict_every if evict_every else None
+        while not self._stop.wait(self.poll_interval or evict_every):
+            if self.poll_interval:
+                self.poll_changes()
+            if next_evict is not None and time.monotonic() >= next_evict:
+                next_evict = time.monotonic() + evict_every
+                try:
+                    self.evict_idle()
+                except Exception as e:
+                    print(f"关闭空闲租户失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """获取打开的租户数和连接数
+
+        Returns:
+            Dict[str, Any]: 打开的租户数、正在处理请求的租户数和连接总数
+        """
+        with self._lock:
+            leases = list(self._tenants.values())
+        return {
+            'open': sum(1 for lease in leases if lease.ready),
+            'in_use': sum(1 for lease in leases if lease.leases),
+            'max_open': self.max_open,
+            'db_connections': sum(lease.container.db.connection_count for lease in leases if lease.ready)
+        }
+
+    def collect_metrics(self) -> List[Tuple[str, str, str, List[Sample]]]:
+        """输出指标时采集打开的租户数和连接数
+
+        Returns:
+            List[Tuple[str, str, str, List[Sample]]]: 指标名、类型、说明和采样
+        """
+        stats = self.stats()
+        return [
+            ('llm_roles_tenants_open', 'gauge', '打开的租户数',
+             [('llm_roles_tenants_open', {}, stats['open'])]),
+            ('llm_roles_tenant_db_connections_open', 'gauge', '所有租户打开的数据库连接数',
+             [('llm_roles_tenant_db_connections_open', {}, stats['db_connections'])]),
+        ]
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""按X-Tenant-Id请求头把请求交给租户的服务容器
+
+中间件始终安装，只通过app.state.tenants上的TenantRegistry（见tenancy）打开和占用租户；
+未启用多租户模式时不导入tenancy，请求头被忽略。
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from .instrumentation import ASGIApp, Receive, Scope, Send
+from .responses import serialize_envelope
+
+TENANT_HEADER = b'x-tenant-id'
+
+
+def tenant_id(scope: Scope) -> Optional[str]:
+    """获取请求的租户ID
+
+    Args:
+        scope: ASGI请求作用域
+
+    Returns:
+        Optional[str]: X-Tenant-Id请求头，没有时返回None
+    """
+    for name, value in scope.get('headers') or []:
+        if name == TENANT_HEADER and value:
+            return value.decode('latin-1')
+    return None
+
+
+class TenantMiddleware:
+    """按X-Tenant-Id请求头选择租户服务容器，放入scope['state']['container']
+
+    占用持续到响应（包括流式响应）发送完成，处理中的租户不会被淘汰。
+    未启用多租户模式（app.state.tenants为None）时忽略请求头。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        registry = getattr(getattr(scope.get('app'), 'state', None), 'tenants', None)
+        tenant = tenant_id(scope) if scope['type'] == 'http' else None
+        if registry is None or tenant is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            lease = registry.checkout(tenant)
+        except ValueError as e:
+            await self._reject(send, 400, str(e))
+            return
+        try:
+            try:
+                # 已打开的租户不经过线程池
+                container = lease.container if lease.ready else await run_in_threadpool(registry.open, lease)
+            except Exception as e:
+                print(f"打开租户数据库失败 {tenant}: {e}")
+                await self._reject(send, 503, "租户数据库暂不可用", {'tenant': tenant})
+                return
+            # Starlette的request.state读取scope['state']
+            scope['state'] = {**scope.get('state', {}), 'container': container}
+            await self.app(scope, receive, send)
+        finally:
+            evicted = registry.release(lease)
+            if evicted:
+                await run_in_threadpool(registry.close_evicted, evicted)
+
+    @staticmethod
+    async def _reject(send: Send, status: int, message: str, data: Optional[Dict[str, Any]] = None) -> None:
+        """返回错误响应"""
+        body = serialize_envelope({'status': status, 'message': message, 'success': False, 'data': data})
+        headers: List[Tuple[bytes, bytes]] = [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ]
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
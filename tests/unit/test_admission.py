@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import unittest
+
+import httpx
+from fastapi import FastAPI
+
+from src.llm_roles.utils.metrics import REGISTRY
+from src.llm_roles.web.admission import AdmissionMiddleware, AdmissionPolicy
+
+
+def _build_app(policies, **options):
+    """构建带准入控制的测试应用，/slow 处理0.2秒"""
+    app = FastAPI()
+
+    @app.get("/slow/{item_id}")
+    async def slow(item_id: str):
+        await asyncio.sleep(0.2)
+        return {"id": item_id}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    app.add_middleware(AdmissionMiddleware, policies=policies, **options)
+    return app
+
+
+async def _gather(app, paths, headers=None):
+    """并发发送请求"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await asyncio.gather(*(client.get(path, headers=headers) for path in paths))
+
+
+class TestAdmission(unittest.TestCase):
+    """准入控制单元测试"""
+
+    def test_queue_full_sheds_with_retry_after(self):
+        """测试超出并发上限和队列长度的请求立即返回503"""
+        app = _build_app([AdmissionPolicy("t-full", limit=1, max_queue=1, latency_target=5.0,
+                                          routes=("/slow/{item_id}",))])
+        responses = asyncio.run(_gather(app, [f"/slow/{i}" for i in range(4)]))
+
+        codes = sorted(r.status_code for r in responses)
+        self.assertEqual(codes, [200, 200, 503, 503])
+        rejected = [r for r in responses if r.status_code == 503][0]
+        self.assertGreaterEqual(int(rejected.headers["retry-after"]), 1)
+        self.assertEqual(rejected.json()["data"]["reason"], "queue_full")
+        self.assertIn('llm_roles_admission_rejected_total{policy="t-full",reason="queue_full"} 2',
+                      REGISTRY.render())
+
+    def test_wait_over_target_is_shed(self):
+        """测试排队超过目标延迟的请求被拒绝，预计超时的请求不再排队"""
+        app = _build_app([AdmissionPolicy("t-target", limit=1, max_queue=10, latency_target=0.05)])
+        first = asyncio.run(_gather(app, ["/slow/a", "/slow/b"]))
+        reasons = [r.json()["data"]["reason"] for r in first if r.status_code == 503]
+        self.assertEqual(reasons, ["wait_timeout"])
+
+        # 已知处理耗时约0.2秒，超过0.05秒的目标，第二个请求不再排队
+        second = asyncio.run(_gather(app, ["/slow/c", "/slow/d"]))
+        reasons = [r.json()["data"]["reason"] for r in second if r.status_code == 503]
+        self.assertEqual(reasons, ["predicted_wait"])
+
+    def test_health_and_conditional_reads_bypass(self):
+        """测试健康检查和支持304的路由上的条件GET不排队"""
+        app = _build_app([AdmissionPolicy("t-bypass", limit=1, max_queue=0, latency_target=5.0)],
+                         conditional_routes=("/slow/{item_id}",))
+        health = asyncio.run(_gather(app, ["/slow/x"] + ["/health"] * 3))
+        self.assertTrue(all(r.status_code == 200 for r in health))
+
+        conditional = asyncio.run(_gather(app, [f"/slow/{i}" for i in range(3)],
+                                          headers={"If-None-Match": '"abc"'}))
+        self.assertTrue(all(r.status_code == 200 for r in conditional))
+
+    def test_conditional_header_does_not_bypass_other_routes(self):
+        """测试批量路由带条件头的GET仍受并发限制，包括与详情路由模板重叠的固定路径"""
+        app = _build_app([AdmissionPolicy("t-cond-bulk", limit=1, max_queue=0, latency_target=5.0,
+                                          routes=("/slow/stream",))],
+                         conditional_routes=("/slow/{item_id}",))
+        responses = asyncio.run(_gather(app, ["/slow/stream"] * 3, headers={"If-None-Match": '"x"'}))
+        self.assertEqual(sorted(r.status_code for r in responses), [200, 503, 503])
+
+        app = _build_app([AdmissionPolicy("t-cond-other", limit=1, max_queue=0, latency_target=5.0)],
+                         conditional_routes=("/health/{item_id}",))
+        responses = asyncio.run(_gather(app, [f"/slow/{i}" for i in range(3)],
+                                        headers={"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"}))
+        self.assertEqual(sorted(r.status_code for r in responses), [200, 503, 503])
+
+
+if __name__ == "__main__":
+    unittest.main()
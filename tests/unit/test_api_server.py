@@ -0,0 +1,595 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from fastapi.testclient import TestClient
+
+from src.llm_roles.web import profiling, responses
+from src.llm_roles.web.admission import _PolicyState
+from src.llm_roles.web.api_server import app
+from src.llm_roles.database.memory import MemoryDatabase
+from src.llm_roles.database.replica import ReplicatedDatabase
+from src.llm_roles.database.sharding import ShardedDatabase
+from src.llm_roles.database.sqlalchemy_core import SQLAlchemyDatabase
+from src.llm_roles.web.container import (BACKEND_ENV, DB_PATH_ENV, REPLICA_STALENESS_ENV, SESSION_SHARDS_ENV,
+                                         TENANT_DIR_ENV, ServiceContainer)
+from src.llm_roles.web.profiling import PROFILE_DIR_ENV, PROFILE_TOKEN_ENV
+
+
+def _without_timestamps(value):
+    """去掉响应中的created_at/updated_at（角色读取时会重新生成这两个字段）"""
+    if isinstance(value, dict):
+        return {k: _without_timestamps(v) for k, v in value.items() if k not in ("created_at", "updated_at")}
+    if isinstance(value, list):
+        return [_without_timestamps(v) for v in value]
+    return value
+
+
+class TestApiServerLifespan(unittest.TestCase):
+    """API服务生命周期与服务容器单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.tmp_dir.name, "api.db")
+        self.env = patch.dict(os.environ, {DB_PATH_ENV: db_path})
+        self.env.start()
+        self.output = io.StringIO()
+
+    def tearDown(self):
+        """测试后的清理"""
+        self.env.stop()
+        self.tmp_dir.cleanup()
+
+    def test_services_are_shared_across_requests(self):
+        """测试服务在启动时创建一次，请求之间共享"""
+        with contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            container = app.state.container
+            role_api = container.role_api
+            role_id = client.post("/roles", json={"name": "测试角色"}).json()["data"]["id"]
+            first = client.get("/prompt-templates").json()["data"]["templates"]
+            second = client.get("/prompt-templates").json()["data"]["templates"]
+
+            self.assertIs(app.state.container, container)
+            self.assertIs(container.role_api, role_api)
+            self.assertEqual(client.get(f"/roles/{role_id}").json()["status"], 200)
+            # 默认模板只加载一次，ID在请求之间保持稳定
+            self.assertEqual([t["id"] for t in first], [t["id"] for t in second])
+            self.assertGreaterEqual(container.db.connection_count, 1)
+
+        self.assertEqual(container.db.connection_count, 0)
+        self.assertEqual(self.output.getvalue().count("Connected to database"), 1)
+
+    def test_shed_response_carries_cors_headers(self):
+        """测试准入控制直接返回的503也带CORS响应头，浏览器能读到Retry-After"""
+        with contextlib.redirect_stdout(self.output), TestClient(app) as client, \
+                patch.object(_PolicyState, "acquire", AsyncMock(return_value="queue_full")):
+            shed = client.get("/roles", headers={"Origin": "http://localhost:3000"})
+
+        self.assertEqual(shed.status_code, 503)
+        self.assertEqual(shed.headers.get("access-control-allow-origin"), "http://localhost:3000")
+
+    def test_memory_backend_is_seeded_from_database(self):
+        """测试内存后端启动时从数据库文件复制目录数据，写入不回写文件"""
+        with contextlib.redirect_stdout(self.output):
+            source = ServiceContainer()
+            source.start()
+            role_id = source.role_api.create_role({"name": "常驻角色"})["data"]["id"]
+            source.close()
+
+            container = ServiceContainer(backend="memory")
+            container.start()
+            try:
+                self.assertIsInstance(container.db, MemoryDatabase)
+                self.assertEqual(container.role_api.get_role(role_id)["data"]["name"], "常驻角色")
+                container.role_api.create_role({"name": "临时角色"})
+                self.assertTrue(container.readiness.check()["ready"])
+            finally:
+                container.close()
+
+            source.start()
+            self.assertEqual([r["name"] for r in source.db.list_roles()], ["常驻角色"])
+            source.close()
+
+        with self.assertRaises(ValueError):
+            ServiceContainer(backend="unknown")
+
+    def test_memory_backend_rejects_writes(self):
+        """测试内存后端拒绝写请求，不返回成功后在重启时丢失写入"""
+        with contextlib.redirect_stdout(self.output):
+            source = ServiceContainer()
+            source.start()
+            role_id = source.role_api.create_role({"name": "常驻角色"})["data"]["id"]
+            source.close()
+
+        with patch.dict(os.environ, {BACKEND_ENV: "memory"}), \
+                contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            created = client.post("/roles", json={"name": "临时角色"})
+            updated = client.put(f"/roles/{role_id}", json={"name": "新名称"})
+            session = client.post("/sessions", json={"role_id": role_id})
+            write_batch = client.post("/batch", json={"operations": [
+                {"op": "get_role", "args": {"role_id": role_id}},
+                {"op": "create_role", "args": {"role_data": {"name": "批量角色"}}},
+            ]}).json()
+            read_batch = client.post("/batch", json={"operations": [
+                {"op": "get_role", "args": {"role_id": role_id}},
+            ]}).json()
+            prompt = client.post(f"/roles/{role_id}/prompt", json={}).json()
+            roles = client.get("/roles").json()["data"]["roles"]
+
+        for response in (created, updated, session):
+            self.assertEqual(response.status_code, 405)
+            self.assertEqual(response.json()["status"], 405)
+            self.assertFalse(response.json()["success"])
+        self.assertEqual(write_batch["status"], 405)
+        self.assertTrue(read_batch["success"])
+        self.assertTrue(prompt["success"])
+        self.assertEqual([r["name"] for r in roles], ["常驻角色"])
+
+    def test_replica_reads_your_own_writes(self):
+        """测试启用只读快照副本后，客户端立即读到自己的写入，其他客户端读取快照"""
+        with patch.dict(os.environ, {REPLICA_STALENESS_ENV: "60"}), \
+                contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            self.assertIsInstance(app.state.container.db, ReplicatedDatabase)
+            role_id = client.post("/roles", json={"name": "原名"}, headers={"X-Client-Id": "a"}).json()["data"]["id"]
+            app.state.container.db.refresh()
+
+            client.put(f"/roles/{role_id}", json={"name": "新名"}, headers={"X-Client-Id": "a"})
+            own = client.get(f"/roles/{role_id}", headers={"X-Client-Id": "a"}).json()["data"]
+            other = client.get(f"/roles/{role_id}", headers={"X-Client-Id": "b"}).json()["data"]
+
+            self.assertEqual((own["name"], other["name"]), ("新名", "原名"))
+            app.state.container.db.refresh()
+            other = client.get(f"/roles/{role_id}", headers={"X-Client-Id": "b"}).json()["data"]
+            self.assertEqual(other["name"], "新名")
+
+    def test_sharded_sessions(self):
+        """测试启用会话分片后会话和消息写入分片文件，接口行为不变"""
+        with patch.dict(os.environ, {SESSION_SHARDS_ENV: "4"}), \
+                contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            db = app.state.container.db
+            self.assertIsInstance(db, ShardedDatabase)
+            self.assertEqual(os.path.dirname(db.shards[0].db_path),
+                             os.path.join(self.tmp_dir.name, "session_shards"))
+            role_id = client.post("/roles", json={"name": "分片角色"}).json()["data"]["id"]
+            session_id = client.post("/sessions", json={"role_id": role_id}).json()["data"]["id"]
+            client.post(f"/sessions/{session_id}/messages", json={"sender": "user", "content": "你好"})
+            messages = client.get(f"/sessions/{session_id}/messages").json()["data"]
+
+            self.assertEqual([m["content"] for m in messages["messages"]], ["你好"])
+            self.assertIsNotNone(db.shard_for(session_id).get_session(session_id))
+            self.assertIsNone(db.catalog.get_session(session_id))
+
+    def test_sqlalchemy_backend_uses_database_file(self):
+        """测试sqlalchemy后端未指定URL时读写LLM_ROLES_DB_PATH指定的文件"""
+        with contextlib.redirect_stdout(self.output):
+            container = ServiceContainer(backend="sqlalchemy")
+            container.start()
+            try:
+                self.assertIsInstance(container.db, SQLAlchemyDatabase)
+                role_id = container.role_api.create_role({"name": "共享角色"})["data"]["id"]
+                self.assertTrue(container.readiness.check()["ready"])
+            finally:
+                container.close()
+
+            source = ServiceContainer()
+            source.start()
+            self.assertEqual(source.role_api.get_role(role_id)["data"]["name"], "共享角色")
+            source.close()
+
+    def test_default_backend_does_not_import_sqlalchemy(self):
+        """测试默认的sqlite后端启动时不导入SQLAlchemy（冷启动耗时）"""
+        code = ("import sys; from src.llm_roles.web.container import ServiceContainer; ServiceContainer(); "
+                "print(any(name.split('.')[0] == 'sqlalchemy' for name in sys.modules))")
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        self.assertEqual(result.stdout.strip().splitlines()[-1], "False", result.stderr)
+
+    def test_optional_subsystems_are_not_imported(self):
+        """测试导入api_server时不导入未启用的子系统和可选编码库（冷启动耗时）"""
+        deferred = ["src.llm_roles.web.tenancy", "src.llm_roles.database.replica", "src.llm_roles.web.server",
+                    "msgpack", "brotli", "cProfile"]
+        code = ("import sys; import src.llm_roles.web.api_server; "
+                f"print(sorted(name for name in {deferred!r} if name in sys.modules))")
+        env = {k: v for k, v in os.environ.items() if k != TENANT_DIR_ENV}
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env,
+                                cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        self.assertEqual(result.stdout.strip().splitlines()[-1], "[]", result.stderr)
+
+    def test_batch_endpoint(self):
+        """测试批量操作接口"""
+        with contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            response = client.post("/batch", json={"operations": [
+                {"op": "create_role", "args": {"role_data": {"name": "批量角色"}}},
+                {"op": "get_role", "args": {"role_id": {"$ref": "0.data.id"}}},
+            ]}).json()
+
+        self.assertTrue(response["success"])
+        self.assertEqual(response["data"]["results"][1]["data"]["name"], "批量角色")
+
+    def test_ndjson_streams(self):
+        """测试NDJSON流式列表跨多个批次返回全部记录"""
+        with contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            role_ids = [client.post("/roles", json={"name": f"角色{i}"}).json()["data"]["id"]
+                        for i in range(7)]
+            session_id = client.post("/sessions", json={"role_id": role_ids[0]}).json()["data"]["id"]
+            client.post(f"/sessions/{session_id}/messages/batch", json={"messages": [
+                {"sender": "user", "content": f"消息{i}"} for i in range(5)
+            ]})
+
+            roles = client.get("/roles/stream", params={"batch_size": 3})
+            templates = client.get("/prompt-templates/stream", params={"include_defaults": False})
+            messages = client.get(f"/sessions/{session_id}/messages/stream",
+                                  params={"batch_size": 2, "after": 1})
+            missing = client.get("/sessions/missing/messages/stream")
+
+        self.assertEqual(roles.headers["content-type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in roles.text.splitlines()]
+        self.assertEqual([r["id"] for r in rows], sorted(role_ids))
+        self.assertEqual(templates.text, "")
+        self.assertEqual([json.loads(line)["sequence"] for line in messages.text.splitlines()],
+                         [2, 3, 4, 5])
+        self.assertEqual(missing.json()["status"], 404)
+
+    def test_role_update_invalidates_system_prompt(self):
+        """测试更新角色后会话上下文使用新的系统提示词"""
+        with contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            role_id = client.post("/roles", json={"name": "旧名字"}).json()["data"]["id"]
+            session_id = client.post("/sessions", json={"role_id": role_id}).json()["data"]["id"]
+            before = client.get(f"/sessions/{session_id}/context").json()["data"]
+
+            client.put(f"/roles/{role_id}", json={"name": "新名字"})
+            after = client.get(f"/sessions/{session_id}/context").json()["data"]
+
+        self.assertIn("旧名字", before["messages"][0]["content"])
+        self.assertIn("新名字", after["messages"][0]["content"])
+
+    def test_metrics_endpoint(self):
+        """测试指标接口按路由模板、数据库操作和缓存输出指标"""
+        with contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            role_id = client.post("/roles", json={"name": "指标角色"}).json()["data"]["id"]
+            client.get(f"/roles/{role_id}")
+            client.get(f"/roles/{role_id}/prompt")
+            response = client.get("/metrics")
+
+        text = response.text
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        self.assertIn('llm_roles_http_requests_total{method="GET",route="/roles/{role_id}",status="200"}', text)
+        self.assertNotIn(f'route="/roles/{role_id}"', text)
+        self.assertIn('llm_roles_db_query_duration_seconds_count{operation="get_role"}', text)
+        self.assertIn('llm_roles_prompt_render_duration_seconds_count{format="openai"}', text)
+        self.assertIn('llm_roles_cache_hit_ratio{cache="system_prompts"}', text)
+        self.assertIn("llm_roles_db_connections_open", text)
+        self.assertIn("llm_roles_threadpool_size", text)
+        self.assertIn("llm_roles_http_requests_in_flight 1", text)
+
+
+class TestReadiness(unittest.TestCase):
+    """就绪与深度健康检查单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "ready.db")
+        self.env = patch.dict(os.environ, {DB_PATH_ENV: self.db_path})
+        self.env.start()
+        self.output = io.StringIO()
+
+    def tearDown(self):
+        """测试后的清理"""
+        self.env.stop()
+        self.tmp_dir.cleanup()
+
+    def test_ready_and_deep_health(self):
+        """测试数据库可用时就绪，深度检查返回各项详情"""
+        with contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            ready = client.get("/ready")
+            self.assertEqual(ready.status_code, 200)
+            self.assertTrue(ready.json()["data"]["ready"])
+
+            deep = client.get("/health/deep")
+            self.assertEqual(deep.status_code, 200)
+            data = deep.json()["data"]
+            self.assertEqual(set(data["checks"]), {"database", "pool", "wal", "caches"})
+            self.assertTrue(data["checks"]["database"]["ok"])
+            self.assertIn("latency_ms", data["checks"]["database"])
+            self.assertGreater(data["checks"]["caches"]["default_templates"], 0)
+            self.assertGreater(data["checks"]["pool"]["threadpool_total"], 0)
+
+    def test_missing_database_is_not_ready(self):
+        """测试数据库文件丢失时返回503"""
+        with contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            probe = app.state.container.readiness
+            probe.ttl = 0
+            os.replace(self.db_path, self.db_path + ".moved")
+            try:
+                response = client.get("/ready")
+                deep = client.get("/health/deep").json()
+            finally:
+                os.replace(self.db_path + ".moved", self.db_path)
+
+            self.assertEqual(response.status_code, 503)
+            self.assertFalse(response.json()["success"])
+            self.assertEqual(deep["data"]["status"], "unavailable")
+            self.assertIn("database", deep["data"]["failed"])
+
+    def test_result_is_cached(self):
+        """测试缓存有效期内重复探测不会再次查询数据库"""
+        with contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            probe = app.state.container.readiness
+            probe.ttl = 60
+            client.get("/ready")
+            with patch.object(probe, "_check_database") as check_database:
+                for _ in range(5):
+                    self.assertEqual(client.get("/ready").status_code, 200)
+                check_database.assert_not_called()
+
+
+class TestConditionalGet(unittest.TestCase):
+    """条件GET单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.tmp_dir.name, "api.db")
+        self.env = patch.dict(os.environ, {DB_PATH_ENV: db_path})
+        self.env.start()
+        self.output = io.StringIO()
+        self.stdout = contextlib.redirect_stdout(self.output)
+        self.stdout.__enter__()
+        self.client = TestClient(app)
+        self.client.__enter__()
+        self.role_id = self.client.post("/roles", json={"name": "测试角色"}).json()["data"]["id"]
+
+    def tearDown(self):
+        """测试后的清理"""
+        self.client.__exit__(None, None, None)
+        self.stdout.__exit__(None, None, None)
+        self.env.stop()
+        self.tmp_dir.cleanup()
+
+    def test_role_etag_and_304(self):
+        """测试角色未变化时返回304且不读取角色属性"""
+        first = self.client.get(f"/roles/{self.role_id}")
+        etag = first.headers["etag"]
+
+        with patch.object(app.state.container.db, "get_role") as read_role:
+            cached = self.client.get(f"/roles/{self.role_id}", headers={"If-None-Match": etag})
+        read_role.assert_not_called()
+
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b"")
+        self.assertEqual(cached.headers["etag"], etag)
+
+        self.client.put(f"/roles/{self.role_id}", json={"description": "新描述"})
+        changed = self.client.get(f"/roles/{self.role_id}", headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["etag"], etag)
+
+    def test_if_modified_since(self):
+        """测试If-Modified-Since"""
+        first = self.client.get(f"/roles/{self.role_id}")
+        last_modified = first.headers["last-modified"]
+
+        cached = self.client.get(f"/roles/{self.role_id}", headers={"If-Modified-Since": last_modified})
+        stale = self.client.get(f"/roles/{self.role_id}",
+                                headers={"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"})
+
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(stale.status_code, 200)
+
+    def test_template_etag_changes_on_update(self):
+        """测试模板更新后ETag变化"""
+        template_id = self.client.post("/prompt-templates", json={
+            "name": "模板", "template_content": "你是{role.name}"
+        }).json()["data"]["id"]
+        etag = self.client.get(f"/prompt-templates/{template_id}").headers["etag"]
+
+        self.client.put(f"/prompt-templates/{template_id}", json={"template_content": "你好{role.name}"})
+        response = self.client.get(f"/prompt-templates/{template_id}", headers={"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("你好", response.json()["data"]["template_content"])
+
+    def test_template_etag_changes_within_same_timestamp(self):
+        """测试同一时间戳内的两次模板修改得到不同的ETag"""
+        template_id = self.client.post("/prompt-templates", json={
+            "name": "模板", "template_content": "你是{role.name}"
+        }).json()["data"]["id"]
+        db = app.state.container.db
+
+        def update(content):
+            self.client.put(f"/prompt-templates/{template_id}", json={"template_content": content})
+            # 模拟两次修改落在同一时间戳内
+            with db.transaction():
+                db.conn.execute("UPDATE prompt_templates SET updated_at = '2024-01-01 00:00:00' WHERE id = ?",
+                                (template_id,))
+            return self.client.get(f"/prompt-templates/{template_id}").headers["etag"]
+
+        first = update("第一版{role.name}")
+        second = update("第二版{role.name}")
+        response = self.client.get(f"/prompt-templates/{template_id}", headers={"If-None-Match": first})
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("第二版", response.json()["data"]["template_content"])
+
+    def test_prompt_etag(self):
+        """测试提示词ETag随格式、类型和默认模板变化"""
+        url = f"/roles/{self.role_id}/prompt"
+        etag = self.client.get(url).headers["etag"]
+
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 304)
+        self.assertNotEqual(self.client.get(url, params={"type": "system"}).headers["etag"], etag)
+
+        template_id = self.client.post("/prompt-templates", json={
+            "name": "模板", "template_content": "你是{role.name}"
+        }).json()["data"]["id"]
+        self.client.post(f"/roles/{self.role_id}/default-templates/{template_id}")
+        response = self.client.get(url, headers={"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"]["template_id"], template_id)
+
+    def test_prompt_fast_path_keeps_validators_and_compresses(self):
+        """测试提示词走快速响应路径时保留ETag并按Accept-Encoding压缩"""
+        self.client.put(f"/roles/{self.role_id}", json={"description": "很长的描述" * 400})
+
+        response = self.client.get(f"/roles/{self.role_id}/prompt", headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertIn("etag", response.headers)
+        self.assertIn("很长的描述", response.json()["data"]["prompt"]["content"])
+
+    def test_compressed_response_has_distinct_etag(self):
+        """测试压缩和未压缩的响应使用不同的强ETag，两者都能通过If-None-Match得到304"""
+        self.client.put(f"/roles/{self.role_id}", json={"description": "很长的描述" * 400})
+        url = f"/roles/{self.role_id}"
+
+        identity = self.client.get(url, headers={"Accept-Encoding": "identity"})
+        compressed = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+
+        self.assertNotIn("content-encoding", identity.headers)
+        self.assertEqual(compressed.headers["content-encoding"], "gzip")
+        self.assertEqual(compressed.headers["etag"], identity.headers["etag"][:-1] + '-gzip"')
+        self.assertFalse(compressed.headers["etag"].startswith("W/"))
+
+        cached = self.client.get(url, headers={"Accept-Encoding": "gzip",
+                                               "If-None-Match": compressed.headers["etag"]})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.headers["etag"], compressed.headers["etag"])
+        cached = self.client.get(url, headers={"Accept-Encoding": "identity",
+                                               "If-None-Match": identity.headers["etag"]})
+        self.assertEqual(cached.status_code, 304)
+
+    @unittest.skipIf(responses.msgpack is None, "未安装msgpack")
+    def test_msgpack_negotiation(self):
+        """测试按Accept返回MessagePack，且与JSON表示使用不同的ETag"""
+        msgpack_headers = {"Accept": responses.MSGPACK_MEDIA_TYPE}
+        url = f"/roles/{self.role_id}"
+        plain = self.client.get(url)
+        packed = self.client.get(url, headers=msgpack_headers)
+
+        self.assertEqual(packed.headers["content-type"], responses.MSGPACK_MEDIA_TYPE)
+        self.assertEqual(
+            _without_timestamps(responses.deserialize_envelope(packed.content, packed.headers["content-type"])),
+            _without_timestamps(plain.json())
+        )
+        self.assertNotEqual(packed.headers["etag"], plain.headers["etag"])
+        # JSON的ETag不能让MessagePack请求得到304
+        cross = self.client.get(url, headers={**msgpack_headers, "If-None-Match": plain.headers["etag"]})
+        self.assertEqual(cross.status_code, 200)
+        cached = self.client.get(url, headers={**msgpack_headers, "If-None-Match": packed.headers["etag"]})
+        self.assertEqual(cached.status_code, 304)
+        self.assertIn("Accept,", cached.headers["vary"])
+
+        for path in ("/roles", "/prompt-templates", f"/roles/{self.role_id}/prompt"):
+            response = self.client.get(path, headers=msgpack_headers)
+            decoded = responses.deserialize_envelope(response.content, response.headers["content-type"])
+            self.assertEqual(_without_timestamps(decoded), _without_timestamps(self.client.get(path).json()))
+
+    def test_missing_resource_has_no_etag(self):
+        """测试资源不存在时不返回ETag"""
+        response = self.client.get("/roles/missing", headers={"If-None-Match": "*"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], 404)
+        self.assertNotIn("etag", response.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class TestProfiling(unittest.TestCase):
+    """按需剖析单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.profile_dir = os.path.join(self.tmp_dir.name, "profiles")
+        self.env = patch.dict(os.environ, {
+            DB_PATH_ENV: os.path.join(self.tmp_dir.name, "api.db"),
+            PROFILE_TOKEN_ENV: "secret",
+            PROFILE_DIR_ENV: self.profile_dir,
+        })
+        self.env.start()
+        self.output = io.StringIO()
+
+    def tearDown(self):
+        """测试后的清理"""
+        self.env.stop()
+        self.tmp_dir.cleanup()
+
+    def test_profiled_request_returns_breakdown(self):
+        """测试携带令牌的请求返回耗时分解并写入剖析文件"""
+        with contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            role_id = client.post("/roles", json={"name": "剖析角色"}).json()["data"]["id"]
+            plain = client.get(f"/roles/{role_id}/prompt")
+            wrong = client.get(f"/roles/{role_id}/prompt", headers={"X-Profile": "wrong"})
+            query = client.get(f"/roles/{role_id}/prompt?profile=secret")
+            profiled = client.get(f"/roles/{role_id}/prompt", headers={"X-Profile": "secret"})
+
+        self.assertNotIn("server-timing", plain.headers)
+        self.assertNotIn("server-timing", wrong.headers)
+        # 查询参数中的令牌会写入访问日志，不被接受
+        self.assertNotIn("server-timing", query.headers)
+        timing = profiled.headers["server-timing"]
+        for name in ("routing", "db", "render", "serialize", "app", "total"):
+            self.assertIn(f"{name};dur=", timing)
+
+        prof_file = profiled.headers["x-profile-file"]
+        self.assertTrue(os.path.exists(prof_file))
+        with open(prof_file.replace(".prof", ".json"), encoding="utf-8") as f:
+            summary = json.load(f)
+        self.assertEqual(summary["route"], "/roles/{role_id}/prompt")
+        self.assertGreaterEqual(summary["counts"]["db"], 1)
+
+    def test_async_endpoint_has_no_profile_file(self):
+        """测试异步处理函数没有cProfile结果时不返回X-Profile-File"""
+        with contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            profiled = client.get("/ready", headers={"X-Profile": "secret"})
+
+        self.assertIn("total;dur=", profiled.headers["server-timing"])
+        self.assertNotIn("x-profile-file", profiled.headers)
+        self.assertFalse(any(name.endswith(".prof") for name in os.listdir(self.profile_dir)))
+
+    def test_profile_files_are_written_off_the_event_loop(self):
+        """测试剖析结果在线程池中写入，不阻塞事件循环"""
+        store = profiling._store
+        loops = []
+
+        def recording_store(*args):
+            try:
+                loops.append(asyncio.get_running_loop())
+            except RuntimeError:
+                loops.append(None)
+            store(*args)
+
+        with patch.object(profiling, "_store", recording_store), \
+                contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            client.get("/health", headers={"X-Profile": "secret"})
+
+        self.assertEqual(loops, [None])
+
+    def test_process_profile(self):
+        """测试进程级采样需要令牌并写入折叠栈文件"""
+        with contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            denied = client.get("/debug/profile?seconds=0.05").json()
+            result = client.get("/debug/profile?seconds=0.05",
+                                headers={"X-Profile": "secret"}).json()
+
+        self.assertEqual(denied["status"], 403)
+        self.assertTrue(result["success"])
+        self.assertGreater(result["data"]["samples"], 0)
+        self.assertTrue(os.path.exists(result["data"]["file"]))
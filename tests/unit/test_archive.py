@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from src.llm_roles.database.archive import ArchivedDatabase
+from src.llm_roles.database.sharding import ShardedDatabase
+from src.llm_roles.database.sqlite import SQLiteDatabase
+
+
+class TestArchivedDatabase(unittest.TestCase):
+    """不活跃会话归档单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "hot.db")
+        self.archive_path = os.path.join(self.tmp_dir.name, "archive.db")
+        self.output = io.StringIO()
+        self.db = ArchivedDatabase(SQLiteDatabase(self.db_path), self.archive_path)
+        with contextlib.redirect_stdout(self.output):
+            self.db.connect()
+            self.role_id = self.db.create_role({"name": "客服"})
+            self.old = self.db.create_session(self.role_id, "u1", {"channel": "web"})
+            self.db.add_messages(self.old, [
+                {"sender": "user" if i % 2 else "assistant", "content": f"旧消息{i}" * 50} for i in range(1, 11)
+            ])
+            self.recent = self.db.create_session(self.role_id)
+            self.db.add_message(self.recent, "user", "新消息")
+        self._age(self.old, "2000-01-01 00:00:00")
+
+    def tearDown(self):
+        """测试后的清理"""
+        with contextlib.redirect_stdout(self.output):
+            self.db.disconnect()
+        self.tmp_dir.cleanup()
+
+    def _age(self, session_id, last_activity):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("UPDATE sessions SET last_activity = ? WHERE id = ?", (last_activity, session_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _hot_count(self, table):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_inactive_sessions_move_to_archive(self):
+        """测试只归档不活跃的会话，读取透明回退到归档库"""
+        before = self.db.get_session_messages(self.old)
+
+        result = self.db.archive_inactive(86400, batch_size=1)
+
+        self.assertEqual((result["sessions"], result["messages"], result["skipped"]), (1, 10, 0))
+        self.assertEqual((self._hot_count("sessions"), self._hot_count("messages")), (1, 1))
+        self.assertEqual(self.db.get_session_messages(self.old), before)
+        self.assertEqual(self.db.get_session(self.old)["metadata"], {"channel": "web"})
+        self.assertEqual([m["sequence"] for m in self.db.get_session_messages(self.old, after=2, before=6)],
+                         [3, 4, 5])
+        self.assertEqual([m["sequence"] for m in self.db.get_session_messages(self.old, limit=2, order="desc")],
+                         [10, 9])
+        self.assertEqual([m["sequence"] for m in self.db.tail_session_messages(self.old, 3)], [8, 9, 10])
+        self.assertEqual(self.db.get_session_messages(self.recent)[0]["content"], "新消息")
+        self.assertEqual(self.db.get_session_messages("missing"), [])
+
+    def test_append_restores_archived_session(self):
+        """测试向已归档的会话追加消息时先恢复到热库"""
+        self.db.archive_inactive(86400)
+
+        with contextlib.redirect_stdout(self.output):
+            added = self.db.add_message(self.old, "user", "回来了")
+
+        self.assertEqual(self.db.tail_session_messages(self.old, 1)[0]["id"], added)
+        self.assertEqual(len(self.db.get_session_messages(self.old)), 11)
+        self.assertIsNone(self.db.archive.load(self.old))
+        with self.assertRaises(ValueError):
+            self.db.add_message("missing", "user", "x")
+
+    def test_role_referenced_by_archived_session_cannot_be_deleted(self):
+        """测试已归档会话引用的角色不能删除"""
+        with contextlib.redirect_stdout(self.output):
+            self.db.archive_inactive(86400)
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (self.recent,))
+            conn.execute("DELETE FROM sessions WHERE id = ?", (self.recent,))
+            conn.commit()
+            conn.close()
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.db.delete_role(self.role_id)
+
+    def test_incremental_vacuum_returns_pages(self):
+        """测试热库启用增量清理后归档会归还空闲页"""
+        store = self.db.stores[0]
+        store.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        store.conn.execute("VACUUM")
+        size = os.path.getsize(self.db_path)
+
+        result = self.db.archive_inactive(86400)
+
+        self.assertEqual(result["free_pages"], 0)
+        self.assertLess(os.path.getsize(self.db_path), size)
+
+    def test_sharded_sessions_are_archived(self):
+        """测试会话分片时归档每个分片并恢复到原分片"""
+        with contextlib.redirect_stdout(self.output):
+            self.db.disconnect()
+            catalog = SQLiteDatabase(os.path.join(self.tmp_dir.name, "catalog.db"))
+            sharded = ShardedDatabase(catalog, os.path.join(self.tmp_dir.name, "shards"), 3)
+            self.db = ArchivedDatabase(sharded, self.archive_path)
+            self.db.connect()
+            role_id = self.db.create_role({"name": "分片"})
+            session_ids = [self.db.create_session(role_id) for _ in range(6)]
+            for session_id in session_ids:
+                self.db.add_message(session_id, "user", session_id)
+
+        result = self.db.archive_inactive(-60)
+
+        self.assertEqual(result["sessions"], 6)
+        self.assertTrue(all(s.get_session(i) is None for s in sharded.shards for i in session_ids))
+        with contextlib.redirect_stdout(self.output):
+            self.db.add_message(session_ids[0], "user", "追加")
+        self.assertEqual(len(sharded.shard_for(session_ids[0]).get_session_messages(session_ids[0])), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from src.llm_roles.core.versioning import SNAPSHOT_INTERVAL
+from src.llm_roles.database.archive import ArchivedDatabase
+from src.llm_roles.database.base import DatabaseBackend
+from src.llm_roles.database.memory import MemoryDatabase
+from src.llm_roles.database.sharding import ShardedDatabase
+from src.llm_roles.database.sqlite import SQLiteDatabase
+
+try:
+    from sqlalchemy.exc import IntegrityError as SQLAlchemyIntegrityError
+    from src.llm_roles.database.sqlalchemy_core import METADATA, SQLAlchemyDatabase
+except ImportError:  # pragma: no cover - sqlalchemy未安装
+    SQLAlchemyDatabase = None
+    SQLAlchemyIntegrityError = None
+
+# PostgreSQL测试库的URL，未设置时跳过PostgreSQL一致性测试
+POSTGRES_URL_ENV = 'LLM_ROLES_TEST_POSTGRES_URL'
+
+
+class BackendConformance:
+    """数据库后端一致性测试，每个后端实现通过子类提供make_backend()"""
+
+    # 违反唯一约束或外键约束时抛出的异常类型
+    integrity_error = sqlite3.IntegrityError
+
+    def make_backend(self) -> DatabaseBackend:
+        raise NotImplementedError
+
+    def setUp(self):
+        """测试前的设置"""
+        self.output = io.StringIO()
+        self.stdout = contextlib.redirect_stdout(self.output)
+        self.stdout.__enter__()
+        self.db = self.make_backend()
+        self.db.connect()
+
+    def tearDown(self):
+        """测试后的清理"""
+        self.db.disconnect()
+        self.stdout.__exit__(None, None, None)
+
+    def _template(self, name, **extra):
+        return self.db.create_template({
+            'name': name, 'template_content': f'{name}: {{{{ name }}}}',
+            'role_types': ['assistant', 'expert'], 'variables': ['name'], **extra
+        })
+
+    def test_is_backend(self):
+        """测试实现了完整的抽象基类"""
+        self.assertIsInstance(self.db, DatabaseBackend)
+
+    def test_role_crud(self):
+        """测试角色的创建、读取、更新和删除"""
+        role_id = self.db.create_role({
+            'name': '写作助手', 'description': '帮助写作', 'role_type': 'assistant',
+            'skills': ['写作'], 'level': 3
+        })
+
+        self.assertEqual(self.db.get_role(role_id), {
+            'id': role_id, 'name': '写作助手', 'description': '帮助写作',
+            'role_type': 'assistant', 'skills': ['写作'], 'level': 3
+        })
+        self.assertFalse(self.db.update_role(role_id, {}))
+        self.assertFalse(self.db.update_role('missing', {'name': 'x'}))
+        self.assertTrue(self.db.update_role(role_id, {'name': '编辑助手', 'tone': '正式'}))
+        # 属性非空时整体替换
+        self.assertEqual(self.db.get_role(role_id), {
+            'id': role_id, 'name': '编辑助手', 'description': '帮助写作',
+            'role_type': 'assistant', 'tone': '正式'
+        })
+        info = self.db.get_role_version_info(role_id)
+        self.assertEqual((info['id'], info['version']), (role_id, 2))
+        self.assertIsNotNone(info['updated_at'])
+
+        self.assertTrue(self.db.delete_role(role_id))
+        self.assertFalse(self.db.delete_role(role_id))
+        self.assertIsNone(self.db.get_role(role_id))
+        self.assertIsNone(self.db.get_role_version_info(role_id))
+        self.assertEqual(self.db.list_role_versions(role_id), [])
+
+    def test_duplicate_role_id(self):
+        """测试重复的角色ID违反唯一约束"""
+        self.db.create_role({'id': 'r1', 'name': 'A'})
+        with self.assertRaises(self.integrity_error):
+            self.db.create_role({'id': 'r1', 'name': 'B'})
+        self.assertEqual(self.db.get_role('r1')['name'], 'A')
+        self.assertEqual(len(self.db.list_role_versions('r1')), 1)
+
+    def test_list_and_search_roles(self):
+        """测试按名称排序分页和搜索"""
+        for name in ('Charlie', 'alpha', 'Bravo', 'Delta'):
+            self.db.create_role({'name': name, 'description': f'{name} role'})
+        self.db.create_role({'name': 'Echo', 'description': 'contains BRAVO'})
+
+        names = [r['name'] for r in self.db.list_roles()]
+        self.assertEqual(names, ['Bravo', 'Charlie', 'Delta', 'Echo', 'alpha'])
+        self.assertEqual([r['name'] for r in self.db.list_roles(limit=2, offset=1)], ['Charlie', 'Delta'])
+        self.assertEqual([r['name'] for r in self.db.search_roles('bravo')], ['Bravo', 'Echo'])
+        self.assertEqual(self.db.search_roles('zulu'), [])
+
+    def test_role_versions(self):
+        """测试版本记录、快照间隔和历史版本重建"""
+        role_id = self.db.create_role({'name': 'v1', 'level': 0})
+        for i in range(1, SNAPSHOT_INTERVAL + 2):
+            self.db.update_role(role_id, {'name': f'v{i + 1}', 'level': i})
+        # 内容没有变化时不产生新版本
+        self.db.update_role(role_id, {'name': f'v{SNAPSHOT_INTERVAL + 2}'})
+
+        versions = self.db.list_role_versions(role_id)
+        self.assertEqual([v['version'] for v in versions], list(range(SNAPSHOT_INTERVAL + 2, 0, -1)))
+        snapshots = [v['version'] for v in versions if v['is_snapshot']]
+        self.assertEqual(snapshots, [SNAPSHOT_INTERVAL + 1, 1])
+        self.assertEqual(versions[0]['changed_fields'], ['level', 'name'])
+        self.assertEqual([v['version'] for v in self.db.list_role_versions(role_id, limit=2, offset=1)],
+                         [SNAPSHOT_INTERVAL + 1, SNAPSHOT_INTERVAL])
+
+        for version in (1, 5, SNAPSHOT_INTERVAL + 1, SNAPSHOT_INTERVAL + 2):
+            record = self.db.get_role_version(role_id, version)
+            self.assertEqual(record['data'], {
+                'id': role_id, 'name': f'v{version}', 'description': '', 'role_type': '',
+                'level': version - 1
+            })
+        self.assertIsNone(self.db.get_role_version(role_id, SNAPSHOT_INTERVAL + 3))
+        self.assertIsNone(self.db.get_role_version('missing', 1))
+
+    def test_sessions_and_messages(self):
+        """测试会话创建和按序号分页读取消息"""
+        role_id = self.db.create_role({'name': '客服'})
+        session_id = self.db.create_session(role_id, 'u1', {'channel': 'web'})
+        session = self.db.get_session(session_id)
+        self.assertEqual((session['role_id'], session['user_id'], session['metadata']),
+                         (role_id, 'u1', {'channel': 'web'}))
+        self.assertIsNone(self.db.get_session('missing'))
+
+        first = self.db.add_message(session_id, 'user', '你好', {'lang': 'zh'})
+        added = self.db.add_messages(session_id, [
+            {'sender': 'assistant' if i % 2 else 'user', 'content': f'm{i}'} for i in range(2, 8)
+        ])
+        self.assertEqual([a['sequence'] for a in added], list(range(2, 8)))
+        self.assertEqual(self.db.add_messages(session_id, []), [])
+
+        messages = self.db.get_session_messages(session_id)
+        self.assertEqual([m['sequence'] for m in messages], list(range(1, 8)))
+        self.assertEqual((messages[0]['id'], messages[0]['metadata']), (first, {'lang': 'zh'}))
+        self.assertNotIn('metadata', messages[1])
+        self.assertEqual(
+            [m['sequence'] for m in self.db.get_session_messages(session_id, after=2, before=6)], [3, 4, 5]
+        )
+        self.assertEqual(
+            [m['sequence'] for m in self.db.get_session_messages(session_id, limit=2, before=6, order='desc')],
+            [5, 4]
+        )
+        self.assertEqual([m['content'] for m in self.db.tail_session_messages(session_id, 2)], ['m6', 'm7'])
+        self.assertEqual(self.db.get_session_messages('missing'), [])
+        with self.assertRaises(ValueError):
+            self.db.get_session_messages(session_id, order='random')
+        with self.assertRaises(ValueError):
+            self.db.add_messages('missing', [{'sender': 'user', 'content': 'x'}])
+
+    def test_foreign_keys(self):
+        """测试会话和默认模板关联引用的外键约束"""
+        with self.assertRaises(self.integrity_error):
+            self.db.create_session('missing')
+
+        role_id = self.db.create_role({'name': '被引用'})
+        self.db.create_session(role_id)
+        with self.assertRaises(self.integrity_error):
+            self.db.delete_role(role_id)
+        self.assertIsNotNone(self.db.get_role(role_id))
+        self.assertEqual(len(self.db.list_role_versions(role_id)), 1)
+
+    def test_template_crud(self):
+        """测试提示词模板的创建、读取、更新和删除"""
+        template_id = self._template('通用')
+        template = self.db.get_template(template_id)
+        self.assertEqual(template['role_types'], ['assistant', 'expert'])
+        self.assertEqual((template['format'], template['variables']), ('openai', ['name']))
+        self.assertNotIn('is_default', template)
+        self.assertEqual(self.db.get_template_version_info(template_id)['updated_at'], template['updated_at'])
+
+        self.assertFalse(self.db.update_template(template_id, {}))
+        self.assertFalse(self.db.update_template('missing', {'name': 'x'}))
+        self.assertEqual(self.db.get_template_version_info(template_id)['version'], 1)
+        self.assertTrue(self.db.update_template(template_id, {'format': 'anthropic', 'variables': []}))
+        self.assertEqual(self.db.get_template_version_info(template_id)['version'], 2)
+        updated = self.db.get_template(template_id)
+        self.assertEqual((updated['format'], updated['variables']), ('anthropic', []))
+        self.assertEqual(updated['template_content'], template['template_content'])
+
+        with self.assertRaises(self.integrity_error):
+            self.db.create_template({'id': template_id, 'name': 'dup', 'template_content': 'x'})
+        self.assertTrue(self.db.delete_template(template_id))
+        self.assertFalse(self.db.delete_template(template_id))
+        self.assertIsNone(self.db.get_template(template_id))
+        self.assertIsNone(self.db.get_template_version_info(template_id))
+
+    def test_list_templates(self):
+        """测试模板按名称排序分页"""
+        for name in ('c', 'a', 'b'):
+            self._template(name)
+        templates = self.db.list_templates()
+        self.assertEqual([t['name'] for t in templates], ['a', 'b', 'c'])
+        self.assertFalse(templates[0]['is_default'])
+        self.assertEqual([t['name'] for t in self.db.list_templates(limit=1, offset=1)], ['b'])
+
+    def test_role_default_templates(self):
+        """测试角色默认模板关联"""
+        role_id = self.db.create_role({'name': '翻译'})
+        second = self._template('second')
+        first = self._template('first')
+
+        self.assertFalse(self.db.set_role_default_template('missing', first))
+        self.assertFalse(self.db.set_role_default_template(role_id, 'missing'))
+        self.assertIsNone(self.db.get_role_default_template_version_info(role_id))
+        self.assertTrue(self.db.set_role_default_template(role_id, second))
+        self.assertTrue(self.db.set_role_default_template(role_id, first))
+        self.assertTrue(self.db.set_role_default_template(role_id, first))
+
+        bound = self.db.get_role_default_templates(role_id)
+        self.assertEqual([t['id'] for t in bound], [first, second])
+        self.assertEqual(bound[0]['role_types'], ['assistant', 'expert'])
+        self.assertEqual(self.db.get_role_default_template_version_info(role_id)['id'], first)
+        with self.assertRaises(self.integrity_error):
+            self.db.delete_role(role_id)
+
+        self.assertTrue(self.db.remove_role_default_template(role_id, first))
+        self.assertFalse(self.db.remove_role_default_template(role_id, first))
+        # 删除模板时一并删除关联
+        self.assertTrue(self.db.delete_template(second))
+        self.assertEqual(self.db.get_role_default_templates(role_id), [])
+        self.assertTrue(self.db.delete_role(role_id))
+
+    def test_transaction_and_savepoint(self):
+        """测试事务整体回滚和保存点局部回滚"""
+        kept = self.db.create_role({'name': 'kept'})
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction():
+                self.db.create_role({'id': 'rolled', 'name': 'rolled'})
+                self.db.update_role(kept, {'name': 'renamed'})
+                session_id = self.db.create_session(kept)
+                self.db.add_message(session_id, 'user', 'x')
+                raise RuntimeError('abort')
+        self.assertIsNone(self.db.get_role('rolled'))
+        self.assertEqual(self.db.get_role(kept)['name'], 'kept')
+        self.assertEqual(self.db.get_role_version_info(kept)['version'], 1)
+        self.assertEqual([r['name'] for r in self.db.list_roles()], ['kept'])
+        # 事务回滚后角色不再被会话引用
+        self.assertTrue(self.db.delete_role(kept))
+
+        with self.db.transaction():
+            self.db.create_role({'id': 'outer', 'name': 'outer'})
+            with self.assertRaises(self.integrity_error):
+                with self.db.savepoint():
+                    self.db.create_role({'id': 'inner', 'name': 'inner'})
+                    self.db.create_role({'id': 'outer', 'name': 'duplicate'})
+            with self.db.transaction():
+                self.db.create_role({'id': 'nested', 'name': 'nested'})
+        self.assertEqual([r['id'] for r in self.db.list_roles()], ['nested', 'outer'])
+
+        with self.assertRaises(RuntimeError):
+            with self.db.savepoint():
+                pass
+
+    def test_export_and_upsert_catalog(self):
+        """测试按主键顺序分批导出，以及批量写入目录记录"""
+        for role_id in ('r3', 'r1', 'r2'):
+            self.db.create_role({'id': role_id, 'name': role_id, 'skills': [role_id]})
+        template_id = self._template('t', id='t1')
+        self.db.set_role_default_template('r1', template_id)
+
+        roles = list(self.db.export_roles(batch_size=2))
+        self.assertEqual([r['id'] for r in roles], ['r1', 'r2', 'r3'])
+        self.assertEqual(roles[0]['attributes'], {'skills': ['r1']})
+        templates = list(self.db.export_templates(batch_size=1))
+        self.assertEqual(templates[0]['role_types'], ['assistant', 'expert'])
+        self.assertEqual(
+            [(b['role_id'], b['template_id']) for b in self.db.export_role_default_templates()],
+            [('r1', 't1')]
+        )
+
+        counts = self.db.upsert_catalog_records([
+            ('role', {'id': 'r1', 'name': 'R1', 'attributes': {'level': 2}, 'created_at': '2000-01-01 00:00:00'}),
+            ('role', {'id': 'r9', 'name': 'r9', 'created_at': '2000-01-01 00:00:00',
+                      'updated_at': '2000-01-02 00:00:00'}),
+            ('template', {'id': 't1', 'name': 't', 'template_content': 'new', 'is_default': True}),
+            ('role_default_template', {'role_id': 'r9', 'template_id': 't1'}),
+            ('role_default_template', {'role_id': 'r1', 'template_id': 't1'}),
+        ])
+        self.assertEqual(counts, {'roles': 2, 'templates': 1, 'role_default_templates': 2})
+        self.assertEqual(self.db.get_role('r1'), {
+            'id': 'r1', 'name': 'R1', 'description': '', 'role_type': '', 'level': 2
+        })
+        # 覆盖已有版本历史的角色时追加快照，新角色没有版本记录
+        self.assertEqual(self.db.get_role_version('r1', 2)['data']['name'], 'R1')
+        self.assertTrue(self.db.get_role_version('r1', 2)['is_snapshot'])
+        self.assertEqual(self.db.list_role_versions('r9'), [])
+        exported = {r['id']: r for r in self.db.export_roles()}
+        self.assertNotEqual(exported['r1']['created_at'], '2000-01-01 00:00:00')
+        self.assertEqual((exported['r9']['created_at'], exported['r9']['updated_at']),
+                         ('2000-01-01 00:00:00', '2000-01-02 00:00:00'))
+        template = self.db.list_templates()[0]
+        self.assertEqual((template['template_content'], template['is_default']), ('new', True))
+        self.assertEqual(len(list(self.db.export_role_default_templates())), 2)
+
+        with self.assertRaises(ValueError):
+            self.db.upsert_catalog_records([('role', {'id': 'x'}), ('unknown', {})])
+        # 关联引用不存在的模板时整批回滚
+        with self.assertRaises(self.integrity_error):
+            self.db.upsert_catalog_records([
+                ('role', {'id': 'r10', 'name': 'r10'}),
+                ('role_default_template', {'role_id': 'r10', 'template_id': 'missing'}),
+            ])
+        self.assertIsNone(self.db.get_role('r10'))
+
+
+class TestSQLiteBackend(BackendConformance, unittest.TestCase):
+    """SQLite后端一致性测试"""
+
+    def make_backend(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        return SQLiteDatabase(os.path.join(self.tmp_dir.name, 'conformance.db'))
+
+    def test_connections_of_exited_threads_are_closed(self):
+        """测试线程池回收的线程留下的连接被关闭，不计入连接数"""
+        self.db.list_roles()
+        workers = [threading.Thread(target=self.db.list_roles) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+            worker.join()
+        self.assertEqual(self.db.connection_count, 1)
+
+        worker = threading.Thread(target=self.db.list_roles)
+        worker.start()
+        worker.join()
+        self.db.connect()
+        self.assertEqual(len(self.db._connections), 1)
+
+
+class TestShardedBackend(BackendConformance, unittest.TestCase):
+    """会话分片存储一致性测试"""
+
+    def make_backend(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        catalog = SQLiteDatabase(os.path.join(self.tmp_dir.name, 'catalog.db'))
+        return ShardedDatabase(catalog, os.path.join(self.tmp_dir.name, 'shards'), 3)
+
+
+class TestArchivedBackend(BackendConformance, unittest.TestCase):
+    """带会话归档库的SQLite后端一致性测试"""
+
+    def make_backend(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        hot = SQLiteDatabase(os.path.join(self.tmp_dir.name, 'hot.db'))
+        return ArchivedDatabase(hot, os.path.join(self.tmp_dir.name, 'archive.db'))
+
+
+class TestMemoryBackend(BackendConformance, unittest.TestCase):
+    """内存后端一致性测试"""
+
+    def make_backend(self):
+        return MemoryDatabase()
+
+    def test_data_survives_reconnect(self):
+        """测试断开连接后数据保留"""
+        role_id = self.db.create_role({'name': '常驻'})
+        self.db.disconnect()
+        self.assertEqual(self.db.connection_count, 0)
+        self.db.connect()
+        self.assertEqual(self.db.get_role(role_id)['name'], '常驻')
+
+    def test_returned_records_are_copies(self):
+        """测试修改返回的记录不影响存储的数据"""
+        role_id = self.db.create_role({'name': '副本', 'skills': ['a']})
+        self.db.get_role(role_id)['skills'].append('b')
+        self.assertEqual(self.db.get_role(role_id)['skills'], ['a'])
+
+
+@unittest.skipIf(SQLAlchemyDatabase is None, "需要安装sqlalchemy")
+class TestSQLAlchemySQLiteBackend(BackendConformance, unittest.TestCase):
+    """SQLAlchemy后端（SQLite）一致性测试"""
+
+    integrity_error = SQLAlchemyIntegrityError
+
+    def make_backend(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.db_path = os.path.join(self.tmp_dir.name, 'conformance.db')
+        return SQLAlchemyDatabase(f'sqlite:///{self.db_path}', pragmas={'journal_mode': 'WAL'})
+
+    def test_shares_schema_with_sqlite_backend(self):
+        """测试与SQLiteDatabase读写同一个数据库文件"""
+        role_id = self.db.create_role({'name': '共享', 'skills': ['a']})
+        template_id = self._template('共享模板')
+        self.db.disconnect()
+
+        legacy = SQLiteDatabase(self.db_path)
+        legacy.connect()
+        try:
+            self.assertEqual(legacy.get_role(role_id)['skills'], ['a'])
+            self.assertEqual(legacy.get_template(template_id)['role_types'], ['assistant', 'expert'])
+            legacy.update_role(role_id, {'name': '已更新'})
+        finally:
+            legacy.disconnect()
+
+        self.db.connect()
+        self.assertEqual(self.db.get_role(role_id)['name'], '已更新')
+        self.assertEqual(self.db.get_role_version_info(role_id)['version'], 2)
+
+    def test_connections_are_pooled(self):
+        """测试操作结束后连接归还连接池而不是关闭"""
+        for _ in range(5):
+            self.db.list_roles()
+        self.assertEqual(self.db.connection_count, 1)
+        self.assertEqual(self.db.db_path, self.db_path)
+
+
+@unittest.skipIf(SQLAlchemyDatabase is None or not os.environ.get(POSTGRES_URL_ENV),
+                 f"需要安装sqlalchemy并设置{POSTGRES_URL_ENV}")
+class TestSQLAlchemyPostgresBackend(BackendConformance, unittest.TestCase):
+    """SQLAlchemy后端（PostgreSQL）一致性测试，每个测试前清空测试库"""
+
+    integrity_error = SQLAlchemyIntegrityError
+
+    def make_backend(self):
+        db = SQLAlchemyDatabase(os.environ[POSTGRES_URL_ENV])
+        METADATA.drop_all(db.engine)
+        return db
+
+
+if __name__ == '__main__':
+    unittest.main()
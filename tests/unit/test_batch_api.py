@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from src.llm_roles.api.batch_api import BatchAPI
+from src.llm_roles.api.prompt_api import PromptAPI
+from src.llm_roles.api.role_api import RoleAPI
+from src.llm_roles.database.sqlite import SQLiteDatabase
+from src.llm_roles.services.prompt_service import PromptService
+from src.llm_roles.services.role_manager import RoleManager
+
+
+class TestBatchAPI(unittest.TestCase):
+    """批量操作API单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = SQLiteDatabase(os.path.join(self.tmp_dir.name, "batch.db"))
+        self.output = io.StringIO()
+        self.stdout = contextlib.redirect_stdout(self.output)
+        self.stdout.__enter__()
+        self.api = BatchAPI(RoleAPI(RoleManager(self.db)), PromptAPI(PromptService(self.db)), self.db)
+
+    def tearDown(self):
+        """测试后的清理"""
+        self.db.disconnect()
+        self.stdout.__exit__(None, None, None)
+        self.tmp_dir.cleanup()
+
+    def _provisioning(self, template_ref="1.data.id"):
+        return [
+            {"op": "create_role", "args": {"role_data": {"name": "客服"}}},
+            {"op": "create_template", "args": {"template_data": {
+                "name": "客服模板", "template_content": "你是{role.name}"
+            }}},
+            {"op": "set_role_default_template", "args": {
+                "role_id": {"$ref": "0.data.id"}, "template_id": {"$ref": template_ref}
+            }},
+        ]
+
+    def test_provisioning_in_one_transaction(self):
+        """测试创建角色、模板并设置默认模板"""
+        result = self.api.execute(self._provisioning())
+
+        self.assertTrue(result["success"])
+        self.assertTrue(result["data"]["committed"])
+        self.assertEqual(result["data"]["succeeded"], 3)
+        role_id = result["data"]["results"][0]["data"]["id"]
+        template_id = result["data"]["results"][1]["data"]["id"]
+        bound = self.db.get_role_default_templates(role_id)
+        self.assertEqual([t["id"] for t in bound], [template_id])
+
+    def test_atomic_failure_rolls_back_everything(self):
+        """测试atomic模式下任一操作失败则全部回滚"""
+        operations = self._provisioning()
+        operations.insert(2, {"op": "update_role", "args": {"role_id": "missing", "updates": {"name": "x"}}})
+
+        result = self.api.execute(operations)
+
+        self.assertFalse(result["success"])
+        self.assertFalse(result["data"]["committed"])
+        self.assertEqual(result["status"], 404)
+        self.assertEqual([r["status"] for r in result["data"]["results"]][2:], [404, 424])
+        self.assertEqual(self.db.list_roles(), [])
+        self.assertEqual(self.db.list_templates(), [])
+
+    def test_continue_mode_keeps_successful_operations(self):
+        """测试continue模式只回滚失败的操作"""
+        operations = self._provisioning(template_ref="9.data.id")
+
+        result = self.api.execute(operations, mode="continue")
+
+        self.assertTrue(result["success"])
+        self.assertEqual(result["data"]["succeeded"], 2)
+        self.assertEqual(result["data"]["results"][2]["status"], 400)
+        self.assertEqual(len(self.db.list_roles()), 1)
+        self.assertEqual(len(self.db.list_templates()), 1)
+
+    def test_invalid_requests(self):
+        """测试不支持的操作和模式"""
+        self.assertEqual(self.api.execute([{"op": "drop_database"}])["status"], 400)
+        self.assertEqual(self.api.execute(self._provisioning(), mode="maybe")["status"], 400)
+        self.assertEqual(self.db.list_roles(), [])
+
+    def test_nested_transaction_and_savepoint(self):
+        """测试事务内的保存点回滚"""
+        with self.db.transaction():
+            self.db.create_role({"name": "保留"})
+            with self.assertRaises(RuntimeError):
+                with self.db.savepoint():
+                    self.db.create_role({"name": "回滚"})
+                    raise RuntimeError("fail")
+
+        self.assertEqual([r["name"] for r in self.db.list_roles()], ["保留"])
+        with self.assertRaises(RuntimeError):
+            with self.db.savepoint():
+                pass
+
+
+if __name__ == "__main__":
+    unittest.main()
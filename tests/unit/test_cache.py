@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest.mock import patch
+
+from src.llm_roles.utils.cache import TTLCache
+
+
+class TestTTLCache(unittest.TestCase):
+    """TTL缓存单元测试"""
+
+    def test_lru_eviction_and_stats(self):
+        """测试超出容量时淘汰最久未使用的条目"""
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.stats()["hits"], 2)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_expiry_and_invalidate(self):
+        """测试条目过期和按条件失效"""
+        cache = TTLCache(ttl=10)
+        with patch("src.llm_roles.utils.cache.time.monotonic", return_value=100.0):
+            cache.set(("role", "r1"), "x")
+            cache.set(("role", "r2"), "y")
+        with patch("src.llm_roles.utils.cache.time.monotonic", return_value=105.0):
+            self.assertEqual(cache.get(("role", "r1")), "x")
+            self.assertEqual(cache.invalidate_where(lambda key: key[1] == "r2"), 1)
+        with patch("src.llm_roles.utils.cache.time.monotonic", return_value=111.0):
+            self.assertIsNone(cache.get(("role", "r1")))
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
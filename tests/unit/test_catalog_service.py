@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from src.llm_roles.database.sqlite import SQLiteDatabase
+from src.llm_roles.services.catalog_service import CatalogService
+from src.llm_roles.services.prompt_service import PromptService
+from src.llm_roles.services.role_manager import RoleManager
+
+
+class TestCatalogService(unittest.TestCase):
+    """目录导入导出服务单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.source = SQLiteDatabase(os.path.join(self.tmp_dir.name, "source.db"))
+        self.target = SQLiteDatabase(os.path.join(self.tmp_dir.name, "target.db"))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = RoleManager(self.source)
+            self.roles = [manager.create_role(name=f"角色{i}", language_style="友好")
+                          for i in range(25)]
+            self.template = PromptService(self.source).create_template({
+                "name": "测试模板",
+                "template_content": "你好，{name}",
+                "role_types": ["assistant"]
+            })
+            self.source.set_role_default_template(self.roles[0].id, self.template.id)
+
+    def tearDown(self):
+        """测试后的清理"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.source.disconnect()
+            self.target.disconnect()
+        self.tmp_dir.cleanup()
+
+    def test_export_order_and_format(self):
+        """测试导出记录的顺序和格式"""
+        lines = list(CatalogService(self.source).export_lines(batch_size=10))
+        records = [json.loads(line) for line in lines]
+
+        self.assertEqual(len(records), 27)
+        self.assertEqual([r["type"] for r in records[-2:]], ["template", "role_default_template"])
+        self.assertEqual(records[-2]["data"]["role_types"], ["assistant"])
+        self.assertTrue(all(line.endswith("\n") for line in lines))
+
+    def test_round_trip(self):
+        """测试导出后导入到新数据库"""
+        lines = CatalogService(self.source).export_lines(batch_size=10)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = CatalogService(self.target).import_lines(lines, chunk_size=7)
+
+        self.assertEqual(stats["roles"], 25)
+        self.assertEqual(stats["templates"], 1)
+        self.assertEqual(stats["role_default_templates"], 1)
+        role = self.target.get_role(self.roles[3].id)
+        self.assertEqual(role["name"], "角色3")
+        self.assertEqual(role["language_style"], "友好")
+        self.assertEqual(len(self.target.get_role_default_templates(self.roles[0].id)), 1)
+
+    def test_import_is_upsert(self):
+        """测试重复导入会覆盖已有记录而不是报错"""
+        lines = list(CatalogService(self.source).export_lines())
+        service = CatalogService(self.target)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            service.import_lines(lines)
+            record = json.loads(lines[0])
+            record["data"]["name"] = "改名"
+            lines[0] = json.dumps(record)
+            service.import_lines(lines)
+
+        self.assertEqual(self.target.get_role(record["data"]["id"])["name"], "改名")
+        self.assertEqual(len(self.target.list_roles(limit=100)), 25)
+
+    def test_failed_chunk_reports_checkpoint_and_resumes(self):
+        """测试导入失败时保留已提交的块，并可以从断点继续"""
+        lines = list(CatalogService(self.source).export_lines())
+        broken = lines[:12] + ["not json\n"] + lines[12:]
+        checkpoints = []
+        service = CatalogService(self.target)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaises(ValueError):
+                service.import_lines(broken, chunk_size=5, on_checkpoint=checkpoints.append)
+
+            self.assertEqual(checkpoints, [5, 10])
+            self.assertEqual(len(self.target.list_roles(limit=100)), 10)
+
+            # 修复数据后从最后一个断点继续
+            stats = service.import_lines(lines, chunk_size=5, skip=checkpoints[-1])
+
+        self.assertEqual(stats["lines"], len(lines))
+        self.assertEqual(len(self.target.list_roles(limit=100)), 25)
+
+    def test_invalid_record_type(self):
+        """测试未知记录类型"""
+        line = json.dumps({"type": "unknown", "data": {"id": "x"}})
+
+        with self.assertRaises(ValueError):
+            CatalogService(self.target).import_lines([line])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import tempfile
+import unittest
+
+from src.llm_roles.database.compression import TextCompressor, decompress, train_dictionary
+from src.llm_roles.database.sqlite import SQLiteDatabase
+
+LONG_TEXT = "好的，下面我将分步骤为你详细说明。Make sure to handle errors and edge cases. " * 40
+
+
+class TestTextCompressor(unittest.TestCase):
+    """文本压缩格式单元测试"""
+
+    def test_round_trip(self):
+        """测试各算法压缩后带格式标记并能还原"""
+        for spec, marker in (("zlib", b"Cz"), ("lzma:9", b"Cx")):
+            value = TextCompressor.parse(spec).compress(LONG_TEXT)
+            self.assertEqual(value[:2], marker)
+            self.assertLess(len(value), len(LONG_TEXT.encode("utf-8")))
+            self.assertEqual(decompress(value, {}.__getitem__), LONG_TEXT)
+
+    def test_small_and_incompressible_values_stay_text(self):
+        """测试未达到阈值或压缩后没有变小的值原样返回"""
+        compressor = TextCompressor(threshold=64)
+        self.assertEqual(compressor.compress("短文本"), "短文本")
+        random_text = random.Random(0).randbytes(100).decode("latin-1")
+        self.assertIsInstance(compressor.compress(random_text), str)
+        self.assertIsNone(compressor.compress(None))
+
+    def test_dictionary(self):
+        """测试预设字典提高短文本的压缩率"""
+        samples = [f"第{i}条回复。" + "如果你还有其他问题，欢迎随时告诉我。总结一下，推荐先评估再迁移。" for i in range(20)]
+        dictionary = train_dictionary(samples)
+        self.assertIn("欢迎随时告诉我".encode("utf-8"), dictionary)
+
+        plain = TextCompressor(threshold=32)
+        with_dict = TextCompressor(threshold=32, use_dictionary=True)
+        with_dict.dictionary = dictionary
+        text = "第99条回复。如果你还有其他问题，欢迎随时告诉我。总结一下，推荐先评估再迁移。"
+        value = with_dict.compress(text)
+        self.assertEqual(value[:2], b"Cd")
+        self.assertLess(len(value), len(plain.compress(text)))
+        self.assertEqual(decompress(value, lambda dict_id: dictionary), text)
+
+    def test_invalid_settings(self):
+        """测试未知算法和lzma使用字典被拒绝"""
+        with self.assertRaises(ValueError):
+            TextCompressor.parse("brotli")
+        with self.assertRaises(ValueError):
+            TextCompressor.parse("lzma+dict")
+        with self.assertRaises(ValueError):
+            decompress(b"Cq123", {}.__getitem__)
+
+
+class TestSQLiteCompression(unittest.TestCase):
+    """SQLite后端透明压缩单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "compressed.db")
+        self.output = io.StringIO()
+
+    def tearDown(self):
+        """测试后的清理"""
+        self.tmp_dir.cleanup()
+
+    def _open(self, compression=None):
+        db = SQLiteDatabase(self.db_path, compression=compression)
+        with contextlib.redirect_stdout(self.output):
+            db.connect()
+        self.addCleanup(self._close, db)
+        return db
+
+    def _close(self, db):
+        with contextlib.redirect_stdout(self.output):
+            db.disconnect()
+
+    def _stored(self, sql, *params):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(sql, params).fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_messages_and_templates_are_transparent(self):
+        """测试长消息和模板内容以压缩值存储，读取得到原文"""
+        db = self._open(TextCompressor("lzma", threshold=256))
+        with contextlib.redirect_stdout(self.output):
+            role_id = db.create_role({"name": "客服"})
+            template_id = db.create_template({"name": "长模板", "template_content": LONG_TEXT})
+        session_id = db.create_session(role_id)
+        db.add_messages(session_id, [{"sender": "assistant", "content": LONG_TEXT},
+                                     {"sender": "user", "content": "短消息"}])
+
+        self.assertEqual(self._stored("SELECT typeof(content) FROM messages WHERE sequence = 1"), "blob")
+        self.assertEqual(self._stored("SELECT typeof(content) FROM messages WHERE sequence = 2"), "text")
+        self.assertEqual(self._stored("SELECT typeof(template_content) FROM prompt_templates"), "blob")
+        self.assertEqual([m["content"] for m in db.get_session_messages(session_id)], [LONG_TEXT, "短消息"])
+        self.assertEqual(db.get_template(template_id)["template_content"], LONG_TEXT)
+        self.assertEqual(db.list_templates()[0]["template_content"], LONG_TEXT)
+        self.assertEqual(next(db.export_templates())["template_content"], LONG_TEXT)
+
+        self.assertTrue(db.update_template(template_id, {"template_content": LONG_TEXT + "更新"}))
+        self.assertEqual(db.get_template(template_id)["template_content"], LONG_TEXT + "更新")
+
+    def test_uncompressed_instance_reads_compressed_values(self):
+        """测试关闭压缩的实例（或其他进程）能读取压缩值和按需加载字典"""
+        writer = self._open(TextCompressor(threshold=32, use_dictionary=True))
+        dictionary = train_dictionary([f"{i}：" + LONG_TEXT[:200] for i in range(5)])
+        writer.store_compression_dictionary(dictionary)
+        with contextlib.redirect_stdout(self.output):
+            role_id = writer.create_role({"name": "客服"})
+        session_id = writer.create_session(role_id)
+        writer.add_message(session_id, "assistant", LONG_TEXT[:300])
+        self.assertEqual(bytes(self._stored("SELECT content FROM messages"))[:2], b"Cd")
+
+        reader = SQLiteDatabase(self.db_path)
+        with contextlib.redirect_stdout(self.output):
+            self.assertEqual(reader.get_session_messages(session_id)[0]["content"], LONG_TEXT[:300])
+            reader.disconnect()
+
+        # 重新连接的写入方从数据库加载最新的字典
+        again = self._open(TextCompressor(threshold=32, use_dictionary=True))
+        self.assertEqual(again.compression.dictionary, dictionary)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from src.llm_roles.database.replica import FENCED, FRESH, ReplicatedDatabase
+from src.llm_roles.database.sqlite import SQLiteDatabase
+from src.llm_roles.services.invalidation import InvalidationBus
+from src.llm_roles.services.session_service import SessionService
+
+
+class TestInvalidationBus(unittest.TestCase):
+    """变更日志和跨进程缓存失效单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "roles.db")
+        self.output = io.StringIO()
+        with contextlib.redirect_stdout(self.output):
+            self.db = SQLiteDatabase(self.db_path)
+            self.db.connect()
+            self.role_id = self.db.create_role({"name": "角色", "description": "描述"})
+            self.template_id = self.db.create_template({"name": "模板", "template_content": "你是{{ name }}"})
+        # 不启动后台线程，由测试调用poll()
+        self.bus = InvalidationBus(self.db, interval=0)
+        self.events = []
+        for entity in ("role", "template", "role_default_template"):
+            self.bus.subscribe(entity, lambda entity_id, entity=entity: self.events.append((entity, entity_id)))
+        self.resets = 0
+        self.bus.subscribe_reset(self._on_reset)
+        self.bus.start()
+
+    def tearDown(self):
+        """测试后的清理"""
+        self.bus.stop()
+        with contextlib.redirect_stdout(self.output):
+            self.db.disconnect()
+        self.tmp_dir.cleanup()
+
+    def _on_reset(self):
+        self.resets += 1
+
+    def test_start_does_not_replay(self):
+        """测试启动前的变更不会重放"""
+        self.assertEqual(self.bus.poll(), 0)
+        self.assertEqual(self.events, [])
+
+    def test_each_table_is_logged(self):
+        """测试三张表的变更都以对应的键记录"""
+        with contextlib.redirect_stdout(self.output):
+            self.db.update_role(self.role_id, {"name": "新名"})
+            self.db.set_role_default_template(self.role_id, self.template_id)
+            self.db.delete_template(self.template_id)
+
+        self.bus.poll()
+
+        self.assertIn(("role", self.role_id), self.events)
+        self.assertIn(("role_default_template", self.role_id), self.events)
+        self.assertIn(("template", self.template_id), self.events)
+
+    def test_template_update_fans_out_to_roles(self):
+        """测试修改模板时使用它作为默认模板的角色也失效"""
+        with contextlib.redirect_stdout(self.output):
+            self.db.set_role_default_template(self.role_id, self.template_id)
+        self.bus.poll()
+        self.events.clear()
+
+        with contextlib.redirect_stdout(self.output):
+            self.db.update_template(self.template_id, {"template_content": "新内容"})
+        self.bus.poll()
+
+        self.assertEqual(self.events, [("template", self.template_id),
+                                       ("role_default_template", self.role_id)])
+
+    def test_external_writer_is_picked_up(self):
+        """测试其他进程直接写入的变更也被读到，同一批中重复的键只通知一次"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            for name in ("一", "二", "三"):
+                conn.execute("UPDATE roles SET name = ? WHERE id = ?", (name, self.role_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.assertEqual(self.bus.poll(), 1)
+        self.assertEqual(self.events, [("role", self.role_id)])
+        self.assertEqual(self.bus.poll(), 0)
+
+    def test_pruned_gap_resets(self):
+        """测试需要的日志已被清理时整体重置并跳到最新位置"""
+        with contextlib.redirect_stdout(self.output):
+            for i in range(5):
+                self.db.update_role(self.role_id, {"name": f"名{i}"})
+        self.db.prune_changes(keep=2)
+
+        self.assertEqual(self.bus.poll(), 0)
+        self.assertEqual(self.resets, 1)
+        self.assertEqual(self.events, [])
+        self.assertEqual(self.bus.position, self.db.get_change_log_bounds()[1])
+
+    def test_session_prompt_cache_evicted_by_other_instance(self):
+        """测试另一个数据库实例修改角色后只有该角色的系统提示词缓存失效"""
+        with contextlib.redirect_stdout(self.output):
+            other_role = self.db.create_role({"name": "其他角色"})
+        service = SessionService(self.db)
+        self.bus.subscribe("role", service.invalidate_role)
+        self.bus.poll()
+        service._get_system_prompt(self.role_id)
+        service._get_system_prompt(other_role)
+
+        other = SQLiteDatabase(self.db_path)
+        with contextlib.redirect_stdout(self.output):
+            other.update_role(self.role_id, {"name": "另一个进程改的名字"})
+            other.disconnect()
+        self.bus.poll()
+
+        self.assertIsNone(service._system_prompts.get(self.role_id))
+        self.assertIsNotNone(service._system_prompts.get(other_role))
+        self.assertIn("另一个进程改的名字", service._get_system_prompt(self.role_id))
+
+    def test_invalidated_prompt_is_not_reloaded_from_stale_snapshot(self):
+        """测试使用快照副本时，失效的系统提示词从主库重新渲染，而不是从落后的快照"""
+        replica = ReplicatedDatabase(self.db, max_staleness=60, refresh_interval=0,
+                                     snapshot_dir=self.tmp_dir.name)
+        with contextlib.redirect_stdout(self.output):
+            replica.connect()
+        self.addCleanup(self._disconnect, replica)
+        # 与ServiceContainer相同的注册顺序：先隔离快照，再丢弃缓存
+        bus = InvalidationBus(replica, interval=0)
+        bus.subscribe("role", replica.fence)
+        service = SessionService(replica)
+        bus.subscribe("role", service.invalidate_role)
+        bus.start()
+        self.assertIn("角色", service._get_system_prompt(self.role_id))
+
+        other = SQLiteDatabase(self.db_path)
+        with contextlib.redirect_stdout(self.output):
+            other.update_role(self.role_id, {"name": "另一个进程改的名字"})
+            other.disconnect()
+        # 快照还没有刷新
+        self.assertEqual(replica.get_role(self.role_id)["name"], "角色")
+        bus.poll()
+
+        self.assertIn("另一个进程改的名字", service._get_system_prompt(self.role_id))
+        self.assertEqual(replica._acquire()[1], FENCED)
+        replica.refresh()
+        snapshot, reason = replica._acquire()
+        replica._release(snapshot)
+        self.assertEqual(reason, FRESH)
+        self.assertEqual(replica.get_role(self.role_id)["name"], "另一个进程改的名字")
+
+    def _disconnect(self, db):
+        with contextlib.redirect_stdout(self.output):
+            db.disconnect()
+
+
+if __name__ == '__main__':
+    unittest.main()
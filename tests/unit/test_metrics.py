@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+from src.llm_roles.utils.metrics import (
+    Counter, Gauge, Histogram, MultiprocessMetrics, Registry, reset_metrics_dir
+)
+
+
+class TestMetrics(unittest.TestCase):
+    """指标注册表单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.registry = Registry()
+
+    def test_counter_and_gauge_render(self):
+        """测试计数器和仪表的文本输出及标签转义"""
+        requests = Counter("requests_total", "请求数", ["route"], registry=self.registry)
+        in_flight = Gauge("in_flight", "处理中", registry=self.registry)
+        requests.labels('/a"b').inc()
+        requests.labels('/a"b').inc(2)
+        in_flight.inc()
+        in_flight.dec()
+        in_flight.inc(3)
+
+        text = self.registry.render()
+        self.assertIn("# TYPE requests_total counter", text)
+        self.assertIn('requests_total{route="/a\\"b"} 3', text)
+        self.assertIn("in_flight 3", text)
+        with self.assertRaises(ValueError):
+            requests.labels()
+        with self.assertRaises(ValueError):
+            Counter("requests_total", "重复", registry=self.registry)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """测试直方图分桶累积计数、总数和总和"""
+        latency = Histogram("latency_seconds", "耗时", ["op"], buckets=(0.1, 1.0),
+                            registry=self.registry)
+        child = latency.labels("get")
+        for value in (0.05, 0.1, 0.5, 2.0):
+            child.observe(value)
+
+        text = self.registry.render()
+        self.assertIn('latency_seconds_bucket{op="get",le="0.1"} 2', text)
+        self.assertIn('latency_seconds_bucket{op="get",le="1"} 3', text)
+        self.assertIn('latency_seconds_bucket{op="get",le="+Inf"} 4', text)
+        self.assertIn('latency_seconds_count{op="get"} 4', text)
+        self.assertIn('latency_seconds_sum{op="get"} 2.65', text)
+
+    def test_collectors(self):
+        """测试输出时调用采集回调，移除后不再输出"""
+        def collector():
+            return [("cache_size", "gauge", "缓存条目数", [("cache_size", {"cache": "x"}, 5)])]
+
+        self.registry.register_collector(collector)
+        self.assertIn('cache_size{cache="x"} 5', self.registry.render())
+        self.registry.unregister_collector(collector)
+        self.assertNotIn("cache_size", self.registry.render())
+
+
+class TestMultiprocessMetrics(unittest.TestCase):
+    """多进程指标汇总单元测试"""
+
+    def setUp(self):
+        """测试前的设置：两个模拟工作进程，各有自己的注册表"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workers = []
+        for pid, requests, latency, in_flight in ((101, 2, 0.05, 1), (102, 3, 0.5, 4)):
+            registry = Registry()
+            Counter("requests_total", "请求数", ["route"], registry=registry).labels("/a").inc(requests)
+            Histogram("latency_seconds", "耗时", buckets=(0.1, 1.0), registry=registry).observe(latency)
+            Gauge("in_flight", "处理中", registry=registry).set(in_flight)
+            self.workers.append(MultiprocessMetrics(self.tmp_dir.name, registry=registry, pid=pid))
+
+    def tearDown(self):
+        """测试后的清理"""
+        self.tmp_dir.cleanup()
+
+    def test_scrape_merges_all_workers(self):
+        """测试任一工作进程输出所有进程的合计：计数器和直方图求和，仪表按进程输出"""
+        self.workers[1].flush()
+        text = self.workers[0].render()
+
+        self.assertIn('requests_total{route="/a"} 5', text)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{le="1"} 2', text)
+        self.assertIn("latency_seconds_count 2", text)
+        self.assertIn('in_flight{worker="101"} 1', text)
+        self.assertIn('in_flight{worker="102"} 4', text)
+        self.assertEqual(text.count("# TYPE requests_total counter"), 1)
+
+    def test_exited_worker_keeps_totals_only(self):
+        """测试退出的工作进程保留累计值，不再输出仪表；重新启动时清空快照目录"""
+        self.workers[1].close()
+        text = self.workers[0].render()
+        self.assertIn('requests_total{route="/a"} 5', text)
+        self.assertNotIn('worker="102"', text)
+
+        reset_metrics_dir(self.tmp_dir.name)
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
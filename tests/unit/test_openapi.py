@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import yaml
+from fastapi.testclient import TestClient
+
+from src.llm_roles.web.api_server import app
+from src.llm_roles.web.container import DB_PATH_ENV
+from src.llm_roles.web.openapi import YAML_PATH, is_stale, load_openapi_bytes
+
+
+class TestOpenApi(unittest.TestCase):
+    """OpenAPI文档预编译单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.yaml_path = Path(self.tmp_dir.name) / "api_docs.yml"
+        self.json_path = Path(self.tmp_dir.name) / "openapi.json"
+
+    def tearDown(self):
+        """测试后的清理"""
+        self.tmp_dir.cleanup()
+
+    def test_compiled_json_is_reused_until_yaml_changes(self):
+        """测试JSON产物存在且较新时直接读取，YAML修改后重新生成"""
+        self.yaml_path.write_text("openapi: 3.0.0\ninfo:\n  title: 旧标题\n", encoding="utf-8")
+        first = load_openapi_bytes(self.yaml_path, self.json_path)
+        self.assertEqual(json.loads(first)["info"]["title"], "旧标题")
+        self.assertFalse(is_stale(self.yaml_path, self.json_path))
+
+        with patch("yaml.safe_load") as safe_load:
+            self.assertEqual(load_openapi_bytes(self.yaml_path, self.json_path), first)
+        safe_load.assert_not_called()
+
+        self.yaml_path.write_text("openapi: 3.0.0\ninfo:\n  title: 新标题\n", encoding="utf-8")
+        later = time.time() + 10
+        os.utime(self.yaml_path, (later, later))
+        self.assertTrue(is_stale(self.yaml_path, self.json_path))
+        self.assertEqual(json.loads(load_openapi_bytes(self.yaml_path, self.json_path))["info"]["title"],
+                         "新标题")
+
+    def test_openapi_endpoint_serves_api_docs(self):
+        """测试/openapi.json返回与YAML文档一致的内容，文档页面可访问"""
+        with open(YAML_PATH, encoding="utf-8") as f:
+            expected = yaml.safe_load(f)
+        with patch.dict(os.environ, {DB_PATH_ENV: os.path.join(self.tmp_dir.name, "api.db")}), \
+                contextlib.redirect_stdout(io.StringIO()), TestClient(app) as client:
+            schema = client.get("/openapi.json").json()
+            docs = client.get("/docs")
+
+        self.assertEqual(schema, expected)
+        self.assertEqual(app.openapi(), expected)
+        self.assertIn("/openapi.json", docs.text)
+
+
+if __name__ == "__main__":
+    unittest.main()
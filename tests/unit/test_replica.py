@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from src.llm_roles.database.replica import ReplicatedDatabase, bind_client, unbind_client
+from src.llm_roles.database.sqlite import SQLiteDatabase
+
+
+class TestReplicatedDatabase(unittest.TestCase):
+    """只读快照副本单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "primary.db")
+        self.snapshot_dir = os.path.join(self.tmp_dir.name, "snapshots")
+        os.mkdir(self.snapshot_dir)
+        self.output = io.StringIO()
+        with contextlib.redirect_stdout(self.output):
+            self.primary = SQLiteDatabase(self.db_path, pragmas={"journal_mode": "WAL"})
+            self.primary.connect()
+            self.role_id = self.primary.create_role({"name": "原名", "description": "描述"})
+        # 不启动后台线程，由测试调用refresh()
+        self.db = ReplicatedDatabase(self.primary, max_staleness=60, refresh_interval=0,
+                                     snapshot_dir=self.snapshot_dir)
+        self.db.connect()
+
+    def tearDown(self):
+        """测试后的清理"""
+        with contextlib.redirect_stdout(self.output):
+            self.db.disconnect()
+        self.tmp_dir.cleanup()
+
+    def _rename_in_primary(self, name):
+        """绕过副本直接修改主库"""
+        self.primary.update_role(self.role_id, {"name": name})
+
+    @contextlib.contextmanager
+    def _client(self, client_id):
+        token = bind_client(client_id)
+        try:
+            yield
+        finally:
+            unbind_client(token)
+
+    def test_reads_are_served_from_snapshot(self):
+        """测试快照刷新前读到的是复制时的数据"""
+        self._rename_in_primary("新名")
+
+        self.assertEqual(self.db.get_role(self.role_id)["name"], "原名")
+        self.assertEqual([r["name"] for r in self.db.search_roles("原")], ["原名"])
+        self.assertTrue(self.db.refresh())
+        self.assertEqual(self.db.get_role(self.role_id)["name"], "新名")
+        self.assertEqual([r["name"] for r in self.db.list_roles()], ["新名"])
+
+    def test_unchanged_primary_is_not_copied(self):
+        """测试主库没有变化时只刷新确认时间，不复制"""
+        first = self.db._snapshot
+        self.assertFalse(self.db.refresh())
+        self.assertIs(self.db._snapshot, first)
+
+        self._rename_in_primary("新名")
+        self.assertTrue(self.db.refresh())
+        self.assertIsNot(self.db._snapshot, first)
+        self.assertFalse(self.db.refresh())
+
+    def test_read_your_writes(self):
+        """测试客户端写入后读到自己的写入，其他客户端在快照刷新后才读到"""
+        with self._client("a"):
+            self.assertTrue(self.db.update_role(self.role_id, {"name": "a的修改"}))
+            self.assertEqual(self.db.get_role(self.role_id)["name"], "a的修改")
+        with self._client("b"):
+            self.assertEqual(self.db.get_role(self.role_id)["name"], "原名")
+
+        self.db.refresh()
+        with self._client("b"):
+            self.assertEqual(self.db.get_role(self.role_id)["name"], "a的修改")
+        # 快照已包含a的写入，a的读取回到快照
+        with self._client("a"):
+            snapshot, reason = self.db._acquire()
+            self.assertIsNotNone(snapshot)
+            self.db._release(snapshot)
+
+    def test_stale_snapshot_falls_back_to_primary(self):
+        """测试快照超过允许的落后时间后读取走主库"""
+        self._rename_in_primary("新名")
+        self.db.max_staleness = 0
+
+        self.assertEqual(self.db.get_role(self.role_id)["name"], "新名")
+
+    def test_transaction_reads_primary(self):
+        """测试事务内的读取看到事务中的写入，回滚后不记录写入"""
+        with self._client("a"):
+            with self.assertRaises(RuntimeError):
+                with self.db.transaction():
+                    self.db.update_role(self.role_id, {"name": "事务中"})
+                    self.assertEqual(self.db.get_role(self.role_id)["name"], "事务中")
+                    raise RuntimeError("回滚")
+            self.assertEqual(self.db.get_role(self.role_id)["name"], "原名")
+
+    def test_retired_snapshot_closed_after_readers_finish(self):
+        """测试被替换的快照在读取结束后关闭并删除文件"""
+        snapshot, _ = self.db._acquire()
+        snapshot.get_role(self.role_id)
+        self._rename_in_primary("新名")
+        self.db.refresh()
+
+        self.assertTrue(os.path.exists(snapshot.db_path))
+        self.assertEqual(snapshot.get_role(self.role_id)["name"], "原名")
+        self.db._release(snapshot)
+        self.assertFalse(os.path.exists(snapshot.db_path))
+        self.assertEqual(snapshot.connection_count, 0)
+
+    def test_disconnect_removes_snapshots(self):
+        """测试断开连接后删除快照目录"""
+        self.db.get_role(self.role_id)
+        self.assertEqual(len(os.listdir(self.snapshot_dir)), 1)
+        with contextlib.redirect_stdout(self.output):
+            self.db.disconnect()
+        self.assertEqual(os.listdir(self.snapshot_dir), [])
+        self.assertEqual(self.db.connection_count, 0)
+        # 再次连接生成新快照
+        self.db.connect()
+        self.assertEqual(self.db.get_role(self.role_id)["name"], "原名")
+
+
+if __name__ == '__main__':
+    unittest.main()
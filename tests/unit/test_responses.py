@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+import unittest
+from http import HTTPStatus
+from unittest.mock import MagicMock
+
+from src.llm_roles.web import responses
+
+
+def _request(accept_encoding=None, accept=None):
+    request = MagicMock()
+    request.headers = {}
+    if accept_encoding:
+        request.headers["accept-encoding"] = accept_encoding
+    if accept:
+        request.headers["accept"] = accept
+    return request
+
+
+class TestEnvelopeResponse(unittest.TestCase):
+    """快速响应路径单元测试"""
+
+    def test_serialize_matches_api_response_shape(self):
+        """测试序列化结果与ApiResponse结构一致"""
+        body = responses.serialize_envelope({
+            "status": HTTPStatus.NOT_FOUND, "message": "角色不存在", "success": False
+        })
+
+        self.assertEqual(json.loads(body), {
+            "status": 404, "message": "角色不存在", "success": False, "data": None
+        })
+        self.assertIn("角色不存在".encode("utf-8"), body)
+
+    def test_choose_encoding(self):
+        """测试按Accept-Encoding和q值选择编码"""
+        self.assertIsNone(responses.choose_encoding(None))
+        self.assertIsNone(responses.choose_encoding("identity"))
+        self.assertEqual(responses.choose_encoding("gzip, deflate"), "gzip")
+        self.assertEqual(responses.choose_encoding("br;q=0, gzip;q=0.5"), "gzip")
+        self.assertIsNone(responses.choose_encoding("gzip;q=0"))
+
+    @unittest.skipIf(responses.brotli is None, "未安装brotli")
+    def test_prefers_brotli(self):
+        """测试同时接受时优先使用brotli"""
+        self.assertEqual(responses.choose_encoding("gzip, br"), "br")
+        self.assertEqual(responses.choose_encoding("*"), "br")
+
+    def test_small_bodies_are_not_compressed(self):
+        """测试小响应不压缩"""
+        response = responses.envelope_response(
+            _request("gzip"), {"status": 200, "message": "ok", "success": True}
+        )
+
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(response.headers["vary"], "Accept, Accept-Encoding")
+
+    def test_large_bodies_are_compressed(self):
+        """测试大响应按请求压缩，保留额外响应头，ETag带上内容编码后缀"""
+        result = {"status": 200, "message": "ok", "success": True,
+                  "data": {"items": ["角色描述" * 20] * 50}}
+
+        response = responses.envelope_response(_request("gzip"), result, headers={"ETag": '"x"'})
+
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.headers["etag"], '"x-gzip"')
+        self.assertEqual(json.loads(gzip.decompress(response.body))["data"], result["data"])
+
+
+
+@unittest.skipIf(responses.msgpack is None, "未安装msgpack")
+class TestMessagePack(unittest.TestCase):
+    """MessagePack内容协商单元测试"""
+
+    def test_choose_media_type(self):
+        """测试只有明确优先msgpack时才使用MessagePack"""
+        self.assertEqual(responses.choose_media_type(None), responses.JSON_MEDIA_TYPE)
+        self.assertEqual(responses.choose_media_type("*/*"), responses.JSON_MEDIA_TYPE)
+        self.assertEqual(responses.choose_media_type("application/msgpack"), responses.MSGPACK_MEDIA_TYPE)
+        self.assertEqual(responses.choose_media_type("application/x-msgpack"), responses.MSGPACK_MEDIA_TYPE)
+        self.assertEqual(
+            responses.choose_media_type("application/msgpack, application/json;q=0.5"),
+            responses.MSGPACK_MEDIA_TYPE
+        )
+        # 同等优先时使用JSON
+        self.assertEqual(
+            responses.choose_media_type("application/json, application/msgpack"),
+            responses.JSON_MEDIA_TYPE
+        )
+        self.assertEqual(responses.choose_media_type("application/msgpack;q=0"), responses.JSON_MEDIA_TYPE)
+
+    def test_envelope_round_trip(self):
+        """测试MessagePack响应与JSON响应的信封内容一致"""
+        result = {"status": HTTPStatus.OK, "message": "ok", "success": True,
+                  "data": {"attributes": {"技能": ["写作", "翻译"]}, "content": "模板" * 800}}
+
+        packed = responses.envelope_response(_request("gzip", "application/msgpack"), result)
+        plain = responses.envelope_response(_request(), result)
+
+        self.assertEqual(packed.headers["content-type"], responses.MSGPACK_MEDIA_TYPE)
+        self.assertEqual(packed.headers["vary"], "Accept, Accept-Encoding")
+        self.assertEqual(packed.headers["content-encoding"], "gzip")
+        decoded = responses.deserialize_envelope(gzip.decompress(packed.body), packed.headers["content-type"])
+        self.assertEqual(decoded, responses.deserialize_envelope(plain.body))
+        self.assertEqual(decoded["status"], 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+from src.llm_roles.core import versioning
+from src.llm_roles.database.sqlite import SQLiteDatabase
+from src.llm_roles.services.role_manager import RoleManager
+
+
+class TestRoleVersioning(unittest.TestCase):
+    """角色版本历史单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        self.db = SQLiteDatabase(self.db_path)
+        self.db.connect()
+        self.manager = RoleManager(self.db)
+        self.role = self.manager.create_role(
+            name="测试角色",
+            description="版本测试",
+            role_type="assistant",
+            language_style="友好"
+        )
+
+    def tearDown(self):
+        """测试后的清理"""
+        self.db.disconnect()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_diff_and_apply_delta(self):
+        """测试差量计算与应用"""
+        old = {"name": "a", "x": 1, "y": [1, 2]}
+        new = {"name": "b", "y": [1, 2], "z": True}
+
+        delta = versioning.diff_role_state(old, new)
+
+        self.assertEqual(delta, {"set": {"name": "b", "z": True}, "unset": ["x"]})
+        self.assertEqual(versioning.apply_role_delta(old, delta), new)
+        self.assertEqual(versioning.changed_fields(delta), ["name", "x", "z"])
+
+    def test_create_records_initial_snapshot(self):
+        """测试创建角色时记录初始快照"""
+        versions = self.manager.list_role_versions(self.role.id)
+
+        self.assertEqual(len(versions), 1)
+        self.assertEqual(versions[0]["version"], 1)
+        self.assertTrue(versions[0]["is_snapshot"])
+
+    def test_update_records_delta(self):
+        """测试更新角色时记录差量版本"""
+        self.manager.update_role(self.role.id, language_style="严谨")
+
+        versions = self.manager.list_role_versions(self.role.id)
+
+        self.assertEqual([v["version"] for v in versions], [2, 1])
+        self.assertFalse(versions[0]["is_snapshot"])
+        self.assertEqual(versions[0]["changed_fields"], ["language_style"])
+
+    def test_noop_update_does_not_create_version(self):
+        """测试内容未变化的更新不产生新版本"""
+        self.manager.update_role(self.role.id, language_style="友好")
+
+        self.assertEqual(len(self.manager.list_role_versions(self.role.id)), 1)
+
+    def test_reconstruct_versions_across_snapshots(self):
+        """测试跨越快照边界重建任意版本"""
+        total = versioning.SNAPSHOT_INTERVAL * 2 + 3
+        for i in range(2, total + 1):
+            self.manager.update_role(self.role.id, counter=i)
+
+        for version in (1, 2, versioning.SNAPSHOT_INTERVAL + 1, total):
+            role = self.manager.get_role_version(self.role.id, version)
+            self.assertIsNotNone(role)
+            self.assertEqual(role.name, "测试角色")
+            if version == 1:
+                self.assertNotIn("counter", role.attributes)
+            else:
+                self.assertEqual(role.attributes["counter"], version)
+
+        snapshots = [v["version"] for v in self.manager.list_role_versions(self.role.id)
+                     if v["is_snapshot"]]
+        self.assertEqual(sorted(snapshots),
+                         [1, versioning.SNAPSHOT_INTERVAL + 1, versioning.SNAPSHOT_INTERVAL * 2 + 1])
+
+    def test_get_missing_version(self):
+        """测试获取不存在的版本"""
+        self.assertIsNone(self.manager.get_role_version(self.role.id, 5))
+        self.assertIsNone(self.manager.get_role_version("missing-role", 1))
+
+    def test_rollback_restores_previous_state(self):
+        """测试回滚到历史版本"""
+        self.manager.update_role(self.role.id, name="新名称", extra_field="新增")
+
+        rolled_back = self.manager.rollback_role(self.role.id, 1)
+        current = self.manager.get_role(self.role.id)
+
+        self.assertEqual(rolled_back.name, "测试角色")
+        self.assertEqual(current.name, "测试角色")
+        self.assertNotIn("extra_field", current.attributes)
+        # 回滚本身也记录为新版本
+        self.assertEqual(self.manager.list_role_versions(self.role.id)[0]["version"], 3)
+
+    def test_delete_role_removes_versions(self):
+        """测试删除角色时一并删除历史版本"""
+        self.manager.update_role(self.role.id, language_style="严谨")
+
+        self.assertTrue(self.manager.delete_role(self.role.id))
+        self.assertEqual(self.manager.list_role_versions(self.role.id), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
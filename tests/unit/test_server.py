@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from src.llm_roles.database.sqlite import SQLiteDatabase
+from src.llm_roles.web.api_server import app
+from src.llm_roles.web.container import DB_PATH_ENV, PRAGMAS_ENV, ServiceContainer, parse_pragmas
+from src.llm_roles.utils.metrics import HTTP_REQUESTS, METRICS_DIR_ENV, Counter, MultiprocessMetrics, Registry
+from src.llm_roles.web.server import PRELOAD_ENV, THREADPOOL_SIZE_ENV, build_launch
+
+
+class TestServerLaunch(unittest.TestCase):
+    """服务启动配置单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "server.db")
+        self.output = io.StringIO()
+
+    def tearDown(self):
+        """测试后的清理"""
+        self.tmp_dir.cleanup()
+
+    def test_build_launch_modes(self):
+        """测试开发模式自动重载，生产模式多进程并默认启用WAL"""
+        dev_options, dev_env = build_launch()
+        self.assertTrue(dev_options["reload"])
+        self.assertNotIn("workers", dev_options)
+        self.assertEqual(dev_env, {})
+
+        options, env = build_launch(production=True, workers=4, preload=True, keepalive=15,
+                                    backlog=4096, graceful_timeout=20, threadpool_size=64,
+                                    pragmas={"busy_timeout": "10000"})
+        self.assertEqual(options["workers"], 4)
+        self.assertNotIn("reload", options)
+        self.assertEqual(options["timeout_keep_alive"], 15)
+        self.assertEqual(options["backlog"], 4096)
+        self.assertEqual(options["timeout_graceful_shutdown"], 20)
+        self.assertEqual(parse_pragmas(env[PRAGMAS_ENV]),
+                         {"journal_mode": "WAL", "synchronous": "NORMAL", "busy_timeout": "10000"})
+        self.assertEqual(env[THREADPOOL_SIZE_ENV], "64")
+        self.assertEqual(env[PRELOAD_ENV], "1")
+
+    def test_multiple_workers_aggregate_metrics(self):
+        """测试多个工作进程时指定指标快照目录，/metrics输出所有进程的合计"""
+        _, env = build_launch(production=True, workers=4, metrics_dir=self.tmp_dir.name)
+        self.assertEqual(env[METRICS_DIR_ENV], self.tmp_dir.name)
+        _, single_env = build_launch(production=True, workers=1)
+        self.assertNotIn(METRICS_DIR_ENV, single_env)
+
+        # 另一个工作进程已处理过请求
+        other = Registry()
+        Counter("llm_roles_http_requests_total", "HTTP请求数", ["method", "route", "status"],
+                registry=other).labels("GET", "/health", 200).inc(1000)
+        MultiprocessMetrics(self.tmp_dir.name, registry=other, pid=1).flush()
+
+        with patch.dict(os.environ, {DB_PATH_ENV: self.db_path, METRICS_DIR_ENV: self.tmp_dir.name}), \
+                contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            local = HTTP_REQUESTS.labels("GET", "/health", 200).value
+            client.get("/health")
+            text = client.get("/metrics").text
+
+        self.assertIn(
+            f'llm_roles_http_requests_total{{method="GET",route="/health",status="200"}} {int(local) + 1001}',
+            text
+        )
+        self.assertIn(f'llm_roles_threadpool_size{{worker="{os.getpid()}"}}', text)
+        self.assertIn(f"{os.getpid()}.json", os.listdir(self.tmp_dir.name))
+
+    def test_pragmas_applied_per_connection(self):
+        """测试每个连接都执行PRAGMA设置，非法设置被拒绝"""
+        env = {PRAGMAS_ENV: "journal_mode=WAL,busy_timeout=7000"}
+        with patch.dict(os.environ, env), contextlib.redirect_stdout(self.output):
+            container = ServiceContainer(db_path=self.db_path)
+            container.start()
+            try:
+                conn = container.db.conn
+                self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+                self.assertEqual(conn.execute("PRAGMA busy_timeout").fetchone()[0], 7000)
+                self.assertEqual(conn.execute("PRAGMA foreign_keys").fetchone()[0], 1)
+            finally:
+                container.close()
+
+        with self.assertRaises(ValueError):
+            SQLiteDatabase(self.db_path, pragmas={"journal_mode": "WAL; DROP TABLE roles"})
+        with self.assertRaises(ValueError):
+            parse_pragmas("journal_mode")
+
+    def test_worker_threadpool_size(self):
+        """测试工作进程启动时按配置设置线程池大小"""
+        env = {DB_PATH_ENV: self.db_path, THREADPOOL_SIZE_ENV: "8"}
+        with patch.dict(os.environ, env), contextlib.redirect_stdout(self.output), \
+                TestClient(app) as client:
+            text = client.get("/metrics").text
+
+        self.assertIn("llm_roles_threadpool_size 8", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
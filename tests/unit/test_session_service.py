@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.llm_roles.database.sqlite import SQLiteDatabase
+from src.llm_roles.services.role_manager import RoleManager
+from src.llm_roles.services.session_service import SessionService
+
+
+class TestSessionService(unittest.TestCase):
+    """会话服务单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        self.db = SQLiteDatabase(self.db_path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.db.connect()
+            self.role = RoleManager(self.db).create_role(name="测试角色")
+        self.service = SessionService(self.db)
+        self.session_id = self.db.create_session(self.role.id)
+        for i in range(1, 11):
+            self.db.add_message(self.session_id, "user" if i % 2 else "assistant", f"消息{i}")
+
+    def tearDown(self):
+        """测试后的清理"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.db.disconnect()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_messages_are_numbered_per_session(self):
+        """测试消息按会话递增编号"""
+        other_session = self.db.create_session(self.role.id)
+        self.db.add_message(other_session, "user", "其他会话")
+
+        messages = self.service.get_session_messages(self.session_id)
+
+        self.assertEqual([m["sequence"] for m in messages], list(range(1, 11)))
+        self.assertEqual(self.service.get_session_messages(other_session)[0]["sequence"], 1)
+
+    def test_paging_with_cursors(self):
+        """测试游标分页"""
+        first = self.service.get_session_messages(self.session_id, limit=4)
+        second = self.service.get_session_messages(
+            self.session_id, limit=4, after=first[-1]["sequence"]
+        )
+        older = self.service.get_session_messages(
+            self.session_id, limit=3, before=8, order="desc"
+        )
+
+        self.assertEqual([m["content"] for m in first], ["消息1", "消息2", "消息3", "消息4"])
+        self.assertEqual([m["sequence"] for m in second], [5, 6, 7, 8])
+        self.assertEqual([m["sequence"] for m in older], [7, 6, 5])
+
+    def test_invalid_order(self):
+        """测试无效的排序方向"""
+        with self.assertRaises(ValueError):
+            self.service.get_session_messages(self.session_id, order="random")
+
+    def test_tail_returns_latest_in_order(self):
+        """测试获取最近消息"""
+        messages = self.service.tail(self.session_id, 3)
+
+        self.assertEqual([m["content"] for m in messages], ["消息8", "消息9", "消息10"])
+        self.assertEqual(self.service.tail("missing", 3), [])
+
+    def test_create_session(self):
+        """测试创建会话"""
+        session = self.service.create_session(self.role.id, user_id="u1", metadata={"k": "v"})
+
+        self.assertEqual(session["role_id"], self.role.id)
+        self.assertEqual(session["metadata"], {"k": "v"})
+        self.assertEqual(self.service.get_session(session["id"])["user_id"], "u1")
+        with self.assertRaises(ValueError):
+            self.service.create_session("missing-role")
+
+    def test_append_messages_batch(self):
+        """测试批量追加消息"""
+        added = self.service.append_messages(self.session_id, [
+            {"sender": "user", "content": "批量1"},
+            {"sender": "assistant", "content": "批量2", "metadata": {"tokens": 3}},
+        ])
+
+        self.assertEqual([m["sequence"] for m in added], [11, 12])
+        tail = self.service.tail(self.session_id, 2)
+        self.assertEqual([m["id"] for m in tail], [m["id"] for m in added])
+        self.assertEqual(tail[1]["metadata"], {"tokens": 3})
+
+    def test_append_messages_validation(self):
+        """测试追加无效消息时整批不写入"""
+        with self.assertRaises(ValueError):
+            self.service.append_messages(self.session_id, [
+                {"sender": "user", "content": "有效"},
+                {"sender": "robot", "content": "无效发送者"},
+            ])
+        with self.assertRaises(ValueError):
+            self.service.append_message("missing-session", "user", "你好")
+
+        self.assertEqual(len(self.service.get_session_messages(self.session_id)), 10)
+
+    def test_build_context_openai(self):
+        """测试组装OpenAI格式上下文"""
+        context = self.service.build_context(self.session_id, max_messages=3)
+
+        self.assertEqual(context["messages"][0]["role"], "system")
+        self.assertIn("测试角色", context["messages"][0]["content"])
+        self.assertEqual([m["content"] for m in context["messages"][1:]],
+                         ["消息8", "消息9", "消息10"])
+        self.assertEqual(context["messages"][-1]["role"], "assistant")
+        self.assertTrue(context["truncated"])
+
+    def test_build_context_anthropic(self):
+        """测试组装Anthropic格式上下文"""
+        self.service.append_message(self.session_id, "system", "补充说明")
+
+        context = self.service.build_context(self.session_id, format="anthropic", max_messages=2)
+
+        self.assertIn("补充说明", context["system"])
+        self.assertEqual([m["role"] for m in context["messages"]], ["assistant"])
+
+    def test_build_context_token_budget(self):
+        """测试按token预算截断历史"""
+        system_tokens = self.service.build_context(self.session_id, max_messages=0)["estimated_tokens"]
+
+        context = self.service.build_context(self.session_id, max_tokens=system_tokens + 7)
+
+        # 每条"消息N"约估算为3个token
+        self.assertEqual([m["content"] for m in context["messages"][1:]], ["消息9", "消息10"])
+        self.assertLessEqual(context["estimated_tokens"], system_tokens + 7)
+
+    def test_build_context_hot_path_skips_database(self):
+        """测试热缓冲命中时组装上下文不读取数据库"""
+        self.service.build_context(self.session_id)
+        self.service.append_message(self.session_id, "user", "新消息")
+
+        with patch.object(self.db, "get_session_messages") as page_read, \
+                patch.object(self.db, "tail_session_messages") as tail_read, \
+                patch.object(self.db, "get_role") as role_read:
+            context = self.service.build_context(self.session_id, max_messages=5)
+
+        page_read.assert_not_called()
+        tail_read.assert_not_called()
+        role_read.assert_not_called()
+        self.assertEqual(context["messages"][-1]["content"], "新消息")
+
+    def test_build_context_reads_beyond_hot_tail(self):
+        """测试需要比热缓冲更早的历史时分页读取数据库"""
+        service = SessionService(self.db, hot_tail_size=4)
+
+        context = service.build_context(self.session_id, max_messages=8)
+
+        self.assertEqual([m["content"] for m in context["messages"][1:]],
+                         [f"消息{i}" for i in range(3, 11)])
+        self.assertTrue(context["truncated"])
+        full = service.build_context(self.session_id, max_messages=20)
+        self.assertEqual(full["message_count"], 10)
+        self.assertFalse(full["truncated"])
+
+    def test_hot_tail_sees_messages_from_other_workers(self):
+        """测试两个进程（两个容器共用一个数据库文件）各自的热缓冲在变更日志通知后补上对方追加的消息"""
+        for session_shards in (0, 2):
+            with self.subTest(session_shards=session_shards):
+                self._check_other_worker_messages(session_shards)
+
+    def _check_other_worker_messages(self, session_shards):
+        from src.llm_roles.web.container import ServiceContainer
+
+        shard_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, shard_dir, True)
+        workers = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(2):
+                # 轮询间隔很长，由测试调用poll()
+                worker = ServiceContainer(db_path=self.db_path, backend="sqlite", replica_max_staleness=0,
+                                          session_shards=session_shards, session_shard_dir=shard_dir,
+                                          archive_path="", invalidation_interval=3600)
+                worker.start(register_metrics=False)
+                self.addCleanup(self._close_container, worker)
+                workers.append(worker)
+        first, second = (worker.session_service for worker in workers)
+        role_id = workers[0].role_manager.create_role(name="分片测试").id
+        session_id = first.create_session(role_id)["id"]
+        first.append_messages(session_id, [{"sender": "user", "content": f"消息{i}"} for i in range(1, 11)])
+        for worker in workers:
+            worker.invalidation.poll()
+        first.build_context(session_id)
+        second.build_context(session_id)
+
+        second.append_message(session_id, "user", "来自第二个进程")
+        # 通知到达之前，缓存命中只读内存
+        with patch.object(workers[0].db, "get_session_messages") as page_read:
+            self.assertEqual(first.tail(session_id, 1)[0]["content"], "消息10")
+        page_read.assert_not_called()
+        for worker in workers:
+            worker.invalidation.poll()
+        first.append_message(session_id, "assistant", "来自第一个进程")
+        for worker in workers:
+            worker.invalidation.poll()
+
+        for service in (first, second):
+            self.assertEqual([m["content"] for m in service.tail(session_id, 2)],
+                             ["来自第二个进程", "来自第一个进程"])
+            context = service.build_context(session_id, max_messages=3)
+            self.assertEqual([m["content"] for m in context["messages"][1:]],
+                             ["消息10", "来自第二个进程", "来自第一个进程"])
+
+        # 其他进程追加的消息超过缓冲容量时重新加载
+        small = SessionService(workers[0].db, hot_tail_size=3)
+        small.build_context(session_id)
+        second.append_messages(session_id, [{"sender": "user", "content": f"批量{i}"} for i in range(5)])
+        small.mark_session_changed(session_id)
+        self.assertEqual([m["content"] for m in small.tail(session_id, 3)], ["批量2", "批量3", "批量4"])
+
+    def _close_container(self, container):
+        with contextlib.redirect_stdout(io.StringIO()):
+            container.close()
+
+    def test_build_context_errors(self):
+        """测试组装上下文的错误情况"""
+        with self.assertRaises(ValueError):
+            self.service.build_context("missing-session")
+        with self.assertRaises(ValueError):
+            self.service.build_context(self.session_id, format="unknown")
+
+    def test_existing_messages_are_backfilled(self):
+        """测试旧数据库迁移时按时间戳补齐序号"""
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        conn = sqlite3.connect(path)
+        conn.executescript("""
+            CREATE TABLE messages (
+                id TEXT PRIMARY KEY, session_id TEXT NOT NULL, sender TEXT NOT NULL,
+                content TEXT NOT NULL, timestamp TIMESTAMP NOT NULL, metadata JSON
+            );
+            INSERT INTO messages VALUES ('b', 's1', 'user', '第二条', '2024-01-01 00:00:02', '{}');
+            INSERT INTO messages VALUES ('a', 's1', 'user', '第一条', '2024-01-01 00:00:01', '{}');
+        """)
+        conn.close()
+
+        legacy = SQLiteDatabase(path)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                legacy.connect()
+            messages = legacy.get_session_messages("s1")
+        finally:
+            with contextlib.redirect_stdout(io.StringIO()):
+                legacy.disconnect()
+            os.unlink(path)
+
+        self.assertEqual([(m["id"], m["sequence"]) for m in messages], [("a", 1), ("b", 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from src.llm_roles.database.sharding import ShardedDatabase, shard_index
+from src.llm_roles.database.sqlite import SQLiteDatabase
+
+
+class TestShardedDatabase(unittest.TestCase):
+    """会话分片存储单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.catalog_path = os.path.join(self.tmp_dir.name, "catalog.db")
+        self.shard_dir = os.path.join(self.tmp_dir.name, "shards")
+        self.output = io.StringIO()
+        self.db = self._open(4)
+        with contextlib.redirect_stdout(self.output):
+            self.role_id = self.db.create_role({"name": "客服"})
+
+    def tearDown(self):
+        """测试后的清理"""
+        with contextlib.redirect_stdout(self.output):
+            self.db.disconnect()
+        self.tmp_dir.cleanup()
+
+    def _open(self, shard_count):
+        db = ShardedDatabase(SQLiteDatabase(self.catalog_path), self.shard_dir, shard_count)
+        with contextlib.redirect_stdout(self.output):
+            db.connect()
+        return db
+
+    def _count(self, path, table):
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_sessions_and_messages_live_in_their_shard(self):
+        """测试会话和消息只写入会话ID对应的分片，目录库中没有会话"""
+        with contextlib.redirect_stdout(self.output):
+            session_ids = [self.db.create_session(self.role_id) for _ in range(40)]
+            for session_id in session_ids:
+                self.db.add_message(session_id, "user", "你好")
+
+        for index, shard in enumerate(self.db.shards):
+            expected = sum(1 for s in session_ids if shard_index(s, 4) == index)
+            self.assertEqual(self._count(shard.db_path, "sessions"), expected)
+            self.assertEqual(self._count(shard.db_path, "messages"), expected)
+        self.assertTrue(all(self._count(s.db_path, "sessions") for s in self.db.shards))
+        self.assertEqual(self._count(self.catalog_path, "sessions"), 0)
+        self.assertEqual(self.db.get_session_messages(session_ids[0])[0]["content"], "你好")
+
+    def test_routing_is_stable_across_instances(self):
+        """测试重新打开后按同样的分片找到已有会话"""
+        with contextlib.redirect_stdout(self.output):
+            session_id = self.db.create_session(self.role_id, "u1")
+            self.db.disconnect()
+        self.db = self._open(4)
+
+        self.assertEqual(self.db.get_session(session_id)["user_id"], "u1")
+
+    def test_changing_shard_count_is_rejected(self):
+        """测试已有分片文件时改变分片数连接失败"""
+        with contextlib.redirect_stdout(self.output):
+            self.db.create_session(self.role_id)
+
+        with self.assertRaises(ValueError):
+            self._open(8)
+
+    def test_catalog_stays_in_main_database(self):
+        """测试角色写入目录库，删除角色时检查所有分片的会话引用"""
+        self.assertEqual(self._count(self.catalog_path, "roles"), 1)
+        self.assertEqual(self._count(self.db.shards[0].db_path, "messages"), 0)
+        with contextlib.redirect_stdout(self.output):
+            other = self.db.create_role({"name": "未使用"})
+            self.db.create_session(self.role_id)
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.db.delete_role(self.role_id)
+        self.assertTrue(self.db.delete_role(other))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from src.llm_roles.web.api_server import app
+from src.llm_roles.web.container import DB_PATH_ENV, INVALIDATION_INTERVAL_ENV, ServiceContainer
+from src.llm_roles.database.sqlite import SQLiteDatabase
+from src.llm_roles.web.tenancy import (
+    TENANT_DIR_ENV, TENANT_EVICTIONS, TENANT_OPENS, TenantRegistry, validate_tenant_id
+)
+
+
+def _container(db_path):
+    """不跟踪变更日志的租户容器，测试中不启动后台线程"""
+    return ServiceContainer(db_path=db_path, backend="sqlite", replica_max_staleness=0,
+                            session_shards=0, archive_path="", invalidation_interval=0)
+
+
+class TestTenantRegistry(unittest.TestCase):
+    """租户数据库注册表单元测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tenant_dir = os.path.join(self.tmp_dir.name, "tenants")
+        self.output = io.StringIO()
+        self.registry = TenantRegistry(self.tenant_dir, max_open=2, idle_timeout=60, factory=_container)
+
+    def tearDown(self):
+        """测试后的清理"""
+        with contextlib.redirect_stdout(self.output):
+            self.registry.close()
+        self.tmp_dir.cleanup()
+
+    def test_tenant_files_are_created_lazily_and_isolated(self):
+        """测试租户数据库在第一次使用时创建并建表，租户之间数据隔离"""
+        self.assertFalse(os.path.exists(self.tenant_dir))
+        with contextlib.redirect_stdout(self.output):
+            with self.registry.lease("team-a") as container:
+                role_id = container.role_manager.create_role("A的角色").id
+            with self.registry.lease("team-b") as container:
+                self.assertIsNone(container.role_manager.get_role(role_id))
+
+        conn = sqlite3.connect(os.path.join(self.tenant_dir, "team-a.db"))
+        try:
+            self.assertEqual(conn.execute("SELECT name FROM roles").fetchall(), [("A的角色",)])
+        finally:
+            conn.close()
+        self.assertEqual(self.registry.stats()["open"], 2)
+
+    def test_least_recently_used_tenant_is_closed(self):
+        """测试超过上限时关闭最久未使用的租户，正在使用的租户保留"""
+        evictions = TENANT_EVICTIONS.labels("capacity").value
+        with contextlib.redirect_stdout(self.output):
+            with self.registry.lease("a") as held:
+                held.db.get_role("x")
+                with self.registry.lease("b"):
+                    pass
+                with self.registry.lease("c"):
+                    pass
+                # a被占用，淘汰的是b
+                self.assertEqual(self.registry.stats()["open"], 2)
+                self.assertEqual(held.db.connection_count, 1)
+            with self.registry.lease("c"):
+                pass
+
+        self.assertEqual(TENANT_EVICTIONS.labels("capacity").value, evictions + 1)
+        with contextlib.redirect_stdout(self.output):
+            with self.registry.lease("d"):
+                pass
+        # c最近被使用，淘汰的是a，a的连接已关闭
+        self.assertEqual(held.db.connection_count, 0)
+        self.assertEqual(sorted(self.registry._tenants), ["c", "d"])
+
+    def test_idle_tenants_are_closed(self):
+        """测试空闲超时的租户被关闭，再次使用时重新打开"""
+        opens = TENANT_OPENS.value
+        with contextlib.redirect_stdout(self.output):
+            with self.registry.lease("a") as container:
+                role_id = container.role_manager.create_role("角色").id
+            self.assertEqual(self.registry.evict_idle(), 0)
+            self.assertEqual(self.registry.evict_idle(now=time.monotonic() + 61), 1)
+            self.assertEqual(container.db.connection_count, 0)
+            with self.registry.lease("a") as reopened:
+                self.assertIsNot(reopened, container)
+                self.assertEqual(reopened.role_manager.get_role(role_id).name, "角色")
+        self.assertEqual(TENANT_OPENS.value, opens + 2)
+
+    def test_tenants_share_one_change_log_poller(self):
+        """测试打开多个租户不会为每个租户启动轮询线程，变更日志由注册表统一轮询"""
+        registry = TenantRegistry(self.tenant_dir, max_open=8, idle_timeout=60, poll_interval=3600)
+        threads = threading.active_count()
+        with contextlib.redirect_stdout(self.output):
+            registry.start()
+            self.addCleanup(self._close_registry, registry)
+            for i in range(8):
+                with registry.lease(f"tenant-{i}") as container:
+                    role_id = container.role_manager.create_role("角色").id
+                    container.session_service._get_system_prompt(role_id)
+        # 只多了注册表自己的一个线程
+        self.assertEqual(threading.active_count(), threads + 1)
+        self.assertEqual(registry.stats()["open"], 8)
+
+        other = SQLiteDatabase(registry.path_for("tenant-7"))
+        with contextlib.redirect_stdout(self.output):
+            other.update_role(role_id, {"name": "另一个进程改的名字"})
+            other.disconnect()
+        self.assertGreaterEqual(registry.poll_changes(), 1)
+        self.assertIsNone(container.session_service._system_prompts.get(role_id))
+        self.assertEqual(registry.stats()["in_use"], 0)
+
+    def _close_registry(self, registry):
+        with contextlib.redirect_stdout(self.output):
+            registry.close()
+
+    def test_invalid_tenant_ids(self):
+        """测试不能用作文件名的租户ID被拒绝"""
+        for tenant_id in ("", "../etc", "a/b", "a..b", ".hidden", "x" * 65):
+            with self.assertRaises(ValueError):
+                validate_tenant_id(tenant_id)
+        self.assertEqual(validate_tenant_id("Team_1.prod"), "Team_1.prod")
+
+
+class TestTenantRequests(unittest.TestCase):
+    """按请求头选择租户数据库的接口测试"""
+
+    def setUp(self):
+        """测试前的设置"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {
+            DB_PATH_ENV: os.path.join(self.tmp_dir.name, "main.db"),
+            TENANT_DIR_ENV: os.path.join(self.tmp_dir.name, "tenants"),
+            INVALIDATION_INTERVAL_ENV: "0",
+        })
+        self.env.start()
+        self.output = io.StringIO()
+
+    def tearDown(self):
+        """测试后的清理"""
+        self.env.stop()
+        self.tmp_dir.cleanup()
+
+    def test_requests_use_tenant_database(self):
+        """测试带X-Tenant-Id的请求读写租户自己的数据库，不带时使用主库"""
+        with contextlib.redirect_stdout(self.output), TestClient(app) as client:
+            tenant_a = {"X-Tenant-Id": "team-a"}
+            role_id = client.post("/roles", json={"name": "A的角色"}, headers=tenant_a).json()["data"]["id"]
+            session_id = client.post("/sessions", json={"role_id": role_id}, headers=tenant_a).json()["data"]["id"]
+            client.post(f"/sessions/{session_id}/messages", json={"sender": "user", "content": "你好"},
+                        headers=tenant_a)
+
+            self.assertEqual(client.get(f"/roles/{role_id}", headers=tenant_a).json()["data"]["name"], "A的角色")
+            self.assertEqual(client.get(f"/roles/{role_id}", headers={"X-Tenant-Id": "team-b"}).json()["status"], 404)
+            self.assertEqual(client.get(f"/roles/{role_id}").json()["status"], 404)
+            messages = client.get(f"/sessions/{session_id}/messages", headers=tenant_a).json()["data"]
+            self.assertEqual([m["content"] for m in messages["messages"]], ["你好"])
+            self.assertEqual(app.state.tenants.stats()["open"], 2)
+
+            rejected = client.get("/roles", headers={"X-Tenant-Id": "../main"})
+            self.assertEqual(rejected.status_code, 400)
+            self.assertFalse(rejected.json()["success"])
+
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, "tenants", "team-a.db")))
+
+
+if __name__ == '__main__':
+    unittest.main()